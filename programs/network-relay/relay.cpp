@@ -13,22 +13,58 @@
 #include <time.h>
 #include <math.h>
 #include <sys/ioctl.h>
+#include <algorithm>
+#include <atomic>
 #include <iostream>
 #include <thread>
 #include <memory>
 #include <set>
 #include <map>
+#include <sstream>
+#include <string>
 #include <vector>
 
 static int mode = 3;
 static int next_session_id = 0;
 
 static double x_sec = 0, y_sec = 0;
-static long long bw_out = 0, bw_in = 0;
-static double lat_out = 0, lat_in = 0, lat_delta = 0;
 static int terminate_signal = false;
-static double accept_rate = 1.0;
-static double drop_rate = 0.9;
+static int control_port = 0;
+static bool p2p_framing = false;
+
+// can be changed at runtime through the control channel
+static std::atomic<long long> bw_out{0}, bw_in{0};
+static std::atomic<double> lat_out{0}, lat_in{0}, lat_delta{0};
+static std::atomic<double> accept_rate{1.0};
+static std::atomic<double> drop_rate{0.9};
+static std::atomic<bool> link_down{false};
+
+struct link_stats_t {
+   std::atomic<long long> bytes_out{0}, bytes_in{0};
+   std::atomic<long long> messages_out{0}, messages_in{0};
+   std::atomic<long long> sessions{0}, rejected{0};
+};
+static link_stats_t link_stats;
+
+// sets one of the runtime adjustable parameters, shared by the command line and the control channel
+bool set_param(const std::string& name, const std::string& value) {
+   char *end = nullptr;
+   if (name == "bandwidth-out" || name == "bandwidth-in") {
+      long long v = strtoll(value.c_str(), &end, 10);
+      if (end == value.c_str() || *end || v < 0) return false;
+      (name == "bandwidth-out" ? bw_out : bw_in) = v;
+      return true;
+   }
+   double v = strtod(value.c_str(), &end);
+   if (end == value.c_str() || *end || v < 0) return false;
+   if (name == "latency-out") lat_out = v;
+   else if (name == "latency-in") lat_in = v;
+   else if (name == "latency-delta") lat_delta = v;
+   else if (name == "accept-rate" && v <= 1.0) accept_rate = v;
+   else if (name == "drop-rate" && v <= 1.0) drop_rate = v;
+   else return false;
+   return true;
+}
 
 struct listening_session {
    int listen_port = 0;
@@ -61,7 +97,14 @@ bool parse_param(int argc, char **argv) {
              "--latency-in=VAL        - backward traffic latency in seconds, can have floating point values\n"
              "--latency-delta=VAL     - increase latency by VAL per sec after the start of each session, default = 0.0\n"
              "--accept-rate=VAL       - probably of accepting an new connection, default = 1.0\n"
-             "--drop-rate=VAL         - probably of dropping existing connection between X & Y sec, default = 0.9, take effect only if --disconnect-max is set\n");
+             "--drop-rate=VAL         - probably of dropping existing connection between X & Y sec, default = 0.9, take effect only if --disconnect-max is set\n"
+             "--control-port=PORT     - accept control commands on 127.0.0.1:PORT, one per line:\n"
+             "                            set NAME=VAL ...  - change bandwidth-*, latency-*, accept-rate or drop-rate\n"
+             "                            disconnect        - drop all sessions and reject new connections\n"
+             "                            connect           - accept new connections again\n"
+             "                            stats             - current parameters and forwarded bytes/messages as json\n"
+             "--framing=p2p           - count messages using the 4 byte length prefix of the nodeos p2p protocol,\n"
+             "                          otherwise every forwarded read counts as a message\n");
       exit(1);
    }
 
@@ -71,11 +114,17 @@ bool parse_param(int argc, char **argv) {
       bool unknown_param = true;
       param = "--accept-rate=";
       if (memcmp(argv[p], param, strlen(param)) == 0) {
-         sscanf(argv[p] + strlen(param), "%lf", &accept_rate); unknown_param = false;
+         if (!set_param("accept-rate", argv[p] + strlen(param))) {
+            std::cerr << "invalid parameter " << argv[p] << std::endl; return false;
+         }
+         unknown_param = false;
       }
       param = "--drop-rate=";
       if (memcmp(argv[p], param, strlen(param)) == 0) {
-         sscanf(argv[p] + strlen(param), "%lf", &drop_rate); unknown_param = false;
+         if (!set_param("drop-rate", argv[p] + strlen(param))) {
+            std::cerr << "invalid parameter " << argv[p] << std::endl; return false;
+         }
+         unknown_param = false;
       }
       param = "--relay=";
       if (memcmp(argv[p], param, strlen(param)) == 0) {
@@ -111,23 +160,49 @@ bool parse_param(int argc, char **argv) {
       }
       param = "--bandwidth-out=";
       if (memcmp(argv[p], param, strlen(param)) == 0) {
-         sscanf(argv[p] + strlen(param), "%lld", &bw_out); unknown_param = false;
+         if (!set_param("bandwidth-out", argv[p] + strlen(param))) {
+            std::cerr << "invalid parameter " << argv[p] << std::endl; return false;
+         }
+         unknown_param = false;
       }
       param = "--bandwidth-in=";
       if (memcmp(argv[p], param, strlen(param)) == 0) {
-         sscanf(argv[p] + strlen(param), "%lld", &bw_in); unknown_param = false;
+         if (!set_param("bandwidth-in", argv[p] + strlen(param))) {
+            std::cerr << "invalid parameter " << argv[p] << std::endl; return false;
+         }
+         unknown_param = false;
       }
       param = "--latency-out=";
       if (memcmp(argv[p], param, strlen(param)) == 0) {
-         sscanf(argv[p] + strlen(param), "%lf", &lat_out); unknown_param = false;
+         if (!set_param("latency-out", argv[p] + strlen(param))) {
+            std::cerr << "invalid parameter " << argv[p] << std::endl; return false;
+         }
+         unknown_param = false;
       }
       param = "--latency-in=";
       if (memcmp(argv[p], param, strlen(param)) == 0) {
-         sscanf(argv[p] + strlen(param), "%lf", &lat_in); unknown_param = false;
+         if (!set_param("latency-in", argv[p] + strlen(param))) {
+            std::cerr << "invalid parameter " << argv[p] << std::endl; return false;
+         }
+         unknown_param = false;
       }
       param = "--latency-delta=";
       if (memcmp(argv[p], param, strlen(param)) == 0) {
-         sscanf(argv[p] + strlen(param), "%lf", &lat_delta); unknown_param = false;
+         if (!set_param("latency-delta", argv[p] + strlen(param))) {
+            std::cerr << "invalid parameter " << argv[p] << std::endl; return false;
+         }
+         unknown_param = false;
+      }
+      param = "--control-port=";
+      if (memcmp(argv[p], param, strlen(param)) == 0) {
+         sscanf(argv[p] + strlen(param), "%d", &control_port); unknown_param = false;
+      }
+      param = "--framing=";
+      if (memcmp(argv[p], param, strlen(param)) == 0) {
+         if (strcmp(argv[p] + strlen(param), "p2p") != 0) {
+            std::cerr << "invalid parameter " << argv[p] << std::endl; return false;
+         }
+         p2p_framing = true; unknown_param = false;
       }
       if (unknown_param) {
          std::cerr << "invalid unknown pararmeter " << argv[p] << std::endl; return false;
@@ -153,9 +228,40 @@ struct session_t {
    bool session_ended = false;
    bool incoming_closed = false;
    bool outgoing_closed = false;
+   std::atomic<bool> force_disconnect{false};
    long long r0 = 0, s0 = 0, r1 = 0, s1 = 0; // byte counts
 };
 
+// counts complete messages in one direction of a stream
+struct message_counter_t {
+   uint32_t remaining = 0;   // bytes left of the current message
+   uint32_t header = 0;      // length prefix being assembled
+   int header_bytes = 0;
+
+   long long count(const char *data, int len) {
+      if (!p2p_framing) return 1;
+      long long messages = 0;
+      int i = 0;
+      while (i < len) {
+         if (remaining > 0) {
+            uint32_t n = std::min<uint32_t>(remaining, len - i);
+            remaining -= n;
+            i += n;
+            if (remaining == 0) ++messages;
+         } else {
+            header |= (uint32_t)(unsigned char)data[i++] << (8 * header_bytes);
+            if (++header_bytes == 4) {
+               remaining = header;
+               header = 0;
+               header_bytes = 0;
+               if (remaining == 0) ++messages;
+            }
+         }
+      }
+      return messages;
+   }
+};
+
 long long gettimeus() {
    static long long _init_time = 0;
    long long t;
@@ -234,15 +340,24 @@ void worker(std::shared_ptr<session_t> session_ptr, bool is_outgoing) {
       recv_count = &(session_ptr->r1);
       send_count = &(session_ptr->s1);
    }
-   int bandwidth = is_outgoing ? bw_out : bw_in;
-   if (bandwidth == 0) bandwidth = INT_MAX;
-   double latency = is_outgoing ? lat_out : lat_in;
-
-   if (latency > 1.0) {
-      double new_bw = latency * (double)bandwidth;
-      if (new_bw >= INT_MAX) bandwidth = INT_MAX;
-      else bandwidth = new_bw; // compensate bandwidth for sleeping
-   }
+   std::atomic<long long> &forwarded_bytes = is_outgoing ? link_stats.bytes_out : link_stats.bytes_in;
+   std::atomic<long long> &forwarded_messages = is_outgoing ? link_stats.messages_out : link_stats.messages_in;
+   message_counter_t message_counter;
+
+   // bandwidth and latency are read again on every iteration, they can change through the control channel
+   int bandwidth;
+   double latency;
+   auto load_limits = [&]() {
+      long long bw = is_outgoing ? bw_out : bw_in;
+      bandwidth = (bw == 0 || bw >= INT_MAX) ? INT_MAX : bw;
+      latency = is_outgoing ? lat_out : lat_in;
+      if (latency > 1.0) {
+         double new_bw = latency * (double)bandwidth;
+         if (new_bw >= INT_MAX) bandwidth = INT_MAX;
+         else bandwidth = new_bw; // compensate bandwidth for sleeping
+      }
+   };
+   load_limits();
 
    long long t0 = gettimeus();
    long long t00 = t0;
@@ -264,6 +379,13 @@ void worker(std::shared_ptr<session_t> session_ptr, bool is_outgoing) {
    }
 
    while (!terminate_signal && !session_ptr->shouldstop && !session_ptr->incoming_thread_stopped && !session_ptr->outgoing_thread_stopped) {      
+      if (session_ptr->force_disconnect) {
+         shutdown(from_fd, SHUT_RDWR);
+         shutdown(to_fd, SHUT_RDWR);
+         printf("session %d: %s side disconnected by control command\n", session_ptr->id, (is_outgoing ? "outgoing":"incoming"));
+         goto _disconnected;
+      }
+      load_limits();
       int navail = select_read(from_fd);
 
       long long t = gettimeus();
@@ -317,6 +439,7 @@ void worker(std::shared_ptr<session_t> session_ptr, bool is_outgoing) {
             if (r3 > 0) {
                r2 += r3;
                *send_count += r3;
+               forwarded_bytes += r3;
             }
             else if (r3 == 0) goto _disconnected;
             else {
@@ -329,6 +452,7 @@ void worker(std::shared_ptr<session_t> session_ptr, bool is_outgoing) {
                }
             }
          }
+         forwarded_messages += message_counter.count(buf, nr);
          if (terminate_signal) break;
       }
       else if (nr == 0) goto _disconnected;
@@ -351,6 +475,97 @@ _disconnected:
    printf("session %d: %s worker thread stopped\n", session_ptr->id, (is_outgoing ? "outgoing":"incoming"));
 }
 
+typedef std::map<std::thread *, std::shared_ptr<session_t> > session_map;
+
+struct control_client_t {
+   int fd = 0;
+   std::string input;
+};
+
+std::string stats_json(const session_map &live_sessions) {
+   int live = 0;
+   for (session_map::const_iterator itr = live_sessions.begin(); itr != live_sessions.end(); ++itr) {
+      if (!itr->second->incoming_thread_stopped && !itr->second->outgoing_thread_stopped) live++;
+   }
+   std::ostringstream os;
+   os << "{\"link_down\":" << (link_down ? "true" : "false")
+      << ",\"bandwidth_out\":" << bw_out << ",\"bandwidth_in\":" << bw_in
+      << ",\"latency_out\":" << lat_out << ",\"latency_in\":" << lat_in << ",\"latency_delta\":" << lat_delta
+      << ",\"accept_rate\":" << accept_rate << ",\"drop_rate\":" << drop_rate
+      << ",\"bytes_out\":" << link_stats.bytes_out << ",\"bytes_in\":" << link_stats.bytes_in
+      << ",\"messages_out\":" << link_stats.messages_out << ",\"messages_in\":" << link_stats.messages_in
+      << ",\"sessions\":" << link_stats.sessions << ",\"rejected\":" << link_stats.rejected
+      << ",\"live_sessions\":" << live << ",\"time_us\":" << gettimeus() << "}";
+   return os.str();
+}
+
+// executes one control command and returns the json reply
+std::string control_command(const std::string &line, session_map &live_sessions) {
+   std::istringstream is(line);
+   std::string cmd;
+   is >> cmd;
+   if (cmd == "stats") {
+      return stats_json(live_sessions);
+   } else if (cmd == "set") {
+      std::string assignment;
+      while (is >> assignment) {
+         size_t eq = assignment.find('=');
+         if (eq == std::string::npos || !set_param(assignment.substr(0, eq), assignment.substr(eq + 1))) {
+            return "{\"ok\":false,\"error\":\"invalid parameter " + assignment + "\"}";
+         }
+      }
+      printf("%lldus: control: %s\n", gettimeus(), line.c_str());
+      return "{\"ok\":true}";
+   } else if (cmd == "disconnect") {
+      link_down = true;
+      for (session_map::iterator itr = live_sessions.begin(); itr != live_sessions.end(); ++itr) {
+         itr->second->force_disconnect = true;
+      }
+      printf("%lldus: control: disconnect, rejecting new connections\n", gettimeus());
+      return "{\"ok\":true}";
+   } else if (cmd == "connect") {
+      link_down = false;
+      printf("%lldus: control: connect, accepting new connections\n", gettimeus());
+      return "{\"ok\":true}";
+   }
+   return "{\"ok\":false,\"error\":\"unknown command " + cmd + "\"}";
+}
+
+// reads from a control client and answers every complete line, returns false once the client is gone
+bool serve_control_client(control_client_t &client, session_map &live_sessions) {
+   char buf[4096];
+   int nr = read(client.fd, buf, sizeof(buf));
+   if (nr <= 0) return false;
+   client.input.append(buf, nr);
+   size_t eol;
+   while ((eol = client.input.find('\n')) != std::string::npos) {
+      std::string line = client.input.substr(0, eol);
+      client.input.erase(0, eol + 1);
+      if (!line.empty() && line.back() == '\r') line.pop_back();
+      if (line.empty()) continue;
+      std::string reply = control_command(line, live_sessions) + "\n";
+      if (write(client.fd, reply.c_str(), reply.size()) != (ssize_t)reply.size()) return false;
+   }
+   return true;
+}
+
+int open_control_port(int port) {
+   int fd = socket(AF_INET, SOCK_STREAM, 0);
+   if (fd <= 0) return -1;
+   int reuse = 1;
+   setsockopt(fd, SOL_SOCKET, SO_REUSEADDR, &reuse, sizeof(reuse));
+   struct sockaddr_in addr;
+   memset((char *)&addr, 0, sizeof(addr));
+   addr.sin_family = AF_INET;
+   addr.sin_addr.s_addr = inet_addr("127.0.0.1");
+   addr.sin_port = htons(port);
+   if (bind(fd, (struct sockaddr *)&addr, sizeof(addr)) < 0 || listen(fd, 4) < 0) {
+      close(fd);
+      return -1;
+   }
+   return fd;
+}
+
 void sig_handler(int sig) {
    terminate_signal = true;
 }
@@ -411,6 +626,17 @@ int main(int argc, char *argv[])
       std::cout << "OK\n";
    }
 
+   int control_fd = -1;
+   std::vector<control_client_t> control_clients;
+   if (control_port && !terminate_signal) {
+      control_fd = open_control_port(control_port);
+      if (control_fd < 0) {
+         fprintf(stderr, "failed to open control port %d\n", control_port);
+         exit(2);
+      }
+      std::cout << "accepting control commands on 127.0.0.1:" << control_port << std::endl;
+   }
+
    int state = 1; // 1 - random reject, 0 - reject new connections;
    long long next_disconnect_time = INT64_MAX;
    long long next_accept_time = INT64_MAX;
@@ -429,7 +655,7 @@ int main(int argc, char *argv[])
    }
    std::cout << std::endl;
    
-   std::map<std::thread *, std::shared_ptr<session_t> > live_sessions;
+   session_map live_sessions;
 
    while (!terminate_signal) {
 
@@ -483,16 +709,39 @@ int main(int argc, char *argv[])
       for (int i = 0; i < listening_list.size(); i++) {
          FD_SET(listening_list[i].listening_fd, &rfds);
       }
+      if (control_fd >= 0) {
+         FD_SET(control_fd, &rfds);
+         for (int i = 0; i < control_clients.size(); i++) {
+            FD_SET(control_clients[i].fd, &rfds);
+         }
+      }
       int active = select(FD_SETSIZE, &rfds, NULL, NULL, &tv);
+
+      if (active > 0 && control_fd >= 0) {
+         for (int i = 0; i < control_clients.size(); ) {
+            if (FD_ISSET(control_clients[i].fd, &rfds) && !serve_control_client(control_clients[i], live_sessions)) {
+               close(control_clients[i].fd);
+               control_clients.erase(control_clients.begin() + i);
+            } else {
+               i++;
+            }
+         }
+         if (FD_ISSET(control_fd, &rfds)) {
+            control_client_t client;
+            client.fd = accept(control_fd, NULL, NULL);
+            if (client.fd > 0) control_clients.push_back(client);
+         }
+      }
       
       if (active >= 0) {
          for (int i = 0; i < listening_list.size(); i++) {
             if (FD_ISSET(listening_list[i].listening_fd, &rfds)) {
                int incoming_sockfd = accept(listening_list[i].listening_fd, (struct sockaddr *)&incoming_addr, (socklen_t*)&addrlen);
                if (incoming_sockfd > 0) {
-                  if (state == 0 || (rand() >= (RAND_MAX * accept_rate))) {
+                  if (state == 0 || link_down || (rand() >= (RAND_MAX * accept_rate))) {
                      close(incoming_sockfd); 
-                     if (state != 0) {
+                     link_stats.rejected++;
+                     if (state != 0 && !link_down) {
                         printf("randomly reject incoming connection from %d\n", listening_list[i].listen_port);
                      }
                   } else {
@@ -508,6 +757,7 @@ int main(int argc, char *argv[])
                         session_ptr->incoming_sockfd = incoming_sockfd;
                         session_ptr->outgoing_sockfd = outgoing_sockfd;
                         session_ptr->id = next_session_id++;
+                        link_stats.sessions++;
                         
                         std::thread *thread = new std::thread( [session_ptr]() { session_start(session_ptr); } );
                         live_sessions[thread] = session_ptr;
@@ -530,6 +780,10 @@ int main(int argc, char *argv[])
    for (int i = 0; i < listening_list.size(); i++) {
       close(listening_list[i].listening_fd);
    }
+   for (int i = 0; i < control_clients.size(); i++) {
+      close(control_clients[i].fd);
+   }
+   if (control_fd >= 0) close(control_fd);
 
    return 0;
 }
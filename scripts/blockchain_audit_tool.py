@@ -1,24 +1,56 @@
 #!/usr/bin/env python3
 
+import base64
+import concurrent.futures
+import datetime
+import hashlib
 import http.client
+import os
 import sys
 import json
 import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
 
 USAGE = "\
-Usage: blockchain_audit_tool.py [OPTIONS] [<rpc_endpoint>]\n"
+Usage: blockchain_audit_tool.py [OPTIONS] [<rpc_endpoint>]\n\
+       blockchain_audit_tool.py [OPTIONS] --snapshot <filepath>\n"
 
 HELP_INFO = "\
     Audit EOSIO blockchain.\n\
     <rpc_endpoint> RPC endpoint URI of nodeos with chain_api_plugin enabled. Defaults to 'localhost:8888'\n\
     OPTIONS:\n\
                   --help  Print help info and exit\n\
+--incremental <filepath>  Reuse the MI and KV table data of <filepath>, a previous audit made with the same limits, for accounts\n\
+                          whose code hash, permissions and table scope row counts are unchanged.  Rows updated in place\n\
+                          without changing a table's row count are not refetched for those accounts\n\
        --comp <filepath>  Do not query nodeos.  Instead use <filepath> as basis for comparison combined with '--ref' option\n\
-           -o <filepath>  Output to filepath instead of default 'blockchain_audit_data.json'\n\
+     --concurrency <num>  Integer > 0, default 4. Max # of RPC requests in flight to nodeos. Results are ordered the same for any value\n\
+           -o <filepath>  Output to filepath instead of default 'blockchain_audit_data.json'.  If <filepath> ends with '.jsonl'\n\
+                          the audit is streamed to it as it is fetched, one record per line sorted by record type and key\n\
        --page_size <num>  Integer > 0, default 1024. The 'limit' field in RPC queries for accounts and table data.  Default 1024\n\
-        --ref <filepath>  Use <filepath> to comparefor non-transient data to use comparison\n\
+        --ref <filepath>  Use <filepath> to comparefor non-transient data to use comparison.  '.jsonl' audits are compared\n\
+                          in one streaming pass\n\
      --scope-limit <num>  Integer >= 0, default 0. Max # of scopes to fetch. 0=no limit\n\
  --table-row-limit <num>  Integer >= 0, default 0. Max # of rows of MI and KV tables to fetch. 0=no limit\n\
+   --snapshot <filepath>  Do not query nodeos.  Instead audit the binary or JSON snapshot <filepath>, streaming its sections.\n\
+                          MI table rows are hex encoded, as get_table_rows returns them with \"json\":false, unless\n\
+                          '--client-decode' is set.  Account metadata is limited to what the snapshot holds (privilege,\n\
+                          dates and permissions)\n\
+        --nodeos <path>  nodeos used to convert a binary snapshot to JSON with '--snapshot-to-json'.  Default 'nodeos'\n\
+              --resume  Flag.  Continue the audit to the same output from its last checkpoint instead of starting over.\n\
+                          The other options must be the same as for the interrupted run.  Checkpoints continue to be\n\
+                          saved, every 60 seconds unless '--checkpoint-interval' is given\n\
+ --checkpoint-interval <sec>  Integer >= 0, default 0.  Seconds between checkpoints of an audit of nodeos, saved in\n\
+                          '<output>.ckpt' after pages of accounts and removed when the audit completes.  0=no checkpoints\n\
+       --client-decode  Flag.  Fetch MI table rows from nodeos as binary (\"json\":false) and decode them in this tool\n\
+                          with the contract ABIs, cached by code hash.  Keeps the ABI serialization cost of large tables\n\
+                          off nodeos and out of its abi-serializer-max-time-ms limit.  With '--snapshot', decodes the\n\
+                          snapshot's rows with the ABIs it holds\n\
        --keep-irrelevant  Flag.  Normally time and block number data will be removed from the JSON.  Setting this flag keeps that data.\n\
     Outputs to stdout in a human readable format, and write to JSON file specified by '-o' which defaults to:\n\
          'blockchain_audit_data.json'\n\
@@ -131,7 +163,19 @@ def parseArgs(argv, optionsMapIn, otherArgsMin, otherArgsMax):
     return optionsMapOut, otherArgsList
 
 
+class RequestCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def add(self):
+        with self.lock:
+            self.count += 1
+
+requestCounter = RequestCounter()
+
 def getJSONResp(conn, rpc, req_body="", exitOnError=True):
+    requestCounter.add()
     conn.request("POST", rpc, body=req_body)
     resp = conn.getresponse()
 
@@ -147,48 +191,140 @@ def getJSONResp(conn, rpc, req_body="", exitOnError=True):
     return json_data
 
 
-def getAllAccounts(conn, limit):
+class FetchPool:
+    """
+    Runs fetch functions concurrently on a pool of worker threads.  Each worker owns its own
+    connection to nodeos since http.client connections cannot be shared between threads.
+    """
+    def __init__(self, rpc_endpt, concurrency):
+        self.rpc_endpt = rpc_endpt
+        self.concurrency = concurrency
+        self.local = threading.local()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.rpc_endpt)
+            self.local.conn = conn
+        return conn
+
+    # call fn(conn, item) for every item, returns the results in the order of items
+    def map(self, fn, items):
+        return list(self.executor.map(lambda item: fn(self.conn(), item), items))
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def formatDuration(sec):
+    sec = int(sec)
+    return f"{sec // 3600:02}:{sec // 60 % 60:02}:{sec % 60:02}"
+
+
+class PhaseProgress:
+    """
+    Progress of one phase of the audit on stderr: items done out of total, table rows and nodeos requests
+    per second and the time left at the current rate.  Items done before a resume count towards the total
+    but not towards the rates.
+    """
+    REFRESH_SEC = 0.5
+
+    def __init__(self, label, total=None, done=0):
+        self.lock = threading.Lock()
+        self.label = label
+        self.total = total
+        self.count = done
+        self.startCount = done
+        self.rows = 0
+        self.start = time.monotonic()
+        self.startRequests = requestCounter.count
+        self.lastPrint = 0
+        self.width = 0
+        self.printLine(True)
+
+    def add(self, n=1, rows=0):
+        with self.lock:
+            self.count += n
+            self.rows += rows
+            self.printLine(False)
+
+    def printLine(self, force):
+        now = time.monotonic()
+        if not force and now - self.lastPrint < PhaseProgress.REFRESH_SEC:
+            return
+        self.lastPrint = now
+        elapsed = max(now - self.start, 0.001)
+        line = f"{self.label} {self.count:8}"
+        if self.total is not None:
+            line += f"/{self.total:8}"
+        line += f"  {self.rows / elapsed:9.1f} rows/s  {(requestCounter.count - self.startRequests) / elapsed:7.1f} req/s"
+        if self.total is not None:
+            rate = (self.count - self.startCount) / elapsed
+            eta = formatDuration((self.total - self.count) / rate) if rate > 0 else "--:--:--"
+            line += f"  ETA {eta}"
+        self.width = max(self.width, len(line))
+        print("\r" + line.ljust(self.width), end="", file=sys.stderr, flush=True)
+
+    def finish(self):
+        with self.lock:
+            self.printLine(True)
+            print(f"  done in {formatDuration(time.monotonic() - self.start)}", file=sys.stderr)
+
+
+# returns the pages of accounts named after after_name, and their number
+def getAllAccounts(conn, limit, after_name=""):
     moreAccounts = True
     all_accts = []
     req_body = '{"limit":' + str(limit) + '}'
+    if after_name != "":
+        req_body = '{"limit":' + str(limit) + f', "lower_bound":"{after_name}"' + '}'
     numAccounts = 0
-    print('fetching accounts...', end="", file=sys.stderr)
-    print(f'{numAccounts:8}', end="", file=sys.stderr)
+    progress = PhaseProgress('fetching accounts...')
     while moreAccounts:
         accts = getJSONResp(conn, "/v1/chain/get_all_accounts", req_body)
-        all_accts.append(accts['accounts'])
-        numAccounts += len(accts['accounts'])
-        print("\b"*8, end="", file=sys.stderr)
-        print(f'{numAccounts:8}', end="", file=sys.stderr)
+        page = [a for a in accts['accounts'] if a['name'] > after_name]
+        if len(page) > 0:
+            all_accts.append(page)
+        numAccounts += len(page)
+        progress.add(len(page), len(page))
         moreAccounts = 'more' in accts
         if moreAccounts:
             nextAcct = accts['more']
             req_body = '{"limit":' + str(limit) + f', "lower_bound":"{nextAcct}"' + '}'
+    progress.finish()
     return all_accts, numAccounts
 
+# the 'limit' of the next page request, so that paging stops at exactly max_count items (0=no limit)
+# as the snapshot audit does, which keeps the two audits of the same state equal for any limit
+def pageLimit(page_size, fetched, max_count):
+    if max_count == 0:
+        return page_size
+    return min(page_size, max_count - fetched)
+
 def getScopes(conn, code_name, page_size, max_scopes):
     next_scope = ""
-    i = 0
     scope_rows_all = []
     moreData = True
-    while moreData and (max_scopes == 0 or i < max_scopes):
-        req_body = '{' + f'"code":"{code_name}", "table":"", "lower_bound":"{next_scope}", "upper_bound":"", "limit":{page_size}, "reverse":false' + '}'
+    while moreData and (max_scopes == 0 or len(scope_rows_all) < max_scopes):
+        limit = pageLimit(page_size, len(scope_rows_all), max_scopes)
+        req_body = '{' + f'"code":"{code_name}", "table":"", "lower_bound":"{next_scope}", "upper_bound":"", "limit":{limit}, "reverse":false' + '}'
         scopes = getJSONResp(conn, "/v1/chain/get_table_by_scope", req_body)
         scope_rows_all.extend(scopes["rows"])
         next_scope = scopes["more"]
-        i += page_size
         moreData = (next_scope != "")
 
-    return scope_rows_all
+    return scope_rows_all[:max_scopes] if max_scopes > 0 else scope_rows_all
 
-def getTableRows(conn, code_name, scope_name, table_name, page_size, max_rows):
+def getTableRows(conn, code_name, scope_name, table_name, page_size, max_rows, binary=False):
+    json_rows = "false" if binary else "true"
     next_table = ""
-    i = 0
     table_rows_all = []
     moreData = True
-    while moreData and (i < max_rows or max_rows == 0):
-        req_body = '{' + f'"json":true, "code":"{code_name}", "scope":"{scope_name}", "table":"{table_name}", "lower_bound":"{next_table}",\
-    "upper_bound":"", "limit": {page_size},"table_key": "",  "key_type": "", "index_position": "",\
+    while moreData and (len(table_rows_all) < max_rows or max_rows == 0):
+        limit = pageLimit(page_size, len(table_rows_all), max_rows)
+        req_body = '{' + f'"json":{json_rows}, "code":"{code_name}", "scope":"{scope_name}", "table":"{table_name}", "lower_bound":"{next_table}",\
+    "upper_bound":"", "limit": {limit},"table_key": "",  "key_type": "", "index_position": "",\
     "encode_type": "bytes", "reverse": false, "show_payer": false' + '}'
 
         resp = getJSONResp(conn, "/v1/chain/get_table_rows", req_body, exitOnError=False)
@@ -197,21 +333,20 @@ def getTableRows(conn, code_name, scope_name, table_name, page_size, max_rows):
 
             next_table = resp["more"]
             moreData = (next_table != "")
-            i += page_size
         except Exception as e:
             break
 
-    return table_rows_all
+    return table_rows_all[:max_rows] if max_rows > 0 else table_rows_all
 
 def getKVTableData(conn, code_name, page_size, max_rows):
     next_key = ""
-    i = 0
     kv_data_all = []
     moreData = True
-    while moreData and (i < max_rows or max_rows == 0):
+    while moreData and (len(kv_data_all) < max_rows or max_rows == 0):
+        limit = pageLimit(page_size, len(kv_data_all), max_rows)
         req_body = '{' + f'"json": false,  "code": "{code_name}",  "table": "{next_key}",\
 "index_name": "", "index_value": "", "lower_bound": "", "upper_bound": "",\
-"limit": {page_size},  "encode_type": "bytes",  "reverse": false,  "show_payer": false' + '}'
+"limit": {limit},  "encode_type": "bytes",  "reverse": false,  "show_payer": false' + '}'
 
         # print(f"getKVTableData: req_body={req_body}")
         resp = getJSONResp(conn, "/v1/chain/get_kv_table_rows", req_body, exitOnError=False)
@@ -220,44 +355,851 @@ def getKVTableData(conn, code_name, page_size, max_rows):
 
             moreData = resp['more']
             next_key = resp["next_key"]
-            i += page_size
         except Exception as e:
             break
 
-    return kv_data_all
+    return kv_data_all[:max_rows] if max_rows > 0 else kv_data_all
+
+class AbiReader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, n):
+        if self.pos + n > len(self.data):
+            raise ValueError(f"read past end of data at {self.pos}")
+        b = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return b
+
+    def unpack(self, fmt, n):
+        return struct.unpack("<" + fmt, self.read(n))[0]
+
+    def varuint32(self):
+        v = 0
+        shift = 0
+        while True:
+            b = self.read(1)[0]
+            v |= (b & 0x7f) << shift
+            shift += 7
+            if b & 0x80 == 0:
+                return v
+
+    def varint32(self):
+        v = self.varuint32()
+        return (v >> 1) ^ -(v & 1)
+
+    def atEnd(self):
+        return self.pos >= len(self.data)
+
+
+NAME_CHARS = ".12345abcdefghijklmnopqrstuvwxyz"
+BASE58_CHARS = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+KEY_TYPES = ("K1", "R1", "WA")
+UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+BLOCK_TIMESTAMP_EPOCH_MS = 946684800000
+BLOCK_INTERVAL_MS = 500
+
+def nameToString(v):
+    s = ""
+    for i in range(13):
+        if i == 0:
+            c = v & 0x0f
+            v >>= 4
+        else:
+            c = v & 0x1f
+            v >>= 5
+        s = NAME_CHARS[c] + s
+    return s.rstrip(".")
+
+def base58(b):
+    n = int.from_bytes(b, "big")
+    s = ""
+    while n > 0:
+        n, r = divmod(n, 58)
+        s = BASE58_CHARS[r] + s
+    return "1" * (len(b) - len(b.lstrip(b"\0"))) + s
+
+def keyDigest(b, suffix):
+    return hashlib.new("ripemd160", b + suffix.encode()).digest()[:4]
+
+# 64 bit integers are quoted by nodeos once they do not fit in 32 bits
+def int64ToJson(v):
+    return str(v) if v > 0xffffffff or v < -0xffffffff else v
+
+def timePointToString(ms):
+    return (UNIX_EPOCH + datetime.timedelta(milliseconds=ms)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+
+def symbolToString(v):
+    return f"{v & 0xff},{nameFromSymbolCode(v >> 8)}"
+
+def nameFromSymbolCode(v):
+    return v.to_bytes(7, "little").rstrip(b"\0").decode()
+
+def assetToString(amount, sym):
+    precision = sym & 0xff
+    s = str(abs(amount)).rjust(precision + 1, "0")
+    if precision > 0:
+        s = s[:-precision] + "." + s[-precision:]
+    return f"{'-' if amount < 0 else ''}{s} {nameFromSymbolCode(sym >> 8)}"
+
+def readPublicKey(r):
+    t = r.read(1)[0]
+    data = r.read(33)
+    if t == 0:
+        return "EOS" + base58(data + hashlib.new("ripemd160", data).digest()[:4])
+    if t == 2:
+        # webauthn keys also carry the user presence and relying party id
+        data += r.read(1)
+        data += r.read(r.varuint32())
+    suffix = KEY_TYPES[t]
+    return f"PUB_{suffix}_" + base58(data + keyDigest(data, suffix))
+
+def readSignature(r):
+    t = r.read(1)[0]
+    data = r.read(65)
+    if t == 2:
+        data += r.read(r.varuint32())
+        data += r.read(r.varuint32())
+    suffix = KEY_TYPES[t]
+    return f"SIG_{suffix}_" + base58(data + keyDigest(data, suffix))
+
+BUILTIN_DECODERS = {
+    "bool": lambda r: r.read(1)[0] != 0,
+    "int8": lambda r: r.unpack("b", 1),
+    "uint8": lambda r: r.unpack("B", 1),
+    "int16": lambda r: r.unpack("h", 2),
+    "uint16": lambda r: r.unpack("H", 2),
+    "int32": lambda r: r.unpack("i", 4),
+    "uint32": lambda r: r.unpack("I", 4),
+    "int64": lambda r: int64ToJson(r.unpack("q", 8)),
+    "uint64": lambda r: int64ToJson(r.unpack("Q", 8)),
+    "int128": lambda r: "0x" + r.read(16).hex(),
+    "uint128": lambda r: "0x" + r.read(16).hex(),
+    "varint32": lambda r: r.varint32(),
+    "varuint32": lambda r: r.varuint32(),
+    # fc::variant renders floating point as fixed with 17 decimals, a float32 after widening to double
+    "float32": lambda r: "%.17f" % r.unpack("f", 4),
+    "float64": lambda r: "%.17f" % r.unpack("d", 8),
+    "float128": lambda r: "0x" + r.read(16).hex(),
+    "time_point": lambda r: timePointToString(r.unpack("q", 8) // 1000),
+    "time_point_sec": lambda r: timePointToString(r.unpack("I", 4) * 1000)[:-4],
+    "block_timestamp_type": lambda r: timePointToString(r.unpack("I", 4) * BLOCK_INTERVAL_MS + BLOCK_TIMESTAMP_EPOCH_MS),
+    "name": lambda r: nameToString(r.unpack("Q", 8)),
+    "bytes": lambda r: r.read(r.varuint32()).hex(),
+    "string": lambda r: r.read(r.varuint32()).decode("utf-8", errors="replace"),
+    "checksum160": lambda r: r.read(20).hex(),
+    "checksum256": lambda r: r.read(32).hex(),
+    "checksum512": lambda r: r.read(64).hex(),
+    "public_key": readPublicKey,
+    "signature": readSignature,
+    "symbol": lambda r: symbolToString(r.unpack("Q", 8)),
+    "symbol_code": lambda r: nameFromSymbolCode(r.unpack("Q", 8)),
+    "asset": lambda r: assetToString(r.unpack("q", 8), r.unpack("Q", 8)),
+}
+BUILTIN_DECODERS["extended_asset"] = lambda r: { 'quantity': BUILTIN_DECODERS["asset"](r), 'contract': BUILTIN_DECODERS["name"](r) }
+
+# the parts of abi_def that are needed to decode tables, used to read the binary ABIs in snapshots
+ABI_DEF_ABI = {
+    'structs': [
+        { 'name': "type_def", 'base': "", 'fields': [{ 'name': "new_type_name", 'type': "string" }, { 'name': "type", 'type': "string" }] },
+        { 'name': "field_def", 'base': "", 'fields': [{ 'name': "name", 'type': "string" }, { 'name': "type", 'type': "string" }] },
+        { 'name': "struct_def", 'base': "", 'fields': [{ 'name': "name", 'type': "string" }, { 'name': "base", 'type': "string" },
+                                                      { 'name': "fields", 'type': "field_def[]" }] },
+        { 'name': "action_def", 'base': "", 'fields': [{ 'name': "name", 'type': "name" }, { 'name': "type", 'type': "string" },
+                                                      { 'name': "ricardian_contract", 'type': "string" }] },
+        { 'name': "table_def", 'base': "", 'fields': [{ 'name': "name", 'type': "name" }, { 'name': "index_type", 'type': "string" },
+                                                     { 'name': "key_names", 'type': "string[]" }, { 'name': "key_types", 'type': "string[]" },
+                                                     { 'name': "type", 'type': "string" }] },
+        { 'name': "clause_pair", 'base': "", 'fields': [{ 'name': "id", 'type': "string" }, { 'name': "body", 'type': "string" }] },
+        { 'name': "error_message", 'base': "", 'fields': [{ 'name': "error_code", 'type': "uint64" }, { 'name': "error_msg", 'type': "string" }] },
+        { 'name': "extension", 'base': "", 'fields': [{ 'name': "tag", 'type': "uint16" }, { 'name': "value", 'type': "bytes" }] },
+        { 'name': "variant_def", 'base': "", 'fields': [{ 'name': "name", 'type': "string" }, { 'name': "types", 'type': "string[]" }] },
+        { 'name': "abi_def", 'base': "", 'fields': [{ 'name': "version", 'type': "string" }, { 'name': "types", 'type': "type_def[]" },
+                                                   { 'name': "structs", 'type': "struct_def[]" }, { 'name': "actions", 'type': "action_def[]" },
+                                                   { 'name': "tables", 'type': "table_def[]" }, { 'name': "ricardian_clauses", 'type': "clause_pair[]" },
+                                                   { 'name': "error_messages", 'type': "error_message[]" },
+                                                   { 'name': "abi_extensions", 'type': "extension[]" },
+                                                   { 'name': "variants", 'type': "variant_def[]$" }] },
+    ],
+}
+
+
+class AbiDecoder:
+    """
+    Decodes binary rows with a contract ABI, rendering them as nodeos' abi_serializer does for "json":true.
+    A decode function is built once per type, so decoding all rows of a table only walks the ABI once.
+    """
+    def __init__(self, abi):
+        self.typedefs = { t['new_type_name']: t['type'] for t in abi.get('types', []) }
+        self.structs = { s['name']: s for s in abi.get('structs', []) }
+        self.variants = { v['name']: v['types'] for v in abi.get('variants', []) }
+        self.tables = { t['name']: t['type'] for t in abi.get('tables', []) }
+        self.decoders = dict()
+
+    def resolve(self, t):
+        seen = 0
+        while t in self.typedefs and seen < len(self.typedefs):
+            t = self.typedefs[t]
+            seen += 1
+        return t
+
+    def decoder(self, t):
+        fn = self.decoders.get(t)
+        if fn is None:
+            # placeholder so recursive types refer back to the finished decoder
+            self.decoders[t] = lambda r: self.decoders[t](r)
+            fn = self.buildDecoder(t)
+            self.decoders[t] = fn
+        return fn
+
+    def buildDecoder(self, t):
+        if t.endswith("[]"):
+            elem = self.decoder(t[:-2])
+            return lambda r: [elem(r) for _ in range(r.varuint32())]
+        if t.endswith("?"):
+            elem = self.decoder(t[:-1])
+            return lambda r: elem(r) if r.read(1)[0] != 0 else None
+        if t.endswith("$"):
+            return self.decoder(t[:-1])
+        t = self.resolve(t)
+        if t in BUILTIN_DECODERS:
+            return BUILTIN_DECODERS[t]
+        if t in self.variants:
+            alternatives = [(v, self.decoder(v)) for v in self.variants[t]]
+            def decodeVariant(r):
+                name, fn = alternatives[r.varuint32()]
+                return [name, fn(r)]
+            return decodeVariant
+        if t in self.structs:
+            return self.buildStructDecoder(t)
+        raise ValueError(f"unknown ABI type '{t}'")
+
+    def buildStructDecoder(self, t):
+        fields = []
+        s = self.structs[t]
+        bases = []
+        while s is not None:
+            bases.insert(0, s)
+            s = self.structs.get(self.resolve(s['base'])) if s.get('base', "") != "" else None
+        for s in bases:
+            for f in s['fields']:
+                fields.append((f['name'], self.decoder(f['type']), f['type'].endswith("$")))
+        def decodeStruct(r):
+            obj = dict()
+            for name, fn, isExtension in fields:
+                # binary extensions are left out when the data ends before them
+                if isExtension and r.atEnd():
+                    break
+                obj[name] = fn(r)
+            return obj
+        return decodeStruct
+
+    def decode(self, t, data):
+        return self.decoder(t)(AbiReader(data))
+
+    # decode the hex rows of table, raises ValueError when the table or a row cannot be decoded
+    def decodeRows(self, table, rows):
+        if table not in self.tables:
+            raise ValueError(f"table '{table}' is not in the ABI")
+        fn = self.decoder(self.tables[table])
+        return [fn(AbiReader(bytes.fromhex(row))) for row in rows]
+
+
+ABI_DEF_DECODER = AbiDecoder(ABI_DEF_ABI)
+
+def decodeAbiDef(data):
+    return ABI_DEF_DECODER.decode("abi_def", data)
+
+
+class AbiCache:
+    """
+    Decoders of contract ABIs keyed by account code hash, so every deployment of the same contract
+    shares one decoder.  fetchAbi() is only called for code hashes not seen yet.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.decoders = dict()
+        self.undecoded = 0
+
+    def get(self, code_hash, fetchAbi):
+        with self.lock:
+            if code_hash in self.decoders:
+                return self.decoders[code_hash]
+        abi = fetchAbi()
+        decoder = AbiDecoder(abi) if abi is not None else None
+        with self.lock:
+            self.decoders[code_hash] = decoder
+        return decoder
+
+    # returns the decoded rows, or the hex rows unchanged if they cannot be decoded
+    def decodeRows(self, code, code_hash, table, rows, fetchAbi):
+        if len(rows) == 0:
+            return rows
+        decoder = self.get(code_hash, fetchAbi)
+        try:
+            if decoder is None:
+                raise ValueError("account has no ABI")
+            return decoder.decodeRows(table, rows)
+        except (ValueError, IndexError, KeyError, struct.error) as e:
+            with self.lock:
+                self.undecoded += 1
+            print(f"\nWARNING: rows of {code}:{table} left hex encoded: {e}", file=sys.stderr)
+            return rows
+
+# returns a fetchAbi function for AbiCache that gets the ABI of code from nodeos
+def abiFetcher(conn, code):
+    def fetchAbi():
+        resp = getJSONResp(conn, "/v1/chain/get_abi", '{ "account_name": "' + code + '" }', exitOnError=False)
+        return resp.get('abi')
+    return fetchAbi
+
+
+def getAccount(conn, nm):
+    e = { 'name' : nm }
+    req_body = '{ "account_name": "' + nm + '" }'
+    e['metadata'] = getJSONResp(conn, "/v1/chain/get_account", req_body)
+
+    # get code hash of account
+    code_hash = getJSONResp(conn, "/v1/chain/get_code_hash", req_body)
+    e['code_hash'] = code_hash['code_hash']
+    return e
+
+def isAccountUnchanged(prev, cur):
+    if prev is None:
+        return False
+    return prev['code_hash'] == cur['code_hash'] and \
+           prev['metadata']['permissions'] == cur['metadata']['permissions'] and \
+           prev['scopes'] == cur['scopes']
+
+
+# fetch metadata, code hash, scopes, MI tables and KV tables of the accounts in names
+# requests are spread over the pool's workers per account and per scope, the returned list is in the order of names
+# accounts found unchanged in prev_accts take their table data from there instead of nodeos
+# with an abi_cache, MI table rows are fetched as binary and decoded by the tool
+def auditAccounts(pool, names, page_size, scope_limit, table_row_limit, progress, prev_accts=None, abi_cache=None):
+    accts_lst = pool.map(getAccount, names)
+
+    def fetchScopes(conn, nm):
+        return getScopes(conn, nm, page_size, scope_limit)
+    all_scopes = pool.map(fetchScopes, names)
+
+    table_keys = []
+    fetch_names = []
+    for a, scopes in zip(accts_lst, all_scopes):
+        a['scopes'] = scopes
+        prev = prev_accts.get(a['name']) if prev_accts is not None else None
+        if isAccountUnchanged(prev, a):
+            a['tables'] = prev['tables']
+            a['kv_tables'] = prev['kv_tables']
+            progress.add()
+            continue
+        fetch_names.append(a['name'])
+        for scope in scopes:
+            table_keys.append((a['name'], scope['scope'], scope['table']))
+
+    code_hashes = { a['name']: a['code_hash'] for a in accts_lst }
+    def fetchTableRows(conn, key):
+        code, scope, table = key
+        rows = getTableRows(conn, code, scope, table, page_size, table_row_limit, binary=abi_cache is not None)
+        if abi_cache is not None:
+            rows = abi_cache.decodeRows(code, code_hashes[code], table, rows, abiFetcher(conn, code))
+        progress.add(0, len(rows))
+        return rows
+    all_table_rows = pool.map(fetchTableRows, table_keys)
+
+    def fetchKVTableData(conn, nm):
+        kv_data = getKVTableData(conn, nm, page_size, table_row_limit)
+        progress.add(1, len(kv_data))
+        return kv_data
+    all_kv_data = dict(zip(fetch_names, pool.map(fetchKVTableData, fetch_names)))
+
+    i = 0
+    for a in accts_lst:
+        if a['name'] not in all_kv_data:
+            continue
+        a['tables'] = dict()
+        for scope in a['scopes']:
+            a['tables'][scope['scope'] + ":" + scope['table']] = all_table_rows[i]
+            i += 1
+        a['kv_tables'] = all_kv_data[a['name']]
+
+    return accts_lst, len(names) - len(fetch_names)
+
+
+# line-oriented audit format, used when the output file ends with '.jsonl'
+# every line is one record { "type": ..., "key": ..., "value": ... } and records are sorted by type
+# (in the order of RECORD_TYPES) and key, so two audits can be compared in one streaming merge-join pass
+RECORD_TYPES = ( "info", "account", "protocol_feature", "producer_schedule", "deferred_trx", "server_info_end" )
+RECORD_ORDER = { t: i for i, t in enumerate(RECORD_TYPES) }
+
+def isLineFormat(filepath):
+    return filepath.endswith(".jsonl")
+
+
+def recordSortKey(rec):
+    return (RECORD_ORDER[rec['type']], rec['key'])
+
+
+def makeRecord(recType, key, value):
+    return { 'type': recType, 'key': key, 'value': value }
+
+
+# generate the sorted records of an audit held in memory
+def auditRecords(data):
+    info = { 'scope_limit': data['scope_limit'], 'table_row_limit': data['table_row_limit'], 'server_info_begin': data['server_info_begin'] }
+    if 'snapshot' in data:
+        info['snapshot'] = data['snapshot']
+    yield makeRecord("info", "", info)
+    for a in sorted(data['accounts'], key=lambda a: a['name']):
+        yield makeRecord("account", a['name'], a)
+    for feat in sorted(data['activated_protocol_features'], key=lambda f: f['feature_digest']):
+        yield makeRecord("protocol_feature", feat['feature_digest'], feat)
+    yield makeRecord("producer_schedule", "", data['producer_schedule'])
+    for trx in sorted(data['deferred_transactions'], key=lambda t: t['trx_id']):
+        yield makeRecord("deferred_trx", trx['trx_id'], trx)
+    yield makeRecord("server_info_end", "", data['server_info_end'])
+
+
+# generate the sorted records of an audit file, '.jsonl' files are streamed
+def readAuditRecords(filepath):
+    if not isLineFormat(filepath):
+        with open(filepath, "r") as f:
+            data = json.loads(f.read())
+        yield from auditRecords(data)
+        return
+
+    lastKey = None
+    with open(filepath, "r") as f:
+        for line in f:
+            rec = json.loads(line)
+            sortKey = recordSortKey(rec)
+            if lastKey is not None and sortKey <= lastKey:
+                print(f"ERROR: '{filepath}' is not sorted, record {sortKey} follows {lastKey}", file=sys.stderr)
+                exit(1)
+            lastKey = sortKey
+            yield rec
+
+
+class PreviousAccounts:
+    """
+    Accounts of a previous audit for --incremental.  get() must be called with ascending account names,
+    which lets '.jsonl' audits be read forward instead of being loaded.
+    """
+    def __init__(self, filepath):
+        self.records = readAuditRecords(filepath)
+        self.info = next(self.records)['value']
+        self.current = self.nextAccount()
+
+    def nextAccount(self):
+        rec = next(self.records, None)
+        if rec is None or rec['type'] != "account":
+            return None
+        return rec
+
+    def matchesLimits(self, scope_limit, table_row_limit):
+        return self.info['scope_limit'] == scope_limit and self.info['table_row_limit'] == table_row_limit
+
+    def get(self, name):
+        while self.current is not None and self.current['key'] < name:
+            self.current = self.nextAccount()
+        if self.current is not None and self.current['key'] == name:
+            return self.current['value']
+        return None
+
+
+# load the accounts of a previous audit for --incremental
+# returns None if the audit was made with different limits and its table data cannot be reused
+def loadPreviousAccounts(filepath, scope_limit, table_row_limit):
+    prevAccts = PreviousAccounts(filepath)
+    if not prevAccts.matchesLimits(scope_limit, table_row_limit):
+        print(f"WARNING: '{filepath}' was made with scope-limit {prevAccts.info['scope_limit']} and table-row-limit {prevAccts.info['table_row_limit']}, "
+              "ignoring it and fetching all tables", file=sys.stderr)
+        return None
+    return prevAccts
+
+
+def removeIrrelevantServerInfo(inf):
+    for fld in SERVER_INFO_TRANSIENT_FIELDS:
+        inf.pop(fld, None)
 
-def compareAccountNames(ref, cmp):
-    mismatch = []
-    for nm in ref:
-        if nm not in cmp:
-            mismatch.append((nm, '(none)'))
-    for nm in cmp:
-        if nm not in ref:
-            mismatch.append(('(none)', nm))
-    return mismatch
 
+def removeIrrelevantAccount(a):
+    md = a["metadata"]
+    del md["head_block_num"]
+    del md["head_block_time"]
+    del md["last_code_update"]
+    del md["created"]
+    # not present in accounts audited from a snapshot
+    if "net_limit" in md:
+        del md["net_limit"]["last_usage_update_time"]
+        del md["cpu_limit"]["last_usage_update_time"]
 
-def compareAccountsField(ref, cmp, fieldName, subFieldName=None):
-    mismatches = []
-    for nm, ref_acct in ref.items():
-        if nm in cmp:
-            ref_v = ref_acct[fieldName]
-            if subFieldName is not None:
-                ref_v = ref_v[subFieldName]
-            cmp_v = cmp[nm][fieldName]
-            if subFieldName is not None:
-                cmp_v = cmp_v[subFieldName]
-            if ref_v != cmp_v:
-                mismatches.append((nm, ref_v, cmp_v))
-    return mismatches
 
+def removeIrrelevant(data):
+    removeIrrelevantServerInfo(data["server_info_begin"])
+    removeIrrelevantServerInfo(data["server_info_end"])
+    for a in data["accounts"]:
+        removeIrrelevantAccount(a)
 
-def compareServerInfo(ref, cmp):
+    for feat in data["activated_protocol_features"]:
+        del feat["activation_block_num"]
+
+
+# open filepath for writing, or when offset is given, reopen it and drop whatever was written after offset
+def openResumable(filepath, offset=None):
+    if offset is None:
+        return open(filepath, "w+t")
+    f = open(filepath, "r+t")
+    f.truncate(offset)
+    f.seek(offset)
+    return f
+
+
+class Checkpoint:
+    """
+    State of an online audit saved every interval seconds for '--resume': the accounts audited so far,
+    the name to continue get_all_accounts after, and the offsets of the output and report files holding
+    their data.  Saved to '<output>.ckpt/checkpoint.json', the directory is removed when the audit completes.
+    options holds the settings that change the audit data, a checkpoint only resumes with the same ones.
+    """
+    def __init__(self, output_filepath, interval, options):
+        self.dir = output_filepath + ".ckpt"
+        self.filepath = os.path.join(self.dir, "checkpoint.json")
+        self.interval = interval
+        self.options = options
+        self.lastSave = time.monotonic()
+
+    def create(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir)
+
+    # returns the saved state, exits if there is none or it was made with other options
+    def load(self):
+        if not os.path.exists(self.filepath):
+            print(f"ERROR: no checkpoint '{self.filepath}' to resume from", file=sys.stderr)
+            exit(1)
+        with open(self.filepath, "r") as f:
+            state = json.loads(f.read())
+        if state['options'] != self.options:
+            print(f"ERROR: checkpoint '{self.filepath}' was made with options {state['options']}, not {self.options}", file=sys.stderr)
+            exit(1)
+        return state
+
+    def due(self):
+        return time.monotonic() - self.lastSave >= self.interval
+
+    def save(self, state):
+        state = dict(state, options=self.options)
+        tmp_filepath = self.filepath + ".tmp"
+        with open(tmp_filepath, "wt") as f:
+            f.write(json.dumps(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filepath, self.filepath)
+        self.lastSave = time.monotonic()
+
+    def remove(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class AuditWriter:
+    """
+    Writes the audit as it is fetched.  For '.jsonl' output every record is written as one line when it
+    arrives and is not kept.  Any other output is collected and written as one JSON document on close().
+    With a checkpoint directory, collected accounts are also appended to a file there so that
+    checkpoint() and a resumed writer only need file offsets.
+    """
+    def __init__(self, filepath, keep_irrelevant, checkpoint_dir=None, resume_state=None):
+        self.filepath = filepath
+        self.keep_irrelevant = keep_irrelevant
+        self.lineFormat = isLineFormat(filepath)
+        self.lastKey = None
+        self.spool = None
+        if self.lineFormat:
+            self.f = openResumable(filepath, resume_state['offset'] if resume_state is not None else None)
+            if resume_state is not None:
+                self.lastKey = tuple(resume_state['last_key'])
+            return
+        self.data = { 'accounts': [] }
+        if checkpoint_dir is not None:
+            self.spool = openResumable(os.path.join(checkpoint_dir, "accounts.jsonl"), resume_state['offset'] if resume_state is not None else None)
+        if resume_state is not None:
+            self.data.update(resume_state['info'])
+            self.spool.seek(0)
+            for line in self.spool:
+                self.data['accounts'].append(json.loads(line))
+
+    def checkpoint(self):
+        if self.lineFormat:
+            self.f.flush()
+            return { 'offset': self.f.tell(), 'last_key': self.lastKey }
+        self.spool.flush()
+        info = { k: v for k, v in self.data.items() if k != 'accounts' }
+        return { 'offset': self.spool.tell(), 'info': info }
+
+    def writeRecord(self, recType, key, value):
+        rec = makeRecord(recType, key, value)
+        sortKey = recordSortKey(rec)
+        if self.lastKey is not None and sortKey <= self.lastKey:
+            print(f"ERROR: audit record {sortKey} written after {self.lastKey}", file=sys.stderr)
+            exit(1)
+        self.lastKey = sortKey
+        self.f.write(json.dumps(rec, sort_keys=True))
+        self.f.write("\n")
+
+    # snapshot: file name of the snapshot an offline audit was made from
+    def writeInfo(self, scope_limit, table_row_limit, server_info_begin, snapshot=None):
+        info = { 'scope_limit': scope_limit, 'table_row_limit': table_row_limit }
+        if snapshot is not None:
+            info['snapshot'] = snapshot
+        if not self.lineFormat:
+            self.data.update(info, server_info_begin=server_info_begin)
+            return
+        server_info_begin = dict(server_info_begin)
+        if not self.keep_irrelevant:
+            removeIrrelevantServerInfo(server_info_begin)
+        self.writeRecord("info", "", dict(info, server_info_begin=server_info_begin))
+
+    # the account is modified when irrelevant data is removed
+    def writeAccount(self, a):
+        if not self.lineFormat:
+            self.data['accounts'].append(a)
+            if self.spool is not None:
+                self.spool.write(json.dumps(a))
+                self.spool.write("\n")
+            return
+        if not self.keep_irrelevant:
+            removeIrrelevantAccount(a)
+        self.writeRecord("account", a['name'], a)
+
+    def writeTail(self, prot_feats, prod_sched, deferred_trx, server_info_end):
+        if not self.lineFormat:
+            self.data.update({ 'activated_protocol_features': prot_feats, 'producer_schedule': prod_sched,
+                               'deferred_transactions': deferred_trx, 'server_info_end': server_info_end })
+            return
+        for feat in sorted(prot_feats, key=lambda f: f['feature_digest']):
+            feat = dict(feat)
+            if not self.keep_irrelevant:
+                del feat["activation_block_num"]
+            self.writeRecord("protocol_feature", feat['feature_digest'], feat)
+        self.writeRecord("producer_schedule", "", prod_sched)
+        for trx in sorted(deferred_trx, key=lambda t: t['trx_id']):
+            self.writeRecord("deferred_trx", trx['trx_id'], trx)
+        server_info_end = dict(server_info_end)
+        if not self.keep_irrelevant:
+            removeIrrelevantServerInfo(server_info_end)
+        self.writeRecord("server_info_end", "", server_info_end)
+
+    def close(self):
+        if self.lineFormat:
+            self.f.close()
+            return
+        if self.spool is not None:
+            self.spool.close()
+        with open(self.filepath, "wt") as f:
+            if not self.keep_irrelevant:
+                removeIrrelevant(self.data)
+
+            f.write(json.dumps(self.data, sort_keys=True, indent=2))
+
+
+class AuditReport:
+    """
+    Human readable report written to stdout.  The per account sections are collected in temporary
+    files while accounts are fetched so accounts do not have to be kept in memory until the end.
+    With a checkpoint directory the files are kept there so a resumed audit can continue them.
+    """
+    SECTIONS = ( "code", "permissions", "tables", "kv_tables" )
+
+    def __init__(self, checkpoint_dir=None, resume_state=None):
+        for section in AuditReport.SECTIONS:
+            if checkpoint_dir is None:
+                f = tempfile.TemporaryFile("w+t")
+            else:
+                offset = resume_state['offsets'][section] if resume_state is not None else None
+                f = openResumable(os.path.join(checkpoint_dir, f"report_{section}.txt"), offset)
+            setattr(self, section, f)
+        self.anyTables = resume_state['any_tables'] if resume_state is not None else False
+
+    def checkpoint(self):
+        offsets = dict()
+        for section in AuditReport.SECTIONS:
+            f = getattr(self, section)
+            f.flush()
+            offsets[section] = f.tell()
+        return { 'offsets': offsets, 'any_tables': self.anyTables }
+
+    def addAccount(self, a):
+        m = a['metadata']
+        cr = m['created']
+        cr = cr[0:21]
+        lcu = m['last_code_update']
+        lcu = lcu[0:21]
+        print(f"{a['name']:13} | {m['privileged']:9} | {cr:21} | {lcu:21} | {a['code_hash']} ", file=self.code)
+
+        out = self.permissions
+        for p in m['permissions']:
+            print(f"{a['name']:13} | {p['perm_name']:13} | {p['parent']:13} | ", end="", file=out)
+            auth = p['required_auth']
+            print(f"{auth['threshold']}", end=" / [", file=out)
+            for k in auth['keys']:
+                print(f"({k['key']}, {k['weight']})", end=",", file=out)
+            print("] / [", end="", file=out)
+            for auth_a in auth['accounts']:
+                print(f"{auth_a}", end=",", file=out)
+            print("] / [", end="", file=out)
+            for auth_w in auth['waits']:
+                print(f"{auth_w}", end=",", file=out)
+            print("]", file=out)
+
+            print("     Linked Actions: ", end="", file=out)
+            if 'linked_actions' in p:
+                linked_acts = p['linked_actions']
+                if len(linked_acts) == 0:
+                    print("(None)", end="", file=out)
+                for l_act in linked_acts:
+                    # links to all actions of a contract have no action
+                    print(f'{l_act["account"]}::{l_act.get("action", "*")}, ', end="", file=out)
+                print(file=out)
+            else:
+                print('(Unkonwn)', file=out)
+
+        out = self.tables
+        for s in a['scopes']:
+            scope_table = s['scope'] + ":" + s['table']
+            print(f"{s['code']:13} | {scope_table:27}", end=" ", file=out)
+            tbl = a['tables'][scope_table]
+            print('[', end="", file=out)
+            for v in tbl:
+                print(v, end=", ", file=out)
+            print(']', file=out)
+            self.anyTables = True
+
+        out = self.kv_tables
+        print(f"{a['name']:13}", end="", file=out)
+        print("[", end="", file=out)
+        for v in a['kv_tables']:
+            print(v, end=", ", file=out)
+        print(']', file=out)
+
+    @staticmethod
+    def copyOut(f):
+        sys.stdout.flush()
+        f.seek(0)
+        shutil.copyfileobj(f, sys.stdout)
+        f.close()
+
+    def printReport(self, server_info_begin, server_info_end, prod_sched, prot_feats, deferred_trx):
+        try:
+            print("                          EOSIO BLOCKCHAIN AUDIT RESULTS\n")
+            print(f"             Server Version: {server_info_begin['server_full_version_string']}")
+            print(f"                   Chain ID: {server_info_begin['chain_id']}")
+            print(f"    Start Head Block / Time: {server_info_begin['head_block_num']} / {server_info_begin['head_block_time']}")
+            print(f"      End Head Block / Time: {server_info_end['head_block_num']} / {server_info_end['head_block_time']}")
+            print()
+            print("     ======  ACCOUNTS CODE ======")
+            print("Name            Privilege    Created                Last Code Update            Code Hash                     ")
+            print("---------------------------------------------------------------------------------------------------------")
+            AuditReport.copyOut(self.code)
+
+            print("\n\n     ======  ACCOUNT PERMISSIONS AND PERMISSION LINKS ======")
+            print("Accoount        Perm Name       Parent         Auth Threshold / [(Key, Weight)..] / Accounts / Waits               ")
+            print("-------------------------------------------------------------------------------------------------------------------")
+            AuditReport.copyOut(self.permissions)
+
+            for s in ('active', 'pending', 'proposed'):
+                sched = prod_sched[s]
+                print(f"\n\n     ====== {s.upper()} PRODUCER SCHEDULE ======")
+                if sched is None:
+                    print("---------------------------------------------------------------------------------------------------------")
+                    print(" (None)")
+                    continue
+                print(f"Version: {sched['version']}")
+                print("Producer Name    Authority  Data Type / Threshold / [ (key, weight), ...] ")
+                print("---------------------------------------------------------------------------------------------------------")
+                for p in sched['producers']:
+                    print(f"{p['producer_name']:15} | ", end="")
+                    auth = p['authority']
+                    if auth[0] != 0:
+                        print(f"ERROR: known block signing authority type expected 0, got {auth[0]}")
+                        continue
+                    a = auth[1]
+                    keys = a["keys"]
+                    keys_str = ""
+                    for k in keys:
+                        keys_str += " (" + k['key'] + ", " + str(k['weight']) + "),"
+
+                    print(f"{auth[0]} / {a['threshold']} / [{keys_str}] ")
+
+            print("\n\n     ====== ACTIVATED PROTOCOL FEATURES ======")
+            print("---------------------------------------------------------------------------------------------------------")
+            if len(prot_feats) == 0:
+                print(" (None)")
+            else:
+                for feat in prot_feats:
+                    print(feat)
+
+            print("\n\n     ====== MULTI-INDEX TABLES ======")
+            print("Account        Scope:Table                  Values")
+            print("---------------------------------------------------------------------------------------------------------")
+            AuditReport.copyOut(self.tables)
+            if not self.anyTables:
+                print("(None)")
+
+            print("\n\n     ====== KV TABLES ======")
+            print("Account        Data")
+            print("---------------------------------------------------------------------------------------------------------")
+            AuditReport.copyOut(self.kv_tables)
+
+            print("\n\n     ====== DEFERRED TRANSACTIONS ======")
+            print("---------------------------------------------------------------------------------------------------------")
+            if len(deferred_trx) == 0:
+                print("(None)")
+            else:
+                for trx in deferred_trx:
+                    print(trx)
+
+            print("\nFULL SERVER INFO:\n")
+            for k, v in server_info_end.items():
+                print(f"{k:>30} : {v}")
+
+        except Exception as e:
+            print("\n\n***** exception occured when outputting tables *****")
+            print(e)
+            raise e
+
+
+def compareAccounts(ref, cmp, mismatches):
+    nm = ref['name']
+    for category, fieldName, subFieldName in (('accounts_privilege', 'metadata', 'privileged'),
+                                              ('accounts_hash', 'code_hash', None),
+                                              ('accounts_scopes', 'scopes', None),
+                                              ('accounts_tables', 'tables', None),
+                                              ('accounts_kv_tables', 'kv_tables', None),
+                                              ('accounts_permissions', 'metadata', 'permissions')):
+        ref_v = ref[fieldName]
+        cmp_v = cmp[fieldName]
+        if subFieldName is not None:
+            ref_v = ref_v[subFieldName]
+            cmp_v = cmp_v[subFieldName]
+        if ref_v != cmp_v:
+            mismatches[category].append((nm, ref_v, cmp_v))
+
+
+# fields a snapshot does not hold, not compared when one of the audits was made from a snapshot
+SNAPSHOT_MISSING_SERVER_INFO_FIELDS = ( 'server_version', 'virtual_block_cpu_limit', 'virtual_block_net_limit', 'block_cpu_limit',
+    'block_net_limit', 'server_version_string', 'server_full_version_string' )
+SNAPSHOT_MISSING_FEATURE_FIELDS = ( 'description_digest', 'dependencies', 'protocol_feature_type', 'specification' )
+
+def compareServerInfo(ref, cmp, fromSnapshot=False):
     fields = ('server_version', 'chain_id', 'head_block_producer', 'virtual_block_cpu_limit',
               'virtual_block_net_limit', 'block_cpu_limit', 'block_net_limit', 'server_version_string',
               'server_full_version_string')
     mismatches = []
     for f in fields:
+        if fromSnapshot and f in SNAPSHOT_MISSING_SERVER_INFO_FIELDS:
+            continue
         if f in ref and f not in cmp:
             mismatches.append((f, ref[f], None))
         elif f in cmp and f not in ref:
@@ -269,25 +1211,16 @@ def compareServerInfo(ref, cmp):
     return mismatches
 
 
-def compareProtocolFeatures(ref, cmp):
+def compareProtocolFeature(digest, ref_feat, cmp_feat, fromSnapshot=False):
     fieldNames = ('feature_digest', 'activation_ordinal', 'description_digest', 'dependencies',
                   'protocol_feature_type', 'specification')
     mismatches = []
-    for digest, ref_feat in ref.items():
-        if digest in cmp:
-            cmp_feat = cmp[digest]
-            for f in fieldNames:
-                if ref_feat[f] != cmp_feat[f]:
-                    mismatches.append((f"digest '{digest}' field '{f}'", ref_feat[f], cmp_feat[f]))
-        else:
-            mismatches.append(('digest', digest, '(none)'))
-    return mismatches
-
-
-def compareDeferredTrx(ref, cmp):
-    mismatches = []
-    if ref != cmp:
-        mismatches.append("transactions", ref, cmp)
+    for f in fieldNames:
+        # features audited from a snapshot only have the digest and activation data
+        if fromSnapshot and f in SNAPSHOT_MISSING_FEATURE_FIELDS:
+            continue
+        if ref_feat.get(f) != cmp_feat.get(f):
+            mismatches.append((f"digest '{digest}' field '{f}'", ref_feat.get(f), cmp_feat.get(f)))
     return mismatches
 
 
@@ -299,35 +1232,61 @@ def compareProduceSchedules(ref, cmp):
     return mismatches
 
 
-def compareRefData(refData, cmpData):
-    # build dictionary of account names to ease in comparison
-    refAccts = dict()
-    for a in refData['accounts']:
-        refAccts[a['name']] = a
-    cmpAccts = dict()
-    for a in cmpData['accounts']:
-        cmpAccts[a['name']] = a
+# pair up the records of two sorted record streams, yields (ref, cmp) with None for a record missing on one side
+def mergeJoin(refRecords, cmpRecords):
+    ref = next(refRecords, None)
+    cmp = next(cmpRecords, None)
+    while ref is not None or cmp is not None:
+        if cmp is None or (ref is not None and recordSortKey(ref) < recordSortKey(cmp)):
+            yield ref, None
+            ref = next(refRecords, None)
+        elif ref is None or recordSortKey(cmp) < recordSortKey(ref):
+            yield None, cmp
+            cmp = next(cmpRecords, None)
+        else:
+            yield ref, cmp
+            ref = next(refRecords, None)
+            cmp = next(cmpRecords, None)
 
-    # build dictionary of feature digest to protocol feature
-    refProtFeats = dict()
-    for feat in refData['activated_protocol_features']:
-        refProtFeats[feat['feature_digest']] = feat
-    cmpProtFeats = dict()
-    for feat in cmpData['activated_protocol_features']:
-        cmpProtFeats[feat['feature_digest']] = feat
 
+def compareRefData(refRecords, cmpRecords):
     mismatches = dict()
-    mismatches['account_names'] = compareAccountNames(refAccts, cmpAccts)
-    mismatches['accounts_privilege'] = compareAccountsField(refAccts, cmpAccts, 'metadata', 'privileged')
-    mismatches['accounts_hash'] = compareAccountsField(refAccts, cmpAccts, 'code_hash')
-    mismatches['accounts_scopes'] = compareAccountsField(refAccts, cmpAccts, 'scopes')
-    mismatches['accounts_tables'] = compareAccountsField(refAccts, cmpAccts, 'tables')
-    mismatches['accounts_kv_tables'] = compareAccountsField(refAccts, cmpAccts, 'kv_tables')
-    mismatches['accounts_permissions'] = compareAccountsField(refAccts, cmpAccts, 'metadata', 'permissions')
-    mismatches['producer_schedule'] = compareProduceSchedules(refData['producer_schedule'], cmpData['producer_schedule'])
-    mismatches['deferred_trx'] = compareDeferredTrx(refData['deferred_transactions'], cmpData['deferred_transactions'])
-    mismatches['server_info'] = compareServerInfo(refData['server_info_begin'], cmpData['server_info_begin'])
-    mismatches['protocol_features'] = compareProtocolFeatures(refProtFeats, cmpProtFeats)
+    for k in ('account_names', 'accounts_privilege', 'accounts_hash', 'accounts_scopes', 'accounts_tables',
+              'accounts_kv_tables', 'accounts_permissions', 'producer_schedule', 'deferred_trx', 'server_info',
+              'protocol_features'):
+        mismatches[k] = []
+
+    # the info record comes first, it tells whether either audit was made from a snapshot
+    fromSnapshot = False
+    for ref, cmp in mergeJoin(refRecords, cmpRecords):
+        recType = ref['type'] if ref is not None else cmp['type']
+        key = ref['key'] if ref is not None else cmp['key']
+        ref_v = ref['value'] if ref is not None else '(none)'
+        cmp_v = cmp['value'] if cmp is not None else '(none)'
+        if recType == "account":
+            if ref is None or cmp is None:
+                mismatches['account_names'].append(('name', key if ref is not None else '(none)', key if cmp is not None else '(none)'))
+            else:
+                compareAccounts(ref_v, cmp_v, mismatches)
+        elif recType == "protocol_feature":
+            if ref is None or cmp is None:
+                mismatches['protocol_features'].append(('digest', key if ref is not None else '(none)', key if cmp is not None else '(none)'))
+            else:
+                mismatches['protocol_features'].extend(compareProtocolFeature(key, ref_v, cmp_v, fromSnapshot))
+        elif recType == "producer_schedule":
+            if ref is None or cmp is None:
+                mismatches['producer_schedule'].append(('schedule', ref_v, cmp_v))
+            else:
+                mismatches['producer_schedule'].extend(compareProduceSchedules(ref_v, cmp_v))
+        elif recType == "deferred_trx":
+            if ref_v != cmp_v:
+                mismatches['deferred_trx'].append((key, ref_v, cmp_v))
+        elif recType == "info":
+            if ref is None or cmp is None:
+                mismatches['server_info'].append(('server_info_begin', ref_v, cmp_v))
+            else:
+                fromSnapshot = 'snapshot' in ref_v or 'snapshot' in cmp_v
+                mismatches['server_info'].extend(compareServerInfo(ref_v['server_info_begin'], cmp_v['server_info_begin'], fromSnapshot))
 
     isSame = True
     for k, v in mismatches.items():
@@ -342,24 +1301,334 @@ def compareRefData(refData, cmpData):
         print("Reference comparison FAILURE - see errors above.", file=sys.stderr)
     return isSame
 
-def removeIrrelevant(data):
-    inf_begin = data["server_info_begin"]
-    inf_end = data["server_info_end"]
-    for fld in SERVER_INFO_TRANSIENT_FIELDS:
-        del inf_begin[fld]
-        del inf_end[fld]
-    accts = data["accounts"]
-    for a in accts:
-        md = a["metadata"]
-        del md["head_block_num"]
-        del md["head_block_time"]
-        del md["last_code_update"]
-        del md["created"]
-        del md["net_limit"]["last_usage_update_time"]
-        del md["cpu_limit"]["last_usage_update_time"]
 
-    for feat in data["activated_protocol_features"]:
-        del feat["activation_block_num"]
+# audit a live nodeos over RPC, accounts are passed to the writer and report as they are fetched
+# with a checkpoint, progress is saved after pages of accounts and resume_state continues from a saved one
+# returns (server_info_begin, server_info_end, prod_sched, prot_feats, deferred_trx)
+def auditNode(rpc_endpt, writer, report, page_size, scope_limit, table_row_limit, concurrency, incremental_filepath, abi_cache=None,
+              checkpoint=None, resume_state=None):
+    # establish connection to nodeos
+    conn = http.client.HTTPConnection(rpc_endpt)
+
+    last_account = ""
+    numDone = 0
+    numReused = 0
+    if resume_state is not None:
+        server_info_begin = resume_state['server_info_begin']
+        last_account = resume_state['last_account']
+        numDone = resume_state['accounts_done']
+        numReused = resume_state['accounts_reused']
+        print(f"resuming after {numDone} accounts, at '{last_account}'", file=sys.stderr)
+    else:
+        # get the server info
+        server_info_begin = getJSONResp(conn, "/v1/chain/get_info")
+
+    # get all accounts on the chain
+    all_accts, numAccounts = getAllAccounts(conn, page_size, last_account)
+    numAccounts += numDone
+    if numAccounts == 0:
+        print("Error, no accounts returned from get_all_accounts!", file=sys.stderr)
+        exit(1)
+
+    prev_accts = None
+    if incremental_filepath != "":
+        prev_accts = loadPreviousAccounts(incremental_filepath, scope_limit, table_row_limit)
+
+    if resume_state is None:
+        writer.writeInfo(scope_limit, table_row_limit, server_info_begin)
+
+    def saveCheckpoint():
+        checkpoint.save({ 'server_info_begin': server_info_begin, 'last_account': last_account,
+                          'accounts_done': numDone, 'accounts_reused': numReused,
+                          'writer': writer.checkpoint(), 'report': report.checkpoint() })
+
+    pool = FetchPool(rpc_endpt, concurrency)
+    progress = PhaseProgress("fetching accounts, code hashes, scopes and tables...", numAccounts, numDone)
+    for accts in all_accts:
+        names = [a['name'] for a in accts]
+        audited, reused = auditAccounts(pool, names, page_size, scope_limit, table_row_limit, progress, prev_accts, abi_cache)
+        for a in audited:
+            report.addAccount(a)
+            writer.writeAccount(a)
+        numReused += reused
+        numDone += len(names)
+        last_account = names[-1]
+        if checkpoint is not None and checkpoint.due():
+            saveCheckpoint()
+    pool.shutdown()
+    progress.finish()
+    if checkpoint is not None:
+        saveCheckpoint()
+    if prev_accts is not None:
+        print(f"reused table data of {numReused}/{numAccounts} accounts from '{incremental_filepath}'", file=sys.stderr)
+
+    prod_sched = getJSONResp(conn, "/v1/chain/get_producer_schedule")
+
+    prot_feats = getJSONResp(conn, "/v1/chain/get_activated_protocol_features")
+    prot_feats = prot_feats['activated_protocol_features']
+
+    # get deferred transactions
+    limit = page_size
+    progress = PhaseProgress("fetching deferred transactions...")
+    req_body = '{ "json":true, ' + f'"limit":{limit}' + '}'
+    trx = getJSONResp(conn, "/v1/chain/get_scheduled_transactions", req_body, exitOnError=False)
+    deferred_trx = []
+    deferred_trx.extend(trx['transactions'])
+    progress.add(len(trx['transactions']), len(trx['transactions']))
+    while 'more' in trx and len(trx['more']) > 0:
+        more_trx = trx["more"]
+        req_body = '{"json":true, ' + f'"limit":{limit}, "more":"{more_trx}"' + '}'
+
+        trx = getJSONResp(conn, "/v1/chain/get_scheduled_transactions", req_body, exitOnError=False)
+        deferred_trx.extend(trx['transactions'])
+        progress.add(len(trx['transactions']), len(trx['transactions']))
+    progress.finish()
+
+    # get the server info again
+    server_info_end = getJSONResp(conn, "/v1/chain/get_info")
+
+    # get all accounts again
+    all_accts_end, numAccounts_end = getAllAccounts(conn, page_size)
+    if numAccounts != numAccounts_end:
+        msg = f"ERROR: Accounts added during audit. begin= {numAccounts} end= {numAccounts_end}"
+        print(msg, file=sys.stderr)
+
+    if server_info_begin['head_block_num'] != server_info_end['head_block_num']:
+        print("WARNING: Audit data was collected from different blocks.  Data may be inconssitent.", file=sys.stderr)
+
+    return server_info_begin, server_info_end, prod_sched, prot_feats, deferred_trx
+
+
+SNAPSHOT_SECTION_PREFIX = "eosio::chain::"
+PRIVILEGED_FLAG = 1
+
+# convert a binary snapshot with 'nodeos --snapshot-to-json', returns the path of the JSON snapshot
+def snapshotToJson(filepath, nodeos_path):
+    with open(filepath, "rb") as f:
+        if f.read(1) == b"{":
+            return filepath
+    json_filepath = filepath + ".json"
+    if os.path.exists(json_filepath):
+        if os.path.getmtime(json_filepath) >= os.path.getmtime(filepath):
+            print(f"using existing JSON snapshot '{json_filepath}'", file=sys.stderr)
+            return json_filepath
+        print(f"removing JSON snapshot '{json_filepath}', it is older than '{filepath}'", file=sys.stderr)
+        os.remove(json_filepath)
+    print(f"converting '{filepath}' to JSON with '{nodeos_path}'...", file=sys.stderr)
+    result = subprocess.run([nodeos_path, "--snapshot-to-json", filepath], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0 or not os.path.exists(json_filepath):
+        print(f"ERROR: failed to convert snapshot '{filepath}' to JSON", file=sys.stderr)
+        print(result.stderr.decode("utf-8"), file=sys.stderr)
+        exit(1)
+    return json_filepath
+
+
+# generate (section name, rows) for each section of a JSON snapshot written by 'nodeos --snapshot-to-json'
+# the writer puts one row per line, so rows are parsed one at a time as the caller iterates them
+def snapshotSections(filepath):
+    with open(filepath, "r") as f:
+        def sectionRows():
+            for line in f:
+                line = line.rstrip("\n")
+                if line == "],":
+                    return
+                yield json.loads(line[1:] if line.startswith(",") else line)
+
+        for line in f:
+            line = line.rstrip("\n")
+            if not (line.startswith(',"') and line.endswith('":{')):
+                continue
+            name = json.loads(line[1:-2])
+            if f.readline().rstrip("\n") != '"rows":[':
+                print(f"ERROR: section '{name}' of snapshot '{filepath}' does not start with rows", file=sys.stderr)
+                exit(1)
+            rows = sectionRows()
+            yield name, rows
+            # skip whatever the caller did not read
+            for _ in rows:
+                pass
+
+
+def bytesToHex(b64):
+    return base64.b64decode(b64).hex()
+
+
+class TableSpool:
+    """
+    Holds the MI table previews and KV rows read from a snapshot in a temporary file.  The snapshot stores
+    tables in creation order, so only (scope, table, offset) per table is kept in memory to emit them per account.
+    """
+    def __init__(self):
+        self.f = tempfile.TemporaryFile("w+t")
+        self.tables = dict()
+        self.kv_rows = dict()
+
+    def write(self, obj):
+        offset = self.f.tell()
+        self.f.write(json.dumps(obj))
+        self.f.write("\n")
+        return offset
+
+    def read(self, offset):
+        self.f.seek(offset)
+        obj = json.loads(self.f.readline())
+        self.f.seek(0, os.SEEK_END)
+        return obj
+
+    def addTable(self, scope_row, rows):
+        offset = self.write({ 'scope_row': scope_row, 'rows': rows })
+        self.tables.setdefault(scope_row['code'], []).append((scope_row['scope'], scope_row['table'], offset))
+
+    def addKVRow(self, contract, row):
+        self.kv_rows.setdefault(contract, []).append(self.write(row))
+
+    # returns the scope rows sorted like get_table_by_scope, and the rows of each scope:table
+    def getTables(self, code, scope_limit):
+        tables = sorted(self.tables.get(code, []))
+        if scope_limit > 0:
+            tables = tables[:scope_limit]
+        scopes = []
+        table_rows = dict()
+        for scope, table, offset in tables:
+            entry = self.read(offset)
+            scopes.append(entry['scope_row'])
+            table_rows[scope + ":" + table] = entry['rows']
+        return scopes, table_rows
+
+    def getKVRows(self, contract):
+        return [self.read(offset) for offset in self.kv_rows.get(contract, [])]
+
+
+# read the contract_tables section: each table_id row is followed by a size row and that many data rows
+# for the primary index and then for each secondary index; only primary rows are kept, as get_table_rows would return
+def spoolContractTables(rows, spool, table_row_limit):
+    scope_row = None
+    table_rows = []
+    remaining = None
+    for row in rows:
+        if isinstance(row, dict) and 'code' in row and 'scope' in row and 'table' in row:
+            if scope_row is not None:
+                spool.addTable(scope_row, table_rows)
+            scope_row = { 'code': row['code'], 'scope': row['scope'], 'table': row['table'], 'payer': row['payer'], 'count': row['count'] }
+            table_rows = []
+            remaining = None
+        elif scope_row is None:
+            continue
+        elif remaining is None:
+            remaining = int(row)
+        elif remaining > 0:
+            if table_row_limit == 0 or len(table_rows) < table_row_limit:
+                table_rows.append(bytesToHex(row['value']))
+            remaining -= 1
+    if scope_row is not None:
+        spool.addTable(scope_row, table_rows)
+
+
+# audit a snapshot file without a running node, accounts are passed to the writer and report in name order
+# MI table rows are the hex encoded row data, as get_table_rows returns them with "json":false, unless abi_cache is given to decode them
+# returns (server_info_begin, server_info_end, prod_sched, prot_feats, deferred_trx)
+def auditSnapshot(filepath, nodeos_path, writer, report, scope_limit, table_row_limit, abi_cache=None):
+    json_filepath = snapshotToJson(filepath, nodeos_path)
+
+    accounts = dict()
+    permissions = dict()
+    links = dict()
+    spool = TableSpool()
+    block_state = None
+    gpo = None
+    prot_feats = []
+    deferred_trx = []
+
+    print(f"reading snapshot '{json_filepath}'...", file=sys.stderr)
+    for name, rows in snapshotSections(json_filepath):
+        print(f"  {name}", file=sys.stderr)
+        if name.startswith(SNAPSHOT_SECTION_PREFIX):
+            name = name[len(SNAPSHOT_SECTION_PREFIX):]
+        if name == "block_state":
+            block_state = next(rows)
+        elif name == "global_property_object":
+            gpo = next(rows)
+        elif name == "protocol_state_object":
+            state = next(rows)
+            for i, feat in enumerate(state['activated_protocol_features']):
+                prot_feats.append({ 'feature_digest': feat['feature_digest'], 'activation_ordinal': i,
+                                    'activation_block_num': feat['activation_block_num'] })
+        elif name == "account_object":
+            for row in rows:
+                accounts[row['name']] = { 'created': row['creation_date'] }
+                if abi_cache is not None and row['abi'] != "":
+                    accounts[row['name']]['abi_offset'] = spool.write(row['abi'])
+        elif name == "account_metadata_object":
+            for row in rows:
+                acct = accounts.setdefault(row['name'], { 'created': None })
+                acct['code_hash'] = row['code_hash']
+                acct['last_code_update'] = row['last_code_update']
+                acct['privileged'] = (int(row['flags']) & PRIVILEGED_FLAG) != 0
+        elif name == "permission_object":
+            for row in rows:
+                if row['owner'] == "":
+                    continue
+                permissions.setdefault(row['owner'], []).append({ 'perm_name': row['name'], 'parent': row['parent'],
+                                                                  'required_auth': row['auth'] })
+        elif name == "permission_link_object":
+            for row in rows:
+                link = { 'account': row['code'] }
+                if row['message_type'] != "":
+                    link['action'] = row['message_type']
+                links.setdefault((row['account'], row['required_permission']), []).append(link)
+        elif name == "generated_transaction_object":
+            for row in rows:
+                trx = dict(row)
+                trx['packed_trx'] = bytesToHex(row['packed_trx'])
+                deferred_trx.append(trx)
+        elif name == "kv_object":
+            for row in rows:
+                spool.addKVRow(row['contract'], { 'key': bytesToHex(row['kv_key']), 'value': bytesToHex(row['kv_value']), 'payer': row['payer'] })
+        elif name == "contract_tables":
+            spoolContractTables(rows, spool, table_row_limit)
+
+    if block_state is None or gpo is None:
+        print(f"ERROR: snapshot '{json_filepath}' has no block_state or global_property_object section", file=sys.stderr)
+        exit(1)
+
+    header = block_state['header']
+    server_info = { 'server_full_version_string': f"(offline audit of {os.path.basename(filepath)})",
+                    'chain_id': gpo['chain_id'], 'head_block_num': block_state['block_num'], 'head_block_id': block_state['id'],
+                    'head_block_time': header['timestamp'], 'head_block_producer': header['producer'],
+                    'last_irreversible_block_num': block_state['dpos_irreversible_blocknum'] }
+    writer.writeInfo(scope_limit, table_row_limit, server_info, os.path.basename(filepath))
+
+    pending = block_state['pending_schedule']['schedule']
+    prod_sched = { 'active': block_state['active_schedule'],
+                   'pending': pending if len(pending['producers']) > 0 else None,
+                   'proposed': gpo['proposed_schedule'] if gpo.get('proposed_schedule_block_num') is not None and
+                                                           len(gpo['proposed_schedule']['producers']) > 0 else None }
+
+    for nm in sorted(accounts.keys()):
+        acct = accounts[nm]
+        perms = sorted(permissions.get(nm, []), key=lambda p: p['perm_name'])
+        for p in perms:
+            p['linked_actions'] = links.get((nm, p['perm_name']), [])
+        metadata = { 'account_name': nm, 'head_block_num': block_state['block_num'], 'head_block_time': header['timestamp'],
+                     'privileged': acct['privileged'], 'last_code_update': acct['last_code_update'],
+                     'created': acct['created'], 'permissions': perms }
+        scopes, tables = spool.getTables(nm, scope_limit)
+        if abi_cache is not None:
+            def fetchAbi():
+                if 'abi_offset' not in acct:
+                    return None
+                return decodeAbiDef(base64.b64decode(spool.read(acct['abi_offset'])))
+            for s in scopes:
+                key = s['scope'] + ":" + s['table']
+                tables[key] = abi_cache.decodeRows(nm, acct['code_hash'], s['table'], tables[key], fetchAbi)
+        kv_tables = spool.getKVRows(nm)
+        if table_row_limit > 0:
+            kv_tables = kv_tables[:table_row_limit]
+        a = { 'name': nm, 'metadata': metadata, 'code_hash': acct['code_hash'], 'scopes': scopes, 'tables': tables, 'kv_tables': kv_tables }
+        report.addAccount(a)
+        writer.writeAccount(a)
+
+    return server_info, dict(server_info), prod_sched, prot_feats, deferred_trx
 
 
 if __name__ == "__main__":
@@ -372,7 +1641,14 @@ if __name__ == "__main__":
                 "--ref" : ("reference-filepath", ""),
         "--scope-limit" : ("scope-limit", 0),
     "--table-row-limit" : ("table-row-limit", 0),
-    "--keep-irrelevant" : ("keep-irrelevant", None)
+    "--keep-irrelevant" : ("keep-irrelevant", None),
+        "--concurrency" : ("concurrency", 4),
+        "--incremental" : ("incremental-filepath", ""),
+           "--snapshot" : ("snapshot-filepath", ""),
+             "--nodeos" : ("nodeos-path", "nodeos"),
+      "--client-decode" : ("client-decode", None),
+             "--resume" : ("resume", None),
+"--checkpoint-interval" : ("checkpoint-interval", 0)
                   }
 
     # parse options
@@ -392,6 +1668,13 @@ if __name__ == "__main__":
     ref_filepath = optionsMap['reference-filepath']
     comp_filepath = optionsMap['comp-filepath']
     keep_irrelevant = optionsMap['keep-irrelevant']
+    concurrency = optionsMap['concurrency']
+    incremental_filepath = optionsMap['incremental-filepath']
+    snapshot_filepath = optionsMap['snapshot-filepath']
+    nodeos_path = optionsMap['nodeos-path']
+    abi_cache = AbiCache() if optionsMap['client-decode'] else None
+    resume = optionsMap['resume']
+    checkpoint_interval = optionsMap['checkpoint-interval']
 
     if scope_limit < 0:
         print("scope-limit must be >= 0")
@@ -400,263 +1683,67 @@ if __name__ == "__main__":
     if table_row_limit < 0:
         print("scope-limit must be >= 0")
         print(USAGE)
+    if concurrency <= 0:
+        print("concurrency must be > 0")
+        print(USAGE)
+        exit(1)
+    if snapshot_filepath != "" and incremental_filepath != "":
+        print("'--incremental' option cannot be used with '--snapshot' option", file=sys.stderr)
+        exit(1)
+    if checkpoint_interval < 0:
+        print("checkpoint-interval must be >= 0")
+        print(USAGE)
+        exit(1)
+    if resume and snapshot_filepath != "":
+        print("'--resume' option cannot be used with '--snapshot' option", file=sys.stderr)
+        exit(1)
+    if resume and checkpoint_interval == 0:
+        checkpoint_interval = 60
 
     if comp_filepath != "":
         if ref_filepath == "":
             print("'--comp 'option must be used in combination with '--ref' option", file=sys.stderr)
             exit(1)
-        fComp = open(comp_filepath, "r")
-        s = fComp.read()
-        cmpData = json.loads(s)
-        fRef = open(ref_filepath, "r")
-        s = fRef.read()
-        refData = json.loads(s)
-        compSuccess = compareRefData(refData, cmpData)
+        compSuccess = compareRefData(readAuditRecords(ref_filepath), readAuditRecords(comp_filepath))
         if compSuccess:
             exit(0)
         exit(1)
 
-    # establish connection to nodeos
-    conn = http.client.HTTPConnection(rpc_endpt)
-
-    # get the server info
-    server_info_begin = getJSONResp(conn, "/v1/chain/get_info")
-
-    # get all accounts on the chain
-    all_accts, numAccounts = getAllAccounts(conn, page_size)
-    if numAccounts == 0:
-        print("Error, no accounts returned from get_all_accounts!", file=sys.stderr)
-        exit(1)
-
-    print('\nfetching account metadata and code hashes... ', end="", file=sys.stderr)
-    accts_lst = []
-    i = 0
-    print(f"############# {i:8}/{numAccounts:8}", end="", file=sys.stderr)
-    for accts in all_accts:
-        for a in accts:
-            i += 1
-            nm = a['name']
-            print("\b"*31, end="", file=sys.stderr)
-            print(f"{nm:13} {i:8}/{numAccounts:8}", end="", file=sys.stderr, flush=True)
-
-            e = { 'name' : nm }
-            req_body = '{ "account_name": "' + nm + '" }'
-            metadata = getJSONResp(conn, "/v1/chain/get_account", req_body)
-
-            e['metadata'] = metadata
-
-            # get code hash of account
-            code_hash = getJSONResp(conn, "/v1/chain/get_code_hash", req_body)
-            e['code_hash'] = code_hash['code_hash']
-
-            accts_lst.append(e)
-
-    print("\nfetching scopes and tables... ", end="", file=sys.stderr)
-    print(f"############# {i:8}/{numAccounts:8}", end="", file=sys.stderr)
-    i = 0
-    for a in accts_lst:
-        # get scopes and tables
-        nm = a['name']
-        print("\b"*31, end="", file=sys.stderr)
-        print(f"{nm:13} {i:8}/{numAccounts:8}", end="", file=sys.stderr, flush=True)
-        i += 1
-
-        scopes = getScopes(conn, nm, page_size, scope_limit)
-
-        a['scopes'] = scopes
-        a['tables'] = dict()
-        for scope in scopes:
-            sc = scope['scope']
-            tbl = scope['table']
-
-            table_rows = getTableRows(conn, nm, sc, tbl, page_size, table_row_limit)
-
-            a['tables'][sc + ":" + tbl] = table_rows
-
-        kv_data = getKVTableData(conn, nm, page_size, table_row_limit)
-        a['kv_tables'] = kv_data
-
-    data = {'accounts' : accts_lst, 'scope_limit' : scope_limit, 'table_row_limit' : table_row_limit }
-    print(file=sys.stderr)
-
-    prod_sched = getJSONResp(conn, "/v1/chain/get_producer_schedule")
-    data['producer_schedule'] = prod_sched
-
-    prot_feats = getJSONResp(conn, "/v1/chain/get_activated_protocol_features")
-    prot_feats = prot_feats['activated_protocol_features']
-    data['activated_protocol_features'] = prot_feats
-
-    # get deferred transactions
-    limit = page_size
-    req_body = '{ "json":true, ' + f'"limit":{limit}' + '}'
-    trx = getJSONResp(conn, "/v1/chain/get_scheduled_transactions", req_body, exitOnError=False)
-    deferred_trx = []
-    deferred_trx.extend(trx['transactions'])
-    while 'more' in trx and len(trx['more']) > 0:
-        deferred_trx.extend(trx['transactions'])
-        more_trx = trx["more"]
-        req_body = '{"json":true, ' + f'"limit":{limit}, "more":"{more_trx}"' + '}'
-
-        trx = getJSONResp(conn, "/v1/chain/get_scheduled_transactions", req_body, exitOnError=False)
-
-    data['deferred_transactions'] = deferred_trx
-
-    # get the server info again
-    server_info_end = getJSONResp(conn, "/v1/chain/get_info")
-
-    data['server_info_begin'] = server_info_begin
-    data['server_info_end'] = server_info_end
-
-    # get all accounts again
-    all_accts_end, numAccounts_end = getAllAccounts(conn, page_size)
-    print(file=sys.stderr)
-    if numAccounts != numAccounts_end:
-        msg = f"ERROR: Accounts added during audit. begin= {numAccounts} end= {numAccounts_end}"
-        print(msg, file=sys.stderr)
-
-    if server_info_begin['head_block_num'] != server_info_end['head_block_num']:
-        print("WARNING: Audit data was collected from different blocks.  Data may be inconssitent.", file=sys.stderr)
-
-    # print out results
-    try:
-        print("                          EOSIO BLOCKCHAIN AUDIT RESULTS\n")
-        print(f"             Server Version: {server_info_begin['server_full_version_string']}")
-        print(f"                   Chain ID: {server_info_begin['chain_id']}")
-        print(f"    Start Head Block / Time: {server_info_begin['head_block_num']} / {server_info_begin['head_block_time']}")
-        print(f"      End Head Block / Time: {server_info_end['head_block_num']} / {server_info_end['head_block_time']}")
-        print()
-        print("     ======  ACCOUNTS CODE ======")
-        print("Name            Privilege    Created                Last Code Update            Code Hash                     ")
-        print("---------------------------------------------------------------------------------------------------------")
-        for a in accts_lst:
-            m = a['metadata']
-            cr = m['created']
-            cr = cr[0:21]
-            lcu = m['last_code_update']
-            lcu = lcu[0:21]
-            print(f"{a['name']:13} | {m['privileged']:9} | {cr:21} | {lcu:21} | {a['code_hash']} ")
-
-        print("\n\n     ======  ACCOUNT PERMISSIONS AND PERMISSION LINKS ======")
-        print("Accoount        Perm Name       Parent         Auth Threshold / [(Key, Weight)..] / Accounts / Waits               ")
-        print("-------------------------------------------------------------------------------------------------------------------")
-        for a in accts_lst:
-            m = a['metadata']
-            for p in m['permissions']:
-                print(f"{a['name']:13} | {p['perm_name']:13} | {p['parent']:13} | ", end="")
-                auth = p['required_auth']
-                print(f"{auth['threshold']}", end=" / [")
-                for k in auth['keys']:
-                    print(f"({k['key']}, {k['weight']})", end=",")
-                print("] / [", end="")
-                for auth_a in auth['accounts']:
-                    print(f"{auth_a}", end=",")
-                print("] / [", end="")
-                for auth_w in auth['waits']:
-                    print(f"{auth_w}", end=",")
-                print("]")
-
-                print("     Linked Actions: ", end="")
-                if 'linked_actions' in p:
-                    linked_acts = p['linked_actions']
-                    if len(linked_acts) == 0:
-                        print("(None)", end="")
-                    for l_act in linked_acts:
-                        print(f'{l_act["account"]}::{l_act["action"]}, ', end="")
-                    print()
-                else:
-                    print('(Unkonwn)')
-
-        for s in ('active', 'pending', 'proposed'):
-            sched = prod_sched[s]
-            print(f"\n\n     ====== {s.upper()} PRODUCER SCHEDULE ======")
-            if sched is None:
-                print("---------------------------------------------------------------------------------------------------------")
-                print(" (None)")
-                continue
-            print(f"Version: {sched['version']}")
-            print("Producer Name    Authority  Data Type / Threshold / [ (key, weight), ...] ")
-            print("---------------------------------------------------------------------------------------------------------")
-            for p in sched['producers']:
-                print(f"{p['producer_name']:15} | ", end="")
-                auth = p['authority']
-                if auth[0] != 0:
-                    print(f"ERROR: known block signing authority type expected 0, got {auth[0]}")
-                    continue
-                a = auth[1]
-                keys = a["keys"]
-                keys_str = ""
-                for k in keys:
-                    keys_str += " (" + k['key'] + ", " + str(k['weight']) + "),"
-
-                print(f"{auth[0]} / {a['threshold']} / [{keys_str}] ")
-
-        print("\n\n     ====== ACTIVATED PROTOCOL FEATURES ======")
-        print("---------------------------------------------------------------------------------------------------------")
-        if len(prot_feats) == 0:
-            print(" (None)")
-        else:
-            for feat in prot_feats:
-                print(feat)
-
-        print("\n\n     ====== MULTI-INDEX TABLES ======")
-        print("Account        Scope:Table                  Values")
-        print("---------------------------------------------------------------------------------------------------------")
-        atLeastOne = False
-        for a in accts_lst:
-            scopes = a['scopes']
-            for s in scopes:
-                scope_table = s['scope'] + ":" + s['table']
-                print(f"{s['code']:13} | {scope_table:27}", end=" ")
-                tbl = a['tables'][scope_table]
-                print('[', end="")
-                for v in tbl:
-                    print(v, end=", ")
-                print(']')
-                atLeastOne = True
-        if not atLeastOne:
-            print("(None)")
-
-        print("\n\n     ====== KV TABLES ======")
-        print("Account        Data")
-        print("---------------------------------------------------------------------------------------------------------")
-        for a in accts_lst:
-            print(f"{a['name']:13}", end="")
-            kv_tables = a['kv_tables']
-            print("[", end="")
-            for v in kv_tables:
-                print(v, end=", ")
-
-            print(']')
-
-        print("\n\n     ====== DEFERRED TRANSACTIONS ======")
-        print("---------------------------------------------------------------------------------------------------------")
-        if len(deferred_trx) == 0:
-            print("(None)")
+    checkpoint = None
+    resume_state = None
+    if snapshot_filepath == "" and checkpoint_interval > 0:
+        checkpoint = Checkpoint(output_filepath, checkpoint_interval,
+                                { 'rpc_endpoint': rpc_endpt, 'page_size': page_size, 'scope_limit': scope_limit, 'table_row_limit': table_row_limit,
+                                  'keep_irrelevant': keep_irrelevant, 'client_decode': abi_cache is not None })
+        if resume:
+            resume_state = checkpoint.load()
         else:
-            for trx in deferred_trx:
-                print(trx)
-
-        print("\nFULL SERVER INFO:\n")
-        for k, v in server_info_end.items():
-            print(f"{k:>30} : {v}")
-
-    except Exception as e:
-        print("\n\n***** exception occured when outputting tables *****")
-        print(e)
-        raise e
+            checkpoint.create()
+
+    checkpoint_dir = checkpoint.dir if checkpoint is not None else None
+    writer = AuditWriter(output_filepath, keep_irrelevant, checkpoint_dir, resume_state['writer'] if resume_state is not None else None)
+    report = AuditReport(checkpoint_dir, resume_state['report'] if resume_state is not None else None)
+    if snapshot_filepath != "":
+        server_info_begin, server_info_end, prod_sched, prot_feats, deferred_trx = \
+            auditSnapshot(snapshot_filepath, nodeos_path, writer, report, scope_limit, table_row_limit, abi_cache)
+    else:
+        server_info_begin, server_info_end, prod_sched, prot_feats, deferred_trx = \
+            auditNode(rpc_endpt, writer, report, page_size, scope_limit, table_row_limit, concurrency, incremental_filepath, abi_cache,
+                      checkpoint, resume_state)
+    if abi_cache is not None:
+        print(f"decoded rows with {len(abi_cache.decoders)} ABIs, {abi_cache.undecoded} tables left hex encoded", file=sys.stderr)
 
-    # save results as json
-    with open(output_filepath, "wt") as f:
-        if not keep_irrelevant:
-            removeIrrelevant(data)
+    # print out results
+    report.printReport(server_info_begin, server_info_end, prod_sched, prot_feats, deferred_trx)
 
-        f.write(json.dumps(data, sort_keys=True, indent=2))
+    # save results
+    writer.writeTail(prot_feats, prod_sched, deferred_trx, server_info_end)
+    writer.close()
+    if checkpoint is not None:
+        checkpoint.remove()
 
     if ref_filepath != "":
-        with open(ref_filepath, "r") as f:
-            s = f.read()
-            refData = json.loads(s)
-            compSuccess = compareRefData(refData, data)
-            if compSuccess:
-                exit(0)
-            exit(1)
+        compSuccess = compareRefData(readAuditRecords(ref_filepath), readAuditRecords(output_filepath))
+        if compSuccess:
+            exit(0)
+        exit(1)
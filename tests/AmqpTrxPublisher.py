@@ -0,0 +1,340 @@
+import base64
+import json
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from testUtils import Utils
+from Node import Node
+
+###########################################################################################
+# AmqpTrxPublisher
+#
+# Publishes transactions signed ahead of time (Node.transferFunds(..., dontSend=True,
+# returnPacked=True)) to the amqp_trx_plugin queue without a cleos process per transaction.
+# Messages carry the same body as "cleos --amqp": the binary transaction_msg variant holding a
+# packed_transaction_v0, with the transaction id as correlation id.
+#
+# Like cleos, it publishes over AMQP 0-9-1 on a channel in confirm mode, with the mandatory flag
+# so a message the broker cannot route to the queue is returned. The harness has no AMQP client
+# library, so the few frames a confirmed publisher needs are encoded here. At most inFlight
+# published messages await the broker's confirm at a time. The depth of the queue can be sampled
+# through the RabbitMQ management HTTP API in the background while publishing.
+#
+###########################################################################################
+
+class AmqpTrxPublisher(object):
+    Base58Alphabet="123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+    SignatureTypes={"K1": 0, "R1": 1}
+
+    # AMQP 0-9-1 frame types and (class, method) ids
+    FrameMethod=1
+    FrameHeader=2
+    FrameBody=3
+    FrameHeartbeat=8
+    FrameEnd=0xce
+    ConnectionStart=(10, 10)
+    ConnectionStartOk=(10, 11)
+    ConnectionTune=(10, 30)
+    ConnectionTuneOk=(10, 31)
+    ConnectionOpen=(10, 40)
+    ConnectionOpenOk=(10, 41)
+    ConnectionClose=(10, 50)
+    ConnectionCloseOk=(10, 51)
+    ChannelOpen=(20, 10)
+    ChannelOpenOk=(20, 11)
+    ChannelClose=(20, 40)
+    ConfirmSelect=(85, 10)
+    ConfirmSelectOk=(85, 11)
+    BasicPublish=(60, 40)
+    BasicAck=(60, 80)
+    BasicNack=(60, 120)
+
+    def __init__(self, amqpAddress, queueName="trx", inFlight=16, managementUrl="http://127.0.0.1:15672", user="guest", password="guest", timeout=30):
+        """amqpAddress: amqp://<user>:<password>@<host>:<port>/<vhost>, as passed to nodeos with --amqp-trx-address.
+        user and password are those of the management API, used to sample the queue depth."""
+        url=urllib.parse.urlparse(amqpAddress)
+        self.host=url.hostname
+        self.port=url.port if url.port is not None else 5672
+        self.amqpUser=urllib.parse.unquote(url.username) if url.username else "guest"
+        self.amqpPassword=urllib.parse.unquote(url.password) if url.password else "guest"
+        self.amqpVhost=urllib.parse.unquote(url.path[1:]) if len(url.path) > 1 else "/"
+        self.queueName=queueName
+        self.inFlight=inFlight
+        self.timeout=timeout
+        self.managementUrl=managementUrl
+        self.auth="Basic " + base64.b64encode(("%s:%s" % (user, password)).encode("utf-8")).decode("ascii")
+        self.vhost=urllib.parse.quote(self.amqpVhost, safe="")
+        self.sock=None
+        self.frameMax=131072
+        self.lock=threading.Condition()
+        self.unconfirmed={}            # delivery tag -> index of the message in publishAll
+        self.returned=set()            # correlation ids of messages the broker could not route
+        self.readError=None
+        self.reader=None
+        self.depthSamples=[]           # (time, messages_ready, messages_unacknowledged)
+        self.samplerStop=threading.Event()
+        self.sampler=None
+
+    @staticmethod
+    def varuint(value):
+        out=bytearray()
+        while True:
+            byte=value & 0x7f
+            value>>=7
+            out.append(byte | (0x80 if value else 0))
+            if not value:
+                return bytes(out)
+
+    @staticmethod
+    def base58Decode(text):
+        num=0
+        for ch in text:
+            num=num * 58 + AmqpTrxPublisher.Base58Alphabet.index(ch)
+        raw=num.to_bytes((num.bit_length() + 7) // 8, "big")
+        leadingZeros=len(text) - len(text.lstrip("1"))
+        return b"\0" * leadingZeros + raw
+
+    @staticmethod
+    def signatureToBin(signature):
+        """SIG_K1_... or SIG_R1_... as packed fc::crypto::signature: variant index and 65 bytes, the 4 byte checksum dropped."""
+        prefix,keyType,data=signature.split("_", 2)
+        assert prefix == "SIG" and keyType in AmqpTrxPublisher.SignatureTypes, "unsupported signature %s" % (signature)
+        return AmqpTrxPublisher.varuint(AmqpTrxPublisher.SignatureTypes[keyType]) + AmqpTrxPublisher.base58Decode(data)[:-4]
+
+    @staticmethod
+    def encodeTransactionMsg(packedTrx):
+        """Packs the JSON packed_transaction_v0 as the transaction_msg variant amqp_trx_plugin consumes."""
+        compression={"none": 0, "zlib": 1}[packedTrx.get("compression", "none")]
+        contextFreeData=bytes.fromhex(packedTrx.get("packed_context_free_data", ""))
+        trx=bytes.fromhex(packedTrx["packed_trx"])
+        body=AmqpTrxPublisher.varuint(0)       # packed_transaction_v0 alternative
+        body+=AmqpTrxPublisher.varuint(len(packedTrx["signatures"]))
+        for signature in packedTrx["signatures"]:
+            body+=AmqpTrxPublisher.signatureToBin(signature)
+        body+=bytes([compression])
+        body+=AmqpTrxPublisher.varuint(len(contextFreeData)) + contextFreeData
+        body+=AmqpTrxPublisher.varuint(len(trx)) + trx
+        return body
+
+    @staticmethod
+    def shortstr(value):
+        value=value.encode("utf-8")
+        return struct.pack(">B", len(value)) + value
+
+    @staticmethod
+    def longstr(value):
+        value=value.encode("utf-8") if isinstance(value, str) else value
+        return struct.pack(">I", len(value)) + value
+
+    @staticmethod
+    def readShortstr(data, offset):
+        size=data[offset]
+        return (data[offset+1:offset+1+size].decode("utf-8", "replace"), offset + 1 + size)
+
+    def __sendFrame(self, frameType, channel, payload):
+        self.sock.sendall(struct.pack(">BHI", frameType, channel, len(payload)) + payload + bytes([AmqpTrxPublisher.FrameEnd]))
+
+    def __sendMethod(self, channel, method, args=b""):
+        self.__sendFrame(AmqpTrxPublisher.FrameMethod, channel, struct.pack(">HH", *method) + args)
+
+    def __recvExact(self, size):
+        data=bytearray()
+        while len(data) < size:
+            chunk=self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("AMQP connection to %s:%d closed" % (self.host, self.port))
+            data+=chunk
+        return bytes(data)
+
+    def __recvFrame(self):
+        """Returns (frame type, channel, payload), skipping heartbeats."""
+        while True:
+            frameType,channel,size=struct.unpack(">BHI", self.__recvExact(7))
+            payload=self.__recvExact(size)
+            if self.__recvExact(1)[0] != AmqpTrxPublisher.FrameEnd:
+                raise ConnectionError("AMQP frame from %s:%d not terminated" % (self.host, self.port))
+            if frameType != AmqpTrxPublisher.FrameHeartbeat:
+                return (frameType, channel, payload)
+
+    def __recvMethod(self):
+        frameType,_,payload=self.__recvFrame()
+        if frameType != AmqpTrxPublisher.FrameMethod:
+            raise ConnectionError("expected an AMQP method frame, got frame type %d" % (frameType))
+        method=struct.unpack(">HH", payload[:4])
+        if method in [AmqpTrxPublisher.ConnectionClose, AmqpTrxPublisher.ChannelClose]:
+            replyCode=struct.unpack(">H", payload[4:6])[0]
+            replyText,_=AmqpTrxPublisher.readShortstr(payload, 6)
+            raise ConnectionError("AMQP broker closed the %s: %d %s" % ("connection" if method[0] == 10 else "channel", replyCode, replyText))
+        return (method, payload[4:])
+
+    def __expect(self, expected):
+        method,args=self.__recvMethod()
+        if method != expected:
+            raise ConnectionError("expected AMQP method %s, got %s" % (expected, method))
+        return args
+
+    def connect(self):
+        """Opens the connection and channel 1 in confirm mode."""
+        self.sock=socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.sendall(b"AMQP\x00\x00\x09\x01")
+        self.__expect(AmqpTrxPublisher.ConnectionStart)
+        clientProperties=AmqpTrxPublisher.shortstr("product") + b"S" + AmqpTrxPublisher.longstr("eosio test harness")
+        self.__sendMethod(0, AmqpTrxPublisher.ConnectionStartOk, AmqpTrxPublisher.longstr(clientProperties) + AmqpTrxPublisher.shortstr("PLAIN") +
+                          AmqpTrxPublisher.longstr("\0%s\0%s" % (self.amqpUser, self.amqpPassword)) + AmqpTrxPublisher.shortstr("en_US"))
+        channelMax,frameMax,_=struct.unpack(">HIH", self.__expect(AmqpTrxPublisher.ConnectionTune)[:8])
+        if frameMax != 0:
+            self.frameMax=min(self.frameMax, frameMax)
+        # no heartbeats, the connection only lives for one publishAll
+        self.__sendMethod(0, AmqpTrxPublisher.ConnectionTuneOk, struct.pack(">HIH", channelMax, self.frameMax, 0))
+        self.__sendMethod(0, AmqpTrxPublisher.ConnectionOpen, AmqpTrxPublisher.shortstr(self.amqpVhost) + AmqpTrxPublisher.shortstr("") + b"\x00")
+        self.__expect(AmqpTrxPublisher.ConnectionOpenOk)
+        self.__sendMethod(1, AmqpTrxPublisher.ChannelOpen, AmqpTrxPublisher.shortstr(""))
+        self.__expect(AmqpTrxPublisher.ChannelOpenOk)
+        self.__sendMethod(1, AmqpTrxPublisher.ConfirmSelect, b"\x00")
+        self.__expect(AmqpTrxPublisher.ConfirmSelectOk)
+        self.sock.settimeout(None)
+
+    def close(self):
+        if self.sock is None:
+            return
+        try:
+            self.__sendMethod(0, AmqpTrxPublisher.ConnectionClose, struct.pack(">H", 200) + AmqpTrxPublisher.shortstr("") + struct.pack(">HH", 0, 0))
+            if self.reader is not None:
+                self.reader.join(self.timeout)
+        except OSError:
+            pass
+        self.sock.close()
+        self.sock=None
+        self.reader=None
+
+    def __readConfirms(self, results, confirmTimes):
+        """Runs on the reader thread: settles the unconfirmed deliveries as the broker acks, nacks or returns them."""
+        try:
+            while True:
+                frameType,_,payload=self.__recvFrame()
+                if frameType == AmqpTrxPublisher.FrameHeader:
+                    # properties of a returned message: delivery mode and correlation id, as published
+                    flags=struct.unpack(">H", payload[12:14])[0]
+                    offset=14 + (1 if flags & (1 << 12) else 0)
+                    if flags & (1 << 10):
+                        corrId,_=AmqpTrxPublisher.readShortstr(payload, offset)
+                        with self.lock:
+                            self.returned.add(corrId)
+                    continue
+                if frameType != AmqpTrxPublisher.FrameMethod:
+                    continue
+                method=struct.unpack(">HH", payload[:4])
+                if method == AmqpTrxPublisher.ConnectionCloseOk:
+                    return
+                if method in [AmqpTrxPublisher.ConnectionClose, AmqpTrxPublisher.ChannelClose]:
+                    replyCode=struct.unpack(">H", payload[4:6])[0]
+                    replyText,_=AmqpTrxPublisher.readShortstr(payload, 6)
+                    raise ConnectionError("AMQP broker closed the channel: %d %s" % (replyCode, replyText))
+                if method not in [AmqpTrxPublisher.BasicAck, AmqpTrxPublisher.BasicNack]:
+                    continue
+                deliveryTag,bits=struct.unpack(">QB", payload[4:13])
+                now=time.time()
+                with self.lock:
+                    tags=[tag for tag in self.unconfirmed if tag <= deliveryTag] if bits & 1 else [deliveryTag]
+                    for tag in tags:
+                        index=self.unconfirmed.pop(tag, None)
+                        if index is None:
+                            continue
+                        transId,publishTime,_=results[index]
+                        routed=method == AmqpTrxPublisher.BasicAck and transId not in self.returned
+                        results[index]=(transId, publishTime, routed)
+                        confirmTimes[index]=now
+                    self.lock.notify_all()
+        except (OSError, ValueError, struct.error) as ex:
+            with self.lock:
+                self.readError=ex
+                self.lock.notify_all()
+
+    def __publish(self, deliveryTag, transId, body):
+        payload=struct.pack(">HH", *AmqpTrxPublisher.BasicPublish) + struct.pack(">H", 0) + AmqpTrxPublisher.shortstr("") + \
+                AmqpTrxPublisher.shortstr(self.queueName) + b"\x01"    # default exchange, mandatory
+        frames=struct.pack(">BHI", AmqpTrxPublisher.FrameMethod, 1, len(payload)) + payload + bytes([AmqpTrxPublisher.FrameEnd])
+        # content header: delivery mode persistent and the correlation id
+        header=struct.pack(">HHQH", 60, 0, len(body), (1 << 12) | (1 << 10)) + b"\x02" + AmqpTrxPublisher.shortstr(transId)
+        frames+=struct.pack(">BHI", AmqpTrxPublisher.FrameHeader, 1, len(header)) + header + bytes([AmqpTrxPublisher.FrameEnd])
+        maxBody=self.frameMax - 8
+        for offset in range(0, len(body), maxBody):
+            chunk=body[offset:offset+maxBody]
+            frames+=struct.pack(">BHI", AmqpTrxPublisher.FrameBody, 1, len(chunk)) + chunk + bytes([AmqpTrxPublisher.FrameEnd])
+        self.sock.sendall(frames)
+
+    def publishAll(self, packedTrxs):
+        """Publishes the transactions in order with up to inFlight awaiting the broker's confirm, then waits for all confirms.
+        Returns a list of (transId, publish time, routed) and sets confirmLatencies to the ms from publish to confirm."""
+        results=[(Node.getPackedTransId(packedTrx), None, False) for packedTrx in packedTrxs]
+        confirmTimes=[None] * len(packedTrxs)
+        bodies=[AmqpTrxPublisher.encodeTransactionMsg(packedTrx) for packedTrx in packedTrxs]
+        self.unconfirmed={}
+        self.returned=set()
+        self.readError=None
+        self.connect()
+        self.reader=threading.Thread(target=self.__readConfirms, args=(results, confirmTimes), daemon=True)
+        self.reader.start()
+        try:
+            for index,body in enumerate(bodies):
+                with self.lock:
+                    if not self.lock.wait_for(lambda: len(self.unconfirmed) < self.inFlight or self.readError is not None, self.timeout):
+                        raise RuntimeError("no publisher confirm from %s:%d within %d seconds" % (self.host, self.port, self.timeout))
+                    if self.readError is not None:
+                        raise self.readError
+                    deliveryTag=index + 1
+                    transId=results[index][0]
+                    results[index]=(transId, time.time(), False)
+                    self.unconfirmed[deliveryTag]=index
+                self.__publish(deliveryTag, transId, body)
+            with self.lock:
+                if not self.lock.wait_for(lambda: len(self.unconfirmed) == 0 or self.readError is not None, self.timeout):
+                    Utils.Print("ERROR: %d publishes to %s:%d not confirmed" % (len(self.unconfirmed), self.host, self.port))
+                if self.readError is not None:
+                    Utils.Print("ERROR: AMQP publisher confirms failed: %s" % (self.readError))
+        finally:
+            self.close()
+        self.confirmLatencies=[(confirmTime - publishTime) * 1000 for (_,publishTime,_),confirmTime in zip(results, confirmTimes)
+                               if confirmTime is not None]
+        return results
+
+    def api(self, method, path, payload=None, timeout=30):
+        data=json.dumps(payload).encode("utf-8") if payload is not None else None
+        request=urllib.request.Request("%s/api/%s" % (self.managementUrl, path), data=data, method=method,
+                                       headers={"Authorization": self.auth, "Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            body=resp.read()
+        return json.loads(body) if body else None
+
+    def queueDepth(self):
+        """Returns (messages_ready, messages_unacknowledged) of the queue."""
+        queue=self.api("GET", "queues/%s/%s" % (self.vhost, urllib.parse.quote(self.queueName, safe="")))
+        return (queue.get("messages_ready", 0), queue.get("messages_unacknowledged", 0))
+
+    def __sample(self, interval):
+        while not self.samplerStop.is_set():
+            try:
+                ready,unacked=self.queueDepth()
+                self.depthSamples.append((time.time(), ready, unacked))
+            except (OSError, ValueError) as ex:
+                if Utils.Debug: Utils.Print("queue depth sample failed: %s" % (ex))
+            self.samplerStop.wait(interval)
+
+    def startDepthSampler(self, interval=0.25):
+        assert self.sampler is None, "depth sampler already running"
+        self.depthSamples=[]
+        self.samplerStop.clear()
+        self.sampler=threading.Thread(target=self.__sample, args=(interval,), daemon=True)
+        self.sampler.start()
+
+    def stopDepthSampler(self):
+        if self.sampler is not None:
+            self.samplerStop.set()
+            self.sampler.join()
+            self.sampler=None
+        return self.depthSamples
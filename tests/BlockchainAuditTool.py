@@ -0,0 +1,116 @@
+import concurrent.futures
+import copy
+import filecmp
+import os
+import subprocess
+import sys
+
+from testUtils import Utils
+from Cluster import Cluster
+from Node import Node
+from core_symbol import CORE_SYMBOL
+
+###########################################################################################
+# BlockchainAuditTool
+#
+# Runs scripts/blockchain_audit_tool.py for the blockchain_audit_*_test scripts. Every audit is
+# written to a file of the output directory, with the report the tool prints next to it in
+# <name>.report and its status output in <name>.err, so two audits can be compared byte for byte
+# or with the tool's own --ref/--comp comparison. pauseProduction() stops the chain first, so that
+# audits made one after the other see the same state, and createAccounts() gives them accounts and
+# table rows to page through.
+#
+###########################################################################################
+
+class BlockchainAuditTool(object):
+    Path=os.path.join(os.getcwd(), "scripts", "blockchain_audit_tool.py")
+    NodeosPath=os.path.join(os.getcwd(), "programs", "nodeos", "nodeos")
+
+    def __init__(self, outputDir):
+        self.outputDir=outputDir
+
+    def path(self, name):
+        return os.path.join(self.outputDir, name)
+
+    def start(self, name, node=None, snapshot=None, extraArgs=None):
+        """Starts an audit of node, or of the snapshot file, written to name. Returns the Popen of the tool."""
+        cmd=[sys.executable, BlockchainAuditTool.Path, "-o", self.path(name)] + (extraArgs if extraArgs is not None else [])
+        if snapshot is not None:
+            cmd+=["--snapshot", snapshot, "--nodeos", BlockchainAuditTool.NodeosPath]
+        else:
+            cmd.append("%s:%d" % (node.host, node.port))
+        if Utils.Debug: Utils.Print("cmd: %s" % (" ".join(cmd)))
+        with open(self.path(name + ".report"), "w") as out, open(self.path(name + ".err"), "w") as err:
+            return subprocess.Popen(cmd, stdout=out, stderr=err)
+
+    def audit(self, name, node=None, snapshot=None, extraArgs=None):
+        """Audits node, or the snapshot file, to name. Returns False when the tool failed."""
+        if self.start(name, node, snapshot, extraArgs).wait() != 0:
+            Utils.Print("ERROR: audit %s failed:\n%s" % (name, self.errors(name)))
+            return False
+        return True
+
+    def errors(self, name):
+        with open(self.path(name + ".err"), "r") as f:
+            return f.read()
+
+    def compare(self, ref, comp):
+        """Compares the audits ref and comp with --ref and --comp, the tool's output goes to comp.compare.err and is printed when
+        they differ. Returns True when the tool finds them the same."""
+        with open(self.path(comp + ".compare.err"), "w") as err:
+            same=subprocess.call([sys.executable, BlockchainAuditTool.Path, "--ref", self.path(ref), "--comp", self.path(comp)],
+                                 stderr=err) == 0
+        if not same:
+            Utils.Print("%s differs from %s:\n%s" % (comp, ref, self.compareErrors(comp)))
+        return same
+
+    def compareErrors(self, comp):
+        with open(self.path(comp + ".compare.err"), "r") as f:
+            return f.read()
+
+    def sameFiles(self, nameA, nameB):
+        """True when the files nameA and nameB of the output directory have the same bytes."""
+        same=filecmp.cmp(self.path(nameA), self.path(nameB), shallow=False)
+        if not same:
+            Utils.Print("ERROR: %s and %s differ" % (self.path(nameA), self.path(nameB)))
+        return same
+
+    def sameAudits(self, nameA, nameB):
+        """True when the audits nameA and nameB and the reports printed with them have the same bytes."""
+        return self.sameFiles(nameA, nameB) and self.sameFiles(nameA + ".report", nameB + ".report")
+
+    @staticmethod
+    def createAccounts(node, creator, count, funded=0, prefix="audit"):
+        """Creates count accounts, named prefix followed by digits, sharing one key, and transfers tokens to the first funded of
+        them, so that audits have accounts and table rows to page through. Returns the accounts, None if they do not reach a block."""
+        key=Cluster.createAccountKeys(1)[0]
+        accounts=[]
+        for i in range(count):
+            account=copy.copy(key)
+            digits=""
+            for _ in range(12 - len(prefix)):
+                digits="12345"[i % 5] + digits
+                i//=5
+            account.name=prefix + digits
+            accounts.append(account)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            created=list(executor.map(lambda account: node.createAccount(account, creator, stakedDeposit=0, exitOnError=True), accounts))
+        trans=created[-1]
+        for account in accounts[:funded]:
+            trans=node.transferFunds(creator, account, Node.currencyIntToStr(10000, CORE_SYMBOL), "audit")
+        if not node.waitForTransInBlock(Node.getTransId(trans)):
+            return None
+        Utils.Print("Created %d accounts, %d of them funded" % (count, funded))
+        return accounts
+
+    @staticmethod
+    def pauseProduction(node):
+        """Pauses block production on node and waits until its head stops moving. Returns False if it does not."""
+        node.processCurlCmd("producer", "pause", "{}")
+        lastHead=[node.getHeadBlockNum()]
+        def headStopped():
+            head=node.getHeadBlockNum()
+            stopped=head == lastHead[0]
+            lastHead[0]=head
+            return stopped
+        return Utils.waitForTruth(headStopped, timeout=30, sleepTime=1) is True
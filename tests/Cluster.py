@@ -1,3 +1,4 @@
+import concurrent.futures
 import copy
 import subprocess
 import time
@@ -14,6 +15,10 @@ import json
 
 from core_symbol import CORE_SYMBOL
 from testUtils import Utils
+from testUtils import ReadinessWatcher
+from ClusterLauncher import ClusterLauncher
+from ProducerHaWatcher import ProducerHaWatcher
+from ResourceProfile import ResourceProfile
 from testUtils import Account
 from testUtils import BlockLogAction
 from Node import BlockType
@@ -120,6 +125,8 @@ class Cluster(object):
         self.filesToCleanup=[]
         self.alternateVersionLabels=Cluster.__defaultAlternateVersionLabels()
         self.biosNode = None
+        self.resourceSettings=None
+        self.netns=None
 
 
     def setChainStrategy(self, chainSyncStrategy=Utils.SyncReplayTag):
@@ -167,15 +174,16 @@ class Cluster(object):
     def launch(self, pnodes=1, unstartedNodes=0, totalNodes=1, prodCount=1, topo="mesh", delay=1, onlyBios=False, dontBootstrap=False,
                totalProducers=None, sharedProducers=0, extraNodeosArgs="", useBiosBootFile=True, specificExtraNodeosArgs=None, onlySetProds=False,
                pfSetupPolicy=PFSetupPolicy.FULL, alternateVersionLabelsFile=None, associatedNodeLabels=None, loadSystemContract=True, manualProducerNodeConf={}, prod_ha=False,
-               genesisPath=None):
+               genesisPath=None, resourceProfile=None, netns=None):
         """Launch cluster.
         pnodes: producer nodes count
         unstartedNodes: non-producer nodes that are configured into the launch, but not started.  Should be included in totalNodes.
         totalNodes: producer + non-producer nodes + unstarted non-producer nodes count
         prodCount: producers per producer node count
         topo: cluster topology (as defined by launcher, and "bridge" shape that is specific to this launch method)
-        delay: delay between individual nodes launch (as defined by launcher)
-          delay 0 exposes a bootstrap bug where producer handover may have a large gap confusing nodes and bringing system to a halt.
+        delay: delay between individual nodes launch (as defined by launcher). Pass None to launch all nodes at once
+          and wait on each one until its http endpoint accepts connections, before any bootstrapping.
+          delay 0 without that wait exposes a bootstrap bug where producer handover may have a large gap confusing nodes and bringing system to a halt.
         onlyBios: When true, only loads the bios contract (and not more full bootstrapping).
         dontBootstrap: When true, don't do any bootstrapping at all. (even bios is not uploaded)
         extraNodeosArgs: string of arguments to pass through to each nodoes instance (via --nodeos flag on launcher)
@@ -190,6 +198,11 @@ class Cluster(object):
         associatedNodeLabels: Supply a dictionary of node numbers to use an alternate label for a specific node.
         loadSystemContract: indicate whether the eosio.system contract should be loaded (setting this to False causes useBiosBootFile to be treated as False)
         manualProducerNodeConf: additional producer public keys which is not automatically generated by launcher
+        resourceProfile: ResourceProfile used to size thread pools, state db and wasm runtime of every node to the host.
+          Options already given in extraNodeosArgs or specificExtraNodeosArgs are kept. The chosen settings are
+          printed and saved to resource_profile.json in the data directory.
+        netns: NetnsNetwork, already set up with keys "bios" and 0..totalNodes-1, to run every node in its own network
+          namespace and reach it at its namespace address. Only supported for the mesh, star, ring and bridge shapes.
         """
         assert(isinstance(topo, str))
         assert PFSetupPolicy.isValid(pfSetupPolicy)
@@ -236,8 +249,9 @@ class Cluster(object):
             tries = tries - 1
             time.sleep(2)
 
+        genesisTimestamp=datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
         cmd="%s -p %s -n %s -d %s -i %s -f %s --unstarted-nodes %s" % (
-            Utils.EosLauncherPath, pnodes, totalNodes, delay, datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3],
+            Utils.EosLauncherPath, pnodes, totalNodes, 0 if delay is None else delay, genesisTimestamp,
             producerFlag, unstartedNodes)
         cmdArr=cmd.split()
         if self.staging:
@@ -266,6 +280,10 @@ class Cluster(object):
                 arg = arg + "--producer-name {} ".format(name)
             specificExtraNodeosArgs[node] = arg
 
+        if resourceProfile is not None:
+            specificExtraNodeosArgs=self.applyResourceProfile(resourceProfile, totalNodes, totalNodes-unstartedNodes+(0 if prod_ha else 1),
+                                                              extraNodeosArgs, specificExtraNodeosArgs)
+
         Utils.Print("specificExtraNodeosArgs=", specificExtraNodeosArgs)
 
         httpMaxResponseTimeSet = False
@@ -304,139 +322,50 @@ class Cluster(object):
                 cmdArr.append("--spcfc-inst-nodeos")
                 cmdArr.append(path)
 
-        # must be last cmdArr.append before subprocess.call, so that everything is on the command line
-        # before constructing the shape.json file for "bridge"
-        if topo=="bridge":
-            shapeFilePrefix="shape_bridge"
-            shapeFile=shapeFilePrefix+".json"
-            cmdArrForOutput=copy.deepcopy(cmdArr)
-            cmdArrForOutput.append("--output")
-            cmdArrForOutput.append(shapeFile)
-            s=" ".join(cmdArrForOutput)
-            if Utils.Debug: Utils.Print("cmd: %s" % (s))
-            if 0 != subprocess.call(cmdArrForOutput):
-                Utils.Print("ERROR: Launcher failed to create shape file \"%s\"." % (shapeFile))
-                return False
-
-            Utils.Print("opening %s shape file: %s, current dir: %s" % (topo, shapeFile, os.getcwd()))
-            f = open(shapeFile, "r")
-            shapeFileJsonStr = f.read()
-            f.close()
-            shapeFileObject = json.loads(shapeFileJsonStr)
-            Utils.Print("shapeFileObject=%s" % (shapeFileObject))
-            # retrieve the nodes, which as a map of node name to node definition, which the fc library prints out as
-            # an array of array, the first level of arrays is the pair entries of the map, the second is an array
-            # of two entries - [ <first>, <second> ] with first being the name and second being the node definition
-            shapeFileNodes = shapeFileObject["nodes"]
-
-            numProducers=totalProducers if totalProducers is not None else (totalNodes - unstartedNodes)
-            maxProducers=ord('z')-ord('a')+1
-            assert numProducers<maxProducers, \
-                   "ERROR: topo of %s assumes names of \"defproducera\" to \"defproducerz\", so must have at most %d producers" % \
-                    (topo,maxProducers)
-
-            # will make a map to node object to make identification easier
-            biosNodeObject=None
-            bridgeNodes={}
-            producerNodes={}
-            producers=[]
-            for append in range(ord('a'),ord('a')+numProducers):
-                name="defproducer" + chr(append)
-                producers.append(name)
-
-            # first group starts at 0
-            secondGroupStart=int((numProducers+1)/2)
-            producerGroup1=[]
-            producerGroup2=[]
-
-            Utils.Print("producers=%s" % (producers))
-            shapeFileNodeMap = {}
-            def getNodeNum(nodeName):
-                p=re.compile(r'^testnet_(\d+)$')
-                m=p.match(nodeName)
-                return int(m.group(1))
-
-            for shapeFileNodePair in shapeFileNodes:
-                assert(len(shapeFileNodePair)==2)
-                nodeName=shapeFileNodePair[0]
-                shapeFileNode=shapeFileNodePair[1]
-                shapeFileNodeMap[nodeName]=shapeFileNode
-                Utils.Print("name=%s, shapeFileNode=%s" % (nodeName, shapeFileNodeMap[shapeFileNodePair[0]]))
-                if nodeName=="bios":
-                    biosNodeObject=shapeFileNode
-                    continue
-                nodeNum=getNodeNum(nodeName)
-                Utils.Print("nodeNum=%d, shapeFileNode=%s" % (nodeNum, shapeFileNode))
-                assert("producers" in shapeFileNode)
-                shapeFileNodeProds=shapeFileNode["producers"]
-                numNodeProducers=len(shapeFileNodeProds)
-                if (numNodeProducers==0):
-                    bridgeNodes[nodeName]=shapeFileNode
-                else:
-                    producerNodes[nodeName]=shapeFileNode
-                    group=None
-                    # go through all the producers for this node and determine which group on the bridged network they are in
-                    for shapeFileNodeProd in shapeFileNodeProds:
-                        producerIndex=0
-                        for prod in producers:
-                            if prod==shapeFileNodeProd:
-                                break
-                            producerIndex+=1
-
-                        prodGroup=None
-                        if producerIndex<secondGroupStart:
-                            prodGroup=1
-                            if group is None:
-                                group=prodGroup
-                                producerGroup1.append(nodeName)
-                                Utils.Print("Group1 grouping producerIndex=%s, secondGroupStart=%s" % (producerIndex,secondGroupStart))
-                        else:
-                            prodGroup=2
-                            if group is None:
-                                group=prodGroup
-                                producerGroup2.append(nodeName)
-                                Utils.Print("Group2 grouping producerIndex=%s, secondGroupStart=%s" % (producerIndex,secondGroupStart))
-                        if group!=prodGroup:
-                            Utils.errorExit("Node configuration not consistent with \"bridge\" topology. Node %s has producers that fall into both halves of the bridged network" % (nodeName))
-
-            for _,bridgeNode in bridgeNodes.items():
-                bridgeNode["peers"]=[]
-                for prodName in producerNodes:
-                    bridgeNode["peers"].append(prodName)
-
-            def connectGroup(group, producerNodes, bridgeNodes) :
-                groupStr=""
-                for nodeName in group:
-                    groupStr+=nodeName+", "
-                    prodNode=producerNodes[nodeName]
-                    prodNode["peers"]=[i for i in group if i!=nodeName]
-                    for bridgeName in bridgeNodes:
-                        prodNode["peers"].append(bridgeName)
-
-            connectGroup(producerGroup1, producerNodes, bridgeNodes)
-            connectGroup(producerGroup2, producerNodes, bridgeNodes)
-
-            f=open(shapeFile,"w")
-            f.write(json.dumps(shapeFileObject, indent=4, sort_keys=True))
-            f.close()
-
-            cmdArr.append("--shape")
-            cmdArr.append(shapeFile)
-        else:
-            cmdArr.append("--shape")
-            cmdArr.append(topo)
-
+        cmdArr.append("--shape")
+        cmdArr.append(topo)
         Cluster.__LauncherCmdArr = cmdArr.copy()
 
-        s=" ".join([("'{0}'".format(element) if (' ' in element) else element) for element in cmdArr.copy()])
-        if Utils.Debug: Utils.Print("cmd: %s" % (s))
-        if 0 != subprocess.call(cmdArr):
-            Utils.Print("ERROR: Launcher failed to launch. failed cmd: %s" % (s))
+        if netns is not None and topo not in ClusterLauncher.Shapes:
+            Utils.Print("ERROR: Network namespaces are not supported with custom shape file %s." % (topo))
             return False
+        self.netns=netns
+
+        if topo in ClusterLauncher.Shapes:
+            specificInstallPaths={}
+            if associatedNodeLabels is not None:
+                specificInstallPaths={int(nodeNum): self.alternateVersionLabels[label] for nodeNum,label in associatedNodeLabels.items()}
+            launcher=ClusterLauncher(pnodes=pnodes, totalNodes=totalNodes, unstartedNodes=unstartedNodes,
+                                     producers=int(totalProducers) if totalProducers else 21, sharedProducers=sharedProducers, shape=topo,
+                                     genesisPath=genesisPath if genesisPath else "./genesis.json", genesisTimestamp=genesisTimestamp,
+                                     nodeosArgs=nodeosArgs, prodHa=prod_ha, nogen=self.staging, delay=0 if delay is None else delay,
+                                     specificNodeosArgs={int(nodeNum): arg for nodeNum,arg in specificExtraNodeosArgs.items()} if specificExtraNodeosArgs else None,
+                                     specificInstallPaths=specificInstallPaths, netns=netns)
+            if not launcher.launch():
+                Utils.Print("ERROR: Failed to launch %s topology." % (topo))
+                return False
+        else:
+            # topo is a custom shape file, which only eosio-launcher understands
+            s=" ".join([("'{0}'".format(element) if (' ' in element) else element) for element in cmdArr.copy()])
+            if Utils.Debug: Utils.Print("cmd: %s" % (s))
+            if 0 != subprocess.call(cmdArr):
+                Utils.Print("ERROR: Launcher failed to launch. failed cmd: %s" % (s))
+                return False
 
         startedNodes=totalNodes-unstartedNodes
         self.nodes=list(range(startedNodes)) # placeholder for cleanup purposes only
 
+        if delay is None:
+            watcher=ReadinessWatcher()
+            if not prod_ha:
+                watcher.addPort("bios", self.nodeHost("bios"), Cluster.__BiosPort)
+            for i in range(startedNodes):
+                watcher.addPort("node_%02d" % (i), self.nodeHost(i), self.port+i)
+            if not watcher.wait(Utils.systemWaitTimeout):
+                Utils.Print("ERROR: %s instances failed to start: %s" % (Utils.EosServerName, ", ".join(watcher.failed)))
+                return False
+            Utils.Print("%s instances ready after %.2f seconds" % (Utils.EosServerName, max(watcher.readyTimes.values(), default=0)))
+
         nodes=self.discoverLocalNodes(startedNodes, timeout=Utils.systemWaitTimeout)
         if nodes is None or startedNodes != len(nodes):
             Utils.Print("ERROR: Unable to validate %s instances, expected: %d, actual: %d" %
@@ -516,6 +445,25 @@ class Cluster(object):
 
         return True
 
+    def applyResourceProfile(self, resourceProfile, totalNodes, runningNodes, extraNodeosArgs, specificExtraNodeosArgs):
+        """Returns a copy of specificExtraNodeosArgs with the profile's settings added for every node, and records them."""
+        settings=resourceProfile.nodeSettings(runningNodes)
+        specificArgs=dict(specificExtraNodeosArgs) if specificExtraNodeosArgs is not None else {}
+        nodeArgs={}
+        for nodeNum in range(totalNodes):
+            key=next((k for k in specificArgs if int(k) == nodeNum), nodeNum)
+            args=specificArgs.get(key, "")
+            nodeArgs[nodeNum]=ResourceProfile.toArgs(settings, extraNodeosArgs + " " + args)
+            specificArgs[key]=args + " " + nodeArgs[nodeNum]
+
+        self.resourceSettings=resourceProfile.describe(runningNodes)
+        self.resourceSettings["node_args"]=nodeArgs
+        Utils.Print("Resource profile for %d nodes on %d cores and %d MB: %s" % (runningNodes, resourceProfile.cores, resourceProfile.memoryMb, settings))
+        os.makedirs(Utils.DataDir, exist_ok=True)
+        with open(os.path.join(Utils.DataDir, "resource_profile.json"), "w") as f:
+            json.dump(self.resourceSettings, f, indent=2)
+        return specificArgs
+
     # Initialize the default nodes (at present just the root node)
     def initializeNodes(self, defproduceraPrvtKey=None, defproducerbPrvtKey=None, onlyBios=False):
         port=Cluster.__BiosPort if onlyBios else self.port
@@ -854,9 +802,107 @@ class Cluster(object):
 
         return True
 
+    # pylint: disable=too-many-locals
+    def spreadFundsPipelined(self, source, accounts, amount=1, hopsPerNode=10, expiration=600, timeout=120):
+        """Spreads funds like spreadFunds without waiting for a block between hops. Every hop is signed ahead of time and the
+        transactions are sent in hop order, hopsPerNode consecutive hops to a node before moving round-robin to the next running
+        node. A hop sent before the node received the hop funding it is rejected for the missing balance and sent again with
+        backoff, any other rejection fails the spread. Inclusion of all hops is then confirmed from the blocks, hops dropped on
+        the way to the producer are resent until timeout."""
+        assert(source)
+        assert(isinstance(source, Account))
+        assert(accounts)
+        assert(isinstance(accounts, list))
+        assert(len(accounts) > 0)
+        Utils.Print("len(accounts): %d" % (len(accounts)))
+
+        nodes=[node for node in self.nodes if not node.killed]
+        if len(nodes) == 0:
+            Utils.Print("ERROR: No active nodes found.")
+            return False
+
+        count=len(accounts)
+        hops=[]
+        transferAmount=(count*amount)+amount
+        for i,to in enumerate(accounts + [source]):
+            hops.append((source if i == 0 else accounts[i-1], to, Node.currencyIntToStr(transferAmount, CORE_SYMBOL)))
+            transferAmount -= amount
+
+        start=time.perf_counter()
+        signer=nodes[0]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+            packedTrxs=list(executor.map(lambda hop: signer.transferFunds(hop[0], hop[1], hop[2], dontSend=True, expiration=expiration,
+                                                                          returnPacked=True), hops))
+        Utils.Print("Signed %d transfers in %.3f sec" % (len(hops), time.perf_counter()-start))
+        unsigned=[i for i,packedTrx in enumerate(packedTrxs) if packedTrx is None]
+        if len(unsigned) > 0:
+            fromm,to,amountStr=hops[unsigned[0]]
+            Utils.Print("ERROR: Failed to sign %d of %d transfers, first the transfer of %s from %s to %s." % (len(unsigned), len(hops), amountStr, fromm.name, to.name))
+            return False
+
+        def fundingPending(i, result):
+            # the node has not received the hop funding hop i yet, so the sender has no balance or too small a balance there
+            if i == 0 or "error" not in result:
+                return False
+            error=result["error"]
+            details=json.dumps(error.get("details", []))
+            return error.get("name") == "eosio_assert_message_exception" and ("overdrawn balance" in details or "no balance object found" in details)
+
+        scannedBlockNum=signer.getHeadBlockNum() - 1
+        # known before sending, a send that timed out may still have been accepted
+        transIds=[Node.getPackedTransId(packedTrx) for packedTrx in packedTrxs]
+        included=set()
+        deadline=time.time() + timeout
+        pending=list(range(len(hops)))
+        attempt=0
+        while len(pending) > 0:
+            for n,i in enumerate(pending):
+                # resends start at a different node, the first one may hold the dropped transaction as a duplicate
+                node=nodes[(n // hopsPerNode + attempt) % len(nodes)]
+                fromm,to,amountStr=hops[i]
+                if Utils.Debug: Utils.Print("Transfer %s units from account %s to %s on eos server port %d." % (amountStr, fromm.name, to.name, node.port))
+                backoff=0.01
+                while True:
+                    result=node.sendPackedTransaction(packedTrxs[i])
+                    if result is None:
+                        Utils.Print("ERROR: Failed to send the transfer from %s to %s to eos server port %d." % (fromm.name, to.name, node.port))
+                        return False
+                    if "transaction_id" in result:
+                        break
+                    error=json.dumps(result["error"]) if "error" in result else json.dumps(result)
+                    if "tx_duplicate" in error:
+                        # an earlier send reached the node
+                        break
+                    if not fundingPending(i, result) or time.time() > deadline:
+                        Utils.Print("ERROR: Transfer from %s to %s was not accepted: %s" % (fromm.name, to.name, error))
+                        return False
+                    time.sleep(backoff)
+                    backoff=min(backoff * 2, 0.5)
+
+            # confirm every hop made it into a block, resend those lost before reaching the producer
+            def allIncluded():
+                nonlocal scannedBlockNum
+                headBlockNum=signer.getHeadBlockNum()
+                found=signer.findTransactionsInBlocks(transIds, scannedBlockNum + 1, headBlockNum)
+                if found is not None:
+                    included.update(found.keys())
+                    scannedBlockNum=headBlockNum
+                return len(included) == len(hops)
+            if Utils.waitForTruth(allIncluded, timeout=min(10, max(1, deadline - time.time())), sleepTime=0.5):
+                break
+            pending=[i for i in range(len(hops)) if transIds[i] not in included]
+            attempt+=1
+            if time.time() > deadline:
+                Utils.Print("ERROR: %d of %d transfers did not make it into a block" % (len(pending), len(hops)))
+                return False
+            Utils.Print("Resending %d transfers that did not make it into a block" % (len(pending)))
+
+        Utils.Print("Spread funds across %d accounts in %.3f sec" % (count, time.perf_counter()-start))
+        return True
+
     def validateSpreadFunds(self, initialBalances, transferAmount, source, accounts):
         """Given initial Balances, will validate each account has the expected balance based upon transferAmount.
-        This validation is repeated against every node in the cluster."""
+        This validation is repeated against every node in the cluster, reading the balances of all nodes concurrently."""
         assert(source)
         assert(isinstance(source, Account))
         assert(accounts)
@@ -866,29 +912,39 @@ class Cluster(object):
         assert(isinstance(initialBalances, dict))
         assert(isinstance(transferAmount, int))
 
-        for node in self.nodes:
-            if node.killed:
-                continue
+        nodes=[node for node in self.nodes if not node.killed]
+        if len(nodes) == 0:
+            Utils.Print("ERROR: No active nodes found.")
+            return False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            nodeBalances=list(executor.map(lambda node: node.getEosBalancesBulk([source] + accounts), nodes))
 
+        for node,currentBalances in zip(nodes, nodeBalances):
             if Utils.Debug: Utils.Print("Validate funds on %s server port %d." %
                                         (Utils.EosServerName, node.port))
 
-            if node.validateFunds(initialBalances, transferAmount, source, accounts) is False:
+            if currentBalances is None:
+                Utils.Print("ERROR: Failed to read balances on eos node port: %d" % (node.port))
+                return False
+
+            if node.validateFunds(initialBalances, transferAmount, source, accounts, currentBalances=currentBalances) is False:
                 Utils.Print("ERROR: Failed to validate funds on eos node port: %d" % (node.port))
                 return False
 
         return True
 
-    def spreadFundsAndValidate(self, transferAmount=1):
+    def spreadFundsAndValidate(self, transferAmount=1, pipelined=False):
         """Sprays 'transferAmount' funds across configured accounts and validates action. The spray is done in a trickle down fashion with account 1
-        receiving transferAmount*n SYS and forwarding x-transferAmount funds. Transfer actions are spread round-robin across the cluster to vaidate system cohesiveness."""
+        receiving transferAmount*n SYS and forwarding x-transferAmount funds. Transfer actions are spread round-robin across the cluster to vaidate system cohesiveness.
+        With pipelined the transfers are sent by spreadFundsPipelined."""
 
         if Utils.Debug: Utils.Print("Get initial system balances.")
-        initialBalances=self.nodes[0].getEosBalances([self.defproduceraAccount] + self.accounts)
+        initialBalances=self.nodes[0].getEosBalancesBulk([self.defproduceraAccount] + self.accounts)
         assert(initialBalances)
         assert(isinstance(initialBalances, dict))
 
-        if False == self.spreadFunds(self.defproduceraAccount, self.accounts, transferAmount):
+        spread=self.spreadFundsPipelined if pipelined else self.spreadFunds
+        if False == spread(self.defproduceraAccount, self.accounts, transferAmount):
             Utils.Print("ERROR: Failed to spread funds across nodes.")
             return False
 
@@ -900,9 +956,10 @@ class Cluster(object):
 
         return True
 
-    def validateAccounts(self, accounts, testSysAccounts=True):
+    def validateAccounts(self, accounts, testSysAccounts=True, allNodes=False):
+        """Validates the accounts exist on the first node, or with allNodes on every running node concurrently.
+        Returns False when there is no running node to validate them on."""
         assert(len(self.nodes) > 0)
-        node=self.nodes[0]
 
         myAccounts = []
         if testSysAccounts:
@@ -911,7 +968,14 @@ class Cluster(object):
             assert(isinstance(accounts, list))
             myAccounts += accounts
 
-        node.validateAccounts(myAccounts)
+        nodes=[node for node in self.nodes if not node.killed] if allNodes else self.nodes[:1]
+        if len(nodes) == 0:
+            Utils.Print("ERROR: No active nodes found.")
+            return False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            results=list(executor.map(lambda node: node.validateAccountsBulk(myAccounts), nodes))
+        assert all(results), "account validation failed"
+        return True
 
     # create account, verify account and return transaction id
     def createAccountAndVerify(self, account, creator, stakedDeposit=1000, stakeNet=100, stakeCPU=500, buyRAM=10000):
@@ -1438,6 +1502,18 @@ class Cluster(object):
         if Utils.Debug: Utils.Print("Found %d nodes" % (len(nodes)))
         return nodes
 
+    def nodeHost(self, nodeNum):
+        """Host a local node serves http on, which is its namespace address when the cluster runs in a NetnsNetwork."""
+        if self.netns is not None:
+            return self.netns.address(nodeNum)
+        return Cluster.__BiosHost if nodeNum == "bios" else self.host
+
+    def localNode(self, nodeNum, port, pid, cmd):
+        node=Node(self.nodeHost(nodeNum), port, nodeNum, pid=pid, cmd=cmd, walletMgr=self.walletMgr)
+        if self.netns is not None:
+            node.netns=self.netns.namespace(nodeNum)
+        return node
+
     # Populate a node matched to actual running instance
     def discoverLocalNode(self, nodeNum, psOut=None, timeout=None):
         if psOut is None:
@@ -1450,7 +1526,7 @@ class Cluster(object):
         if m is None:
             Utils.Print("ERROR: Failed to find %s pid. Pattern %s" % (Utils.EosServerName, pattern))
             return None
-        instance=Node(self.host, self.port + nodeNum, nodeNum, pid=int(m.group(1)), cmd=m.group(2), walletMgr=self.walletMgr)
+        instance=self.localNode(nodeNum, self.port + nodeNum, pid=int(m.group(1)), cmd=m.group(2))
         if Utils.Debug: Utils.Print("Node>", instance)
         return instance
 
@@ -1463,7 +1539,7 @@ class Cluster(object):
             Utils.Print("ERROR: Failed to find %s pid. Pattern %s" % (Utils.EosServerName, pattern))
             return None
         else:
-            return Node(Cluster.__BiosHost, Cluster.__BiosPort, "bios", pid=int(m.group(1)), cmd=m.group(2), walletMgr=self.walletMgr)
+            return self.localNode("bios", Cluster.__BiosPort, pid=int(m.group(1)), cmd=m.group(2))
 
     # Kills a percentange of Eos instances starting from the tail and update eosInstanceInfos state
     def killSomeEosInstances(self, killCount, killSignalStr=Utils.SigKillTag):
@@ -1485,16 +1561,26 @@ class Cluster(object):
         return True
 
     def relaunchEosInstances(self, cachePopen=False, nodeArgs=""):
+        """Starts all killed nodes at once and waits for them to be ready in parallel, reporting each node's startup time."""
 
         chainArg=self.__chainSyncStrategy.arg + " " + nodeArgs
 
         newChain= False if self.__chainSyncStrategy.name in [Utils.SyncHardReplayTag, Utils.SyncNoneTag] else True
-        for i in range(0, len(self.nodes)):
-            node=self.nodes[i]
-            if node.killed and not node.relaunch(chainArg=chainArg, newChain=newChain, cachePopen=cachePopen):
-                return False
+        started=[]
+        for node in self.nodes:
+            if node.killed:
+                started.append((node, node.startRelaunch(chainArg=chainArg, newChain=newChain, cachePopen=cachePopen)))
 
-        return True
+        if len(started) == 0:
+            return True
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(started)) as executor:
+            results=list(executor.map(lambda s: s[0].waitForRelaunch(s[1]), started))
+
+        Utils.Print("Relaunched %d nodes:" % (len(started)))
+        for (node, _), success in zip(started, results):
+            startup="%.2f s" % (node.startupTime) if success else "FAILED"
+            Utils.Print("  node %s startup: %s" % (node.nodeId, startup))
+        return all(results)
 
     @staticmethod
     def dumpErrorDetailImpl(fileName):
@@ -1629,7 +1715,7 @@ class Cluster(object):
         with open(startFile, 'r') as file:
             cmd=file.read()
             Utils.Print("unstarted local node cmd: %s" % (cmd))
-        instance=Node(self.host, port=self.port+nodeId, nodeId=nodeId, pid=None, cmd=cmd, walletMgr=self.walletMgr)
+        instance=self.localNode(nodeId, self.port+nodeId, pid=None, cmd=cmd)
         if Utils.Debug: Utils.Print("Unstarted Node>", instance)
         return instance
 
@@ -1777,33 +1863,15 @@ class Cluster(object):
 
         non_leaders = []
         leader = []
-        ha_infos = {}
-
-        leader_id = -1
-        continue_checking = False
-        start_time = time.time()
-        while (leader_id == -1 or continue_checking) and time.time() < start_time + 30:
-            continue_checking = False
-            # get ha_infos
-            for i in range(len(nodes)):
-                ha_infos[i] = nodes[i].get_producer_ha_info()
-            # analyze ha_infos
-            for i in range(len(nodes)):
-                cur_leader_id = ha_infos[i]["leader_id"]
-                if leader_id != -1:
-                    if cur_leader_id != leader_id:
-                        Utils.Print("It seems the leadership changed during the checking. " +
-                                    "Continue checking for next round.")
-                        continue_checking = True
-                        leader_id = cur_leader_id
-                else:
-                    leader_id = cur_leader_id
 
-        if leader_id == -1:
-            Utils.errorExit("Leader not found.")
+        watcher = ProducerHaWatcher(nodes).start()
+        try:
+            leader_id = watcher.waitForLeader(timeout=30)
+        finally:
+            watcher.stop()
 
-        if continue_checking:
-            Utils.errorExit("Leader is still changing after timeout.")
+        if leader_id == -1:
+            Utils.errorExit("No leader all nodes agree on after timeout.")
 
         # ensure leader is producing
         leader_node = nodes[leader_id]
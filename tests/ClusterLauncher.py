@@ -0,0 +1,457 @@
+import concurrent.futures
+import json
+import math
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import time
+
+from testUtils import Utils
+
+###########################################################################################
+# ClusterLauncher
+#
+# Generates the configuration of a local test network (config.ini, logging.json and genesis.json
+# for every node, producer key assignment, p2p peer lists, setprods.json and bios_boot.sh) directly
+# from a topology description, then starts all nodeos instances at once. It produces the same
+# layout as eosio-launcher so the rest of the harness (node discovery, bios_boot.sh bootstrap,
+# "eosio-launcher -k" shutdown through last_run.json) keeps working.
+#
+###########################################################################################
+
+class LauncherNode(object):
+    def __init__(self, name, index, configDir, dataDir, httpPort, p2pPort):
+        self.name=name
+        self.index=index           # None for bios
+        self.configDir=configDir
+        self.dataDir=dataDir
+        self.httpPort=httpPort
+        self.p2pPort=p2pPort
+        self.host=ClusterLauncher.HostName
+        self.p2pEndpoint="%s:%d" % (ClusterLauncher.PublicName, p2pPort)
+        self.keys=[]               # list of (public, private)
+        self.producers=[]
+        self.peers=[]
+        self.dontStart=False
+        self.pid=None
+
+    def isBios(self):
+        return self.index is None
+
+    def key(self):
+        return "bios" if self.isBios() else self.index
+
+# pylint: disable=too-many-instance-attributes
+class ClusterLauncher(object):
+    Shapes=["mesh", "star", "ring", "bridge"]
+
+    HostName="127.0.0.1"
+    PublicName="localhost"
+    ListenAddr="0.0.0.0"
+    NetworkName="testnet_"
+    BiosPublicKey="EOS6MRyAjQq8ud7hVNYcfnVPJqcVpscN5So8BhtHuGYqET5GDW5CV"
+    BiosPrivateKey="5KQwrPbwdL6PhXujxW37FSSQZ1JiwsST4cqQzDeyXtP79zkvFD3"
+    BiosBootTemplate="etc/eosio/launcher/testnet.template"
+    BiosBootScript="bios_boot.sh"
+    SetProdsFile="setprods.json"
+    LastRunFile="last_run.json"
+
+    # matches eosio::chain::genesis_state defaults, written when the genesis file does not exist
+    DefaultGenesis={
+        "initial_timestamp": "2018-06-01T12:00:00.000",
+        "initial_key": BiosPublicKey,
+        "initial_configuration": {
+            "max_block_net_usage": 1048576,
+            "target_block_net_usage_pct": 1000,
+            "max_transaction_net_usage": 524288,
+            "base_per_transaction_net_usage": 12,
+            "net_usage_leeway": 500,
+            "context_free_discount_net_usage_num": 20,
+            "context_free_discount_net_usage_den": 100,
+            "max_block_cpu_usage": 200000,
+            "target_block_cpu_usage_pct": 1000,
+            "max_transaction_cpu_usage": 150000,
+            "min_transaction_cpu_usage": 100,
+            "max_transaction_lifetime": 3600,
+            "deferred_trx_expiration_window": 600,
+            "max_transaction_delay": 3888000,
+            "max_inline_action_size": 524288,
+            "max_inline_action_depth": 4,
+            "max_authority_depth": 6
+        }
+    }
+
+    DebugLoggers=["default", "net_plugin_impl", "http_plugin", "producer_plugin", "trace_api"]
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, pnodes=1, totalNodes=1, unstartedNodes=0, producers=21, sharedProducers=0, shape="mesh", genesisPath="./genesis.json",
+                 genesisTimestamp=None, nodeosArgs="", specificNodeosArgs=None, specificInstallPaths=None, prodHa=False, nogen=False, delay=0,
+                 httpBasePort=8888, p2pBasePort=9876, netns=None):
+        """pnodes, totalNodes, unstartedNodes, producers and sharedProducers have the meaning of the eosio-launcher options of the same name.
+        shape: one of ClusterLauncher.Shapes.
+        specificNodeosArgs: dictionary of node number to extra nodeos arguments for that node.
+        specificInstallPaths: dictionary of node number to the installation path of the nodeos to run for that node.
+        netns: NetnsNetwork, already set up, to run every node in its own network namespace."""
+        assert shape in ClusterLauncher.Shapes, "unsupported shape %s" % (shape)
+        self.shape=shape
+        self.genesisPath=genesisPath
+        self.genesisTimestamp=genesisTimestamp
+        self.nodeosArgs=nodeosArgs
+        self.specificNodeosArgs=specificNodeosArgs if specificNodeosArgs is not None else {}
+        self.specificInstallPaths=specificInstallPaths if specificInstallPaths is not None else {}
+        self.prodHa=prodHa
+        self.nogen=nogen
+        self.delay=delay
+        self.httpBasePort=httpBasePort
+        self.p2pBasePort=p2pBasePort
+        self.netns=netns
+        self.launchTime=time.strftime("%Y_%m_%d_%H_%M_%S")
+
+        # same node count adjustments as eosio-launcher, which counts bios among both producer and total nodes
+        self.producerCount=producers
+        self.sharedProducers=sharedProducers
+        self.unstartedNodes=unstartedNodes
+        self.prodNodes=pnodes+1
+        self.totalNodes=totalNodes+1
+        if self.prodNodes > producers + 1:
+            self.prodNodes=producers
+        if self.prodNodes > self.totalNodes:
+            self.totalNodes=self.prodNodes + unstartedNodes
+        elif self.totalNodes < self.prodNodes + unstartedNodes:
+            raise RuntimeError("totalNodes must be equal or greater than pnodes + unstartedNodes")
+
+        self.nodes=[]              # bios first, then testnet_00, testnet_01, ...
+        self.schedule=[]           # list of (producer name, public key)
+
+    @staticmethod
+    def producerName(producerNumber, shared=False):
+        """Producer names as assigned by eosio-launcher: defproducera .. defproducerz, then defpraaaaaab, ..."""
+        slotChars="abcdefghijklmnopqrstuvwxyz"
+        name=list("defproducera")
+        if producerNumber > len(slotChars):
+            name[5:]="a" * 7
+        for loc in range(len(name)-1, -1, -1):
+            name[loc]=slotChars[producerNumber % len(slotChars)]
+            producerNumber//=len(slotChars)
+            if producerNumber == 0:
+                break
+        if shared:
+            name[0:3]="shr"
+        return "".join(name)
+
+    @staticmethod
+    def createKey():
+        cmd="%s create key --to-console" % (Utils.EosClientPath)
+        if Utils.Debug: Utils.Print("cmd: %s" % (cmd))
+        keyStr=Utils.checkOutput(cmd.split())
+        m=re.search(r'Private key: (.+)\nPublic key: (.+)\n', keyStr)
+        if m is None:
+            Utils.errorExit("Key creation regex mismatch: %s" % (keyStr))
+        return (m.group(2), m.group(1))
+
+    def defineNetwork(self):
+        toNotStartNode=self.totalNodes - self.unstartedNodes - 1
+        bios=LauncherNode("bios", None, os.path.join(Utils.ConfigDir, "node_bios"), os.path.join(Utils.DataDir, "node_bios"),
+                          self.httpBasePort-100, self.p2pBasePort-100)
+        self.nodes=[bios]
+        for i in range(self.totalNodes-1):
+            ext="%02d" % (i)
+            self.nodes.append(LauncherNode(ClusterLauncher.NetworkName + ext, i, os.path.join(Utils.ConfigDir, "node_" + ext),
+                                           os.path.join(Utils.DataDir, "node_" + ext), self.httpBasePort+i, self.p2pBasePort+i))
+            self.nodes[-1].dontStart=i >= toNotStartNode
+        if self.netns is not None:
+            for node in self.nodes:
+                node.host=self.netns.address(node.key())
+                node.p2pEndpoint="%s:%d" % (node.host, node.p2pPort)
+
+    def bindNodes(self):
+        """Assigns keys and producers to nodes, spreading the producers over the producer nodes as evenly as possible."""
+        if self.prodNodes < 2:
+            raise RuntimeError("Unable to allocate producers due to insufficient producer nodes = %d" % (self.prodNodes))
+        nonBios=self.prodNodes-1
+        perNode=self.producerCount // nonBios
+        extra=self.producerCount % nonBios
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, self.totalNodes)) as executor:
+            keys=list(executor.map(lambda _: ClusterLauncher.createKey(), range(self.totalNodes-1)))
+
+        producerNumber=0
+        for node in self.nodes:
+            if node.isBios():
+                node.keys.append((ClusterLauncher.BiosPublicKey, ClusterLauncher.BiosPrivateKey))
+                node.producers.append("eosio")
+                self.schedule.append(("eosio", ClusterLauncher.BiosPublicKey))
+                continue
+            node.keys.append(keys[node.index])
+            publicKey=node.keys[0][0]
+            if node.index < nonBios:
+                count=perNode
+                if extra:
+                    count+=1
+                    extra-=1
+                for _ in range(count):
+                    name=ClusterLauncher.producerName(producerNumber)
+                    node.producers.append(name)
+                    self.schedule.append((name, publicKey))
+                    producerNumber+=1
+                for j in range(self.sharedProducers):
+                    name=ClusterLauncher.producerName(j, shared=True)
+                    node.producers.append(name)
+                    self.schedule.append((name, publicKey))
+
+    def makeRing(self):
+        others=self.nodes[1:]
+        if len(others) > 2:
+            for i,node in enumerate(others):
+                node.peers.append(others[(i+1) % len(others)].name)
+        elif len(others) == 2:
+            others[0].peers.append(others[1].name)
+            others[1].peers.append(others[0].name)
+
+    def makeStar(self):
+        others=self.nodes[1:]
+        count=len(others)
+        if count < 4:
+            self.makeRing()
+            return
+        links=3
+        if count > 12:
+            links=int(math.sqrt(count)) + 2
+        gap=3 if count > 6 else (count - links) // 2 + 1
+        while count % gap == 0:
+            gap+=1
+        # connections are bidirectional, a peer that already links to us is not linked back. eosio-launcher means to do
+        # the same with peers_to_from but its check never skips a link, so this star has fewer links than the launcher's
+        established=set()
+        for i,node in enumerate(others):
+            ndx=i
+            for l in range(1, links+1):
+                ndx=(ndx + l*gap) % count
+                # skip over ourselves and peers already linked
+                while ndx == i or others[ndx].name in node.peers:
+                    ndx=(ndx+1) % count
+                peer=others[ndx].name
+                if (peer, node.name) in established:
+                    continue
+                node.peers.append(peer)
+                established.add((node.name, peer))
+
+    def makeMesh(self):
+        others=self.nodes[1:]
+        # connections are bidirectional, each pair of nodes is linked once by the node listed first
+        for i,node in enumerate(others):
+            node.peers=[peer.name for peer in others[i+1:]]
+
+    def makeBridge(self):
+        """Splits the producer nodes in two groups, each fully connected, which only reach each other through the non-producing nodes."""
+        others=self.nodes[1:]
+        producerNames=[ClusterLauncher.producerName(i) for i in range(self.producerCount)]
+        secondGroupStart=int((self.producerCount+1)/2)
+        bridgeNodes=[]
+        producerGroup1=[]
+        producerGroup2=[]
+        for node in others:
+            if len(node.producers) == 0:
+                bridgeNodes.append(node)
+                continue
+            groups={1 if producerNames.index(prod) < secondGroupStart else 2 for prod in node.producers if prod in producerNames}
+            if len(groups) != 1:
+                Utils.errorExit("Node configuration not consistent with \"bridge\" topology. Node %s has producers that fall into both halves of the bridged network" % (node.name))
+            (producerGroup1 if 1 in groups else producerGroup2).append(node)
+
+        for node in bridgeNodes:
+            node.peers=[prodNode.name for prodNode in producerGroup1 + producerGroup2]
+        for group in [producerGroup1, producerGroup2]:
+            for node in group:
+                node.peers=[peer.name for peer in group if peer is not node] + [bridge.name for bridge in bridgeNodes]
+
+    def generate(self):
+        """Builds the network and writes every node's configuration. Returns False on failure."""
+        self.defineNetwork()
+        if self.nogen:
+            return True
+        self.bindNodes()
+        if self.shape == "ring":
+            self.makeRing()
+        elif self.shape == "star":
+            self.makeStar()
+        elif self.shape == "mesh":
+            self.makeMesh()
+        else:
+            self.makeStar()
+            self.makeBridge()
+
+        genesis=self.loadGenesis()
+        if genesis is None or not self.writeBiosBoot():
+            return False
+        self.writeSetProds()
+        for node in self.nodes:
+            if self.prodHa and node.isBios():
+                continue
+            os.makedirs(node.configDir, exist_ok=True)
+            self.writeConfig(node)
+            self.writeLoggingConfig(node)
+            with open(os.path.join(node.configDir, "genesis.json"), "w") as f:
+                json.dump(genesis, f, indent=2)
+        return True
+
+    def loadGenesis(self):
+        if not os.path.exists(self.genesisPath):
+            Utils.Print("generating default genesis file %s" % (self.genesisPath))
+            with open(self.genesisPath, "w") as f:
+                json.dump(ClusterLauncher.DefaultGenesis, f, indent=2)
+        try:
+            with open(self.genesisPath, "r") as f:
+                genesis=json.load(f)
+        except (OSError, ValueError) as ex:
+            Utils.Print("ERROR: Unable to read genesis file %s: %s" % (self.genesisPath, ex))
+            return None
+        genesis["initial_key"]=self.nodes[0].keys[0][0]
+        return genesis
+
+    def writeConfig(self, node):
+        lines=[
+            "blocks-dir = blocks",
+            "http-server-address = %s:%d" % (node.host, node.httpPort),
+            "http-validate-host = false",
+            "p2p-listen-endpoint = %s:%d" % (ClusterLauncher.ListenAddr, node.p2pPort),
+            "p2p-server-address = %s" % (node.p2pEndpoint)
+        ]
+        if node.isBios() or self.prodHa:
+            lines.append("enable-stale-production = true")
+        lines.append("allowed-connection = any")
+        if not self.prodHa:
+            if not node.isBios():
+                lines.append("p2p-peer-address = %s" % (self.nodes[0].p2pEndpoint))
+            nodesByName={n.name: n for n in self.nodes}
+            for peer in node.peers:
+                lines.append("p2p-peer-address = %s" % (nodesByName[peer].p2pEndpoint))
+        if len(node.producers) > 0:
+            for publicKey,privateKey in node.keys:
+                lines.append("private-key = [\"%s\",\"%s\"]" % (publicKey, privateKey))
+            for producer in node.producers:
+                lines.append("producer-name = %s" % ("eosio" if self.prodHa else producer))
+            lines.append("plugin = eosio::producer_plugin")
+        lines.append("plugin = eosio::net_plugin")
+        lines.append("plugin = eosio::chain_api_plugin")
+        with open(os.path.join(node.configDir, "config.ini"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def writeLoggingConfig(self, node):
+        sink={ "name": "stderr_color_st", "type": "stderr_color_sink_st", "args": {} }
+        loggers=[{ "name": name, "level": "debug", "sinks": [sink["name"]], "sync_type": "sync" } for name in ClusterLauncher.DebugLoggers]
+        with open(os.path.join(node.configDir, "logging.json"), "w") as f:
+            json.dump({ "includes": [], "sinks": [sink], "loggers": loggers }, f, indent=2)
+
+    def writeSetProds(self):
+        schedule=[{ "producer_name": name, "block_signing_key": key } for name,key in self.schedule if name != "eosio"]
+        with open(ClusterLauncher.SetProdsFile, "w") as f:
+            json.dump({ "schedule": schedule }, f, indent=2)
+
+    def writeBiosBoot(self):
+        """Writes bios_boot.sh from the launcher template, filling in the bios endpoint, node keys and producer accounts."""
+        try:
+            with open(ClusterLauncher.BiosBootTemplate, "r") as f:
+                template=f.read().splitlines()
+        except OSError as ex:
+            Utils.Print("ERROR: Unable to open %s: %s" % (ClusterLauncher.BiosBootTemplate, ex))
+            return False
+
+        bios=self.nodes[0]
+        inserts={
+            "envars": ["bioshost=%s" % (bios.host), "biosport=%d" % (bios.httpPort)],
+            "prodkeys": ["wcmd import -n ignition --private-key %s" % (node.keys[0][1]) for node in sorted(self.nodes, key=lambda n: n.name)],
+            "cacmd": ["cacmd %s %s %s" % (name, key, key) for name,key in self.schedule if name != "eosio"]
+        }
+        prefix="###INSERT "
+        with open(ClusterLauncher.BiosBootScript, "w") as f:
+            for line in template:
+                if line.startswith(prefix):
+                    for inserted in inserts.get(line[len(prefix):], []):
+                        f.write(inserted + "\n")
+                f.write(line + "\n")
+        return True
+
+    def nodeosCmd(self, node):
+        installPath=""
+        if not node.isBios() and node.index in self.specificInstallPaths:
+            installPath=self.specificInstallPaths[node.index] + "/"
+        cmd=installPath + Utils.EosServerPath + " "
+        if self.nodeosArgs:
+            cmd+=self.nodeosArgs + " "
+        if not node.isBios() and node.index in self.specificNodeosArgs:
+            cmd+=self.specificNodeosArgs[node.index] + " "
+        cmd+=" --config-dir %s --data-dir %s" % (node.configDir, node.dataDir)
+        cmd+=" --genesis-json %s" % (os.path.join(node.configDir, "genesis.json"))
+        if self.genesisTimestamp:
+            cmd+=" --genesis-timestamp %s" % (self.genesisTimestamp)
+        if "eosio::history_api_plugin" in cmd and "eosio::trace_api_plugin" in cmd:
+            # remove trace_api_plugin from old version nodes in multiversion test
+            for arg in ["--plugin eosio::trace_api_plugin", "--trace-no-abis", "--trace-rpc-abi"]:
+                cmd=re.sub(r"%s.*?(?=--|$)" % (re.escape(arg)), "", cmd, count=1)
+        return cmd
+
+    def prepareDataDir(self, node):
+        os.makedirs(node.dataDir, exist_ok=True)
+        for subDir in ["blocks", "state"]:
+            shutil.rmtree(os.path.join(node.dataDir, subDir), ignore_errors=True)
+
+    def start(self):
+        """Starts every node in one shell, which exits right away so the nodes are not left as children of the test process."""
+        script=[]
+        started=[]
+        runningNodes=[]
+        for node in self.nodes:
+            if self.prodHa and node.isBios():
+                continue
+            self.prepareDataDir(node)
+            cmd=self.nodeosCmd(node)
+            if node.dontStart:
+                Utils.Print("not spawning child, %s" % (cmd))
+                with open(os.path.join(node.dataDir, "start.cmd"), "w") as f:
+                    f.write(cmd + "\n")
+                continue
+            Utils.Print("spawning child, %s" % (cmd))
+            stderrBase="stderr.%s.txt" % (self.launchTime)
+            stderrLink=os.path.join(node.dataDir, "stderr.txt")
+            if os.path.lexists(stderrLink):
+                os.remove(stderrLink)
+            os.symlink(stderrBase, stderrLink)
+            if len(started) > 0 and self.delay:
+                script.append("sleep %d" % (self.delay))
+            if self.netns is not None:
+                cmd=self.netns.wrap(node.key(), cmd)
+            script.append("%s > %s 2> %s &" % (" ".join(shlex.quote(arg) for arg in cmd.split()),
+                                                shlex.quote(os.path.join(node.dataDir, "stdout.txt")),
+                                                shlex.quote(os.path.join(node.dataDir, stderrBase))))
+            script.append("echo $!")
+            started.append(node)
+
+        if len(started) > 0:
+            out=subprocess.run(["sh", "-c", "\n".join(script)], stdout=subprocess.PIPE, check=True, encoding="utf-8").stdout
+            pids=out.split()
+            assert len(pids) == len(started), "expected %d pids, got: %s" % (len(started), out)
+            for node,pid in zip(started, pids):
+                node.pid=int(pid)
+                pidFile=os.path.join(node.dataDir, "%s.pid" % (Utils.EosServerName))
+                with open(pidFile, "w") as f:
+                    f.write(pid)
+                runningNodes.append({ "remote": False, "pid_file": pidFile, "kill_cmd": "" })
+
+        with open(ClusterLauncher.LastRunFile, "w") as f:
+            json.dump({ "running_nodes": runningNodes }, f, indent=2)
+        return True
+
+    def launch(self):
+        """Generates the network configuration and starts the nodes. Returns False on failure."""
+        start=time.time()
+        if not self.generate():
+            return False
+        generated=time.time()
+        if not self.start():
+            return False
+        Utils.Print("Launched %d nodes, configs written in %.2f seconds, processes started in %.2f seconds" %
+                    (sum(1 for node in self.nodes if node.pid is not None), generated-start, time.time()-generated))
+        return True
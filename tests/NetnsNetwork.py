@@ -0,0 +1,173 @@
+import os
+import subprocess
+
+from testUtils import Utils
+
+###########################################################################################
+# NetnsNetwork
+#
+# Emulates a network of hosts on one Linux machine. Every node gets its own network namespace
+# connected through a veth pair to a bridge in the root namespace, so the test process can reach
+# all of them and each node sees its peers over a real network device. Bandwidth, loss and delay
+# are applied per link with tc (htb classes with a netem child selected by destination address),
+# or to a node's whole device through exec(), which accepts the same "{dev}" commands as
+# p2p_test_peers.P2PTestPeers.exec.
+#
+# Requires root (or CAP_NET_ADMIN) and the iproute2 ip and tc tools.
+#
+###########################################################################################
+
+class NetnsNetwork(object):
+    NodeDev="eth0"
+    MaxRate="10gbit"
+
+    def __init__(self, prefix="eosns", subnet="10.213.0", bridge="eosbr0"):
+        """prefix: prefix of the namespace and host side veth names.
+        subnet: first three octets of the /24 the nodes are addressed in, the bridge gets .1."""
+        self.prefix=prefix
+        self.subnet=subnet
+        self.bridge=bridge
+        self.nodes={}              # key -> index, key is a node number or "bios"
+        self.htbReady=set()        # keys whose device has the per link htb root installed
+        self.linkFilters=set()     # (src, dst) pairs with a filter installed
+        self.links={}              # (src, dst) -> settings applied to traffic from src to dst
+
+    @staticmethod
+    def run(cmd, silent=False):
+        if Utils.Debug: Utils.Print("cmd: %s" % (cmd))
+        ret=subprocess.run(cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+        if ret.returncode != 0 and not silent:
+            Utils.Print("ERROR: \"%s\" failed: %s" % (cmd, ret.stderr.strip()))
+        return ret.returncode == 0
+
+    def namespace(self, key):
+        return "%s_%s" % (self.prefix, key)
+
+    def hostDev(self, key):
+        # interface names are limited to 15 characters
+        return "%sv%d" % (self.prefix[:8], self.nodes[key])
+
+    def address(self, key):
+        return "%s.%d" % (self.subnet, 10 + self.nodes[key])
+
+    def wrap(self, key, cmd):
+        """Returns cmd so that it runs inside the namespace of node key."""
+        return "ip netns exec %s %s" % (self.namespace(key), cmd)
+
+    def execIn(self, key, cmd, silent=False):
+        return NetnsNetwork.run(self.wrap(key, cmd), silent=silent)
+
+    def setup(self, keys):
+        """Creates the bridge and a namespace for each of keys. Returns False on failure."""
+        self.teardown(silent=True)
+        if not NetnsNetwork.run("ip link add %s type bridge" % (self.bridge)) or \
+           not NetnsNetwork.run("ip addr add %s.1/24 dev %s" % (self.subnet, self.bridge)) or \
+           not NetnsNetwork.run("ip link set %s up" % (self.bridge)):
+            return False
+        for key in keys:
+            self.nodes[key]=len(self.nodes)
+            ns=self.namespace(key)
+            dev=self.hostDev(key)
+            for cmd in ["ip netns add %s" % (ns),
+                        "ip link add %s type veth peer name %s netns %s" % (dev, NetnsNetwork.NodeDev, ns),
+                        "ip link set %s master %s" % (dev, self.bridge),
+                        "ip link set %s up" % (dev),
+                        self.wrap(key, "ip addr add %s/24 dev %s" % (self.address(key), NetnsNetwork.NodeDev)),
+                        self.wrap(key, "ip link set %s up" % (NetnsNetwork.NodeDev)),
+                        self.wrap(key, "ip link set lo up"),
+                        self.wrap(key, "ip route add default via %s.1" % (self.subnet))]:
+                if not NetnsNetwork.run(cmd):
+                    return False
+        Utils.Print("Created %d network namespaces on bridge %s (%s.0/24)" % (len(self.nodes), self.bridge, self.subnet))
+        return True
+
+    def teardown(self, silent=False):
+        """Deletes the namespaces, which also removes their veth pairs, and the bridge."""
+        names=set(self.namespace(key) for key in self.nodes)
+        listing=subprocess.run(["ip", "netns", "list"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="utf-8").stdout
+        names.update(line.split()[0] for line in listing.splitlines() if line.startswith(self.prefix + "_"))
+        for ns in names:
+            NetnsNetwork.run("ip netns del %s" % (ns), silent=silent)
+        if os.path.exists("/sys/class/net/%s" % (self.bridge)):
+            NetnsNetwork.run("ip link del %s" % (self.bridge), silent=silent)
+        self.nodes={}
+        self.htbReady=set()
+        self.linkFilters=set()
+        self.links={}
+
+    @staticmethod
+    def netemArgs(delay=None, jitter=None, loss=None):
+        args="netem"
+        if delay is not None:
+            args+=" delay %s" % (delay)
+            if jitter is not None:
+                args+=" %s" % (jitter)
+        if loss is not None:
+            args+=" loss %s" % (loss)
+        return args
+
+    def __classId(self, dst):
+        # tc handles are hex, 1:1 is the unshaped default class
+        return "%x" % (0x10 + self.nodes[dst])
+
+    def __shapeEgress(self, src, dst, rate, delay, jitter, loss):
+        dev=NetnsNetwork.NodeDev
+        if src not in self.htbReady:
+            if not self.execIn(src, "tc qdisc replace dev %s root handle 1: htb default 1" % (dev)) or \
+               not self.execIn(src, "tc class replace dev %s parent 1: classid 1:1 htb rate %s" % (dev, NetnsNetwork.MaxRate)):
+                return False
+            self.htbReady.add(src)
+            self.linkFilters={link for link in self.linkFilters if link[0] != src}
+        classId=self.__classId(dst)
+        if not self.execIn(src, "tc class replace dev %s parent 1: classid 1:%s htb rate %s" % (dev, classId, rate if rate else NetnsNetwork.MaxRate)) or \
+           not self.execIn(src, "tc qdisc replace dev %s parent 1:%s handle %s: %s" % (dev, classId, classId, NetnsNetwork.netemArgs(delay, jitter, loss))):
+            return False
+        if (src, dst) not in self.linkFilters:
+            if not self.execIn(src, "tc filter add dev %s parent 1: protocol ip prio 1 u32 match ip dst %s/32 flowid 1:%s" % (dev, self.address(dst), classId)):
+                return False
+            self.linkFilters.add((src, dst))
+        self.links[(src, dst)]={ "rate": rate, "delay": delay, "jitter": jitter, "loss": loss }
+        return True
+
+    # pylint: disable=too-many-arguments
+    def setLink(self, a, b, rate=None, delay=None, jitter=None, loss=None, bidirectional=True):
+        """Impairs the link between nodes a and b, e.g. setLink(0, 1, rate="1mbit", delay="50ms", loss="1%").
+        rate, delay and jitter take tc units; with bidirectional both directions get the same settings."""
+        Utils.Print("Link %s -> %s%s: rate=%s delay=%s jitter=%s loss=%s" % (a, b, " (and back)" if bidirectional else "", rate, delay, jitter, loss))
+        if not self.__shapeEgress(a, b, rate, delay, jitter, loss):
+            return False
+        return not bidirectional or self.__shapeEgress(b, a, rate, delay, jitter, loss)
+
+    def clearLink(self, a, b, bidirectional=True):
+        """Removes the impairment of the link between nodes a and b."""
+        return self.setLink(a, b, bidirectional=bidirectional)
+
+    def reset(self):
+        """Removes all impairments from every node."""
+        for key in self.nodes:
+            self.execIn(key, "tc qdisc del dev %s root" % (NetnsNetwork.NodeDev), silent=True)
+        self.htbReady=set()
+        self.linkFilters=set()
+        self.links={}
+
+    def exec(self, remoteCmd, toprint=True):
+        """Runs remoteCmd in every namespace with {dev} replaced by the node's device, as P2PTestPeers.exec does over ssh.
+        Replacing the root qdisc this way discards per link settings on that device."""
+        for key in self.nodes:
+            cmd=self.wrap(key, remoteCmd.replace("{dev}", NetnsNetwork.NodeDev))
+            if toprint is True:
+                print("execute:" + cmd)
+            NetnsNetwork.run(cmd)
+        self.htbReady=set()
+        self.linkFilters=set()
+        self.links={}
+
+    def counters(self, key):
+        """Bytes and packets node key sent and received, read from the host side of its veth pair."""
+        stats={}
+        # the host side device transmits what the node receives
+        for name,counter in [("rx_bytes", "tx_bytes"), ("tx_bytes", "rx_bytes"), ("rx_packets", "tx_packets"), ("tx_packets", "rx_packets"),
+                             ("dropped", "tx_dropped")]:
+            with open("/sys/class/net/%s/statistics/%s" % (self.hostDev(key), counter), "r") as f:
+                stats[name]=int(f.read())
+        return stats
@@ -1,3 +1,4 @@
+import concurrent.futures
 import copy
 import decimal
 import subprocess
@@ -7,6 +8,11 @@ import re
 import json
 import signal
 import platform
+import hashlib
+import http.client
+import urllib.error
+import urllib.request
+import zlib
 
 from datetime import datetime
 from datetime import timedelta
@@ -53,6 +59,9 @@ class Node(object):
         self.amqpAddr=amqpAddr
         self.missingTransaction=False
         self.popenProc=None           # initial process is started by launcher, this will only be set on relaunch
+        self.launchStartTime=None
+        self.startupTime=None         # seconds from the last relaunch until the node answered http requests
+        self.netns=None               # network namespace the node runs in, see NetnsNetwork
 
     def eosClientArgs(self):
         walletArgs=" " + self.walletMgr.getWalletEndpointArgs() if self.walletMgr is not None else ""
@@ -202,6 +211,14 @@ class Node(object):
         transId=trans["transaction_id"] if "transaction_id" in trans else trans["result"]["id"]
         return transId
 
+    @staticmethod
+    def getPackedTransId(packedTrx):
+        """Computes the id of a packed transaction (transferFunds(..., dontSend=True, returnPacked=True)) without sending it."""
+        trx=bytes.fromhex(packedTrx["packed_trx"])
+        if packedTrx.get("compression", "none") == "zlib":
+            trx=zlib.decompress(trx)
+        return hashlib.sha256(trx).hexdigest()
+
     @staticmethod
     def isTrans(obj):
         """Identify if this is a transaction dictionary."""
@@ -572,7 +589,7 @@ class Node(object):
         return self.waitForBlock(blockNum, timeout=timeout, blockType=blockType)
 
     # Trasfer funds. Returns "transfer" json return object
-    def transferFunds(self, source, destination, amountStr, memo="memo", force=False, waitForTransBlock=False, exitOnError=True, reportStatus=True, sign=False, dontSend=False, expiration=None, skipSign=False):
+    def transferFunds(self, source, destination, amountStr, memo="memo", force=False, waitForTransBlock=False, exitOnError=True, reportStatus=True, sign=False, dontSend=False, expiration=None, skipSign=False, returnPacked=False):
         assert isinstance(amountStr, str)
         assert(source)
         assert(isinstance(source, Account))
@@ -588,6 +605,9 @@ class Node(object):
         dontSendStr = ""
         if dontSend:
             dontSendStr = "--dont-broadcast "
+            if returnPacked:
+                # packed form, ready for sendPackedTransaction
+                dontSendStr += "--return-packed "
             if expiration is None:
                 # default transaction expiration to be 4 minutes in the future
                 expiration = 240
@@ -659,8 +679,9 @@ class Node(object):
 
         return balanceStr
 
-    def validateFunds(self, initialBalances, transferAmount, source, accounts):
-        """Validate each account has the expected SYS balance. Validate cumulative balance matches expectedTotal."""
+    def validateFunds(self, initialBalances, transferAmount, source, accounts, currentBalances=None):
+        """Validate each account has the expected SYS balance. Validate cumulative balance matches expectedTotal.
+        currentBalances are read from the node unless given."""
         assert(source)
         assert(isinstance(source, Account))
         assert(accounts)
@@ -670,7 +691,8 @@ class Node(object):
         assert(isinstance(initialBalances, dict))
         assert(isinstance(transferAmount, int))
 
-        currentBalances=self.getEosBalances([source] + accounts)
+        if currentBalances is None:
+            currentBalances=self.getEosBalances([source] + accounts)
         assert(currentBalances)
         assert(isinstance(currentBalances, dict))
         assert(len(initialBalances) == len(currentBalances))
@@ -703,6 +725,127 @@ class Node(object):
 
         return balances
 
+    def postApi(self, api, payload, timeout=30, returnErrors=False):
+        """POSTs payload as JSON to /v1/<api> over a direct HTTP request, without spawning cleos or curl. Returns the parsed response or None.
+        With returnErrors the error response of a rejected request, with its "code" and "error", is returned instead of None."""
+        request=urllib.request.Request("%s/v1/%s" % (self.endpointHttp, api), data=json.dumps(payload).encode("utf-8"),
+                                       headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as ex:
+            body=ex.read()
+            if returnErrors:
+                try:
+                    return json.loads(body)
+                except ValueError:
+                    pass
+            Utils.Print("ERROR: %s on %s failed: %s %s" % (api, self.endpointHttp, ex, body.decode("utf-8", "replace")))
+            return None
+        except (OSError, http.client.HTTPException, ValueError) as ex:
+            Utils.Print("ERROR: %s on %s failed: %s" % (api, self.endpointHttp, ex))
+            return None
+
+    def sendPackedTransaction(self, packedTrx, timeout=30):
+        """Sends a transaction signed ahead of time (transferFunds(..., dontSend=True, returnPacked=True)) through chain/send_transaction.
+        Returns the response, which holds "transaction_id" when accepted and "code" and "error" when rejected, or None."""
+        return self.postApi("chain/send_transaction", packedTrx, timeout=timeout, returnErrors=True)
+
+    def findTransactionsInBlocks(self, transIds, startBlockNum, endBlockNum=None, workers=8):
+        """Scans blocks startBlockNum to endBlockNum (default head) with concurrent chain/get_block requests.
+        Returns a dictionary of the found ids of transIds to the number of the block containing them, None on failure."""
+        if endBlockNum is None:
+            endBlockNum=self.getHeadBlockNum()
+        transIds=set(transIds)
+        found={}
+        blockNums=list(range(startBlockNum, endBlockNum + 1))
+        if len(blockNums) == 0:
+            return found
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(blockNums))) as executor:
+            blocks=list(executor.map(lambda blockNum: self.postApi("chain/get_block", {"block_num_or_id": blockNum}), blockNums))
+        for blockNum,block in zip(blockNums, blocks):
+            if block is None:
+                return None
+            for trans in block["transactions"]:
+                # deferred transactions appear only by id
+                transId=trans["trx"]["id"] if isinstance(trans["trx"], dict) else trans["trx"]
+                if transId in transIds:
+                    found[transId]=blockNum
+        return found
+
+    def getAllAccounts(self, pageSize=1000):
+        """Returns the names of all accounts on the chain, paging through chain/get_all_accounts. None on failure."""
+        names=[]
+        payload={"limit": pageSize}
+        while True:
+            page=self.postApi("chain/get_all_accounts", payload)
+            if page is None:
+                return None
+            names+=[account["name"] for account in page["accounts"]]
+            if page.get("more") is None:
+                return names
+            payload["lower_bound"]=page["more"]
+
+    def getTableScopes(self, contract, table, pageSize=1000):
+        """Returns the scopes holding rows of contract's table, paging through chain/get_table_by_scope. None on failure."""
+        scopes=[]
+        payload={"code": contract, "table": table, "limit": pageSize}
+        while True:
+            page=self.postApi("chain/get_table_by_scope", payload)
+            if page is None:
+                return None
+            scopes+=[row["scope"] for row in page["rows"] if row["table"] == table]
+            if not page.get("more"):
+                return scopes
+            payload["lower_bound"]=page["more"]
+
+    def getScopeBalance(self, scope, contract="eosio.token", symbol=CORE_SYMBOL, pageSize=100):
+        """Returns the symbol balance of scope in contract's accounts table as an integer, paging through chain/get_table_rows. None on failure."""
+        payload={"json": True, "code": contract, "scope": scope, "table": "accounts", "limit": pageSize}
+        while True:
+            page=self.postApi("chain/get_table_rows", payload)
+            if page is None:
+                return None
+            for row in page["rows"]:
+                if row["balance"].split()[1] == symbol:
+                    return Node.currencyStrToInt(row["balance"])
+            if not page.get("more"):
+                return 0
+            payload["lower_bound"]=page["next_key"]
+
+    def getEosBalancesBulk(self, accounts, contract="eosio.token", symbol=CORE_SYMBOL, workers=16):
+        """Returns a dictionary with account balances keyed by accounts, like getEosBalances, reading the balances over concurrent
+        direct get_table_rows requests. Accounts without a row in the accounts table have a balance of 0. None on failure."""
+        assert(isinstance(accounts, list))
+        scopes=self.getTableScopes(contract, "accounts")
+        if scopes is None:
+            return None
+        scopes=set(scopes)
+        holders=[account for account in accounts if account.name in scopes]
+        balances={account: 0 for account in accounts}
+        if len(holders) > 0:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(holders))) as executor:
+                for account,balance in zip(holders, executor.map(lambda account: self.getScopeBalance(account.name, contract, symbol), holders)):
+                    if balance is None:
+                        return None
+                    balances[account]=balance
+        return balances
+
+    def validateAccountsBulk(self, accounts):
+        """Validates all accounts exist against a single paged read of every account on the chain. Returns False when any is missing."""
+        assert(isinstance(accounts, list))
+        existing=self.getAllAccounts()
+        if existing is None:
+            Utils.Print("ERROR: Unable to read the accounts of node %s" % (self.nodeId))
+            return False
+        existing=set(existing)
+        missing=[account.name for account in accounts if account.name not in existing]
+        if len(missing) > 0:
+            Utils.Print("ERROR: node %s is missing %d of %d accounts: %s" % (self.nodeId, len(missing), len(accounts), ", ".join(missing[:20])))
+            return False
+        if Utils.Debug: Utils.Print("Validated %d accounts on node %s" % (len(accounts), self.nodeId))
+        return True
+
     # Gets accounts mapped to key. Returns json object
     def getAccountsByKey(self, key, exitOnError=False):
         cmdDesc = "get accounts"
@@ -1225,6 +1368,7 @@ class Node(object):
         # mark node as killed
         Utils.Print("Killed node pid: {}".format(self.pid))
         self.pid=None
+        self.popenProc=None
         self.killed=True
         return True
 
@@ -1323,7 +1467,11 @@ class Node(object):
     # pylint: disable=too-many-locals
     # If nodeosPath is equal to None, it will use the existing nodeos path
     def relaunch(self, chainArg=None, newChain=False, skipGenesis=True, timeout=Utils.systemWaitTimeout, addSwapFlags=None, deleteFlags={}, cachePopen=False, nodeosPath=None, waitForTerm=True):
+        cmd=self.startRelaunch(chainArg=chainArg, newChain=newChain, skipGenesis=skipGenesis, addSwapFlags=addSwapFlags, cachePopen=cachePopen, nodeosPath=nodeosPath)
+        return self.waitForRelaunch(cmd, timeout=timeout, waitForTerm=waitForTerm)
 
+    def startRelaunch(self, chainArg=None, newChain=False, skipGenesis=True, addSwapFlags=None, cachePopen=False, nodeosPath=None):
+        """Starts the node process without waiting for it, returns the command to pass to waitForRelaunch."""
         assert(self.pid is None)
         assert(self.killed)
 
@@ -1361,16 +1509,33 @@ class Node(object):
             myCmd=" ".join(cmdArr)
 
         cmd=myCmd + ("" if chainArg is None else (" " + chainArg))
+        self.launchStartTime=time.time()
         self.launchCmd(cmd, cachePopen)
-
-        def isNodeAlive():
-            """wait for node to be responsive."""
+        return cmd
+
+    def waitForHttpReady(self, timeout=Utils.systemWaitTimeout, initialDelay=0.05, maxDelay=1.0):
+        """Probes get_info with exponential backoff until the node answers, returns False if its process exits or timeout expires."""
+        url="%s/v1/chain/get_info" % (self.endpointHttp)
+        endTime=time.time()+timeout
+        delay=initialDelay
+        while True:
             try:
-                return True if self.checkPulse() else False
-            except (TypeError) as _:
+                with urllib.request.urlopen(url, timeout=maxDelay) as resp:
+                    if resp.status == 200:
+                        return True
+            except (OSError, http.client.HTTPException) as _:
                 pass
-            return False
+            if self.popenProc is not None and self.popenProc.poll() is not None:
+                if Utils.Debug: Utils.Print("Node %s exited with %s before becoming ready" % (self.nodeId, self.popenProc.returncode))
+                return False
+            remaining=endTime-time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay=min(delay*2, maxDelay)
 
+    def waitForRelaunch(self, cmd, timeout=Utils.systemWaitTimeout, waitForTerm=True):
+        """Waits for a node started by startRelaunch to be ready, or to terminate at its configured block."""
         class DidProcessExitGracefully:
             def __init__(self, popen, timeout):
                 self.popen = popen
@@ -1388,12 +1553,13 @@ class Node(object):
                         return False
 
         if "terminate-at-block" not in cmd or not waitForTerm:
-            isAlive=Utils.waitForTruth(isNodeAlive, timeout, sleepTime=1)
+            isAlive=self.waitForHttpReady(timeout)
         else:
             lam=DidProcessExitGracefully(self.popenProc, timeout)
             isAlive=Utils.waitForTruth(lam, timeout, sleepTime=1)
         if isAlive:
-            Utils.Print("Node relaunch was successful.")
+            self.startupTime=time.time()-self.launchStartTime
+            Utils.Print("Node relaunch was successful, node %s ready after %.2f seconds." % (self.nodeId, self.startupTime))
         else:
             Utils.Print("ERROR: Node relaunch Failed.")
             # Ensure the node process is really killed
@@ -1424,12 +1590,17 @@ class Node(object):
         stdoutFile="%s/stdout.txt" % (dataDir)
         stderrFile="%s/stderr.txt" % (dataDir)
         with open(stdoutFile, 'w') as sout, open(stderrFile, 'w') as serr:
+            if self.netns is not None:
+                cmd="ip netns exec %s %s" % (self.netns, cmd)
             Utils.Print("cmd: %s" % (cmd))
             popen=subprocess.Popen(cmd.split(), stdout=sout, stderr=serr)
             if cachePopen:
                 popen.outfile=sout
                 popen.errfile=serr
                 self.popenProc=popen
+            else:
+                # a Popen cached by an earlier launch belongs to a process that is gone
+                self.popenProc=None
             self.pid=popen.pid
             if Utils.Debug: Utils.Print("start Node host=%s, port=%s, pid=%s, cmd=%s" % (self.host, self.port, self.pid, self.cmd))
 
@@ -1619,14 +1790,15 @@ class Node(object):
         files.sort()
         return files
 
-    def analyzeProduction(self, specificBlockNum=None, thresholdMs=500):
+    def producedBlocks(self, specificBlockNum=None):
+        """Yields (blockNum, producer, slotTimeStr, prodTimeStr) for every block this node's stderr files report it produced,
+        or only for specificBlockNum. prodTimeStr is when production of the block finished."""
         dataDir=Utils.getNodeDataDir(self.nodeId)
         files=Node.findStderrFiles(dataDir)
-        blockAnalysis={}
         anyBlockStr=r'[0-9]+'
         initialTimestamp=r'\s+([0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}.[0-9]{3})\s'
         producedBlockPreStr=r'.+Produced\sblock\s+.+\s#('
-        producedBlockPostStr=r')\s@\s([0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}.[0-9]{3})'
+        producedBlockPostStr=r')\s@\s([0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}.[0-9]{3})(?:\ssigned\sby\s([a-z1-5.]+))?'
         anyBlockPtrn=re.compile(initialTimestamp + producedBlockPreStr + anyBlockStr + producedBlockPostStr)
         producedBlockPtrn=re.compile(initialTimestamp + producedBlockPreStr + str(specificBlockNum) + producedBlockPostStr) if specificBlockNum is not None else anyBlockPtrn
         producedBlockDonePtrn=re.compile(initialTimestamp + r'.+Producing\sBlock\s+#' + anyBlockStr + '\sreturned:\strue')
@@ -1640,6 +1812,7 @@ class Node(object):
                         prodTimeStr = match.group(1)
                         slotTimeStr = match.group(3)
                         blockNum = int(match.group(2))
+                        producer = match.group(4)
 
                         line = f.readline()
                         while line:
@@ -1655,26 +1828,41 @@ class Node(object):
 
                             line = f.readline()
 
-                        prodTime = datetime.strptime(prodTimeStr, Utils.TimeFmt)
-                        slotTime = datetime.strptime(slotTimeStr, Utils.TimeFmt)
-                        delta = prodTime - slotTime
-                        limit = timedelta(milliseconds=thresholdMs)
-                        if delta > limit:
-                            if blockNum in blockAnalysis:
-                                Utils.errorExit("Found repeat production of the same block num: %d in one of the stderr files in: %s" % (blockNum, dataDir))
-                            blockAnalysis[blockNum] = { "slot": slotTimeStr, "prod": prodTimeStr }
+                        yield (blockNum, producer, slotTimeStr, prodTimeStr)
 
                         if specificBlockNum is not None:
-                            return blockAnalysis
+                            return
 
                     if readLine:
                         line = f.readline()
 
+    def analyzeProduction(self, specificBlockNum=None, thresholdMs=500):
+        blockAnalysis={}
+        limit = timedelta(milliseconds=thresholdMs)
+        for blockNum, _, slotTimeStr, prodTimeStr in self.producedBlocks(specificBlockNum):
+            prodTime = datetime.strptime(prodTimeStr, Utils.TimeFmt)
+            slotTime = datetime.strptime(slotTimeStr, Utils.TimeFmt)
+            delta = prodTime - slotTime
+            if delta > limit:
+                if blockNum in blockAnalysis:
+                    Utils.errorExit("Found repeat production of the same block num: %d in one of the stderr files in: %s" % (blockNum, Utils.getNodeDataDir(self.nodeId)))
+                blockAnalysis[blockNum] = { "slot": slotTimeStr, "prod": prodTimeStr }
+
         if specificBlockNum is not None and specificBlockNum not in blockAnalysis:
             blockAnalysis[specificBlockNum] = { "slot": None, "prod": None}
 
         return blockAnalysis
 
+    def productionLatencies(self):
+        """Returns, for every block this node produced, a dictionary of blockNum, producer, slot and prod timestamps and
+        latencyMs, the time from the block's slot until its production finished (negative when produced ahead of the slot)."""
+        latencies=[]
+        for blockNum, producer, slotTimeStr, prodTimeStr in self.producedBlocks():
+            delta = datetime.strptime(prodTimeStr, Utils.TimeFmt) - datetime.strptime(slotTimeStr, Utils.TimeFmt)
+            latencies.append({ "blockNum": blockNum, "producer": producer, "slot": slotTimeStr, "prod": prodTimeStr,
+                               "latencyMs": delta.total_seconds() * 1000 })
+        return latencies
+
     def hasProducedBlockInRange(self, blockProducer, range):
         """Returns if any block in the specified range is produced by the specified producer"""
         try: 
@@ -1754,6 +1942,32 @@ class Node(object):
                         "address": "localhost:{}".format(8988 + i + cntClstr)}
             if use_relay:
                 peers[i]["listening_port"] = "{}".format(18988 + i + cntClstr)
+        configDic = Node.ha_config_dict(id, peers, is_active=is_active, use_relay=use_relay, quorum_size=quorum_size,
+                                        leadership_expiry_ms=leadership_expiry_ms, heart_beat_interval_ms=heart_beat_interval_ms,
+                                        snapshot_distance=snapshot_distance, enable_ssl=enable_ssl, server_cert_file=server_cert_file,
+                                        server_key_file=server_key_file, root_cert_file=root_cert_file,
+                                        allowed_ssl_subject_names=allowed_ssl_subject_names)
+
+        config_ha = json.dumps(configDic, indent=2)
+        with open("config_ha_{}.json".format(id), "w") as jsonFile:
+            jsonFile.write(config_ha)
+
+    @staticmethod
+    def ha_config_dict(id,
+                       peers,
+                       is_active=True,
+                       use_relay=False,
+                       quorum_size=2,
+                       leadership_expiry_ms=None,
+                       heart_beat_interval_ms=None,
+                       snapshot_distance=None,
+                       enable_ssl=False,
+                       server_cert_file=None,
+                       server_key_file=None,
+                       root_cert_file=None,
+                       allowed_ssl_subject_names=None
+                       ):
+        """Returns the producer_ha config of node id, peers is the list of {"id", "address"[, "listening_port"]} of its cluster."""
         configDic = {
             "is_active_raft_cluster": is_active,
             "leader_election_quorum_size": quorum_size,
@@ -1780,10 +1994,7 @@ class Node(object):
             configDic["server_key_file"] = server_key_file
             configDic["root_cert_file"] = root_cert_file
             configDic["allowed_ssl_subject_names"] = [sn for sn in allowed_ssl_subject_names]
-
-        config_ha = json.dumps(configDic, indent=2)
-        with open("config_ha_{}.json".format(id), "w") as jsonFile:
-            jsonFile.write(config_ha)
+        return configDic
 
     @staticmethod
     def execCommand(cmd, json=True):
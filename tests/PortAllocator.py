@@ -0,0 +1,110 @@
+import atexit
+import errno
+import json
+import os
+import socket
+import tempfile
+import time
+
+from testUtils import Utils
+
+###########################################################################################
+# PortAllocator
+#
+# Hands out TCP ports that no other test on the host is using. A port is leased by creating
+# <LeaseDir>/<port>.lease exclusively; the lease records the owning pid and an expiry time, and
+# a lease whose owner has exited or whose expiry has passed may be taken over. Ports that cannot
+# be bound on 127.0.0.1 are skipped. Leases are released when the allocator is released or the
+# process exits, so concurrent test runs never collide on the ports they lease. Ports a test
+# does not lease, like the fixed nodeos and keosd ports of Cluster, are not protected.
+#
+###########################################################################################
+
+class PortAllocator(object):
+    LeaseDir=os.path.join(tempfile.gettempdir(), "eosio-test-port-leases")
+
+    def __init__(self, basePort=20000, maxPort=40000, leaseSeconds=6*3600):
+        assert basePort < maxPort
+        self.basePort=basePort
+        self.maxPort=maxPort
+        self.leaseSeconds=leaseSeconds
+        self.leased=[]
+        os.makedirs(PortAllocator.LeaseDir, exist_ok=True)
+        atexit.register(self.release)
+
+    @staticmethod
+    def leasePath(port):
+        return os.path.join(PortAllocator.LeaseDir, "%d.lease" % (port))
+
+    @staticmethod
+    def __ownerAlive(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError as ex:
+            return ex.errno == errno.EPERM
+        return True
+
+    @staticmethod
+    def __portFree(port):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            try:
+                s.bind(("127.0.0.1", port))
+            except OSError:
+                return False
+        return True
+
+    def __tryLease(self, port, takeOver=True):
+        path=PortAllocator.leasePath(port)
+        try:
+            fd=os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not takeOver:
+                return False
+            try:
+                with open(path, "r") as f:
+                    lease=json.load(f)
+                stale=lease["expires"] < time.time() or not PortAllocator.__ownerAlive(lease["pid"])
+            except (OSError, ValueError, KeyError):
+                stale=False   # being written by its owner right now
+            if not stale:
+                return False
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return self.__tryLease(port, takeOver=False)
+        with os.fdopen(fd, "w") as f:
+            json.dump({ "pid": os.getpid(), "expires": time.time() + self.leaseSeconds }, f)
+        if not PortAllocator.__portFree(port):
+            os.remove(path)
+            return False
+        self.leased.append(port)
+        return True
+
+    def lease(self, count=1, contiguous=False):
+        """Leases count ports and returns them in ascending order. With contiguous they are consecutive."""
+        ports=[]
+        port=self.basePort
+        while len(ports) < count:
+            if port >= self.maxPort:
+                self.release(ports)
+                raise RuntimeError("Unable to lease %d ports between %d and %d" % (count, self.basePort, self.maxPort))
+            if self.__tryLease(port):
+                ports.append(port)
+            elif contiguous and len(ports) > 0:
+                self.release(ports)
+                ports=[]
+            port+=1
+        if Utils.Debug: Utils.Print("Leased ports %s" % (ports))
+        return ports
+
+    def release(self, ports=None):
+        """Releases the given ports, or every port leased by this allocator."""
+        for port in list(self.leased if ports is None else ports):
+            if port not in self.leased:
+                continue
+            try:
+                os.remove(PortAllocator.leasePath(port))
+            except FileNotFoundError:
+                pass
+            self.leased.remove(port)
@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import sys
+
+from testUtils import Utils
+from Node import Node
+from PortAllocator import PortAllocator
+
+###########################################################################################
+# ProducerHaTopology
+#
+# Generates producer_ha configs for any number of clusters of any size. Node.create_ha_config
+# assumes clusters of three on fixed ports (8988+, 18988+ behind a relay) and writes into the
+# current directory; here every node's peer port (and listening port behind a relay) is leased
+# from a PortAllocator and the configs are written to etc/eosio/producer_ha/<namespace>/, so the
+# producer_ha ports and configs of several HA tests do not collide.
+#
+# Only those ports are leased. Cluster still launches nodeos on fixed HTTP and P2P ports
+# (8888+i and 9876+i, bios on 8788) and keosd on 9899, so two HA runs on one host still collide
+# on them; run concurrent HA tests on separate hosts or in separate network namespaces.
+#
+# producer_ha ids, which are also the node numbers in the cluster launch, run sequentially
+# across clusters: with clusterSizes [3, 5] cluster 0 holds ids 0-2 and cluster 1 ids 3-7.
+#
+###########################################################################################
+
+class ProducerHaTopology(object):
+    def __init__(self, clusterSizes, namespace=None, allocator=None, useRelay=False):
+        """clusterSizes: size of each producer_ha cluster. namespace: name of the config directory, defaults
+        to the test script name and pid. useRelay: peers reach each other through a relay, see addRelayLinks."""
+        self.clusterSizes=list(clusterSizes)
+        self.namespace=namespace if namespace is not None else "%s_%d" % (os.path.splitext(os.path.basename(sys.argv[0]))[0], os.getpid())
+        self.allocator=allocator if allocator is not None else PortAllocator()
+        self.useRelay=useRelay
+        self.configDir=os.path.join(os.getcwd(), Utils.ConfigDir, "producer_ha", self.namespace)
+        self.clusters=[]           # cluster index -> list of producer_ha ids
+        self.peerPorts={}          # id -> port peers connect to
+        self.listenPorts={}        # id -> port the node listens on, differs from the peer port only behind a relay
+
+        nextId=0
+        for size in self.clusterSizes:
+            ids=list(range(nextId, nextId + size))
+            nextId+=size
+            self.clusters.append(ids)
+            for haId in ids:
+                ports=self.allocator.lease(2 if useRelay else 1)
+                self.peerPorts[haId]=ports[0]
+                self.listenPorts[haId]=ports[-1]
+
+    def nodeIds(self, cluster=None):
+        """Returns the producer_ha ids of one cluster, or of all clusters."""
+        if cluster is not None:
+            return list(self.clusters[cluster])
+        return [haId for ids in self.clusters for haId in ids]
+
+    def clusterOf(self, haId):
+        for cluster,ids in enumerate(self.clusters):
+            if haId in ids:
+                return cluster
+        return None
+
+    def peers(self, cluster):
+        peers=[]
+        for haId in self.clusters[cluster]:
+            peer={"id": haId, "address": "localhost:{}".format(self.peerPorts[haId])}
+            if self.useRelay:
+                peer["listening_port"]="{}".format(self.listenPorts[haId])
+            peers.append(peer)
+        return peers
+
+    def configPath(self, haId):
+        return os.path.join(self.configDir, "config_ha_{}.json".format(haId))
+
+    def write(self, activeClusters=(0,), quorumSizes=None, **options):
+        """Writes the config of every node. activeClusters: indices of clusters with is_active_raft_cluster set.
+        quorumSizes: leader_election_quorum_size per cluster, defaults to a majority of the cluster.
+        options are passed on to Node.ha_config_dict, e.g. leadership_expiry_ms or heart_beat_interval_ms."""
+        os.makedirs(self.configDir, exist_ok=True)
+        for cluster,ids in enumerate(self.clusters):
+            quorum=quorumSizes[cluster] if quorumSizes is not None else len(ids) // 2 + 1
+            peers=self.peers(cluster)
+            for haId in ids:
+                configDic=Node.ha_config_dict(haId, peers, is_active=cluster in activeClusters, use_relay=self.useRelay,
+                                              quorum_size=quorum, **options)
+                with open(self.configPath(haId), "w") as jsonFile:
+                    jsonFile.write(json.dumps(configDic, indent=2))
+        if Utils.Debug: Utils.Print("Wrote producer_ha configs for clusters %s to %s" % (self.clusters, self.configDir))
+
+    def nodeosArgs(self, haId):
+        return " --plugin eosio::producer_ha_plugin --producer-ha-config {}".format(self.configPath(haId))
+
+    def specificExtraNodeosArgs(self, cluster=None):
+        """Returns the node number to nodeos arguments map for Cluster.launch(specificExtraNodeosArgs=...)."""
+        return {haId: self.nodeosArgs(haId) for haId in self.nodeIds(cluster)}
+
+    def addRelayLinks(self, relayController, cluster=None):
+        """Adds a relay link per node forwarding its peer port to its listening port, named node_<id>."""
+        assert self.useRelay, "topology was not generated for relays"
+        for haId in self.nodeIds(cluster):
+            relayController.addLink("node_%d" % (haId), self.peerPorts[haId], self.listenPorts[haId])
+
+    def cleanup(self):
+        """Removes the configs and releases the leased ports."""
+        shutil.rmtree(self.configDir, ignore_errors=True)
+        self.allocator.release([port for ports in [self.peerPorts, self.listenPorts] for port in ports.values()])
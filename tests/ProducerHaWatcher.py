@@ -0,0 +1,177 @@
+import concurrent.futures
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from testUtils import Utils
+
+###########################################################################################
+# ProducerHaWatcher
+#
+# Samples /v1/producer_ha/get_info of every producer_ha node concurrently in a background thread
+# and keeps, per node, a timeline of the leader id it reports and its last committed block. From
+# the timeline it derives failover latency: from losing the leader to a new leader being elected,
+# and to the first block the new leader commits.
+#
+# Nodes are identified by their producer_ha id, which is their position in the node list given
+# to the watcher, as in Cluster.find_leader_and_nonleaders.
+#
+###########################################################################################
+
+class HaSample(object):
+    def __init__(self, time, leaderId, committedBlock):
+        self.time=time
+        self.leaderId=leaderId                # None while the node does not answer
+        self.committedBlock=committedBlock
+
+    def sameState(self, other):
+        return other is not None and self.leaderId == other.leaderId and self.committedBlock == other.committedBlock
+
+class ProducerHaWatcher(object):
+    def __init__(self, nodes, interval=0.05, requestTimeout=0.5):
+        """nodes: producer_ha nodes, indexed by producer_ha id. interval: seconds between sampling rounds."""
+        self.nodes=nodes
+        self.interval=interval
+        self.requestTimeout=requestTimeout
+        self.timelines={i: [] for i in range(len(nodes))}    # id -> HaSample on every change
+        self.lock=threading.Lock()
+        self.stopEvent=threading.Event()
+        self.thread=None
+        self.rounds=0
+        self.leaderLossTime=None
+
+    def sample(self, nodeId):
+        url="%s/v1/producer_ha/get_info" % (self.nodes[nodeId].endpointHttp)
+        try:
+            with urllib.request.urlopen(url, timeout=self.requestTimeout) as response:
+                info=json.loads(response.read())
+            return HaSample(time.time(), info.get("leader_id", -1), info.get("last_committed_block_num", 0))
+        except (urllib.error.URLError, OSError, ValueError):
+            return HaSample(time.time(), None, None)
+
+    def __run(self):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.nodes)) as executor:
+            while not self.stopEvent.is_set():
+                roundStart=time.time()
+                samples=list(executor.map(self.sample, range(len(self.nodes))))
+                with self.lock:
+                    for nodeId,sample in enumerate(samples):
+                        timeline=self.timelines[nodeId]
+                        if not sample.sameState(timeline[-1] if timeline else None):
+                            if Utils.Debug: Utils.Print("producer_ha node %d: leader %s, committed block %s" % (nodeId, sample.leaderId, sample.committedBlock))
+                            timeline.append(sample)
+                    self.rounds+=1
+                self.stopEvent.wait(max(0, self.interval - (time.time() - roundStart)))
+
+    def start(self):
+        assert self.thread is None, "watcher already started"
+        self.stopEvent.clear()
+        self.thread=threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopEvent.set()
+            self.thread.join()
+            self.thread=None
+
+    def markLeaderLoss(self):
+        """Records now as the moment the leader is lost, call it right before killing or isolating the leader.
+        Without it failover() uses the first sample that no longer shows the old leader after all nodes agreed on it."""
+        self.leaderLossTime=time.time()
+        return self.leaderLossTime
+
+    def currentLeader(self):
+        """Returns the leader id every answering node agrees on, -1 if there is none or nodes disagree."""
+        with self.lock:
+            leaders=set(timeline[-1].leaderId for timeline in self.timelines.values() if timeline and timeline[-1].leaderId is not None)
+        return leaders.pop() if len(leaders) == 1 else -1
+
+    def waitForLeader(self, timeout=30):
+        """Waits until all answering nodes agree on a leader, returns its id or -1."""
+        leader=-1
+        def agreed():
+            nonlocal leader
+            leader=self.currentLeader()
+            return leader >= 0
+        Utils.waitForTruth(agreed, timeout=timeout, sleepTime=self.interval)
+        return leader
+
+    def timeline(self, nodeId):
+        with self.lock:
+            return list(self.timelines[nodeId])
+
+    def __lossTime(self, oldLeader):
+        """The first moment a node no longer shows oldLeader, or stops answering, after the last moment every node agreed on
+        oldLeader. Samples from before the first election or from a node that briefly did not answer then do not count as
+        the loss. None if the nodes never agreed on oldLeader or still do."""
+        events=sorted((sample.time, nodeId, sample.leaderId) for nodeId in self.timelines for sample in self.timeline(nodeId))
+        current={}
+        lossTime=None
+        agreed=False
+        for sampleTime,nodeId,leaderId in events:
+            current[nodeId]=leaderId
+            if len(current) == len(self.timelines) and all(leader == oldLeader for leader in current.values()):
+                agreed=True
+                lossTime=None
+            elif agreed and leaderId != oldLeader:
+                agreed=False
+                lossTime=sampleTime
+        return lossTime
+
+    def failover(self, oldLeader):
+        """Returns the failover away from oldLeader as a dictionary with the old and new leader ids, the times of leader loss,
+        election of the new leader and the first block it committed, and electionLatency and firstBlockLatency in seconds.
+        Values not reached yet are None."""
+        lossTime=self.leaderLossTime
+        if lossTime is None:
+            lossTime=self.__lossTime(oldLeader)
+
+        result={ "oldLeader": oldLeader, "newLeader": None, "lossTime": lossTime, "electedTime": None, "firstBlockTime": None,
+                 "electionLatency": None, "firstBlockLatency": None }
+        if lossTime is None:
+            return result
+
+        # the new leader is elected once a node other than the old leader reports itself as leader
+        for nodeId in self.timelines:
+            if nodeId == oldLeader:
+                continue
+            elected=None
+            for sample in self.timeline(nodeId):
+                if sample.time < lossTime or sample.leaderId != nodeId:
+                    continue
+                if elected is None:
+                    elected=sample
+                    if result["electedTime"] is None or sample.time < result["electedTime"]:
+                        result["newLeader"]=nodeId
+                        result["electedTime"]=sample.time
+                        result["firstBlockTime"]=None
+                elif result["newLeader"] == nodeId and sample.committedBlock > elected.committedBlock:
+                    result["firstBlockTime"]=sample.time
+                    break
+
+        if result["electedTime"] is not None:
+            result["electionLatency"]=result["electedTime"] - lossTime
+        if result["firstBlockTime"] is not None:
+            result["firstBlockLatency"]=result["firstBlockTime"] - lossTime
+        return result
+
+    def waitForFailover(self, oldLeader, timeout=60):
+        """Waits until a new leader committed its first block, returns the failover() result (incomplete on timeout)."""
+        result=None
+        def done():
+            nonlocal result
+            result=self.failover(oldLeader)
+            return result["firstBlockTime"] is not None
+        Utils.waitForTruth(done, timeout=timeout, sleepTime=self.interval)
+        return result
+
+    @staticmethod
+    def describe(result):
+        def seconds(value):
+            return "%.3fs" % (value) if value is not None else "not reached"
+        return "leader %s -> %s: elected after %s, first block after %s" % (result["oldLeader"], result["newLeader"],
+                                                                            seconds(result["electionLatency"]), seconds(result["firstBlockLatency"]))
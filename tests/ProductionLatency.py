@@ -0,0 +1,107 @@
+import csv
+import json
+from datetime import datetime
+
+from testUtils import Utils
+
+###########################################################################################
+# ProductionLatency
+#
+# Collects the production latency of every block the nodes of a cluster produced, from the slot
+# of the block until nodeos finished producing it (see Node.productionLatencies), and reports its
+# distribution per producer, per node and over time, so the timing of block production can be
+# compared under load or with --signing-delay. Node.analyzeProduction only reports the late blocks.
+#
+###########################################################################################
+
+class ProductionLatency(object):
+    Percentiles=[50, 90, 95, 99]
+
+    def __init__(self):
+        self.records=[]          # one per produced block: nodeId, blockNum, producer, slot, prod, latencyMs
+
+    def addNode(self, node):
+        for record in node.productionLatencies():
+            record["nodeId"]=node.nodeId
+            self.records.append(record)
+        return self
+
+    @staticmethod
+    def fromCluster(cluster):
+        latency=ProductionLatency()
+        for node in cluster.getAllNodes():
+            latency.addNode(node)
+        return latency
+
+    @staticmethod
+    def distribution(values):
+        """Returns count, min, mean, max and the Percentiles of values, None if there are none."""
+        if len(values) == 0:
+            return None
+        values=sorted(values)
+        dist={ "count": len(values), "min": round(values[0], 1), "mean": round(sum(values) / len(values), 1), "max": round(values[-1], 1) }
+        for p in ProductionLatency.Percentiles:
+            # nearest rank
+            dist["p%d" % (p)]=round(values[max(0, -(-len(values) * p // 100) - 1)], 1)
+        return dist
+
+    def __groupBy(self, key):
+        groups={}
+        for record in self.records:
+            groups.setdefault(key(record), []).append(record["latencyMs"])
+        # numeric groups (node numbers, intervals) in order, then named ones such as producers or "bios"
+        order=lambda item: (0, item[0], "") if isinstance(item[0], int) else (1, 0, str(item[0]))
+        return {group: ProductionLatency.distribution(values) for group,values in sorted(groups.items(), key=order)}
+
+    def overall(self):
+        return ProductionLatency.distribution([record["latencyMs"] for record in self.records])
+
+    def byProducer(self):
+        return self.__groupBy(lambda record: record["producer"])
+
+    def byNode(self):
+        return self.__groupBy(lambda record: record["nodeId"])
+
+    def overTime(self, intervalSec=60):
+        """Distribution per interval of intervalSec seconds of slot time, keyed by the interval's start in seconds since the first slot."""
+        if len(self.records) == 0:
+            return {}
+        slotTime=lambda record: datetime.strptime(record["slot"], Utils.TimeFmt)
+        first=min(slotTime(record) for record in self.records)
+        return self.__groupBy(lambda record: int((slotTime(record) - first).total_seconds() // intervalSec) * intervalSec)
+
+    def late(self, thresholdMs):
+        return [record for record in self.records if record["latencyMs"] > thresholdMs]
+
+    def report(self, intervalSec=60):
+        return { "overall": self.overall(), "byProducer": self.byProducer(), "byNode": self.byNode(),
+                 "overTime": self.overTime(intervalSec), "intervalSec": intervalSec }
+
+    def printReport(self, intervalSec=60):
+        columns=["count", "min", "mean"] + ["p%d" % (p) for p in ProductionLatency.Percentiles] + ["max"]
+        Utils.Print("Block production latency (ms) from slot to produced, %d blocks:" % (len(self.records)))
+        Utils.Print("%-24s " % ("") + " ".join("%8s" % (column) for column in columns))
+        def printRow(label, dist):
+            if dist is not None:
+                Utils.Print("%-24s " % (label) + " ".join("%8s" % (dist[column]) for column in columns))
+        report=self.report(intervalSec)
+        printRow("all", report["overall"])
+        for producer,dist in report["byProducer"].items():
+            printRow("producer %s" % (producer), dist)
+        for nodeId,dist in report["byNode"].items():
+            printRow("node %s" % (nodeId), dist)
+        for start,dist in report["overTime"].items():
+            printRow("t+%ds" % (start), dist)
+
+    def writeCsv(self, path):
+        """Writes one row per produced block."""
+        with open(path, "w", newline="") as f:
+            writer=csv.DictWriter(f, fieldnames=["nodeId", "blockNum", "producer", "slot", "prod", "latencyMs"])
+            writer.writeheader()
+            for record in sorted(self.records, key=lambda record: (record["blockNum"], str(record["nodeId"]))):
+                writer.writerow(record)
+
+    def writeJson(self, path, intervalSec=60):
+        """Writes the distributions followed by every produced block."""
+        with open(path, "w") as f:
+            json.dump({ "report": self.report(intervalSec), "blocks": self.records }, f, indent=2)
@@ -0,0 +1,181 @@
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import time
+
+from testUtils import Utils
+from testUtils import ReadinessWatcher
+
+###########################################################################################
+# RelayController
+#
+# Runs one network-relay (bin/relay) process per link and changes latency, bandwidth, accept and
+# drop rates, or disconnects the link, while it runs through the relay's control port. Each link
+# also reports the bytes and messages it forwarded, so partition and latency scenarios can measure
+# throughput and recovery instead of killing and restarting the relay.
+#
+###########################################################################################
+
+class RelayLink(object):
+    def __init__(self, name, listenPort, destHost, destPort, controlPort):
+        self.name=name
+        self.listenPort=listenPort
+        self.destHost=destHost
+        self.destPort=destPort
+        self.controlPort=controlPort
+        self.popen=None
+        self.control=None          # file on the control connection
+        self.logFile=os.path.join(Utils.DataDir, "relay_%s.txt" % (name))
+
+    def __str__(self):
+        return "%s: %d -> %s:%d, control port %d, pid %s" % (self.name, self.listenPort, self.destHost, self.destPort, self.controlPort,
+                                                           self.popen.pid if self.popen is not None else None)
+
+class RelayController(object):
+    RelayPath="bin/relay"
+
+    def __init__(self, controlBasePort=8688, relayPath=None, portAllocator=None):
+        """Control ports are controlBasePort onwards, or leased from portAllocator when given."""
+        self.controlBasePort=controlBasePort
+        self.portAllocator=portAllocator
+        self.relayPath=relayPath if relayPath is not None else RelayController.RelayPath
+        self.links={}
+
+    def addLink(self, name, listenPort, destPort, destHost="127.0.0.1"):
+        """Adds a link forwarding connections to listenPort on to destHost:destPort. Started by start()."""
+        assert name not in self.links, "link %s already exists" % (name)
+        if self.portAllocator is not None:
+            controlPort=self.portAllocator.lease()[0]
+        else:
+            controlPort=self.controlBasePort + len(self.links)
+        link=RelayLink(name, listenPort, destHost, destPort, controlPort)
+        self.links[name]=link
+        return link
+
+    def addHaLinks(self, clusterSize=3, clstrNum=1):
+        """Adds the links of a producer_ha cluster configured by Node.create_ha_config(..., use_relay=True),
+        where peer i is reached on 8988+i and listens on 18988+i. Links are named node_<i>.
+        For configs from ProducerHaTopology use its addRelayLinks instead."""
+        first=(clstrNum-1)*3
+        for i in range(first, first + clusterSize):
+            self.addLink("node_%d" % (i), 8988 + i, 18988 + i)
+
+    def __select(self, names):
+        if names is None:
+            return list(self.links.values())
+        if isinstance(names, str):
+            names=[names]
+        return [self.links[name] for name in names]
+
+    @staticmethod
+    def toArgs(options):
+        """Renders keyword options as relay flags, e.g. latencyOut=0.1 -> --latency-out=0.1"""
+        return ["--%s=%s" % (re.sub(r"([A-Z])", lambda m: "-" + m.group(1).lower(), key), value) for key,value in options.items()]
+
+    def start(self, names=None, timeout=30, **options):
+        """Starts the relay of each link with startup options such as disconnectMin, disconnectMax or mode,
+        and waits until every one accepts control commands. Returns False on failure."""
+        links=self.__select(names)
+        os.makedirs(Utils.DataDir, exist_ok=True)
+        watcher=ReadinessWatcher()
+        for link in links:
+            assert link.popen is None, "relay %s is already running" % (link.name)
+            cmd=[self.relayPath, "--relay=%d:%s:%d" % (link.listenPort, link.destHost, link.destPort), "--control-port=%d" % (link.controlPort)]
+            cmd+=RelayController.toArgs(options)
+            Utils.Print("Starting relay %s: %s" % (link.name, " ".join(cmd)))
+            with open(link.logFile, "a") as log:
+                link.popen=subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+            watcher.addPort(link.name, "127.0.0.1", link.controlPort, link.popen)
+        if not watcher.wait(timeout):
+            Utils.Print("ERROR: relays failed to start: %s" % (", ".join(watcher.failed)))
+            return False
+        return True
+
+    def stop(self, names=None, kill=False):
+        """Stops the relay of each link. With kill the relay gets SIGKILL, like a crashed process, otherwise it shuts down cleanly."""
+        for link in self.__select(names):
+            if link.control is not None:
+                link.control.close()
+                link.control=None
+            if link.popen is None:
+                continue
+            Utils.Print("Stopping relay %s (pid %d)%s" % (link.name, link.popen.pid, " with SIGKILL" if kill else ""))
+            if kill:
+                link.popen.kill()
+            else:
+                link.popen.send_signal(signal.SIGINT)
+            try:
+                link.popen.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                link.popen.kill()
+                link.popen.wait()
+            link.popen=None
+
+    def restart(self, names=None, **options):
+        """Restarts the relays, needed only to change startup options. Forwarded byte and message counts start over."""
+        self.stop(names)
+        return self.start(names, **options)
+
+    def command(self, link, cmd):
+        if link.control is None:
+            assert link.popen is not None, "relay %s is not running" % (link.name)
+            sock=socket.create_connection(("127.0.0.1", link.controlPort), timeout=5)
+            link.control=sock.makefile("rw")
+            sock.close()
+        if Utils.Debug: Utils.Print("relay %s: %s" % (link.name, cmd))
+        link.control.write(cmd + "\n")
+        link.control.flush()
+        reply=json.loads(link.control.readline())
+        if reply.get("ok") is False:
+            Utils.Print("ERROR: relay %s rejected \"%s\": %s" % (link.name, cmd, reply.get("error")))
+        return reply
+
+    def set(self, names=None, **params):
+        """Changes runtime parameters of running relays: latencyOut, latencyIn, latencyDelta (seconds),
+        bandwidthOut, bandwidthIn (bytes per second, 0 is unlimited), acceptRate and dropRate."""
+        cmd="set " + " ".join(arg[2:] for arg in RelayController.toArgs(params))
+        return all([self.command(link, cmd).get("ok", False) for link in self.__select(names)])
+
+    def disconnect(self, names=None):
+        """Drops every connection on the links and rejects new ones until connect()."""
+        Utils.Print("Disconnecting relay link(s) %s" % (", ".join(link.name for link in self.__select(names))))
+        return all([self.command(link, "disconnect").get("ok", False) for link in self.__select(names)])
+
+    def connect(self, names=None):
+        Utils.Print("Reconnecting relay link(s) %s" % (", ".join(link.name for link in self.__select(names))))
+        return all([self.command(link, "connect").get("ok", False) for link in self.__select(names)])
+
+    def stats(self, names=None):
+        """Returns a dictionary of link name to the link's current parameters and its bytes_out, bytes_in,
+        messages_out, messages_in, sessions, rejected and live_sessions counts since the relay started."""
+        return {link.name: self.command(link, "stats") for link in self.__select(names)}
+
+    def measure(self, seconds, names=None):
+        """Samples stats over seconds and returns, per link, forwarded bytes and messages per second in each direction."""
+        before=self.stats(names)
+        time.sleep(seconds)
+        after=self.stats(names)
+        rates={}
+        for name,stats in after.items():
+            elapsed=(stats["time_us"] - before[name]["time_us"]) / 1000000
+            rates[name]={key + "_per_sec": (stats[key] - before[name][key]) / elapsed
+                         for key in ["bytes_out", "bytes_in", "messages_out", "messages_in"]}
+        return rates
+
+    def printStats(self, names=None):
+        """Prints the stats of the relays that are running. Never raises, so it is safe in the cleanup of a test
+        whose relays failed to start or died."""
+        for link in self.__select(names):
+            if link.popen is None or link.popen.poll() is not None:
+                Utils.Print("relay %s: not running" % (link.name))
+                continue
+            try:
+                stats=self.command(link, "stats")
+                Utils.Print("relay %s: %s, sessions %d (%d live), rejected %d, out %d bytes/%d msgs, in %d bytes/%d msgs" %
+                            (link.name, "down" if stats["link_down"] else "up", stats["sessions"], stats["live_sessions"], stats["rejected"],
+                             stats["bytes_out"], stats["messages_out"], stats["bytes_in"], stats["messages_in"]))
+            except (OSError, ValueError, KeyError) as ex:
+                Utils.Print("relay %s: no stats: %s" % (link.name, ex))
@@ -0,0 +1,99 @@
+import os
+import platform
+import re
+import subprocess
+
+from testUtils import Utils
+
+###########################################################################################
+# ResourceProfile
+#
+# Sizes nodeos for the host it runs on. Given the cores and memory available and the number
+# of nodes sharing them, it picks chain-threads, http-threads, net-threads,
+# chain-state-db-size-mb and the wasm runtime for each node, so small CI hosts are not
+# oversubscribed and large hosts are not left idle. Options a test sets explicitly for a node
+# are never overridden.
+#
+###########################################################################################
+
+class ResourceProfile(object):
+    # pylint: disable=too-many-arguments
+    def __init__(self, cores=None, memoryMb=None, memoryFraction=0.5, minStateDbMb=1024, maxStateDbMb=131072, allowOC=False):
+        """cores and memoryMb default to what the host (or its cgroup) provides.
+        memoryFraction: share of memory the chain state databases of all nodes may use together.
+        allowOC: enable EOS VM OC tier-up on nodes that get at least 4 cores."""
+        self.cores=cores if cores is not None else ResourceProfile.detectCores()
+        self.memoryMb=memoryMb if memoryMb is not None else ResourceProfile.detectMemoryMb()
+        self.memoryFraction=memoryFraction
+        self.minStateDbMb=minStateDbMb
+        self.maxStateDbMb=maxStateDbMb
+        self.allowOC=allowOC
+
+    @staticmethod
+    def detectCores():
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+
+    @staticmethod
+    def detectMemoryMb():
+        memoryMb=None
+        try:
+            with open("/proc/meminfo", "r") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        memoryMb=int(line.split()[1]) // 1024
+                        break
+        except OSError:
+            pass
+        if memoryMb is None:
+            try:
+                memoryMb=os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024*1024)
+            except (ValueError, OSError, AttributeError):
+                memoryMb=int(subprocess.check_output(["sysctl", "-n", "hw.memsize"])) // (1024*1024)
+        # respect a container memory limit
+        for limitFile in ["/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"]:
+            try:
+                with open(limitFile, "r") as f:
+                    limit=f.read().strip()
+                if limit.isdigit():
+                    memoryMb=min(memoryMb, int(limit) // (1024*1024))
+                break
+            except OSError:
+                pass
+        return memoryMb
+
+    def nodeSettings(self, nodeCount):
+        """Returns the option settings for each of nodeCount nodes sharing this host."""
+        assert nodeCount > 0
+        coresPerNode=max(1, self.cores // nodeCount)
+        stateDbMb=int(self.memoryMb * self.memoryFraction / nodeCount) // 256 * 256
+        settings={
+            "chain-threads": min(max(coresPerNode // 2, 1), 8),
+            "http-threads": min(max(coresPerNode // 4, 1), 4),
+            "net-threads": min(max(coresPerNode // 4, 1), 4),
+            "chain-state-db-size-mb": min(max(stateDbMb, self.minStateDbMb), self.maxStateDbMb),
+            "wasm-runtime": "eos-vm-jit" if platform.machine().lower() in ["x86_64", "amd64"] else "eos-vm"
+        }
+        if self.allowOC and coresPerNode >= 4:
+            settings["eos-vm-oc-enable"]=True
+            settings["eos-vm-oc-compile-threads"]=coresPerNode // 4
+        return settings
+
+    @staticmethod
+    def hasOption(args, option):
+        return args is not None and re.search(r"(^|\s)--%s(=|\s|$)" % (re.escape(option)), args) is not None
+
+    @staticmethod
+    def toArgs(settings, explicitArgs=""):
+        """Renders settings as nodeos arguments, leaving out options already present in explicitArgs."""
+        args=[]
+        for option,value in settings.items():
+            if ResourceProfile.hasOption(explicitArgs, option):
+                continue
+            args.append("--%s" % (option) if value is True else "--%s %s" % (option, value))
+        return " ".join(args)
+
+    def describe(self, nodeCount):
+        return { "cores": self.cores, "memory_mb": self.memoryMb, "nodes": nodeCount, "settings": self.nodeSettings(nodeCount) }
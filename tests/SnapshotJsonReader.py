@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+###############################################################
+# SnapshotJsonReader
+#
+# Streaming reader for the JSON snapshots written by `nodeos --snapshot-to-json`.
+#
+# The writer (ostream_json_snapshot_writer) emits one row per line, so a single
+# pass over the file is enough to build a byte-offset index of every section,
+# of every contract table inside the "contract_tables" section and of every
+# Nth row (see rowStride).  The index allows random access to one section,
+# table or row without loading the rest of the snapshot, and carries a sha256
+# digest per section and per table so two snapshots can be diffed section by
+# section in bounded memory.
+#
+# Layout produced by the writer:
+#   {
+#   "magic_number":<n>
+#   ,"version":<n>
+#   ,"<section name>":{
+#   "rows":[
+#   <row>
+#   ,<row>
+#   ],
+#   "num_rows":<n>
+#   }
+#   ...
+#   }
+#
+###############################################################
+
+class SnapshotFormatError(Exception):
+    pass
+
+class SnapshotSection(object):
+    def __init__(self, name):
+        self.name=name
+        self.offset=None      # byte offset of the first row
+        self.end=None         # byte offset of the line closing the rows array
+        self.numRows=0
+        self.rowOffsets=[]    # byte offset of every rowStride'th row
+        self.digest=None
+
+    def toDict(self):
+        return { "name": self.name, "offset": self.offset, "end": self.end, "num_rows": self.numRows,
+                 "row_offsets": self.rowOffsets, "digest": self.digest }
+
+    @staticmethod
+    def fromDict(d):
+        section=SnapshotSection(d["name"])
+        section.offset=d["offset"]
+        section.end=d["end"]
+        section.numRows=d["num_rows"]
+        section.rowOffsets=d["row_offsets"]
+        section.digest=d["digest"]
+        return section
+
+class SnapshotTable(object):
+    """A contract table in the "contract_tables" section: the table_id row followed by a size row and the data rows of each index."""
+    def __init__(self, code, scope, table, offset):
+        self.code=code
+        self.scope=scope
+        self.table=table
+        self.offset=offset
+        self.end=None
+        self.numRows=0
+        self.digest=None
+
+    def key(self):
+        return (self.code, self.scope, self.table)
+
+    def toDict(self):
+        return { "code": self.code, "scope": self.scope, "table": self.table, "offset": self.offset, "end": self.end,
+                 "num_rows": self.numRows, "digest": self.digest }
+
+    @staticmethod
+    def fromDict(d):
+        table=SnapshotTable(d["code"], d["scope"], d["table"], d["offset"])
+        table.end=d["end"]
+        table.numRows=d["num_rows"]
+        table.digest=d["digest"]
+        return table
+
+class SnapshotJsonReader(object):
+    ContractTablesSection="contract_tables"
+    TableRowPrefix=b'{"code":'
+    IndexVersion=1
+
+    def __init__(self, path, rowStride=1024):
+        assert(rowStride > 0)
+        self.path=path
+        self.rowStride=rowStride
+        self.magicNumber=None
+        self.version=None
+        self.sections={}
+        self.sectionOrder=[]
+        self.tables={}
+        self.fileSize=None
+
+    @staticmethod
+    def normalizeRow(line):
+        """Strips the row separator and line ending so the same row hashes the same wherever it appears in a section."""
+        line=line.rstrip(b"\r\n")
+        if line.startswith(b","):
+            line=line[1:]
+        return line
+
+    def buildIndex(self):
+        self.sections={}
+        self.sectionOrder=[]
+        self.tables={}
+        section=None
+        sectionHash=None
+        table=None
+        tableHash=None
+        inRows=False
+        offset=0
+
+        def finishTable(end):
+            table.end=end
+            table.digest=tableHash.hexdigest()
+            self.tables[table.key()]=table
+
+        with open(self.path, "rb") as f:
+            for line in f:
+                lineLen=len(line)
+                stripped=line.rstrip(b"\r\n")
+                if section is None:
+                    if stripped.startswith(b',"') and stripped.endswith(b'":{'):
+                        section=SnapshotSection(json.loads(stripped[1:-2]))
+                        sectionHash=hashlib.sha256()
+                    elif stripped.startswith(b'"magic_number":'):
+                        self.magicNumber=int(stripped[len(b'"magic_number":'):])
+                    elif stripped.startswith(b',"version":'):
+                        self.version=int(stripped[len(b',"version":'):])
+                    elif stripped not in (b"{", b"}", b""):
+                        raise SnapshotFormatError("unexpected line at offset %d: %s" % (offset, stripped[:80]))
+                elif section.offset is None:
+                    if stripped != b'"rows":[':
+                        raise SnapshotFormatError("section '%s' does not start with a rows array at offset %d" % (section.name, offset))
+                    section.offset=offset + lineLen
+                    inRows=True
+                elif inRows:
+                    if stripped == b"],":
+                        section.end=offset
+                        section.digest=sectionHash.hexdigest()
+                        if table is not None:
+                            finishTable(offset)
+                            table=None
+                        inRows=False
+                    else:
+                        row=SnapshotJsonReader.normalizeRow(stripped)
+                        sectionHash.update(row + b"\n")
+                        if section.numRows % self.rowStride == 0:
+                            section.rowOffsets.append(offset)
+                        section.numRows+=1
+                        if section.name == SnapshotJsonReader.ContractTablesSection:
+                            if row.startswith(SnapshotJsonReader.TableRowPrefix):
+                                if table is not None:
+                                    finishTable(offset)
+                                tableId=json.loads(row)
+                                table=SnapshotTable(tableId["code"], tableId["scope"], tableId["table"], offset)
+                                tableHash=hashlib.sha256()
+                            if table is not None:
+                                tableHash.update(row + b"\n")
+                                table.numRows+=1
+                elif stripped.startswith(b'"num_rows":'):
+                    numRows=int(stripped[len(b'"num_rows":'):])
+                    if numRows != section.numRows:
+                        raise SnapshotFormatError("section '%s' reports %d rows, found %d" % (section.name, numRows, section.numRows))
+                elif stripped == b"}":
+                    self.sections[section.name]=section
+                    self.sectionOrder.append(section.name)
+                    section=None
+                else:
+                    raise SnapshotFormatError("unexpected line after rows of section '%s' at offset %d" % (section.name, offset))
+                offset+=lineLen
+
+        if section is not None:
+            raise SnapshotFormatError("snapshot ends inside section '%s'" % (section.name))
+        self.fileSize=offset
+        return self
+
+    def saveIndex(self, indexPath=None):
+        indexPath=indexPath if indexPath is not None else self.path + ".idx"
+        index={ "index_version": SnapshotJsonReader.IndexVersion, "file_size": self.fileSize, "row_stride": self.rowStride,
+                "magic_number": self.magicNumber, "version": self.version,
+                "sections": [self.sections[name].toDict() for name in self.sectionOrder],
+                "tables": [t.toDict() for t in self.tables.values()] }
+        with open(indexPath, "w") as f:
+            json.dump(index, f)
+        return indexPath
+
+    def loadIndex(self, indexPath=None):
+        """Loads an index written by saveIndex.  Returns False if it is missing or does not match the snapshot file."""
+        indexPath=indexPath if indexPath is not None else self.path + ".idx"
+        if not os.path.exists(indexPath):
+            return False
+        with open(indexPath, "r") as f:
+            index=json.load(f)
+        if index.get("index_version") != SnapshotJsonReader.IndexVersion or index["file_size"] != os.path.getsize(self.path):
+            return False
+        self.fileSize=index["file_size"]
+        self.rowStride=index["row_stride"]
+        self.magicNumber=index["magic_number"]
+        self.version=index["version"]
+        self.sections={}
+        self.sectionOrder=[]
+        for d in index["sections"]:
+            section=SnapshotSection.fromDict(d)
+            self.sections[section.name]=section
+            self.sectionOrder.append(section.name)
+        self.tables={}
+        for d in index["tables"]:
+            table=SnapshotTable.fromDict(d)
+            self.tables[table.key()]=table
+        return True
+
+    def open(self, useIndexFile=True):
+        """Loads the saved index if it is still valid, otherwise scans the snapshot and saves a new one."""
+        if useIndexFile and self.loadIndex():
+            return self
+        self.buildIndex()
+        if useIndexFile:
+            self.saveIndex()
+        return self
+
+    def getSection(self, name):
+        if name not in self.sections:
+            raise KeyError("snapshot %s has no section '%s'" % (self.path, name))
+        return self.sections[name]
+
+    def __readRange(self, start, end, skip=0):
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            offset=start
+            while offset < end:
+                line=f.readline()
+                if not line:
+                    break
+                offset+=len(line)
+                if skip > 0:
+                    skip-=1
+                    continue
+                yield json.loads(SnapshotJsonReader.normalizeRow(line))
+
+    def rows(self, name, start=0):
+        """Yields the rows of a section, beginning with row number start."""
+        section=self.getSection(name)
+        if start >= section.numRows:
+            return
+        checkpoint=start // self.rowStride
+        for row in self.__readRange(section.rowOffsets[checkpoint], section.end, skip=start - checkpoint * self.rowStride):
+            yield row
+
+    def row(self, name, rowNum):
+        section=self.getSection(name)
+        if rowNum < 0 or rowNum >= section.numRows:
+            raise IndexError("section '%s' has %d rows, requested row %d" % (name, section.numRows, rowNum))
+        return next(self.rows(name, rowNum))
+
+    def getTable(self, code, scope, table):
+        key=(code, scope, table)
+        if key not in self.tables:
+            raise KeyError("snapshot %s has no contract table %s:%s:%s" % (self.path, code, scope, table))
+        return self.tables[key]
+
+    def tableRows(self, code, scope, table):
+        """Returns the table_id row and a list with the rows of each secondary index (primary index first)."""
+        t=self.getTable(code, scope, table)
+        it=self.__readRange(t.offset, t.end)
+        tableId=next(it)
+        indices=[]
+        for size in it:
+            indices.append([next(it) for _ in range(size)])
+        return { "table_id": tableId, "indices": indices }
+
+    def diff(self, other):
+        """
+        Compares section and contract table digests with another indexed snapshot.
+        Returns a list of (kind, name, selfDigest, otherDigest), a digest of None meaning the item is missing.
+        """
+        differences=[]
+        names=self.sectionOrder + [n for n in other.sectionOrder if n not in self.sections]
+        for name in names:
+            mine=self.sections.get(name)
+            theirs=other.sections.get(name)
+            myDigest=mine.digest if mine is not None else None
+            theirDigest=theirs.digest if theirs is not None else None
+            if myDigest != theirDigest:
+                differences.append(("section", name, myDigest, theirDigest))
+
+        tableKeys=sorted(set(self.tables.keys()) | set(other.tables.keys()))
+        for key in tableKeys:
+            mine=self.tables.get(key)
+            theirs=other.tables.get(key)
+            myDigest=mine.digest if mine is not None else None
+            theirDigest=theirs.digest if theirs is not None else None
+            if myDigest != theirDigest:
+                differences.append(("table", ":".join(key), myDigest, theirDigest))
+        return differences
+
+    def diffSectionRows(self, other, name, maxDiffs=10):
+        """Walks a section of both snapshots in step and returns up to maxDiffs (rowNum, selfRow, otherRow) that differ."""
+        differences=[]
+        mine=self.rows(name)
+        theirs=other.rows(name)
+        rowNum=0
+        while len(differences) < maxDiffs:
+            myRow=next(mine, None)
+            theirRow=next(theirs, None)
+            if myRow is None and theirRow is None:
+                break
+            if myRow != theirRow:
+                differences.append((rowNum, myRow, theirRow))
+            rowNum+=1
+        return differences
+
+    @staticmethod
+    def diffSnapshots(pathA, pathB, rowStride=1024, useIndexFile=False):
+        readerA=SnapshotJsonReader(pathA, rowStride).open(useIndexFile)
+        readerB=SnapshotJsonReader(pathB, rowStride).open(useIndexFile)
+        return readerA.diff(readerB)
+
+
+if __name__ == "__main__":
+    parser=argparse.ArgumentParser(description="Index, query and diff JSON snapshots created by 'nodeos --snapshot-to-json'")
+    parser.add_argument("--row-stride", type=int, help="index every Nth row of each section", default=1024)
+    parser.add_argument("--no-index-file", action="store_true", help="do not read or write <snapshot>.idx")
+    subparsers=parser.add_subparsers(dest="command")
+    indexParser=subparsers.add_parser("index", help="print the sections of a snapshot")
+    indexParser.add_argument("snapshot")
+    sectionParser=subparsers.add_parser("section", help="print the rows of a section")
+    sectionParser.add_argument("snapshot")
+    sectionParser.add_argument("name")
+    sectionParser.add_argument("--start", type=int, default=0)
+    sectionParser.add_argument("--count", type=int, default=0, help="0=all rows")
+    tableParser=subparsers.add_parser("table", help="print the rows of a contract table")
+    tableParser.add_argument("snapshot")
+    tableParser.add_argument("code")
+    tableParser.add_argument("scope")
+    tableParser.add_argument("table")
+    diffParser=subparsers.add_parser("diff", help="list the sections and contract tables that differ")
+    diffParser.add_argument("snapshot")
+    diffParser.add_argument("other")
+    diffParser.add_argument("--rows", type=int, default=0, help="also print up to N differing rows per differing section")
+    args=parser.parse_args()
+
+    if args.command is None:
+        parser.print_help()
+        exit(1)
+
+    reader=SnapshotJsonReader(args.snapshot, args.row_stride).open(not args.no_index_file)
+    if args.command == "index":
+        print("magic_number: %s version: %s size: %d" % (reader.magicNumber, reader.version, reader.fileSize))
+        for name in reader.sectionOrder:
+            s=reader.sections[name]
+            print("%-60s rows: %10d offset: %14d bytes: %14d sha256: %s" % (name, s.numRows, s.offset, s.end - s.offset, s.digest))
+        print("contract tables: %d" % (len(reader.tables)))
+    elif args.command == "section":
+        for i, row in enumerate(reader.rows(args.name, args.start)):
+            if args.count > 0 and i >= args.count:
+                break
+            print(json.dumps(row))
+    elif args.command == "table":
+        print(json.dumps(reader.tableRows(args.code, args.scope, args.table), indent=2))
+    elif args.command == "diff":
+        other=SnapshotJsonReader(args.other, args.row_stride).open(not args.no_index_file)
+        differences=reader.diff(other)
+        for kind, name, myDigest, theirDigest in differences:
+            print("%-7s %s: %s != %s" % (kind, name, myDigest, theirDigest))
+            if args.rows > 0 and kind == "section" and myDigest is not None and theirDigest is not None:
+                for rowNum, myRow, theirRow in reader.diffSectionRows(other, name, args.rows):
+                    print("  row %d:\n    < %s\n    > %s" % (rowNum, json.dumps(myRow), json.dumps(theirRow)))
+        if len(differences) == 0:
+            print("snapshots are identical")
+        exit(0 if len(differences) == 0 else 1)
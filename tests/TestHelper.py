@@ -1,6 +1,7 @@
 from testUtils import Utils
 from Cluster import Cluster
 from WalletMgr import WalletMgr
+from ProductionLatency import ProductionLatency
 from datetime import datetime
 import platform
 
@@ -115,6 +116,8 @@ class TestHelper(object):
             parser.add_argument("--alternate-version-labels-file", type=str, help="Provide a file to define the labels that can be used in the test and the path to the version installation associated with that.")
         if "--signing-delay" in includeArgs:
             parser.add_argument("--signing-delay", type=int, help="signing delay in milliseconds", default=0)
+        if "--production-report" in includeArgs:
+            parser.add_argument("--production-report", type=str, help="On shutdown print the block production latency distribution and write it to <path>.csv and <path>.json")
         if "--disconnect-leader" in includeArgs:
             parser.add_argument("--disconnect-leader", help="disconnect/kill leader in producerpha cluster", action='store_true')
         for arg in applicationSpecificArgs.args:
@@ -139,8 +142,10 @@ class TestHelper(object):
     
     @staticmethod
     # pylint: disable=too-many-arguments
-    def shutdown(cluster, walletMgr, testSuccessful=True, killEosInstances=True, killWallet=True, keepLogs=False, cleanRun=True, dumpErrorDetails=False):
-        """Cluster and WalletMgr shutdown and cleanup."""
+    def shutdown(cluster, walletMgr, testSuccessful=True, killEosInstances=True, killWallet=True, keepLogs=False, cleanRun=True, dumpErrorDetails=False,
+                 productionReport=None):
+        """Cluster and WalletMgr shutdown and cleanup. With productionReport the block production latency distribution of
+        every node is printed and written to <productionReport>.csv and <productionReport>.json."""
         assert(cluster)
         assert(isinstance(cluster, Cluster))
         if walletMgr:
@@ -176,6 +181,14 @@ class TestHelper(object):
             # for now report these to know how many blocks we are missing production windows for
             reportProductionAnalysis(thresholdMs=200)
 
+        if productionReport is not None:
+            Utils.Print(Utils.FileDivider)
+            latency=ProductionLatency.fromCluster(cluster)
+            latency.printReport()
+            latency.writeCsv(productionReport + ".csv")
+            latency.writeJson(productionReport + ".json")
+            Utils.Print("Wrote block production latencies to %s.csv and %s.json" % (productionReport, productionReport))
+
         if killEosInstances:
             Utils.Print("Shut down the cluster.")
             cluster.killall(allInstances=cleanRun, kill=testSuccessful)
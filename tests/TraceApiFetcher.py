@@ -0,0 +1,150 @@
+import concurrent.futures
+import http.client
+import json
+import queue
+import time
+
+from testUtils import Utils
+from Node import Node
+from ProductionLatency import ProductionLatency
+
+###########################################################################################
+# TraceApiFetcher
+#
+# Fetches trace_api/get_block over a range of blocks with at most `concurrency` requests in flight,
+# each on a keep-alive connection borrowed from a pool, instead of a curl process per block. Records
+# the latency of every request, so how fast trace_api_plugin serves blocks can be reported, and checks
+# the action traces of the fetched blocks against the transactions a test submitted, in both the
+# --trace-no-abis mode (raw "data" only) and the ABI decoded mode (with "params").
+#
+###########################################################################################
+
+class TraceApiFetcher(object):
+    def __init__(self, node, concurrency=8, timeout=30):
+        self.node=node
+        self.concurrency=concurrency
+        self.timeout=timeout
+        self.pool=queue.LifoQueue()
+        self.latencies=[]           # ms of every get_block request that returned a block
+        self.elapsed=0.0            # seconds spent in fetchRange
+        self.fetched=0
+        self.missing=[]             # blocks without a trace by the end of fetchRange
+
+    def __connection(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPConnection(self.node.host, self.node.port, timeout=self.timeout)
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+
+    def getBlock(self, blockNum):
+        """Requests the trace of block blockNum on a pooled connection. Returns (status, response, latency ms), status None when the request failed."""
+        conn=self.__connection()
+        start=time.perf_counter()
+        try:
+            conn.request("POST", "/v1/trace_api/get_block", body=json.dumps({"block_num": blockNum}),
+                         headers={"Content-Type": "application/json"})
+            resp=conn.getresponse()
+            body=resp.read()
+            latencyMs=(time.perf_counter() - start) * 1000
+            self.pool.put(conn)
+            return (resp.status, json.loads(body), latencyMs)
+        except (OSError, http.client.HTTPException, ValueError) as ex:
+            conn.close()
+            if Utils.Debug: Utils.Print("trace_api/get_block %d on %s failed: %s" % (blockNum, self.node.endpointHttp, ex))
+            return (None, None, (time.perf_counter() - start) * 1000)
+
+    def __fetch(self, blockNum, deadline):
+        while True:
+            status,block,latencyMs=self.getBlock(blockNum)
+            if status == 200:
+                self.latencies.append(latencyMs)
+                return block
+            # 404 while the trace of the block has not been written yet
+            if time.time() > deadline:
+                Utils.Print("ERROR: trace_api/get_block %d on %s returned %s: %s" % (blockNum, self.node.endpointHttp, status, block))
+                return None
+            time.sleep(0.1)
+
+    def fetchRange(self, startBlockNum, endBlockNum, retryTimeout=10):
+        """Fetches the traces of blocks startBlockNum to endBlockNum. A missing block is requested again until retryTimeout
+        seconds after the start. Returns a dictionary of block number to trace, blocks never returned are listed in missing."""
+        deadline=time.time() + retryTimeout
+        blockNums=list(range(startBlockNum, endBlockNum + 1))
+        start=time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            blocks=dict(zip(blockNums, executor.map(lambda blockNum: self.__fetch(blockNum, deadline), blockNums)))
+        self.elapsed+=time.perf_counter() - start
+        self.fetched+=len(blockNums)
+        missing=[blockNum for blockNum,block in blocks.items() if block is None]
+        self.missing+=missing
+        return {blockNum: block for blockNum,block in blocks.items() if block is not None}
+
+    @staticmethod
+    def expectedActions(trans):
+        """The action traces a transaction response of cleos (e.g. from transferFunds) reports, in execution order,
+        in the form trace_api returns them."""
+        expected=[]
+        for trace in sorted(trans["processed"]["action_traces"], key=lambda trace: trace["receipt"]["global_sequence"]):
+            act=trace["act"]
+            expected.append({ "receiver": trace["receiver"], "account": act["account"], "action": act["name"],
+                              "authorization": [{"account": auth["actor"], "permission": auth["permission"]} for auth in act["authorization"]],
+                              "data": act.get("hex_data"), "params": act["data"] if isinstance(act["data"], dict) else None })
+        return expected
+
+    @staticmethod
+    def verify(blocks, transactions, abiAccounts=None):
+        """Checks the transactions, a list of cleos transaction responses, against the traces in blocks. Each must be in exactly
+        one block, in the block the response reports, with the same actions in the same order. abiAccounts: accounts whose
+        ABI the node was given with --trace-rpc-abi, their actions must carry matching "params"; None for --trace-no-abis,
+        where no action may carry "params". Returns a list of the mismatches found, empty when all match."""
+        errors=[]
+        traces={}
+        for blockNum,block in blocks.items():
+            for trx in block["transactions"]:
+                traces.setdefault(trx["id"], []).append((blockNum, trx))
+        for trans in transactions:
+            transId=Node.getTransId(trans)
+            found=traces.get(transId, [])
+            if len(found) != 1:
+                errors.append("%s found in %d blocks %s" % (transId, len(found), [blockNum for blockNum,_ in found]))
+                continue
+            blockNum,trx=found[0]
+            if blockNum != Node.getTransBlockNum(trans):
+                errors.append("%s in block %d, expected in block %d" % (transId, blockNum, Node.getTransBlockNum(trans)))
+            expected=TraceApiFetcher.expectedActions(trans)
+            if len(trx["actions"]) != len(expected):
+                errors.append("%s has %d actions, expected %d" % (transId, len(trx["actions"]), len(expected)))
+                continue
+            for index,(action,exp) in enumerate(zip(trx["actions"], expected)):
+                for key in ["receiver", "account", "action", "authorization"]:
+                    if action[key] != exp[key]:
+                        errors.append("%s action %d %s is %s, expected %s" % (transId, index, key, action[key], exp[key]))
+                if exp["data"] is not None and action["data"] != exp["data"]:
+                    errors.append("%s action %d data is %s, expected %s" % (transId, index, action["data"], exp["data"]))
+                if abiAccounts is None:
+                    if "params" in action:
+                        errors.append("%s action %d has params without an ABI" % (transId, index))
+                elif action["account"] in abiAccounts:
+                    if "params" not in action:
+                        errors.append("%s action %d of %s has no params" % (transId, index, action["account"]))
+                    elif exp["params"] is not None and action["params"] != exp["params"]:
+                        errors.append("%s action %d params are %s, expected %s" % (transId, index, action["params"], exp["params"]))
+        return errors
+
+    def stats(self):
+        return { "blocks": self.fetched, "missing": len(self.missing), "concurrency": self.concurrency, "elapsed_sec": round(self.elapsed, 3),
+                 "blocks_per_sec": round((self.fetched - len(self.missing)) / self.elapsed, 1) if self.elapsed > 0 else None,
+                 "latency_ms": ProductionLatency.distribution(self.latencies) }
+
+    def printStats(self):
+        stats=self.stats()
+        Utils.Print("trace_api/get_block on %s: %d blocks, %d missing, %d concurrent, %s sec, %s blocks/s" %
+                    (self.node.endpointHttp, stats["blocks"], stats["missing"], stats["concurrency"], stats["elapsed_sec"], stats["blocks_per_sec"]))
+        dist=stats["latency_ms"]
+        if dist is not None:
+            Utils.Print("trace_api/get_block latency (ms): " + ", ".join("%s %s" % (key, dist[key]) for key in ["min", "mean"] +
+                        ["p%d" % (p) for p in ProductionLatency.Percentiles] + ["max"]))
@@ -0,0 +1,195 @@
+import time
+from datetime import datetime
+from datetime import timezone
+
+from testUtils import Utils
+from Node import Node
+from ProductionLatency import ProductionLatency
+
+###########################################################################################
+# TransactionTracker
+#
+# Records every transaction a test submits: its id, expiration, the node it went to and every
+# attempt. Sends are retried only while the transaction can still make it into a block before
+# it expires, duplicate sends of one signed transaction to several nodes are counted by outcome,
+# and inclusion is confirmed by scanning the blocks produced since tracking started. A transaction
+# not in any block once its expiration has passed is reported as dropped.
+#
+###########################################################################################
+
+class TrackedTransaction(object):
+    def __init__(self, index, label, expiration):
+        self.index=index              # submission order
+        self.label=label
+        self.expiration=expiration    # epoch seconds after which the transaction can no longer be included
+        self.duplicate=False          # one signed transaction sent to several nodes
+        self.transId=None
+        self.node=None                # node that accepted it first
+        self.attempts=[]              # (time, nodeId, accepted)
+        self.sentTime=None            # time of the first accepted send
+        self.blockNum=None
+        self.blockTime=None
+
+    def accepted(self):
+        return self.transId is not None
+
+    def included(self):
+        return self.blockNum is not None
+
+class TransactionTracker(object):
+    def __init__(self, node, expirationSec=120, retryDelay=1.0, maxAttempts=2, expirationMargin=5):
+        """node: node whose blocks are scanned for inclusion. expirationSec: expiration transactions are signed with.
+        A failed send is retried after retryDelay seconds, at most maxAttempts sends in total, and never later than
+        expirationMargin seconds before the transaction expires."""
+        self.node=node
+        self.expirationSec=expirationSec
+        self.retryDelay=retryDelay
+        self.maxAttempts=maxAttempts
+        self.expirationMargin=expirationMargin
+        self.transactions=[]
+        self.byId={}
+        self.duplicatesAccepted=0
+        self.duplicatesRejected=0
+        self.scannedBlockNum=node.getHeadBlockNum() - 1
+
+    def __track(self, label, expiration):
+        tracked=TrackedTransaction(len(self.transactions), label, expiration)
+        self.transactions.append(tracked)
+        return tracked
+
+    def __accept(self, tracked, transId, node):
+        tracked.transId=transId
+        tracked.node=node
+        tracked.sentTime=tracked.attempts[-1][0]
+        self.byId[transId]=tracked
+
+    def send(self, node, sendFn, label=None):
+        """Sends a transaction with sendFn(node), which creates, signs and sends it (e.g. a transferFunds call with
+        expiration=expirationSec) and returns the transaction or None when it is rejected. A rejected send is retried up
+        to maxAttempts sends. Returns the TrackedTransaction."""
+        tracked=self.__track(label, None)
+        while True:
+            # every attempt signs a new transaction with a new expiration, so only the number of attempts limits retries
+            tracked.expiration=time.time() + self.expirationSec
+            trans=sendFn(node)
+            tracked.attempts.append((time.time(), node.nodeId, trans is not None))
+            if trans is not None:
+                self.__accept(tracked, Node.getTransId(trans), node)
+                return tracked
+            if len(tracked.attempts) >= self.maxAttempts:
+                Utils.Print("ERROR: %s rejected after %d attempts" % (label, len(tracked.attempts)))
+                return tracked
+            if Utils.Debug: Utils.Print("%s rejected, retrying in %s seconds" % (label, self.retryDelay))
+            time.sleep(self.retryDelay)
+
+    def record(self, transId, sentTime, expiration, accepted=True, label=None, node=None):
+        """Tracks a transaction sent by other means, e.g. published to AMQP, at sentTime. A transaction not accepted has no id
+        to look for. Returns the TrackedTransaction."""
+        tracked=self.__track(label, expiration)
+        tracked.attempts.append((sentTime, node.nodeId if node is not None else None, accepted))
+        if accepted:
+            self.__accept(tracked, transId, node)
+        return tracked
+
+    def sendDuplicates(self, nodes, signedTrans, label=None):
+        """Pushes one signed transaction (e.g. transferFunds(..., dontSend=True, expiration=expirationSec)) to each of nodes,
+        counting duplicate sends the nodes accept and reject. Rounds of sends are retried while the transaction has not been
+        accepted by any node and is not about to expire. Returns the TrackedTransaction."""
+        expiration=datetime.strptime(signedTrans["expiration"], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp() \
+                   if "expiration" in signedTrans else time.time() + self.expirationSec
+        tracked=self.__track(label, expiration)
+        tracked.duplicate=True
+        while True:
+            for node in nodes:
+                success,result=node.pushTransaction(signedTrans, silentErrors=True)
+                tracked.attempts.append((time.time(), node.nodeId, success))
+                if not success:
+                    if tracked.accepted() and ("tx_duplicate" in result or "Duplicate transaction" in result):
+                        self.duplicatesRejected+=1
+                    continue
+                if tracked.accepted():
+                    # the node had not seen it yet, it reached this node before the copy from its peers
+                    self.duplicatesAccepted+=1
+                else:
+                    self.__accept(tracked, Node.getTransId(result), node)
+            if tracked.accepted():
+                return tracked
+            if len(tracked.attempts) >= self.maxAttempts * len(nodes) or time.time() + self.retryDelay > tracked.expiration - self.expirationMargin:
+                Utils.Print("ERROR: %s rejected by all nodes" % (label))
+                return tracked
+            time.sleep(self.retryDelay)
+
+    @staticmethod
+    def blockTimestamp(block):
+        return datetime.strptime(block["timestamp"], Utils.TimeFmt).replace(tzinfo=timezone.utc).timestamp()
+
+    def scan(self):
+        """Scans the blocks produced since the last scan for tracked transactions. Returns False if blocks could not be read."""
+        headBlockNum=self.node.getHeadBlockNum()
+        for blockNum in range(self.scannedBlockNum + 1, headBlockNum + 1):
+            block=self.node.postApi("chain/get_block", {"block_num_or_id": blockNum})
+            if block is None:
+                return False
+            for trans in block["transactions"]:
+                transId=trans["trx"]["id"] if isinstance(trans["trx"], dict) else trans["trx"]
+                tracked=self.byId.get(transId)
+                if tracked is None:
+                    continue
+                if tracked.included():
+                    Utils.Print("ERROR: %s found in block %d, but already in block %d" % (transId, blockNum, tracked.blockNum))
+                    continue
+                tracked.blockNum=blockNum
+                tracked.blockTime=TransactionTracker.blockTimestamp(block)
+            self.scannedBlockNum=blockNum
+        return True
+
+    def pending(self):
+        return [tracked for tracked in self.transactions if tracked.accepted() and not tracked.included()]
+
+    def waitForInclusion(self, timeout=None):
+        """Scans blocks until every accepted transaction is in a block or has expired. Returns True when all are included."""
+        deadline=max([tracked.expiration for tracked in self.pending()] + [time.time()]) + self.expirationMargin
+        if timeout is not None:
+            deadline=min(deadline, time.time() + timeout)
+        while True:
+            self.scan()
+            pending=self.pending()
+            if len(pending) == 0:
+                return True
+            now=time.time()
+            if now > deadline or all(tracked.expiration < now for tracked in pending):
+                # one more pass for blocks produced right before the last expiration
+                self.scan()
+                return len(self.pending()) == 0
+            time.sleep(0.5)
+
+    def dropped(self):
+        """Accepted transactions that did not make it into a block, after waitForInclusion."""
+        return self.pending()
+
+    def rejected(self):
+        return [tracked for tracked in self.transactions if not tracked.accepted()]
+
+    def stats(self):
+        submitted=len(self.transactions)
+        accepted=[tracked for tracked in self.transactions if tracked.accepted()]
+        included=[tracked for tracked in accepted if tracked.included()]
+        attempts=sum(len(tracked.attempts) for tracked in self.transactions)
+        return { "submitted": submitted, "accepted": len(accepted), "included": len(included),
+                 "rejected": submitted - len(accepted), "dropped": len(accepted) - len(included),
+                 "acceptance_rate": len(accepted) / submitted if submitted else None,
+                 "inclusion_rate": len(included) / len(accepted) if accepted else None,
+                 "attempts": attempts, "retried": len([tracked for tracked in self.transactions if not tracked.duplicate and len(tracked.attempts) > 1]),
+                 "duplicates_accepted": self.duplicatesAccepted, "duplicates_rejected": self.duplicatesRejected,
+                 "time_to_inclusion_ms": ProductionLatency.distribution([(tracked.blockTime - tracked.sentTime) * 1000 for tracked in included]) }
+
+    def printStats(self):
+        stats=self.stats()
+        Utils.Print("Transactions: %d submitted, %d accepted (%.2f%%), %d included, %d rejected, %d dropped, %d send attempts, %d retried" %
+                    (stats["submitted"], stats["accepted"], (stats["acceptance_rate"] or 0) * 100, stats["included"], stats["rejected"],
+                     stats["dropped"], stats["attempts"], stats["retried"]))
+        Utils.Print("Duplicate sends: %d accepted, %d rejected as duplicates" % (stats["duplicates_accepted"], stats["duplicates_rejected"]))
+        dist=stats["time_to_inclusion_ms"]
+        if dist is not None:
+            Utils.Print("Time to inclusion (ms): " + ", ".join("%s %s" % (key, dist[key]) for key in ["min", "mean"] +
+                        ["p%d" % (p) for p in ProductionLatency.Percentiles] + ["max"]))
@@ -8,6 +8,7 @@ import re
 import sys
 
 from testUtils import Utils
+from testUtils import ReadinessWatcher
 
 Wallet=namedtuple("Wallet", "name password host port")
 # pylint: disable=too-many-instance-attributes
@@ -88,15 +89,9 @@ class WalletMgr(object):
             popen=subprocess.Popen(cmd.split(), stdout=sout, stderr=serr)
             self.__walletPid=popen.pid
 
-        # Give keosd time to warm up
-        time.sleep(2)
-
-        try:
-            if Utils.Debug: Utils.Print("Checking if %s launched. %s" % (Utils.EosWalletName, pgrepCmd))
-            psOut=Utils.checkOutput(pgrepCmd.split())
-            if Utils.Debug: Utils.Print("Launched %s. {%s}" % (Utils.EosWalletName, psOut))
-        except subprocess.CalledProcessError as ex:
+        if not ReadinessWatcher.waitForPort(Utils.EosWalletName, self.host, self.port, timeout=30, proc=popen):
             Utils.errorExit("Failed to launch the wallet manager")
+        if Utils.Debug: Utils.Print("Launched %s, pid %d." % (Utils.EosWalletName, self.__walletPid))
 
         return True
 
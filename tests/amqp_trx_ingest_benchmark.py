@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+from Cluster import Cluster
+from WalletMgr import WalletMgr
+from Node import Node
+from AmqpTrxPublisher import AmqpTrxPublisher
+from ProductionLatency import ProductionLatency
+from TransactionTracker import TransactionTracker
+from TestHelper import TestHelper
+from TestHelper import AppArgs
+
+import concurrent.futures
+import json
+import time
+
+###############################################################
+# amqp_trx_ingest_benchmark
+#
+# Measures how fast amqp_trx_plugin ingests transactions. Transfers are
+# signed ahead of time, then published over AMQP to the "trx" queue of the
+# local broker by AmqpTrxPublisher, in confirm mode with up to --in-flight
+# publishes awaiting the broker's confirm. For every in-flight depth it reports:
+#   - ingest TPS: transactions included per second, first publish to the
+#     block holding the last one
+#   - publish rate: confirmed publishes per second
+#   - publish to broker confirm latency percentiles
+#   - publish to in-block latency percentiles
+#   - queue depth (ready and unacknowledged messages) over time
+#
+###############################################################
+
+Print=Utils.Print
+errorExit=Utils.errorExit
+
+from core_symbol import CORE_SYMBOL
+
+appArgs=AppArgs()
+appArgs.add(flag="--num-transactions", type=int, help="transactions published per in-flight depth", default=2000)
+appArgs.add(flag="--in-flight", type=str, help="comma separated numbers of unconfirmed publishes to sweep", default="1,16,64")
+appArgs.add(flag="--ack-mode", type=str, help="--amqp-trx-ack-mode of the node: received, executed or in_block", default="in_block")
+appArgs.add(flag="--sample-interval", type=float, help="seconds between queue depth samples", default=0.25)
+appArgs.add(flag="--report", type=str, help="write the benchmark results to this JSON file", default=None)
+args=TestHelper.parse_args({"-v","--clean-run","--dump-error-details","--leave-running","--keep-logs","--amqp-address"}, applicationSpecificArgs=appArgs)
+
+Utils.Debug=args.v
+killAll=args.clean_run
+dumpErrorDetails=args.dump_error_details
+dontKill=args.leave_running
+killEosInstances=not dontKill
+killWallet=not dontKill
+keepLogs=args.keep_logs
+amqpAddr=args.amqp_address
+
+if amqpAddr is None:
+    errorExit("--amqp-address of the local broker is required")
+
+transactionExpiration=600             # seconds, long enough for all transactions of a run to be signed and published
+
+def signTransfers(node, source, destination, count, runLabel):
+    """Signs count transfers, made unique by their memo, without sending them."""
+    amountStr=Node.currencyIntToStr(1, CORE_SYMBOL)
+    start=time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        packedTrxs=list(executor.map(lambda i: node.transferFunds(source, destination, amountStr, memo="bench %s %d" % (runLabel, i),
+                                                                  dontSend=True, expiration=transactionExpiration, returnPacked=True),
+                                     range(count)))
+    Print("Signed %d transfers in %.3f sec" % (count, time.perf_counter() - start))
+    return packedTrxs
+
+def depthSummary(samples):
+    if len(samples) == 0:
+        return None
+    start=samples[0][0]
+    return { "max_ready": max(ready for _,ready,_ in samples), "max_unacked": max(unacked for _,_,unacked in samples),
+             "mean_ready": round(sum(ready for _,ready,_ in samples) / len(samples), 1),
+             "timeline": [(round(sampleTime - start, 3), ready, unacked) for sampleTime,ready,unacked in samples] }
+
+def benchmark(node, publisher, packedTrxs, inFlight):
+    publisher.inFlight=inFlight
+    tracker=TransactionTracker(node, expirationSec=transactionExpiration)
+    publisher.startDepthSampler(args.sample_interval)
+    try:
+        start=time.time()
+        published=publisher.publishAll(packedTrxs)
+        publishSec=time.time() - start
+        for i,(transId,publishTime,routed) in enumerate(published):
+            tracker.record(transId, publishTime, publishTime + transactionExpiration, accepted=routed, label="transfer %d" % (i))
+        allIncluded=tracker.waitForInclusion(timeout=120)
+    finally:
+        samples=publisher.stopDepthSampler()
+
+    stats=tracker.stats()
+    tracker.printStats()
+    included=[tracked for tracked in tracker.transactions if tracked.included()]
+    ingestSec=max(tracked.blockTime for tracked in included) - start if len(included) > 0 else None
+    result={ "in_flight": inFlight, "transactions": len(packedTrxs), "routed": stats["accepted"], "included": stats["included"],
+             "dropped": stats["dropped"], "publish_sec": round(publishSec, 3),
+             "publish_rate": round(stats["accepted"] / publishSec, 1) if publishSec > 0 else None,
+             "ingest_tps": round(len(included) / ingestSec, 1) if ingestSec else None,
+             "confirm_ms": ProductionLatency.distribution(publisher.confirmLatencies),
+             "latency_ms": stats["time_to_inclusion_ms"], "queue_depth": depthSummary(samples) }
+    if not allIncluded:
+        Print("ERROR: %d of %d published transactions were not included" % (stats["dropped"], stats["accepted"]))
+    return result
+
+cluster=Cluster(walletd=True)
+walletMgr=WalletMgr(True)
+testSuccessful=False
+try:
+    TestHelper.printSystemInfo("BEGIN")
+    cluster.setWalletMgr(walletMgr)
+    cluster.killall(allInstances=killAll)
+    cluster.cleanup()
+
+    Print("Stand up cluster")
+    cluster.createAMQPQueue("trx")
+    if cluster.launch(pnodes=1, totalNodes=1, totalProducers=1, useBiosBootFile=False,
+                      extraNodeosArgs=" --plugin eosio::amqp_trx_plugin --amqp-trx-address %s --amqp-trx-ack-mode=%s" % (amqpAddr, args.ack_mode)) is False:
+        Utils.cmdError("launcher")
+        errorExit("Failed to stand up eos cluster.")
+    node=cluster.getNode(0)
+
+    testWallet=walletMgr.create("test", [cluster.eosioAccount])
+    destination=cluster.defProducerAccounts["defproducera"]
+    walletMgr.importKey(destination, testWallet, ignoreDupKeyWarning=True)
+
+    publisher=AmqpTrxPublisher(amqpAddr)
+    results=[]
+    for inFlight in [int(v) for v in args.in_flight.split(",")]:
+        Print("Benchmarking %d transactions with %d publishes in flight" % (args.num_transactions, inFlight))
+        packedTrxs=signTransfers(node, cluster.eosioAccount, destination, args.num_transactions, "%d" % (inFlight))
+        results.append(benchmark(node, publisher, packedTrxs, inFlight))
+
+    latencyColumns=["p%d" % (p) for p in ProductionLatency.Percentiles]
+    Print("%9s %8s %8s %10s %10s %11s %11s %s %10s %10s" % ("in flight", "included", "dropped", "ingest tps", "publish/s",
+          "confirm p50", "confirm p99", " ".join("%8s" % (column + " ms") for column in latencyColumns), "max ready", "max unack"))
+    for r in results:
+        latency=r["latency_ms"]
+        confirm=r["confirm_ms"]
+        depth=r["queue_depth"]
+        Print("%9d %8d %8d %10s %10s %11s %11s %s %10s %10s" % (r["in_flight"], r["included"], r["dropped"], r["ingest_tps"], r["publish_rate"],
+              confirm["p50"] if confirm else "-", confirm["p99"] if confirm else "-",
+              " ".join("%8s" % (latency[column] if latency else "-") for column in latencyColumns),
+              depth["max_ready"] if depth else "-", depth["max_unacked"] if depth else "-"))
+
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump({ "ack_mode": args.ack_mode, "results": results }, f, indent=2)
+        Print("Wrote report to %s" % (args.report))
+
+    testSuccessful=all(r["dropped"] == 0 and r["routed"] == r["transactions"] for r in results)
+finally:
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
+
+exitCode=0 if testSuccessful else 1
+exit(exitCode)
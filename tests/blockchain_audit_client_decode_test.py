@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+
+from testUtils import Utils
+from Cluster import Cluster
+from TestHelper import TestHelper
+from WalletMgr import WalletMgr
+from core_symbol import CORE_SYMBOL
+
+###############################################################
+# blockchain_audit_client_decode_test
+#
+# Checks that blockchain_audit_tool.py --client-decode renders table rows exactly
+# as nodeos does for get_table_rows "json":true. The rows of the get_table_test
+# contract (uint64, uint128, float64, float128, checksums) and of the system
+# contract tables are fetched with "json":false, decoded by the tool's AbiDecoder
+# and compared with the rows nodeos decoded. Then a full audit with and without
+# --client-decode must compare equal.
+#
+###############################################################
+
+Print=Utils.Print
+errorExit=Utils.errorExit
+
+args=TestHelper.parse_args({"--dump-error-details","--keep-logs","-v","--leave-running","--clean-run"})
+Utils.Debug=args.v
+dumpErrorDetails=args.dump_error_details
+keepLogs=args.keep_logs
+dontKill=args.leave_running
+killAll=args.clean_run
+killEosInstances=not dontKill
+killWallet=not dontKill
+
+auditTool=os.path.join(os.getcwd(), "scripts", "blockchain_audit_tool.py")
+sys.path.insert(0, os.path.dirname(auditTool))
+from blockchain_audit_tool import AbiDecoder
+
+def compareTable(node, code, scope, table):
+    """Returns the number of rows compared, exits on a row the tool decodes differently than nodeos."""
+    request={ "code": code, "scope": scope, "table": table, "limit": 1000 }
+    decodedByNode=node.postApi("chain/get_table_rows", dict(request, json=True))
+    binary=node.postApi("chain/get_table_rows", dict(request, json=False))
+    assert decodedByNode is not None and binary is not None, "get_table_rows of %s %s %s failed" % (code, scope, table)
+    abi=node.postApi("chain/get_abi", { "account_name": code })["abi"]
+    decodedByTool=AbiDecoder(abi).decodeRows(table, binary["rows"])
+    if len(decodedByTool) != len(decodedByNode["rows"]):
+        errorExit("%s %s %s: tool decoded %d rows, nodeos %d" % (code, scope, table, len(decodedByTool), len(decodedByNode["rows"])))
+    for row,expected in zip(decodedByTool, decodedByNode["rows"]):
+        if row != expected:
+            errorExit("%s %s %s row decoded as %s, nodeos returns %s" % (code, scope, table, row, expected))
+    return len(decodedByTool)
+
+cluster=Cluster(walletd=True)
+walletMgr=WalletMgr(True)
+testSuccessful=False
+try:
+    TestHelper.printSystemInfo("BEGIN")
+    cluster.setWalletMgr(walletMgr)
+    cluster.killall(allInstances=killAll)
+    cluster.cleanup()
+
+    Print("Stand up cluster")
+    if cluster.launch(pnodes=1, totalNodes=1) is False:
+        Utils.cmdError("launcher")
+        errorExit("Failed to stand up eos cluster.")
+    node=cluster.getNode(0)
+
+    account=Cluster.createAccountKeys(1)[0]
+    account.name="gettabletest"
+    testWallet=walletMgr.create("test", [cluster.eosioAccount, account])
+    node.createInitializeAccount(account, cluster.eosioAccount, buyRAM=1000000, stakedDeposit=5000000, waitForTransBlock=True, exitOnError=True)
+    node.publishContract(account, "unittests/test-contracts/get_table_test", "get_table_test.wasm", "get_table_test.abi", waitForTransBlock=True)
+
+    for value in [2, 5, 7, 0xffffffffffffffff]:
+        success,_=node.pushMessage(account.name, "addnumobj", '{"input":%d}' % (value), "-p %s@active" % (account.name))
+        assert success, "addnumobj %d failed" % (value)
+    for text in ["a", "hello", ""]:
+        success,trans=node.pushMessage(account.name, "addhashobj", '{"hashinput":"%s"}' % (text), "-p %s@active" % (account.name))
+        assert success, "addhashobj %s failed" % (text)
+    node.waitForTransInBlock(trans["transaction_id"])
+
+    compared=0
+    for code,scope,table in [(account.name, account.name, "numobjs"), (account.name, account.name, "hashobjs"),
+                             ("eosio", "eosio", "global"), ("eosio", "eosio", "rammarket"), ("eosio", "eosio", "producers"),
+                             ("eosio.token", "eosio", "accounts"), ("eosio.token", CORE_SYMBOL, "stat")]:
+        compared+=compareTable(node, code, scope, table)
+    Print("%d rows decoded by the audit tool match get_table_rows json:true" % (compared))
+
+    Print("Audit with and without --client-decode")
+    endpoint="%s:%d" % (node.host, node.port)
+    dataDir=Utils.getNodeDataDir(0)
+    serverDecoded=os.path.join(dataDir, "audit_server_decode.json")
+    clientDecoded=os.path.join(dataDir, "audit_client_decode.json")
+    for output,extra in [(serverDecoded, []), (clientDecoded, ["--client-decode"])]:
+        if subprocess.call([sys.executable, auditTool, "-o", output] + extra + [endpoint], stdout=subprocess.DEVNULL) != 0:
+            errorExit("audit %s failed" % (" ".join(extra)))
+    if subprocess.call([sys.executable, auditTool, "--ref", serverDecoded, "--comp", clientDecoded]) != 0:
+        errorExit("audit with --client-decode differs from the audit decoded by nodeos")
+
+    testSuccessful=True
+finally:
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
+
+exitCode=0 if testSuccessful else 1
+exit(exitCode)
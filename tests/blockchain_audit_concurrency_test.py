@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+from Cluster import Cluster
+from TestHelper import TestHelper
+from WalletMgr import WalletMgr
+from BlockchainAuditTool import BlockchainAuditTool
+
+###############################################################
+# blockchain_audit_concurrency_test
+#
+# Checks that fetching accounts concurrently (blockchain_audit_tool.py --concurrency)
+# does not change the audit. Accounts, some of them with token balances, are created
+# and production is paused, then the node is audited with one and with several
+# workers, with the default page size and with pages smaller than the number of
+# workers, and the audits and the reports printed with them must have the same bytes.
+#
+###############################################################
+
+Print=Utils.Print
+errorExit=Utils.errorExit
+
+args=TestHelper.parse_args({"--dump-error-details","--keep-logs","-v","--leave-running","--clean-run"})
+Utils.Debug=args.v
+dumpErrorDetails=args.dump_error_details
+keepLogs=args.keep_logs
+dontKill=args.leave_running
+killAll=args.clean_run
+killEosInstances=not dontKill
+killWallet=not dontKill
+
+cluster=Cluster(walletd=True)
+walletMgr=WalletMgr(True)
+testSuccessful=False
+try:
+    TestHelper.printSystemInfo("BEGIN")
+    cluster.setWalletMgr(walletMgr)
+    cluster.killall(allInstances=killAll)
+    cluster.cleanup()
+
+    Print("Stand up cluster")
+    if cluster.launch(pnodes=1, totalNodes=1) is False:
+        Utils.cmdError("launcher")
+        errorExit("Failed to stand up eos cluster.")
+    node=cluster.getNode(0)
+
+    walletMgr.create("test", [cluster.eosioAccount])
+    if BlockchainAuditTool.createAccounts(node, cluster.eosioAccount, 50, funded=20) is None:
+        errorExit("accounts did not reach a block")
+    if not BlockchainAuditTool.pauseProduction(node):
+        errorExit("head did not stop after pausing production")
+
+    tool=BlockchainAuditTool(Utils.getNodeDataDir(0))
+    for label,limits in [("", []), ("_paged", ["--page-size", "3"])]:
+        Print("Audit with one and with 8 workers%s" % (" with " + " ".join(limits) if limits else ""))
+        serial="audit_serial%s.json" % (label)
+        concurrent="audit_concurrent%s.json" % (label)
+        if not tool.audit(serial, node=node, extraArgs=limits + ["--concurrency", "1"]) or \
+           not tool.audit(concurrent, node=node, extraArgs=limits + ["--concurrency", "8"]):
+            errorExit("audit%s failed" % (label))
+        if not tool.sameAudits(serial, concurrent):
+            errorExit("concurrent audit%s differs from the serial audit" % (label))
+
+    testSuccessful=True
+finally:
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
+
+exitCode=0 if testSuccessful else 1
+exit(exitCode)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import re
+
+from testUtils import Utils
+from Cluster import Cluster
+from TestHelper import TestHelper
+from WalletMgr import WalletMgr
+from BlockchainAuditTool import BlockchainAuditTool
+
+###############################################################
+# blockchain_audit_incremental_test
+#
+# Checks that an incremental audit (blockchain_audit_tool.py --incremental) equals a
+# full audit. The chain runs without the system contract, whose onblock updates table
+# rows in place, which --incremental does not detect. With production paused an
+# incremental audit of an unchanged chain must reuse the table data of every account
+# and have the same bytes as the audit it reused. Then accounts are created and rows
+# are added to a contract table, and an incremental audit must still equal a full
+# audit, fetching the changed and the new accounts and reusing the others.
+#
+###############################################################
+
+Print=Utils.Print
+errorExit=Utils.errorExit
+
+args=TestHelper.parse_args({"--dump-error-details","--keep-logs","-v","--leave-running","--clean-run"})
+Utils.Debug=args.v
+dumpErrorDetails=args.dump_error_details
+keepLogs=args.keep_logs
+dontKill=args.leave_running
+killAll=args.clean_run
+killEosInstances=not dontKill
+killWallet=not dontKill
+
+def reusedAccounts(tool, name):
+    """Returns the number of accounts whose table data the audit name reused and the number of accounts audited."""
+    m=re.search(r"reused table data of (\d+)/(\d+) accounts", tool.errors(name))
+    if m is None:
+        errorExit("audit %s does not report the accounts it reused:\n%s" % (name, tool.errors(name)))
+    return int(m.group(1)), int(m.group(2))
+
+def addNumObjs(node, account, values):
+    for value in values:
+        success,trans=node.pushMessage(account.name, "addnumobj", '{"input":%d}' % (value), "-p %s@active" % (account.name))
+        assert success, "addnumobj %d failed" % (value)
+    node.waitForTransInBlock(trans["transaction_id"])
+
+cluster=Cluster(walletd=True)
+walletMgr=WalletMgr(True)
+testSuccessful=False
+try:
+    TestHelper.printSystemInfo("BEGIN")
+    cluster.setWalletMgr(walletMgr)
+    cluster.killall(allInstances=killAll)
+    cluster.cleanup()
+
+    Print("Stand up cluster")
+    if cluster.launch(pnodes=1, totalNodes=1, loadSystemContract=False) is False:
+        Utils.cmdError("launcher")
+        errorExit("Failed to stand up eos cluster.")
+    node=cluster.getNode(0)
+
+    account=Cluster.createAccountKeys(1)[0]
+    account.name="gettabletest"
+    walletMgr.create("test", [cluster.eosioAccount, account])
+    node.createAccount(account, cluster.eosioAccount, stakedDeposit=0, waitForTransBlock=True, exitOnError=True)
+    node.publishContract(account, "unittests/test-contracts/get_table_test", "get_table_test.wasm", "get_table_test.abi", waitForTransBlock=True)
+    addNumObjs(node, account, [2, 5, 7])
+    if BlockchainAuditTool.createAccounts(node, cluster.eosioAccount, 30, funded=10) is None:
+        errorExit("accounts did not reach a block")
+    if not BlockchainAuditTool.pauseProduction(node):
+        errorExit("head did not stop after pausing production")
+
+    tool=BlockchainAuditTool(Utils.getNodeDataDir(0))
+    Print("Audit, then audit the unchanged chain incrementally")
+    if not tool.audit("audit_full.json", node=node) or \
+       not tool.audit("audit_unchanged.json", node=node, extraArgs=["--incremental", tool.path("audit_full.json")]):
+        errorExit("audit failed")
+    if not tool.sameAudits("audit_full.json", "audit_unchanged.json"):
+        errorExit("incremental audit of the unchanged chain differs from the audit it reused")
+    reused,total=reusedAccounts(tool, "audit_unchanged.json")
+    if reused != total:
+        errorExit("incremental audit of the unchanged chain reused %d of %d accounts" % (reused, total))
+
+    Print("Create accounts and add table rows")
+    node.processCurlCmd("producer", "resume", "{}")
+    newAccounts=BlockchainAuditTool.createAccounts(node, cluster.eosioAccount, 5, prefix="auditnew")
+    if newAccounts is None:
+        errorExit("new accounts did not reach a block")
+    addNumObjs(node, account, [11, 13])
+    if not BlockchainAuditTool.pauseProduction(node):
+        errorExit("head did not stop after pausing production")
+
+    Print("Audit the changed chain fully and incrementally")
+    if not tool.audit("audit_changed_full.json", node=node) or \
+       not tool.audit("audit_changed_incremental.json", node=node, extraArgs=["--incremental", tool.path("audit_full.json")]):
+        errorExit("audit of the changed chain failed")
+    if not tool.sameAudits("audit_changed_full.json", "audit_changed_incremental.json"):
+        errorExit("incremental audit of the changed chain differs from the full audit")
+    reused,total=reusedAccounts(tool, "audit_changed_incremental.json")
+    if reused == 0 or reused > total - len(newAccounts) - 1:
+        errorExit("incremental audit of the changed chain reused %d of %d accounts, %d of them are new and %s has new rows" %
+                  (reused, total, len(newAccounts), account.name))
+    Print("Incremental audit reused the table data of %d of %d accounts" % (reused, total))
+
+    testSuccessful=True
+finally:
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
+
+exitCode=0 if testSuccessful else 1
+exit(exitCode)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import json
+
+from testUtils import Utils
+from Cluster import Cluster
+from TestHelper import TestHelper
+from WalletMgr import WalletMgr
+from BlockchainAuditTool import BlockchainAuditTool
+
+###############################################################
+# blockchain_audit_jsonl_test
+#
+# Checks the line format of blockchain_audit_tool.py (-o <file>.jsonl) and the
+# record by record comparison of audits. With production paused the node is audited
+# to .json and to .jsonl, which must print the same report and compare equal in
+# either order, also when compared by the audit itself with --ref. Then a copy of the
+# .jsonl audit with a changed code hash and a missing account must be reported with
+# both mismatches, and a copy with records out of order must be rejected.
+#
+###############################################################
+
+Print=Utils.Print
+errorExit=Utils.errorExit
+
+args=TestHelper.parse_args({"--dump-error-details","--keep-logs","-v","--leave-running","--clean-run"})
+Utils.Debug=args.v
+dumpErrorDetails=args.dump_error_details
+keepLogs=args.keep_logs
+dontKill=args.leave_running
+killAll=args.clean_run
+killEosInstances=not dontKill
+killWallet=not dontKill
+
+def rewriteRecords(tool, name, newName, rewrite):
+    """Writes the records of the .jsonl audit name, as changed by rewrite, to newName."""
+    with open(tool.path(name), "r") as f:
+        records=[json.loads(line) for line in f]
+    with open(tool.path(newName), "w") as f:
+        for rec in rewrite(records):
+            f.write(json.dumps(rec, sort_keys=True))
+            f.write("\n")
+
+def accountIndex(records, name):
+    for i,rec in enumerate(records):
+        if rec["type"] == "account" and rec["key"] == name:
+            return i
+    errorExit("account %s not found in the audit" % (name))
+
+cluster=Cluster(walletd=True)
+walletMgr=WalletMgr(True)
+testSuccessful=False
+try:
+    TestHelper.printSystemInfo("BEGIN")
+    cluster.setWalletMgr(walletMgr)
+    cluster.killall(allInstances=killAll)
+    cluster.cleanup()
+
+    Print("Stand up cluster")
+    if cluster.launch(pnodes=1, totalNodes=1) is False:
+        Utils.cmdError("launcher")
+        errorExit("Failed to stand up eos cluster.")
+    node=cluster.getNode(0)
+
+    walletMgr.create("test", [cluster.eosioAccount])
+    accounts=BlockchainAuditTool.createAccounts(node, cluster.eosioAccount, 20, funded=5)
+    if accounts is None:
+        errorExit("accounts did not reach a block")
+    if not BlockchainAuditTool.pauseProduction(node):
+        errorExit("head did not stop after pausing production")
+
+    tool=BlockchainAuditTool(Utils.getNodeDataDir(0))
+    Print("Audit to .json and to .jsonl")
+    if not tool.audit("audit.json", node=node) or not tool.audit("audit.jsonl", node=node, extraArgs=["--page-size", "7"]):
+        errorExit("audit failed")
+    if not tool.sameFiles("audit.json.report", "audit.jsonl.report"):
+        errorExit("report of the .jsonl audit differs from the report of the .json audit")
+    if not tool.compare("audit.json", "audit.jsonl") or not tool.compare("audit.jsonl", "audit.json"):
+        errorExit("audit.jsonl differs from audit.json")
+    if not tool.audit("audit_ref.jsonl", node=node, extraArgs=["--ref", tool.path("audit.json")]):
+        errorExit("audit to .jsonl with --ref audit.json failed")
+
+    Print("Change a code hash and drop an account")
+    dropped=accounts[3].name
+    def tamper(records):
+        changed=records[accountIndex(records, "eosio.token")]
+        changed["value"]["code_hash"]="0" * len(changed["value"]["code_hash"])
+        del records[accountIndex(records, dropped)]
+        return records
+    rewriteRecords(tool, "audit.jsonl", "audit_tampered.jsonl", tamper)
+    for ref in ["audit.jsonl", "audit.json"]:
+        if tool.compare(ref, "audit_tampered.jsonl"):
+            errorExit("tampered audit compared equal to %s" % (ref))
+        errors=tool.compareErrors("audit_tampered.jsonl")
+        for expected in ["mismatch in 'accounts_hash'", "'eosio.token'", "mismatch in 'account_names'", dropped]:
+            if expected not in errors:
+                errorExit("comparison of the tampered audit with %s does not report %s:\n%s" % (ref, expected, errors))
+
+    Print("Swap two accounts")
+    def swap(records):
+        i=accountIndex(records, accounts[0].name)
+        records[i],records[i + 1]=records[i + 1],records[i]
+        return records
+    rewriteRecords(tool, "audit.jsonl", "audit_unsorted.jsonl", swap)
+    if tool.compare("audit.jsonl", "audit_unsorted.jsonl"):
+        errorExit("audit with accounts out of order compared equal")
+    if "is not sorted" not in tool.compareErrors("audit_unsorted.jsonl"):
+        errorExit("audit with accounts out of order was not rejected:\n%s" % (tool.compareErrors("audit_unsorted.jsonl")))
+
+    testSuccessful=True
+finally:
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
+
+exitCode=0 if testSuccessful else 1
+exit(exitCode)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import os
+
+from testUtils import Utils
+from Cluster import Cluster
+from TestHelper import TestHelper
+from WalletMgr import WalletMgr
+from BlockchainAuditTool import BlockchainAuditTool
+
+###############################################################
+# blockchain_audit_resume_test
+#
+# Checks that an audit killed after a checkpoint and continued with
+# blockchain_audit_tool.py --resume equals an uninterrupted audit. Many accounts
+# are created and production is paused, the node is audited once without
+# interruption, then an audit with the same options is killed as soon as its first
+# checkpoint is saved and resumed. The resumed audit and its report must have the
+# same bytes as the uninterrupted ones and the checkpoint directory must be removed,
+# for both .json and .jsonl output. Pages of one account with one worker make the
+# audit take several checkpoint intervals.
+#
+###############################################################
+
+Print=Utils.Print
+errorExit=Utils.errorExit
+
+args=TestHelper.parse_args({"--dump-error-details","--keep-logs","-v","--leave-running","--clean-run"})
+Utils.Debug=args.v
+dumpErrorDetails=args.dump_error_details
+keepLogs=args.keep_logs
+dontKill=args.leave_running
+killAll=args.clean_run
+killEosInstances=not dontKill
+killWallet=not dontKill
+
+auditArgs=["--checkpoint-interval", "1", "--page-size", "1", "--concurrency", "1"]
+
+def checkpointRemoved(tool, name):
+    if os.path.exists(tool.path(name + ".ckpt")):
+        errorExit("checkpoint directory of %s was not removed" % (name))
+
+cluster=Cluster(walletd=True)
+walletMgr=WalletMgr(True)
+testSuccessful=False
+try:
+    TestHelper.printSystemInfo("BEGIN")
+    cluster.setWalletMgr(walletMgr)
+    cluster.killall(allInstances=killAll)
+    cluster.cleanup()
+
+    Print("Stand up cluster")
+    if cluster.launch(pnodes=1, totalNodes=1) is False:
+        Utils.cmdError("launcher")
+        errorExit("Failed to stand up eos cluster.")
+    node=cluster.getNode(0)
+
+    walletMgr.create("test", [cluster.eosioAccount])
+    if BlockchainAuditTool.createAccounts(node, cluster.eosioAccount, 600, funded=20) is None:
+        errorExit("accounts did not reach a block")
+    if not BlockchainAuditTool.pauseProduction(node):
+        errorExit("head did not stop after pausing production")
+
+    tool=BlockchainAuditTool(Utils.getNodeDataDir(0))
+    for ext in ["json", "jsonl"]:
+        complete="audit_complete.%s" % (ext)
+        resumed="audit_resumed.%s" % (ext)
+        Print("Audit to .%s without interruption" % (ext))
+        if not tool.audit(complete, node=node, extraArgs=auditArgs):
+            errorExit("uninterrupted audit to .%s failed" % (ext))
+        checkpointRemoved(tool, complete)
+
+        Print("Kill an audit to .%s after its first checkpoint" % (ext))
+        checkpointFile=os.path.join(tool.path(resumed + ".ckpt"), "checkpoint.json")
+        popen=tool.start(resumed, node=node, extraArgs=auditArgs)
+        Utils.waitForTruth(lambda: os.path.exists(checkpointFile) or popen.poll() is not None, timeout=120, sleepTime=0.01)
+        if popen.poll() is not None:
+            errorExit("audit to .%s ended before it was killed, exit code %s:\n%s" % (ext, popen.returncode, tool.errors(resumed)))
+        popen.kill()
+        popen.wait()
+
+        Print("Resume the audit to .%s" % (ext))
+        if not tool.audit(resumed, node=node, extraArgs=auditArgs + ["--resume"]):
+            errorExit("resumed audit to .%s failed" % (ext))
+        if "resuming after" not in tool.errors(resumed):
+            errorExit("audit to .%s did not resume from its checkpoint:\n%s" % (ext, tool.errors(resumed)))
+        if not tool.sameAudits(complete, resumed):
+            errorExit("resumed audit to .%s differs from the uninterrupted audit" % (ext))
+        checkpointRemoved(tool, resumed)
+
+    testSuccessful=True
+finally:
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
+
+exitCode=0 if testSuccessful else 1
+exit(exitCode)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import os
+
+from testUtils import Utils
+from Cluster import Cluster
+from TestHelper import TestHelper
+from WalletMgr import WalletMgr
+from BlockchainAuditTool import BlockchainAuditTool
+
+###############################################################
+# blockchain_audit_snapshot_test
+#
+# Checks that an offline audit of a snapshot (blockchain_audit_tool.py --snapshot)
+# equals the online audit of the node the snapshot was taken from. Production is
+# paused, a snapshot is taken on a node in irreversible mode, whose head then stays
+# at the snapshot block, and the node and the snapshot are audited and compared
+# with --ref/--comp, without limits and with scope and row limits that end in the
+# middle of a page.
+#
+###############################################################
+
+Print=Utils.Print
+errorExit=Utils.errorExit
+
+args=TestHelper.parse_args({"--dump-error-details","--keep-logs","-v","--leave-running","--clean-run"})
+Utils.Debug=args.v
+dumpErrorDetails=args.dump_error_details
+keepLogs=args.keep_logs
+dontKill=args.leave_running
+killAll=args.clean_run
+killEosInstances=not dontKill
+killWallet=not dontKill
+
+cluster=Cluster(walletd=True)
+walletMgr=WalletMgr(True)
+testSuccessful=False
+try:
+    TestHelper.printSystemInfo("BEGIN")
+    cluster.setWalletMgr(walletMgr)
+    cluster.killall(allInstances=killAll)
+    cluster.cleanup()
+
+    Print("Stand up cluster")
+    if cluster.launch(pnodes=1, totalNodes=2, specificExtraNodeosArgs={ 1: "--read-mode irreversible" }) is False:
+        Utils.cmdError("launcher")
+        errorExit("Failed to stand up eos cluster.")
+    producerNode=cluster.getNode(0)
+    irrNode=cluster.getNode(1)
+
+    Print("Pause production and wait for the irreversible node to reach the last irreversible block")
+    if not BlockchainAuditTool.pauseProduction(producerNode):
+        errorExit("head of the producer did not stop after pausing production")
+    lib=producerNode.getIrreversibleBlockNum()
+    if not Utils.waitForTruth(lambda: irrNode.getHeadBlockNum() == lib, timeout=30, sleepTime=1):
+        errorExit("head of the irreversible node did not reach block %d" % (lib))
+
+    res=irrNode.createSnapshot()
+    if res is None or "snapshot_name" not in res:
+        errorExit("create_snapshot failed: %s" % (res))
+    snapshot=res["snapshot_name"]
+    Print("Snapshot of block %d: %s" % (res["head_block_num"], snapshot))
+
+    tool=BlockchainAuditTool(Utils.getNodeDataDir(1))
+    for label,limits in [("", []), ("_limited", ["--scope-limit", "3", "--table-row-limit", "5", "--page-size", "2"])]:
+        Print("Audit the node and its snapshot%s" % (" with " + " ".join(limits) if limits else ""))
+        online="audit_online%s.json" % (label)
+        offline="audit_snapshot%s.json" % (label)
+        if not tool.audit(online, node=irrNode, extraArgs=limits) or \
+           not tool.audit(offline, snapshot=snapshot, extraArgs=limits + ["--client-decode"]):
+            errorExit("audit%s failed" % (label))
+        if not tool.compare(online, offline):
+            errorExit("audit of the snapshot%s differs from the audit of the node" % (label))
+
+    Print("A JSON snapshot older than the snapshot is converted again")
+    jsonSnapshot=snapshot + ".json"
+    os.utime(jsonSnapshot, (os.path.getatime(snapshot) - 10, os.path.getmtime(snapshot) - 10))
+    if not tool.audit("audit_snapshot_reconverted.json", snapshot=snapshot, extraArgs=["--client-decode"]):
+        errorExit("audit of the reconverted snapshot failed")
+    if "older than" not in tool.errors("audit_snapshot_reconverted.json"):
+        errorExit("stale JSON snapshot %s was reused" % (jsonSnapshot))
+    if not tool.sameFiles("audit_snapshot.json", "audit_snapshot_reconverted.json"):
+        errorExit("audit of the reconverted snapshot differs")
+
+    testSuccessful=True
+finally:
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
+
+exitCode=0 if testSuccessful else 1
+exit(exitCode)
@@ -116,6 +116,13 @@ try:
 
     print("Funds spread validated")
 
+    if amqpAddr is None:
+        Print("Spread funds pipelined and validate")
+        if not cluster.spreadFundsAndValidate(10, pipelined=True):
+            errorExit("Failed to spread and validate funds pipelined.")
+
+        print("Pipelined funds spread validated")
+
     if not dontKill:
         cluster.killall(allInstances=killAll)
     else:
@@ -5,7 +5,7 @@ import random
 RemoteCmd = p2p_test_peers.P2PTestPeers
 
 class ImpairedNetwork:
-    cmd="tc qdisc add dev {dev} root tbf limit 65536 burst 65536 rate"
+    cmd="tc qdisc replace dev {dev} root tbf limit 65536 burst 65536 rate"
     args=["1mbps","500kbps","100kbps","10kbps","1kbps"] #,"1bps"]
 
     resetcmd="tc qdisc del dev {dev} root"
@@ -15,7 +15,12 @@ class ImpairedNetwork:
 
     def execute(self, cmdInd, node, testerAccount, eosio):
         print("\n==== impaired network test: set network speed to %s ====" % (self.args[cmdInd]))
-        RemoteCmd.exec(self.cmd + " " + self.args[cmdInd])
+        if RemoteCmd.netns is not None:
+            # in network namespaces only the links of node 0, the producer the transactions are pushed to, are impaired
+            for peer in range(1, len(RemoteCmd.hosts)):
+                RemoteCmd.netns.setLink(0, peer, rate=self.args[cmdInd])
+        else:
+            RemoteCmd.exec(self.cmd + " " + self.args[cmdInd])
         s=""
         for i in range(12):
             s=s+random.choice("abcdefghijklmnopqrstuvwxyz12345")
@@ -29,4 +34,7 @@ class ImpairedNetwork:
         return (transIdlist, "", 0.0, "")
     
     def on_exit(self):
-        RemoteCmd.exec(self.resetcmd)
+        if RemoteCmd.netns is not None:
+            RemoteCmd.netns.reset()
+        else:
+            RemoteCmd.exec(self.resetcmd)
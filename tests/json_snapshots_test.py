@@ -5,6 +5,7 @@ from Cluster import Cluster
 from TestHelper import TestHelper
 from WalletMgr import WalletMgr
 from Node import Node
+from SnapshotJsonReader import SnapshotJsonReader
 
 import signal
 import json
@@ -23,6 +24,7 @@ import shutil
 #   3. Load JSON snapshot
 #   4. Create binary snapshot
 #   5. Compare binary snapshots in step 1 and 5. They must be the same
+#   6. Convert the snapshot from step 4 to JSON and diff both JSON snapshots section by section
 #
 ###############################################################
 
@@ -145,6 +147,13 @@ try:
     afterShutdownSnapshotPath = res["snapshot_name"]
     assert filecmp.cmp(beforeShutdownSnapshotPath, afterShutdownSnapshotPath), "snapshot is not identical"
 
+    # ensure the JSON snapshots match section by section
+    createJsonSnapshot(afterShutdownSnapshotPath)
+    differences = SnapshotJsonReader.diffSnapshots(beforeShutdownSnapshotPath + ".json", afterShutdownSnapshotPath + ".json")
+    for kind, name, beforeDigest, afterDigest in differences:
+        Utils.Print("ERROR: JSON snapshot {} '{}' differs: {} != {}".format(kind, name, beforeDigest, afterDigest))
+    assert len(differences) == 0, "JSON snapshot is not identical"
+
     testSuccessful = True
 finally:
     TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
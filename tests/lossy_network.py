@@ -5,7 +5,7 @@ import random
 RemoteCmd = p2p_test_peers.P2PTestPeers
 
 class LossyNetwork:
-    cmd="tc qdisc add dev {dev} root netem loss"
+    cmd="tc qdisc replace dev {dev} root netem loss"
     args=["0%", "1%", "10%", "50%", "90%", "99%"]
 
     resetcmd="tc qdisc del dev {dev} root"
@@ -15,7 +15,12 @@ class LossyNetwork:
 
     def execute(self, cmdInd, node, testerAccount, eosio):
         print("\n==== lossy network test: set loss ratio to %s ====" % (self.args[cmdInd]))
-        RemoteCmd.exec(self.cmd + " " + self.args[cmdInd])
+        if RemoteCmd.netns is not None:
+            # in network namespaces only the links of node 0, the producer the transactions are pushed to, are impaired
+            for peer in range(1, len(RemoteCmd.hosts)):
+                RemoteCmd.netns.setLink(0, peer, loss=self.args[cmdInd])
+        else:
+            RemoteCmd.exec(self.cmd + " " + self.args[cmdInd])
         s=""
         for i in range(12):
             s=s+random.choice("abcdefghijklmnopqrstuvwxyz12345")
@@ -29,4 +34,7 @@ class LossyNetwork:
         return (transIdlist, "", 0.0, "")
     
     def on_exit(self):
-        RemoteCmd.exec(self.resetcmd)
+        if RemoteCmd.netns is not None:
+            RemoteCmd.netns.reset()
+        else:
+            RemoteCmd.exec(self.resetcmd)
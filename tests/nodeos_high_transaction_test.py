@@ -10,6 +10,7 @@ from WalletMgr import WalletMgr
 from Node import Node
 from TestHelper import TestHelper
 from TestHelper import AppArgs
+from TransactionTracker import TransactionTracker
 
 import json
 
@@ -35,7 +36,7 @@ extraArgs = appArgs.add(flag="--num-transactions", type=int, help="How many tota
 extraArgs = appArgs.add(flag="--max-transactions-per-second", type=int, help="How many transactions per second should be sent", default=500)
 extraArgs = appArgs.add(flag="--total-accounts", type=int, help="How many accounts should be involved in sending transfers.  Must be greater than %d" % (minTotalAccounts), default=100)
 extraArgs = appArgs.add_bool(flag="--send-duplicates", help="If identical transactions should be sent to all nodes")
-args = TestHelper.parse_args({"-p", "-n","--dump-error-details","--keep-logs","-v","--leave-running","--clean-run","--amqp-address"}, applicationSpecificArgs=appArgs)
+args = TestHelper.parse_args({"-p", "-n","--dump-error-details","--keep-logs","-v","--leave-running","--clean-run","--amqp-address","--production-report"}, applicationSpecificArgs=appArgs)
 
 Utils.Debug=args.v
 totalProducerNodes=args.p
@@ -74,7 +75,7 @@ WalletdName=Utils.EosWalletName
 ClientName="cleos"
 
 maxTransactionAttempts = 2            # max number of attempts to try to send a transaction
-maxTransactionAttemptsNoSend = 1      # max number of attempts to try to create a transaction to be sent as a duplicate
+transactionExpiration = 120           # seconds, a transaction not in a block by then is dropped
 
 try:
     TestHelper.printSystemInfo("BEGIN")
@@ -255,7 +256,8 @@ try:
 
     Print("Sending %d transfers" % (numTransactions))
     delayAfterRounds = int(maxTransactionsPerSecond / args.total_accounts)
-    history = []
+    tracker = TransactionTracker(nonProdNodes[0], expirationSec=transactionExpiration, maxAttempts=maxTransactionAttempts)
+    duplicateNodes = [allNodes[ordinal] for ordinal in nodeOrder]
     startTime = time.perf_counter()
     startRound = None
     for round in range(0, numRounds):
@@ -282,128 +284,74 @@ try:
             if amqpAddr:
                 node.setAMQPAddress(amqpAddr)
 
-            trans = None
-            attempts = 0
-            maxAttempts = maxTransactionAttempts if not args.send_duplicates else maxTransactionAttemptsNoSend  # for send_duplicates we are just constructing a transaction, so should never require a second attempt
-            # can try up to maxAttempts times to send the transfer
-            while trans is None and attempts < maxAttempts:
-                if attempts > 0:
-                    # delay and see if transfer is accepted now
-                    Utils.Print("Transfer rejected, delay 1 second and see if it is then accepted")
-                    time.sleep(1)
-                trans=node.transferFunds(fromAccount, toAccount, transferAmount, "transfer round %d" % (round), exitOnError=False, reportStatus=False, sign = True, dontSend = args.send_duplicates)
-                attempts += 1
-
+            label = "round %d transfer from %s to %s" % (round, fromAccount.name, toAccount.name)
             if args.send_duplicates:
-                sendTrans = trans
-                trans = None
-                numAccepted = 0
-                attempts = 0
-                while trans is None and attempts < maxTransactionAttempts:
-                    for node in map(lambda ordinal: allNodes[ordinal], nodeOrder):
-                        repeatTrans = node.pushTransaction(sendTrans, silentErrors=True)
-                        if repeatTrans is not None:
-                            if trans is None and repeatTrans[0]:
-                                trans = repeatTrans[1]
-                                transId = Node.getTransId(trans)
-
-                            numAccepted += 1
-
-                    attempts += 1
-
-            assert trans is not None, Print("ERROR: failed round: %d, fromAccount: %s, toAccount: %s" % (round, accountIndex, toAccountIndex))
-            transId = Node.getTransId(trans)
-            history.append(transId)
+                # construct the transaction once and send the identical transaction to every node
+                sendTrans = node.transferFunds(fromAccount, toAccount, transferAmount, "transfer round %d" % (round), exitOnError=False, reportStatus=False, sign = True,
+                                               dontSend = True, expiration = transactionExpiration)
+                assert sendTrans is not None, Print("ERROR: failed to create %s" % (label))
+                tracked = tracker.sendDuplicates(duplicateNodes, sendTrans, label)
+            else:
+                tracked = tracker.send(node, lambda node: node.transferFunds(fromAccount, toAccount, transferAmount, "transfer round %d" % (round), exitOnError=False,
+                                                                              reportStatus=False, sign = True, expiration = transactionExpiration), label)
+
+            assert tracked.accepted(), Print("ERROR: failed round: %d, fromAccount: %s, toAccount: %s" % (round, accountIndex, toAccountIndex))
 
     nextTime = time.perf_counter()
     Print("Sending transfers took %s sec" % (nextTime - startTransferTime))
     startTranferValidationTime = nextTime
 
-    blocks = {}
-    transToBlock = {}
-    missingTransactions = []
+    tracker.waitForInclusion()
+    missingTransactions = tracker.dropped()
+
+    # transactions should make it into blocks roughly in the order they were sent
     transBlockOrderWeird = []
-    newestBlockNum = None
-    newestBlockNumTransId = None
-    newestBlockNumTransOrder = None
-    lastBlockNum = None
-    lastTransId = None
-    transOrder = 0
-    lastPassLIB = None
-    for transId in history:
-        blockNum = None
-        block = None
-        transDesc = None
-        if transId not in transToBlock:
-            (block, trans) = cacheTransIdInBlock(transId, transToBlock, node)
-            if trans is None or block is None:
-                missingTransactions.append({
-                    "newer_trans_id" : transId,
-                    "newer_trans_index" : transOrder,
-                    "newer_bnum" : None,
-                    "last_trans_id" : lastTransId,
-                    "last_trans_index" : transOrder - 1,
-                    "last_bnum" : lastBlockNum,
-                })
-                if newestBlockNum > lastBlockNum:
-                    missingTransactions[-1]["highest_block_seen"] = newestBlockNum
-            blockNum = Node.getTransBlockNum(trans)
-            assert blockNum is not None, Print("ERROR: could not retrieve block num from transId: %s, trans: %s" % (transId, json.dumps(trans, indent=2)))
-        else:
-            block = transToBlock[transId]
-            blockNum = block["block_num"]
-            assert blockNum is not None, Print("ERROR: could not retrieve block num for block retrieved for transId: %s, block: %s" % (transId, json.dumps(block, indent=2)))
-
-        if lastBlockNum is not None:
-            if blockNum > lastBlockNum + transBlocksBehind or blockNum + transBlocksBehind < lastBlockNum:
-                transBlockOrderWeird.append({
-                    "newer_trans_id" : transId,
-                    "newer_trans_index" : transOrder,
-                    "newer_bnum" : blockNum,
-                    "last_trans_id" : lastTransId,
-                    "last_trans_index" : transOrder - 1,
-                    "last_bnum" : lastBlockNum
-                })
-                if newestBlockNum > lastBlockNum:
-                    last = transBlockOrderWeird[-1]
-                    last["older_trans_id"] = newestBlockNumTransId
-                    last["older_trans_index"] = newestBlockNumTransOrder
-                    last["older_bnum"] = newestBlockNum
-
-        if newestBlockNum is None:
-            newestBlockNum = blockNum
-            newestBlockNumTransId = transId
-            newestBlockNumTransOrder = transOrder
-        elif blockNum > newestBlockNum:
-            newestBlockNum = blockNum
-            newestBlockNumTransId = transId
-            newestBlockNumTransOrder = transOrder
-
-        lastTransId = transId
-        transOrder += 1
-        lastBlockNum = blockNum
+    newest = None
+    last = None
+    for tracked in tracker.transactions:
+        if not tracked.included():
+            continue
+        if last is not None and (tracked.blockNum > last.blockNum + transBlocksBehind or tracked.blockNum + transBlocksBehind < last.blockNum):
+            transBlockOrderWeird.append({
+                "newer_trans_id" : tracked.transId,
+                "newer_trans_index" : tracked.index,
+                "newer_bnum" : tracked.blockNum,
+                "last_trans_id" : last.transId,
+                "last_trans_index" : last.index,
+                "last_bnum" : last.blockNum
+            })
+            if newest.blockNum > last.blockNum:
+                transBlockOrderWeird[-1]["older_trans_id"] = newest.transId
+                transBlockOrderWeird[-1]["older_trans_index"] = newest.index
+                transBlockOrderWeird[-1]["older_bnum"] = newest.blockNum
+
+        if newest is None or tracked.blockNum > newest.blockNum:
+            newest = tracked
+        last = tracked
 
     nextTime = time.perf_counter()
     Print("Validating transfers took %s sec" % (nextTime - startTranferValidationTime))
+    tracker.printStats()
 
     delayedReportError = False
     if len(missingTransactions) > 0:
         verboseOutput = "Missing transaction information: [" if Utils.Debug else "Missing transaction ids: ["
-        verboseOutput = ", ".join([missingTrans if Utils.Debug else missingTrans["newer_trans_id"] for missingTrans in missingTransactions])
+        verboseOutput += ", ".join(["%s (#%d %s, sent to node %s, %d attempts)" % (missing.transId, missing.index, missing.label, missing.node.nodeId, len(missing.attempts))
+                                    if Utils.Debug else missing.transId for missing in missingTransactions])
         verboseOutput += "]"
         Utils.Print("ERROR: There are %d missing transactions.  %s" % (len(missingTransactions), verboseOutput))
         delayedReportError = True
 
     if len(transBlockOrderWeird) > 0:
         verboseOutput = "Delayed transaction information: [" if Utils.Debug else "Delayed transaction ids: ["
-        verboseOutput = ", ".join([json.dumps(trans, indent=2) if Utils.Debug else trans["newer_trans_id"] for trans in transBlockOrderWeird])
+        verboseOutput += ", ".join([json.dumps(trans, indent=2) if Utils.Debug else trans["newer_trans_id"] for trans in transBlockOrderWeird])
         verboseOutput += "]"
         Utils.Print("ERROR: There are %d transactions delayed more than %d seconds.  %s" % (len(transBlockOrderWeird), args.transaction_time_delta, verboseOutput))
         delayedReportError = True
 
     testSuccessful = not delayedReportError
 finally:
-    TestHelper.shutdown(cluster, walletMgr, testSuccessful=testSuccessful, killEosInstances=killEosInstances, killWallet=killWallet, keepLogs=keepLogs, cleanRun=killAll, dumpErrorDetails=dumpErrorDetails)
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful=testSuccessful, killEosInstances=killEosInstances, killWallet=killWallet, keepLogs=keepLogs, cleanRun=killAll, dumpErrorDetails=dumpErrorDetails, productionReport=args.production_report)
     if not testSuccessful:
         Print(Utils.FileDivider)
         Print("Compare Blocklog")
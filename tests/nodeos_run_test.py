@@ -27,7 +27,7 @@ from core_symbol import CORE_SYMBOL
 
 args = TestHelper.parse_args({"--host","--port","--prod-count","--defproducera_prvt_key","--defproducerb_prvt_key"
                               ,"--dump-error-details","--dont-launch","--keep-logs","-v","--leave-running","--only-bios","--clean-run"
-                              ,"--sanity-test","--wallet-port","--amqp-address", "--signing-delay"})
+                              ,"--sanity-test","--wallet-port","--amqp-address", "--signing-delay", "--production-report"})
 server=args.host
 port=args.port
 debug=args.v
@@ -747,7 +747,7 @@ try:
 
     testSuccessful=True
 finally:
-    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails, productionReport=args.production_report)
 
 exitCode = 0 if testSuccessful else 1
 exit(exitCode)
\ No newline at end of file
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
-import testUtils
+from testUtils import Utils
+from Cluster import Cluster
+from WalletMgr import WalletMgr
+from NetnsNetwork import NetnsNetwork
 import p2p_test_peers
 import impaired_network
 import lossy_network
@@ -15,14 +18,8 @@ import time
 
 Remote = p2p_test_peers.P2PTestPeers
 
-hosts=Remote.hosts
-ports=Remote.ports
-
-DEFAULT_HOST=hosts[0]
-DEFAULT_PORT=ports[0]
-
 parser = argparse.ArgumentParser(add_help=False)
-Print=testUtils.Utils.Print
+Print=Utils.Print
 cmdError=Utils.cmdError
 errorExit=Utils.errorExit
 
@@ -30,21 +27,24 @@ errorExit=Utils.errorExit
 parser.add_argument('-?', action='help', default=argparse.SUPPRESS,
                     help=argparse._('show this help message and exit'))
 parser.add_argument("--defproducera_prvt_key", type=str, help="defproducera private key.",
-                    default=testUtils.Cluster.defproduceraAccount.ownerPrivateKey)
+                    default=None)
 parser.add_argument("--defproducerb_prvt_key", type=str, help="defproducerb private key.",
-                    default=testUtils.Cluster.defproducerbAccount.ownerPrivateKey)
+                    default=None)
 parser.add_argument("--wallet_host", type=str, help="wallet host", default="localhost")
 parser.add_argument("--wallet_port", type=int, help="wallet port", default=8899)
 parser.add_argument("--impaired_network", help="test impaired network", action='store_true')
 parser.add_argument("--lossy_network", help="test lossy network", action='store_true')
 parser.add_argument("--stress_network", help="test load/stress network", action='store_true')
 parser.add_argument("--not_kill_wallet", help="not killing walletd", action='store_true')
+parser.add_argument("--netns_nodes", type=int, help="launch this many nodes on this machine, each in its own network namespace, "
+                    "instead of using the peers configured in p2p_test_peers.py (requires root); impaired and lossy networks then "
+                    "shape only the links of node 0 to its peers, with htb and netem per link", default=0)
 
 args = parser.parse_args()
 defproduceraPrvtKey=args.defproducera_prvt_key
 defproducerbPrvtKey=args.defproducerb_prvt_key
 
-walletMgr=testUtils.WalletMgr(True, port=args.wallet_port, host=args.wallet_host)
+walletMgr=WalletMgr(True, port=args.wallet_port, host=args.wallet_host)
 
 if args.impaired_network:
     module = impaired_network.ImpairedNetwork()
@@ -55,10 +55,22 @@ elif args.stress_network:
 else:
     errorExit("one of impaired_network, lossy_network or stress_network must be set. Please also check peer configs in p2p_test_peers.py.")
 
-cluster=testUtils.Cluster(walletd=True, defproduceraPrvtKey=defproduceraPrvtKey, defproducerbPrvtKey=defproducerbPrvtKey, walletHost=args.wallet_host, walletPort=args.wallet_port)
+cluster=Cluster(walletd=True, defproduceraPrvtKey=defproduceraPrvtKey, defproducerbPrvtKey=defproducerbPrvtKey, walletHost=args.wallet_host, walletPort=args.wallet_port)
+local=args.netns_nodes > 0
+netns=None
 
 print("BEGIN")
 
+if local:
+    netns=NetnsNetwork()
+    if not netns.setup(["bios"] + list(range(args.netns_nodes))):
+        netns.teardown(silent=True)
+        errorExit("Failed to set up network namespaces.")
+    Remote.useNetns(netns, [cluster.port + i for i in range(args.netns_nodes)])
+
+hosts=Remote.hosts
+ports=Remote.ports
+
 print("number of hosts: %d, list of hosts:" % (len(hosts)))
 for i in range(len(hosts)):
     Print("%s:%d" % (hosts[i], ports[i]))
@@ -70,17 +82,27 @@ for i in range(len(hosts)):
     init_str=init_str+'{"host":"' + hosts[i] + '", "port":'+str(ports[i])+'}'
 init_str=init_str+']}'
 
-#Print('init nodes with json str %s',(init_str))
-cluster.initializeNodesFromJson(init_str);
+if local:
+    cluster.setWalletMgr(walletMgr)
+    cluster.killall(allInstances=True)
+    cluster.cleanup()
+    walletMgr.killall(allInstances=True)
+    walletMgr.cleanup()
+    if cluster.launch(pnodes=1, totalNodes=len(hosts), topo="mesh", netns=netns) is False:
+        netns.teardown()
+        errorExit("Failed to stand up eos cluster in network namespaces.")
+else:
+    #Print('init nodes with json str %s',(init_str))
+    cluster.initializeNodesFromJson(init_str);
 
-if args.not_kill_wallet == False:
-    print('killing all wallets')
-    walletMgr.killall()
+    if args.not_kill_wallet == False:
+        print('killing all wallets')
+        walletMgr.killall()
 
-walletMgr.cleanup()
+    walletMgr.cleanup()
 
 print('creating account keys')
-accounts=testUtils.Cluster.createAccountKeys(3)
+accounts=Cluster.createAccountKeys(3)
 if accounts is None:
     errorExit("FAILURE - create keys")
 testeraAccount=accounts[0]
@@ -103,10 +125,11 @@ testeraAccount.activePublicKey=currencyAccount.activePublicKey=PUB_KEY3
 exchangeAccount.ownerPrivateKey=PRV_KEY2
 exchangeAccount.ownerPublicKey=PUB_KEY2
 
-print("Stand up walletd")
-if walletMgr.launch() is False:
-    cmdError("%s" % (WalletdName))
-    errorExit("Failed to stand up eos walletd.")
+if not local:
+    print("Stand up walletd")
+    if walletMgr.launch() is False:
+        cmdError("%s" % (Utils.EosWalletName))
+        errorExit("Failed to stand up eos walletd.")
 
 testWalletName="test"
 Print("Creating wallet \"%s\"." % (testWalletName))
@@ -115,47 +138,54 @@ testWallet=walletMgr.create(testWalletName)
 for account in accounts:
     Print("Importing keys for account %s into wallet %s." % (account.name, testWallet.name))
     if not walletMgr.importKey(account, testWallet):
-        cmdError("%s wallet import" % (ClientName))
+        cmdError("%s wallet import" % (Utils.EosClientPath))
         errorExit("Failed to import key for account %s" % (account.name))
 
-defproduceraWalletName="defproducera"
-Print("Creating wallet \"%s\"." % (defproduceraWalletName))
-defproduceraWallet=walletMgr.create(defproduceraWalletName)
+node0=cluster.getNode(0)
 
-defproduceraAccount=testUtils.Cluster.defproduceraAccount
-# defproducerbAccount=testUtils.Cluster.defproducerbAccount
+if local:
+    # the bootstrap already loaded the system contract and imported the eosio keys into the ignition wallet
+    eosio = cluster.eosioAccount
+else:
+    defproduceraWalletName="defproducera"
+    Print("Creating wallet \"%s\"." % (defproduceraWalletName))
+    defproduceraWallet=walletMgr.create(defproduceraWalletName)
 
-Print("Importing keys for account %s into wallet %s." % (defproduceraAccount.name, defproduceraWallet.name))
-if not walletMgr.importKey(defproduceraAccount, defproduceraWallet):
-     cmdError("%s wallet import" % (ClientName))
-     errorExit("Failed to import key for account %s" % (defproduceraAccount.name))
+    defproduceraAccount=cluster.defproduceraAccount
 
-node0=cluster.getNode(0)
+    Print("Importing keys for account %s into wallet %s." % (defproduceraAccount.name, defproduceraWallet.name))
+    if not walletMgr.importKey(defproduceraAccount, defproduceraWallet):
+         cmdError("%s wallet import" % (Utils.EosClientPath))
+         errorExit("Failed to import key for account %s" % (defproduceraAccount.name))
 
-# eosio should have the same key as defproducera
-eosio = copy.copy(defproduceraAccount)
-eosio.name = "eosio"
+    # eosio should have the same key as defproducera
+    eosio = copy.copy(defproduceraAccount)
+    eosio.name = "eosio"
 
 Print("Info of each node:")
 for i in range(len(hosts)):
-    node = node0
-    cmd="%s %s get info" % (testUtils.Utils.EosClientPath, node.endpointArgs)
+    node = cluster.getNode(i)
+    cmd="%s %s get info" % (Utils.EosClientPath, node.endpointArgs)
     trans = node.runCmdReturnJson(cmd)
     Print("host %s: %s" % (hosts[i], trans))
 
 
-wasmFile="eosio.system.wasm"
-abiFile="eosio.system.abi"
-Print("\nPush system contract %s %s" % (wasmFile, abiFile))
-trans=node0.publishContract(eosio, wasmFile, abiFile, waitForTransBlock=True)
-if trans is None:
-    Utils.errorExit("Failed to publish eosio.system.")
-else:
-    Print("transaction id %s" % (node0.getTransId(trans)))
+if not local:
+    wasmFile="eosio.system.wasm"
+    abiFile="eosio.system.abi"
+    Print("\nPush system contract %s %s" % (wasmFile, abiFile))
+    trans=node0.publishContract(eosio, wasmFile, abiFile, waitForTransBlock=True)
+    if trans is None:
+        Utils.errorExit("Failed to publish eosio.system.")
+    else:
+        Print("transaction id %s" % (node0.getTransId(trans)))
 
+results = []
 try:
     maxIndex = module.maxIndex()
     for cmdInd in range(maxIndex):
+        stepStart = time.time()
+        sentBefore = sum(netns.counters(i)["tx_bytes"] for i in range(len(hosts))) if local else 0
         (transIdList, checkacct, expBal, errmsg) = module.execute(cmdInd, node0, testeraAccount, eosio)
 
         if len(transIdList) == 0 and len(checkacct) == 0:
@@ -186,7 +216,17 @@ try:
                 if failedcount == 0:
                     successhosts.append(host)
         Print("%d host(s) passed, %d host(s) failed" % (len(successhosts), len(hosts) - len(successhosts)))
+        elapsed = time.time() - stepStart
+        sent = sum(netns.counters(i)["tx_bytes"] for i in range(len(hosts))) - sentBefore if local else 0
+        results.append((cmdInd, len(transIdList), len(successhosts), elapsed, sent))
 finally:
     Print("\nfinally: restore everything")
     module.on_exit()
+    Print("\nstep  transactions  hosts passed  seconds  trx/s   KB sent")
+    for (cmdInd, count, passed, elapsed, sent) in results:
+        Print("%4d  %12d  %12d  %7.2f  %6.2f  %8d" % (cmdInd, count, passed, elapsed, count / elapsed if elapsed > 0 else 0.0, sent // 1024))
+    if local:
+        cluster.killall(allInstances=False)
+        walletMgr.killall()
+        netns.teardown()
 exit(0)
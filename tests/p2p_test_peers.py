@@ -14,8 +14,21 @@ class P2PTestPeers:
     #ports = [8888, 8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888,8888, 8888] # eosiod listening port of each host
     #devs = ["ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3", "ens3"] # network device of each host
 
+    #for testing on one machine, set by useNetns()
+    netns = None # NetnsNetwork the peers run in, commands then run in each namespace instead of over ssh
+
+    @staticmethod
+    def useNetns(netns, ports):
+        P2PTestPeers.netns = netns
+        P2PTestPeers.hosts = [netns.address(i) for i in range(len(ports))]
+        P2PTestPeers.ports = ports
+        P2PTestPeers.devs = [netns.NodeDev] * len(ports)
+
     @staticmethod
     def exec(remoteCmd, toprint=True):
+        if P2PTestPeers.netns is not None:
+            P2PTestPeers.netns.exec(remoteCmd, toprint)
+            return
         for i in range(len(P2PTestPeers.hosts)):
             remoteCmd2 = remoteCmd.replace("{dev}", P2PTestPeers.devs[i])
             cmd = "ssh " + P2PTestPeers.sshname + "@" + P2PTestPeers.hosts[i] + ' ' + remoteCmd2
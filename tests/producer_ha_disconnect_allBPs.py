@@ -3,9 +3,8 @@ from testUtils import Utils
 from Cluster import Cluster
 from Node import Node
 from TestHelper import TestHelper
+from RelayController import RelayController
 import os
-import signal
-import subprocess
 import time
 
 ###############################################################
@@ -35,8 +34,9 @@ testSuccessful=False
 killEosInstances=not dontKill
 specificExtraNodeosArgs={}
 
-# --relay=listening_port:dest_ip:dest_port
-relay_cmd = "bin/relay --relay=8988:127.0.0.1:18988 --relay=8989:127.0.0.1:18989 --relay=8990:127.0.0.1:18990"
+# one relay per BP, forwarding localhost:8988+i to the BP listening on 18988+i
+relays=RelayController()
+relays.addHaLinks(producers)
 
 for i in range(producers):
     Node.create_ha_config(i, use_relay=True)
@@ -46,9 +46,8 @@ try:
     cluster.killall(allInstances=killAll)
     cluster.cleanup()
 
-    Utils.Print("ready to start ha_relay, cmd is: " + relay_cmd)
-    relay_pid = subprocess.Popen(relay_cmd.split(), stdout=subprocess.PIPE,stderr=subprocess.PIPE).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    if not relays.start():
+        Utils.errorExit("Failed to start relays.")
 
     extraNodeosArgs=" --resource-monitor-not-shutdown-on-threshold-exceeded"
     for i in range(producers):
@@ -68,10 +67,11 @@ try:
     else:
         Utils.Print("Cluster is producing blocks after leader BP shutdown.")
 
-    # kill relay to disconnect all BPs
-    Utils.Print("Killing relay... wait for cluster out of sync")
-    os.kill(relay_pid, signal.SIGKILL)
-    relay_pid = 0
+    relays.printStats()
+
+    # disconnect all BPs
+    Utils.Print("Disconnecting relays... wait for cluster out of sync")
+    relays.disconnect()
 
     time.sleep(5.0)
     if cluster.waitOnClusterSync(timeout=50, blockAdvancing=5):
@@ -82,16 +82,17 @@ try:
         if not readlogs(i, 10):
             Utils.errorExit("disconnected nodes are producing blocks")
 
-    # restart relay 
-    Utils.Print("restart start ha_relay, cmd is: " + relay_cmd)
-    relay_pid = subprocess.Popen(relay_cmd.split(), stdout=subprocess.PIPE,stderr=subprocess.PIPE).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    # reconnect all BPs
+    relays.printStats()
+    relays.connect()
+    reconnectTime=time.time()
 
     # cluster should continue production
     if not cluster.waitOnClusterSync(timeout=60, blockAdvancing=5):
         Utils.errorExit("Cluster failed to produce blocks after relaunching killed leader BP.")
     else:
-        Utils.Print("Cluster in producing blocks after relaunching killed leader BP.")
+        Utils.Print("Cluster in producing blocks after relaunching killed leader BP, %.2f seconds after reconnecting." % (time.time()-reconnectTime))
+    relays.printStats()
 
     # ensure there's no fork
     Utils.Print("checking whether there are forks...")
@@ -101,9 +102,7 @@ try:
     testSuccessful=True
 
 finally:
-    if relay_pid != 0:
-        Utils.Print("shutting down relay process (pid " + str(relay_pid) + ") ...")
-        os.kill(relay_pid, signal.SIGKILL)
+    relays.stop()
     TestHelper.shutdown(cluster, None, testSuccessful, killEosInstances, False, keepLogs, killAll, dumpErrorDetails)
 
 exitCode = 0 if testSuccessful else 1
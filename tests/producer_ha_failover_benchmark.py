@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+from Cluster import Cluster
+from ProducerHaTopology import ProducerHaTopology
+from ProducerHaWatcher import ProducerHaWatcher
+from TestHelper import TestHelper
+from TestHelper import AppArgs
+
+from datetime import datetime
+from datetime import timezone
+import itertools
+import json
+import signal
+import statistics
+
+###############################################################
+# producer_ha_failover_benchmark
+#
+# Sweeps producer_ha settings (leadership_expiry_ms, heart_beat_interval_ms,
+# quorum size and cluster size). For every combination it launches an HA
+# cluster, then repeatedly kills the leader with SIGTERM and SIGKILL and
+# records, per kill:
+#   - election latency: leader loss until a new leader reports itself
+#   - recovery time: leader loss until the new leader commits a block
+#   - missed block slots: empty 0.5s slots between the last block before
+#     the kill and the first block after it
+# The distribution of each is reported per config and signal.
+#
+###############################################################
+
+Print=Utils.Print
+errorExit=Utils.errorExit
+
+BlockIntervalSec=0.5
+
+appArgs=AppArgs()
+appArgs.add(flag="--leadership-expiry-ms", type=str, help="comma separated leadership_expiry_ms values to sweep", default="1000,2000")
+appArgs.add(flag="--heart-beat-interval-ms", type=str, help="comma separated heart_beat_interval_ms values to sweep", default="50,200")
+appArgs.add(flag="--quorum-sizes", type=str, help="comma separated leader_election_quorum_size values to sweep", default="2")
+appArgs.add(flag="--cluster-sizes", type=str, help="comma separated producer_ha cluster sizes to sweep", default="3")
+appArgs.add(flag="--kills", type=int, help="leader kills per signal and config", default=3)
+appArgs.add(flag="--signals", type=str, help="comma separated signals to kill the leader with", default="SIGTERM,SIGKILL")
+appArgs.add(flag="--failover-timeout", type=int, help="seconds to wait for a new leader to produce", default=60)
+appArgs.add(flag="--report", type=str, help="write the benchmark results to this JSON file", default=None)
+args=TestHelper.parse_args({"-v","--clean-run","--dump-error-details","--leave-running","--keep-logs"}, applicationSpecificArgs=appArgs)
+
+Utils.Debug=args.v
+killAll=args.clean_run
+dumpErrorDetails=args.dump_error_details
+dontKill=args.leave_running
+killEosInstances=not dontKill
+keepLogs=args.keep_logs
+
+def intList(value):
+    return [int(v) for v in value.split(",")]
+
+killSignals=[getattr(signal, name.strip()) for name in args.signals.split(",")]
+
+def blockTime(node, blockNum):
+    block=node.getBlock(blockNum, exitOnError=True)
+    return datetime.strptime(block["timestamp"], "%Y-%m-%dT%H:%M:%S.%f").replace(tzinfo=timezone.utc).timestamp()
+
+def missedSlots(node, fromNum, toNum):
+    """Counts the empty block slots between blocks fromNum and toNum."""
+    missed=0
+    prev=blockTime(node, fromNum)
+    for blockNum in range(fromNum + 1, toNum + 1):
+        cur=blockTime(node, blockNum)
+        missed+=max(0, round((cur - prev) / BlockIntervalSec) - 1)
+        prev=cur
+    return missed
+
+def distribution(values):
+    values=[v for v in values if v is not None]
+    if len(values) == 0:
+        return None
+    values.sort()
+    return { "count": len(values), "min": round(values[0], 3), "median": round(statistics.median(values), 3),
+             "p90": round(values[min(len(values)-1, int(len(values) * 0.9))], 3), "max": round(values[-1], 3) }
+
+def launchHaCluster(cluster, topology, quorumSize, expiryMs, heartBeatMs):
+    cluster.killall(allInstances=killAll)
+    cluster.cleanup()
+    clusterSize=len(topology.nodeIds())
+    topology.write(quorumSizes=[quorumSize], leadership_expiry_ms=expiryMs, heart_beat_interval_ms=heartBeatMs)
+    if cluster.launch(pnodes=clusterSize, totalNodes=clusterSize, totalProducers=clusterSize, useBiosBootFile=False, dontBootstrap=True,
+                      specificExtraNodeosArgs=topology.specificExtraNodeosArgs(), prod_ha=True,
+                      extraNodeosArgs=" --resource-monitor-not-shutdown-on-threshold-exceeded") is False:
+        errorExit("Failed to stand up producer_ha cluster of %d" % (clusterSize))
+    if not cluster.waitOnClusterSync(timeout=60, blockAdvancing=5):
+        errorExit("Producer_ha cluster of %d failed to produce blocks" % (clusterSize))
+
+def killLeader(cluster, nodes, killSignal):
+    """Kills the current leader, waits for the failover and relaunches the old leader. Returns the measurements."""
+    watcher=ProducerHaWatcher(nodes).start()
+    try:
+        leaderId=watcher.waitForLeader(timeout=60)
+        if leaderId < 0:
+            errorExit("No producer_ha leader")
+        survivor=nodes[(leaderId + 1) % len(nodes)]
+        lastBlock=survivor.getHeadBlockNum()
+        watcher.markLeaderLoss()
+        if not nodes[leaderId].kill(killSignal):
+            errorExit("Failed to kill leader %d" % (leaderId))
+        failover=watcher.waitForFailover(leaderId, timeout=args.failover_timeout)
+    finally:
+        watcher.stop()
+    Print("%s: %s" % (signal.Signals(killSignal).name, ProducerHaWatcher.describe(failover)))
+    if failover["firstBlockTime"] is None:
+        errorExit("No new leader produced blocks within %d seconds" % (args.failover_timeout))
+
+    survivor.waitForBlock(lastBlock + 4, timeout=args.failover_timeout)
+    missed=missedSlots(survivor, lastBlock, survivor.getHeadBlockNum())
+
+    if not nodes[leaderId].relaunch():
+        errorExit("Failed to relaunch old leader %d" % (leaderId))
+    if not cluster.waitOnClusterSync(timeout=60, blockAdvancing=2):
+        errorExit("Cluster did not resync after relaunching old leader %d" % (leaderId))
+    return { "signal": signal.Signals(killSignal).name, "old_leader": leaderId, "new_leader": failover["newLeader"],
+             "election_s": failover["electionLatency"], "recovery_s": failover["firstBlockLatency"], "missed_slots": missed }
+
+cluster=None
+topology=None
+testSuccessful=False
+try:
+    TestHelper.printSystemInfo("BEGIN")
+    results=[]
+    for clusterSize, quorumSize, expiryMs, heartBeatMs in itertools.product(intList(args.cluster_sizes), intList(args.quorum_sizes),
+                                                                             intList(args.leadership_expiry_ms), intList(args.heart_beat_interval_ms)):
+        config={ "cluster_size": clusterSize, "quorum_size": quorumSize, "leadership_expiry_ms": expiryMs, "heart_beat_interval_ms": heartBeatMs }
+        if quorumSize > clusterSize:
+            Print("Skipping %s, quorum larger than the cluster" % (config))
+            continue
+        Print("Benchmarking failover with %s" % (config))
+        if cluster is not None:
+            cluster.killall()
+        if topology is not None:
+            topology.cleanup()
+        cluster=Cluster(walletd=True)
+        topology=ProducerHaTopology([clusterSize])
+        launchHaCluster(cluster, topology, quorumSize, expiryMs, heartBeatMs)
+        nodes=cluster.getNodes()[:clusterSize]
+
+        kills=[]
+        for killSignal in killSignals:
+            for _ in range(args.kills):
+                kills.append(killLeader(cluster, nodes, killSignal))
+        cluster.check_hard_fork()
+
+        bySignal={}
+        for name in set(k["signal"] for k in kills):
+            subset=[k for k in kills if k["signal"] == name]
+            bySignal[name]={ key: distribution([k[key] for k in subset]) for key in ["election_s", "recovery_s", "missed_slots"] }
+        results.append({ "config": config, "kills": kills, "summary": bySignal })
+
+    Print("%7s %6s %9s %9s %8s %24s %24s %24s" % ("cluster", "quorum", "expiry ms", "heartbeat", "signal",
+          "election s (med/p90/max)", "recovery s (med/p90/max)", "missed slots (med/p90/max)"))
+    for r in results:
+        c=r["config"]
+        for name,summary in sorted(r["summary"].items()):
+            cols=["%.3f/%.3f/%.3f" % (d["median"], d["p90"], d["max"]) if d else "-" for d in
+                  [summary["election_s"], summary["recovery_s"], summary["missed_slots"]]]
+            Print("%7d %6d %9d %9d %8s %24s %24s %24s" % (c["cluster_size"], c["quorum_size"], c["leadership_expiry_ms"],
+                  c["heart_beat_interval_ms"], name, cols[0], cols[1], cols[2]))
+
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump({ "results": results }, f, indent=2)
+        Print("Wrote report to %s" % (args.report))
+
+    testSuccessful=True
+finally:
+    if cluster is not None:
+        TestHelper.shutdown(cluster, None, testSuccessful, killEosInstances, False, keepLogs, killAll, dumpErrorDetails)
+    if topology is not None and killEosInstances:
+        topology.cleanup()
+
+exitCode=0 if testSuccessful else 1
+exit(exitCode)
@@ -3,6 +3,7 @@ from testUtils import Utils
 from Cluster import Cluster
 from Node import Node
 from TestHelper import TestHelper
+from ProducerHaWatcher import ProducerHaWatcher
 import os
 import signal
 
@@ -64,9 +65,16 @@ try:
     if len(nonLeaders) != producers - 1:
         Utils.errorExit("Non-leader BPs are not alive.")
 
-    # kill leader BP
+    # kill leader BP and measure how long the failover takes
+    watcher = ProducerHaWatcher(nodes[:producers]).start()
+    watcher.markLeaderLoss()
     if not Leader[0][1].kill(signal.SIGINT):
         Utils.errorExit("Failed to shutdown node")
+    failover = watcher.waitForFailover(Leader[0][0], timeout=30)
+    watcher.stop()
+    Utils.Print("Failover: %s" % (ProducerHaWatcher.describe(failover)))
+    if failover["firstBlockTime"] is None:
+        Utils.errorExit("No new leader produced blocks after leader BP shutdown.")
     if not cluster.waitOnClusterSync(timeout=30, blockAdvancing=5):
         Utils.errorExit("Cluster failed to produce blocks after leader BP shutdown.")
     else:
@@ -3,12 +3,12 @@ from testUtils import Utils
 from Cluster import Cluster
 from TestHelper import TestHelper
 from Node import Node
+from RelayController import RelayController
 import json
 import os
 import subprocess
 import time
 import re
-import signal
 from sys import stdout
 
 ###############################################################
@@ -42,8 +42,9 @@ keepLogs=args.keep_logs
 dontKill=args.leave_running
 killAll=args.clean_run
 
-# --relay=listening_port:dest_ip:dest_port
-relay_cmd = "bin/relay --relay=8988:127.0.0.1:18988 --relay=8989:127.0.0.1:18989 --relay=8990:127.0.0.1:18990"
+# one relay per BP, forwarding localhost:8988+i to the BP listening on 18988+i
+relays=RelayController()
+relays.addHaLinks(producers)
 
 testSuccessful=False
 killEosInstances=not dontKill
@@ -58,9 +59,8 @@ try:
     cluster.killall(allInstances=killAll)
     cluster.cleanup()
 
-    Utils.Print("ready to start ha_relay, cmd is: " + relay_cmd)
-    relay_pid = subprocess.Popen(relay_cmd.split(), stdout=subprocess.PIPE,stderr=subprocess.PIPE).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    if not relays.start():
+        Utils.errorExit("Failed to start relays.")
 
     extraNodeosArgs=" --resource-monitor-not-shutdown-on-threshold-exceeded"
     for i in range(producers):
@@ -89,19 +89,17 @@ try:
     Utils.Print("cluster has no forks, head blocks: node[0]={}, node[1]={}, node[2]={}".format(\
         nodes[0].getHeadBlockNum(),nodes[1].getHeadBlockNum(),nodes[2].getHeadBlockNum()))
 
-    Utils.Print("Killing relay... wait for cluster out of sync")
-    os.kill(relay_pid, signal.SIGKILL)
-    relay_pid = 0
+    Utils.Print("Disconnecting relays... wait for cluster out of sync")
+    relays.disconnect()
 
     time.sleep(5.0)
     if cluster.waitOnClusterSync(timeout=30, blockAdvancing=5):
         Utils.errorExit("cluster still in sync without relay, which is not expected. (something wrong with the config settings?)")
 
-    # restart relay in frequenent disconnect mode
-    relay_cmd2 = relay_cmd + " --latency-in=0.001 --latency-out=0.001 --disconnect-min=3 --disconnect-max=10 --accept-rate=0.2 --drop-rate=0.9"
-    Utils.Print("cluster now out of sync. ready to start ha_relay in frequency-disconnect mode, cmd is: " + relay_cmd2)
-    relay_pid = subprocess.Popen(relay_cmd2.split(), stdout=subprocess.PIPE,stderr=subprocess.PIPE).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    # restart relays in frequent disconnect mode, the random disconnect schedule is a startup option
+    Utils.Print("cluster now out of sync. ready to restart relays in frequency-disconnect mode")
+    if not relays.restart(latencyIn=0.001, latencyOut=0.001, disconnectMin=3, disconnectMax=10, acceptRate=0.2, dropRate=0.9):
+        Utils.errorExit("Failed to restart relays.")
 
     produced = [False, False, False]
 
@@ -123,14 +121,12 @@ try:
         tries = tries - 1
         time.sleep(1.0)
 
-    Utils.Print("Killing relay... wait for cluster out of sync")
-    os.kill(relay_pid, signal.SIGKILL)
-    relay_pid = 0
+    relays.printStats()
 
-    # restart relay and wait for it sync again
-    Utils.Print("restart relay in normal mode, cmd is: " + relay_cmd)
-    relay_pid = subprocess.Popen(relay_cmd.split(), stdout=subprocess.PIPE,stderr=subprocess.PIPE).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    # restart relays and wait for it sync again
+    Utils.Print("restart relays in normal mode")
+    if not relays.restart():
+        Utils.errorExit("Failed to restart relays.")
 
     # wait for the cluster in sync
     tries = 120
@@ -165,9 +161,7 @@ try:
     testSuccessful = True
 
 finally:
-    if relay_pid != 0:
-        Utils.Print("shutting down relay process (pid " + str(relay_pid) + ") ...")
-        os.kill(relay_pid, signal.SIGKILL)
+    relays.stop()
     Utils.Print("shutting down cluster ...")
     TestHelper.shutdown(cluster, None, testSuccessful, killEosInstances, False, keepLogs, killAll, dumpErrorDetails)
 
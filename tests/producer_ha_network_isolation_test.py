@@ -3,12 +3,12 @@ from testUtils import Utils
 from Cluster import Cluster
 from TestHelper import TestHelper
 from Node import Node
+from RelayController import RelayController
 import json
 import os
 import subprocess
 import time
 import re
-import signal
 
 ###############################################################
 #   Producer ha test with isolated network, it will test:
@@ -32,8 +32,9 @@ keepLogs=args.keep_logs
 dontKill=args.leave_running
 killAll=args.clean_run
 
-# --relay=listening_port:dest_ip:dest_port
-relay_cmd = "bin/relay --relay=8988:127.0.0.1:18988 --relay=8989:127.0.0.1:18989 --relay=8990:127.0.0.1:18990"
+# one relay per BP, forwarding localhost:8988+i to the BP listening on 18988+i
+relays=RelayController()
+relays.addHaLinks(producers)
 
 testSuccessful=False
 killEosInstances=not dontKill
@@ -48,9 +49,8 @@ try:
     cluster.killall(allInstances=killAll)
     cluster.cleanup()
 
-    Utils.Print("ready to start ha_relay, cmd is: " + relay_cmd)
-    relay_pid = subprocess.Popen(relay_cmd.split()).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    if not relays.start():
+        Utils.errorExit("Failed to start relays.")
 
     extraNodeosArgs=" --resource-monitor-not-shutdown-on-threshold-exceeded"
     for i in range(producers):
@@ -86,9 +86,8 @@ try:
 
     producing_node_id = leaders[0][0]
 
-    Utils.Print("Leader is {}. Killing relay... wait for cluster out of sync".format(producing_node_id))
-    os.kill(relay_pid, signal.SIGKILL)
-    relay_pid = 0
+    Utils.Print("Leader is {}. Disconnecting relays... wait for cluster out of sync".format(producing_node_id))
+    relays.disconnect()
 
     # wait until out of sync
     time.sleep(5.0)
@@ -101,10 +100,9 @@ try:
     Utils.Print("killing the active BP node {} at head_block_num {}".format(producing_node_id, head_block_num))
     nodes[producing_node_id].kill()
 
-    # restart relay
-    Utils.Print("cluster now out of sync. ready to start ha_relay again, cmd is: " + relay_cmd)
-    relay_pid = subprocess.Popen(relay_cmd.split(), stdout=subprocess.PIPE,stderr=subprocess.PIPE).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    # reconnect relays
+    Utils.Print("cluster now out of sync. reconnecting relays")
+    relays.connect()
 
     # ensure every node has a chance of producing in this frequency disconnect network
     tries = 60
@@ -125,6 +123,7 @@ try:
     # make sure the rest of the cluster is producing
     if rest_produced == False:
         Utils.errorExit("cluster not producing after shutting down the original BP node {} at head_block_num {}".format(producing_node_id, head_block_num))
+    relays.printStats()
 
     # relaunch the original active producer
     Utils.Print("relauch the original BP node {}".format(producing_node_id))
@@ -153,9 +152,7 @@ try:
     testSuccessful = True
 
 finally:
-    if relay_pid != 0:
-        Utils.Print("shutting down relay process (pid " + str(relay_pid) + ") ...")
-        os.kill(relay_pid, signal.SIGKILL)
+    relays.stop()
     Utils.Print("shutting down cluster ...")
     TestHelper.shutdown(cluster, None, testSuccessful, killEosInstances, False, keepLogs, killAll, dumpErrorDetails)
 
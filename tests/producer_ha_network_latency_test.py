@@ -3,12 +3,12 @@ from testUtils import Utils
 from Cluster import Cluster
 from TestHelper import TestHelper
 from Node import Node
+from RelayController import RelayController
 import json
 import os
 import subprocess
 import time
 import re
-import signal
 from sys import stdout
 
 ###############################################################
@@ -46,8 +46,9 @@ keepLogs=args.keep_logs
 dontKill=args.leave_running
 killAll=args.clean_run
 
-# --relay=listening_port:dest_ip:dest_port
-relay_cmd = "bin/relay --relay=8988:127.0.0.1:18988 --relay=8989:127.0.0.1:18989 --relay=8990:127.0.0.1:18990"
+# one relay per BP, forwarding localhost:8988+i to the BP listening on 18988+i
+relays=RelayController()
+relays.addHaLinks(producers)
 
 testSuccessful=False
 killEosInstances=not dontKill
@@ -58,15 +59,13 @@ for i in range(producers):
     Node.create_ha_config(i, use_relay=True)
 path_to_config_ha = os.getcwd()
 
-relay_pid = 0
 try:
     TestHelper.printSystemInfo("BEGIN")
     cluster.killall(allInstances=killAll)
     cluster.cleanup()
 
-    Utils.Print("ready to start ha_relay, cmd is: " + relay_cmd)
-    relay_pid = subprocess.Popen(relay_cmd.split(), stdout=subprocess.PIPE,stderr=subprocess.PIPE).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    if not relays.start():
+        Utils.errorExit("Failed to start relays.")
 
     extraNodeosArgs=" --resource-monitor-not-shutdown-on-threshold-exceeded"
     for i in range(producers):
@@ -97,9 +96,8 @@ try:
         nodes[0].getHeadBlockNum(),nodes[1].getHeadBlockNum(),nodes[2].getHeadBlockNum()))
 
     stdout.flush()
-    Utils.Print("Killing relay... wait for cluster out of sync")
-    os.kill(relay_pid, signal.SIGKILL)
-    relay_pid = 0
+    Utils.Print("Disconnecting relays... wait for cluster out of sync")
+    relays.disconnect()
 
     stdout.flush()
     time.sleep(5.0)
@@ -109,11 +107,10 @@ try:
     if checksum0 != checksum1:
         Utils.errorExit("some of the nodes still producing, checksum0 {} != checksum1 {}, which is not expected".format(checksum0, checksum1))
 
-    # restart relay in frequenent disconnect mode
-    relay_cmd2 = relay_cmd + " --accept-rate=0.2 --latency-delta=0.03"
-    Utils.Print("cluster now out of sync, checksum is {}. Restart ha_relay in latency-increasing mode, cmd is: {}".format(checksum0, relay_cmd2))
-    relay_pid = subprocess.Popen(relay_cmd2.split(), stdout=subprocess.PIPE,stderr=subprocess.PIPE).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    # reconnect relays in latency-increasing mode
+    Utils.Print("cluster now out of sync, checksum is {}. Reconnecting relays in latency-increasing mode".format(checksum0))
+    relays.set(acceptRate=0.2, latencyDelta=0.03)
+    relays.connect()
     stdout.flush()
 
     produced = [False, False, False]
@@ -138,21 +135,21 @@ try:
         stdout.flush()
         time.sleep(1.0)
 
-    Utils.Print("Killing relay, pid {}".format(relay_pid))
-    os.kill(relay_pid, signal.SIGKILL)
-    relay_pid = 0
+    relays.printStats()
+    relays.disconnect()
 
-    # restart relay and wait for it sync again
-    Utils.Print("restart relay in normal mode, cmd is: " + relay_cmd)
-    relay_pid = subprocess.Popen(relay_cmd.split()).pid
-    Utils.Print("relay pid is " + str(relay_pid))
+    # reconnect relays in normal mode and wait for it sync again
+    Utils.Print("reconnecting relays in normal mode")
+    relays.set(acceptRate=1.0, latencyDelta=0)
+    relays.connect()
+    reconnectTime = time.time()
     stdout.flush()
 
     # wait for the cluster in sync
     if not cluster.waitOnClusterSync(timeout=120, blockAdvancing=5):
         Utils.errorExit("Cluster failed to produce blocks.")
     else:
-        Utils.Print("Cluster in Sync")
+        Utils.Print("Cluster in Sync, %.2f seconds after reconnecting relays" % (time.time() - reconnectTime))
 
     # ensure there's no fork
     Utils.Print("checking whether there are forks...")
@@ -165,9 +162,7 @@ try:
     testSuccessful = True
 
 finally:
-    if relay_pid != 0:
-        Utils.Print("shutting down relay process (pid " + str(relay_pid) + ") ...")
-        os.kill(relay_pid, signal.SIGKILL)
+    relays.stop()
     Utils.Print("shutting down cluster ...")
     TestHelper.shutdown(cluster, None, testSuccessful, killEosInstances, False, keepLogs, killAll, dumpErrorDetails)
 
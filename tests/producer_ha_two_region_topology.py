@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 from testUtils import Utils
 from Cluster import Cluster
-from Node import Node
 from TestHelper import TestHelper
 from TestHelper import AppArgs
-import os
-import subprocess
+from RelayController import RelayController
+from ProducerHaTopology import ProducerHaTopology
 
 
 ###############################################################
@@ -34,35 +33,25 @@ NodeIds_A=[0, 1, 2]
 NodeIds_B=[3, 4, 5]
 shipNodeIds=[6, 7, 8, 9, 10, 11]
 
-if netLatency:
-    # --relay=listening_port:dest_ip:dest_port
-    latencyConf= " --latency-in=0.001 --latency-out=0.001 --disconnect-min=3 --disconnect-max=10 --accept-rate=0.2 --drop-rate=0.9"
-    relay_cmd = "bin/relay --relay=8988:127.0.0.1:18988 --relay=8989:127.0.0.1:18989 --relay=8990:127.0.0.1:18990"+latencyConf
+# region A (ids 0-2) is the active producer_ha cluster, region B (ids 3-5) the standby one, on leased ports
+topology=ProducerHaTopology([len(NodeIds_A), len(NodeIds_B)], useRelay=netLatency)
+topology.write(activeClusters=[0])
 
-for i in NodeIds_A:
-    if netLatency:
-        Node.create_ha_config(i, use_relay=True)
-    else:
-        Node.create_ha_config(i)
-for i in NodeIds_B:
-    if netLatency:
-        Node.create_ha_config(i, is_active=False, use_relay=True, clstrNum=2)
-    else:
-        Node.create_ha_config(i, is_active=False, clstrNum=2)
-path_to_config_ha = os.getcwd()
+# one relay per BP of both regions, forwarding the BP's peer port to the port it listens on
+relays=RelayController(portAllocator=topology.allocator)
+if netLatency:
+    topology.addRelayLinks(relays)
 try:
     TestHelper.printSystemInfo("BEGIN")
     cluster.killall(allInstances=killAll)
     cluster.cleanup()  
 
     if netLatency:
-        Utils.Print("ready to start ha_relay, cmd is: " + relay_cmd)
-        relay_pid = subprocess.Popen(relay_cmd.split(), stdout=subprocess.PIPE,stderr=subprocess.PIPE).pid
-        Utils.Print("relay pid is " + str(relay_pid))
+        if not relays.start(latencyIn=0.001, latencyOut=0.001, disconnectMin=3, disconnectMax=10, acceptRate=0.2, dropRate=0.9):
+            Utils.errorExit("Failed to start relays.")
 
     extraNodeosArgs=" --resource-monitor-not-shutdown-on-threshold-exceeded"
-    for i in range(producers):
-        specificExtraNodeosArgs[i]=" --plugin eosio::producer_ha_plugin --producer-ha-config {}/config_ha_{}.json".format(path_to_config_ha, i)
+    specificExtraNodeosArgs.update(topology.specificExtraNodeosArgs())
     for i in NodeIds_A:
         for j in NodeIds_B:
             specificExtraNodeosArgs[i] += " --p2p-peer-address 0.0.0.0:{}".format(9876+j)
@@ -91,7 +80,12 @@ try:
     testSuccessful=True
 
 finally:
+    if netLatency:
+        relays.printStats()
+    relays.stop()
     TestHelper.shutdown(cluster, None, testSuccessful, killEosInstances, False, keepLogs, killAll, dumpErrorDetails)
+    if killEosInstances:
+        topology.cleanup()
 
 exitCode = 0 if testSuccessful else 1
 exit(exitCode)
@@ -3,6 +3,7 @@
 from testUtils import Utils
 from TestHelper import TestHelper
 from Cluster import Cluster
+from ResourceProfile import ResourceProfile
 from rodeos_utils import RodeosUtils
 from WalletMgr import WalletMgr
 
@@ -67,9 +68,9 @@ def launch_cluster(num_rodeos, unix_socket, cleanRestart, killSignal, eos_vm_oc_
             listenArg2 = " --wql-listen 127.0.0.1:8881 "
 
         specificExtraNodeosArgs={
-            0: "--plugin eosio::net_api_plugin --wasm-runtime eos-vm-jit --chain-state-db-size-mb=131072 --plugin eosio::txn_test_gen_plugin ",
-            1: "--chain-state-db-size-mb=131072 --disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg1,
-            2: "--chain-state-db-size-mb=131072 --disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg2
+            0: "--plugin eosio::net_api_plugin --wasm-runtime eos-vm-jit --plugin eosio::txn_test_gen_plugin ",
+            1: "--disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg1,
+            2: "--disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg2
         }
 
         assert cluster.launch(
@@ -80,7 +81,8 @@ def launch_cluster(num_rodeos, unix_socket, cleanRestart, killSignal, eos_vm_oc_
             useBiosBootFile=False,
             loadSystemContract=False,
             extraNodeosArgs=" --plugin eosio::trace_api_plugin --trace-no-abis",
-            specificExtraNodeosArgs=specificExtraNodeosArgs)
+            specificExtraNodeosArgs=specificExtraNodeosArgs,
+            resourceProfile=ResourceProfile())
 
         time.sleep(10)  # Leave rodeos nodes enough time to get fully launched
 
@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
 from testUtils import Utils
+from testUtils import ReadinessWatcher
 from TestHelper import TestHelper
 from Cluster import Cluster
+from ResourceProfile import ResourceProfile
 from rodeos_utils import RodeosUtils
 from WalletMgr import WalletMgr
 from TestHelper import AppArgs
 
-import time
 import subprocess
 ###############################################################
 # rodeos_plugin_multi_test
@@ -62,16 +63,16 @@ def launch_cluster(num_rodeos, unix_socket_option, eos_vm_oc_enable=False):
         specificExtraNodeosArgs=None
         if num_rodeos == 2:
             specificExtraNodeosArgs={
-                0: "--plugin eosio::net_api_plugin --wasm-runtime eos-vm-jit --chain-state-db-size-mb=131072 --plugin eosio::txn_test_gen_plugin ",
-                1: "--chain-state-db-size-mb=131072 --disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg1,
-                2: "--chain-state-db-size-mb=131072 --disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg2
+                0: "--plugin eosio::net_api_plugin --wasm-runtime eos-vm-jit --plugin eosio::txn_test_gen_plugin ",
+                1: "--disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg1,
+                2: "--disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg2
             }
         elif num_rodeos == 3:
             specificExtraNodeosArgs={
-                0: "--chain-state-db-size-mb=131072 --plugin eosio::txn_test_gen_plugin --plugin eosio::net_api_plugin --wasm-runtime eos-vm-jit ",
-                1: "--chain-state-db-size-mb=131072 --disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg1,
-                2: "--chain-state-db-size-mb=131072 --disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg2,
-                3: "--chain-state-db-size-mb=131072 --disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg3
+                0: "--plugin eosio::txn_test_gen_plugin --plugin eosio::net_api_plugin --wasm-runtime eos-vm-jit ",
+                1: "--disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg1,
+                2: "--disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg2,
+                3: "--disable-replay-opts --plugin b1::rodeos_plugin --filter-name test.filter --filter-wasm ./tests/test_filter.wasm " + OCArg + listenArg3
             }
 
         assert cluster.launch(
@@ -82,9 +83,18 @@ def launch_cluster(num_rodeos, unix_socket_option, eos_vm_oc_enable=False):
             useBiosBootFile=False,
             loadSystemContract=False,
             extraNodeosArgs=" --plugin eosio::trace_api_plugin --trace-no-abis",
-            specificExtraNodeosArgs=specificExtraNodeosArgs)
-
-        time.sleep(10)  # Leave rodeos nodes enough time to get fully launched
+            specificExtraNodeosArgs=specificExtraNodeosArgs,
+            resourceProfile=ResourceProfile())
+
+        # wait for every rodeos node to accept wql connections
+        watcher=ReadinessWatcher()
+        for i in range(1, num_rodeos+1):
+            node=cluster.getNode(i)
+            if unix_socket_option:
+                watcher.addUnixSocket(f"rodeos{i-1}", f"./var/lib/node_0{i}/rodeos{i-1}.sock", node.pid)
+            else:
+                watcher.addPort(f"rodeos{i-1}", "127.0.0.1", 8879+i, node.pid)
+        assert watcher.wait(Utils.systemWaitTimeout), "rodeos nodes failed to start listening"
 
         prodNode = cluster.getNode(0)
 
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+from Cluster import Cluster
+from WalletMgr import WalletMgr
+from Node import Node
+from TestHelper import TestHelper
+from TestHelper import AppArgs
+
+from datetime import datetime
+from datetime import timezone
+import json
+import os
+import re
+import shutil
+import signal
+import threading
+import time
+import urllib.request
+
+###############################################################
+# snapshot_benchmark
+#
+# Grows chain state through a list of target sizes and, at each size, measures:
+#   - foreground snapshot: duration of producer_api create_snapshot and the
+#     head block stall it causes on the producing node
+#   - background snapshot: duration of the forked snapshot writer (taken from
+#     the "Background creating/saved state snapshot" log lines) and the head
+#     block stall around it
+#   - restore: time for a node to start from the foreground snapshot and the
+#     time for it to catch up with the producer afterwards
+# Every measurement is reported against the chainbase used bytes at that point.
+#
+###############################################################
+
+Print=Utils.Print
+errorExit=Utils.errorExit
+
+BlockIntervalSec=0.5
+
+appArgs=AppArgs()
+appArgs.add(flag="--state-sizes-mb", type=str, help="comma separated list of state sizes (MB) to benchmark at", default="16,64")
+appArgs.add(flag="--chain-state-db-size-mb", type=int, help="chainbase size to configure nodeos with", default=4096)
+appArgs.add(flag="--accounts-per-trx", type=int, help="newaccount actions per transaction when growing state", default=100)
+appArgs.add(flag="--background-period", type=int, help="value for --background-snapshot-write-period-in-blocks", default=120)
+appArgs.add(flag="--sample-interval", type=float, help="seconds between head block samples", default=0.05)
+appArgs.add(flag="--restore-timeout", type=int, help="seconds to wait for a node to start from a snapshot", default=600)
+appArgs.add(flag="--report", type=str, help="write the benchmark results to this JSON file", default=None)
+args=TestHelper.parse_args({"-v","--clean-run","--dump-error-details","--leave-running","--keep-logs"}, applicationSpecificArgs=appArgs)
+
+Utils.Debug=args.v
+killAll=args.clean_run
+dumpErrorDetails=args.dump_error_details
+dontKill=args.leave_running
+killEosInstances=not dontKill
+killWallet=not dontKill
+keepLogs=args.keep_logs
+
+stateSizesMb=[int(s) for s in args.state_sizes_mb.split(",")]
+stateSizesMb.sort()
+
+class HeadBlockSampler(threading.Thread):
+    """Polls get_info on a node and records (time, head_block_num) pairs."""
+    def __init__(self, node, interval):
+        threading.Thread.__init__(self, daemon=True)
+        self.url="%s/v1/chain/get_info" % (node.endpointHttp)
+        self.interval=interval
+        self.samples=[]
+        self.lock=threading.Lock()
+        self.stopEvent=threading.Event()
+
+    def run(self):
+        while not self.stopEvent.is_set():
+            try:
+                with urllib.request.urlopen(self.url, timeout=5) as resp:
+                    headBlockNum=json.loads(resp.read())["head_block_num"]
+                with self.lock:
+                    self.samples.append((time.time(), headBlockNum))
+            except Exception:
+                pass
+            self.stopEvent.wait(self.interval)
+
+    def stop(self):
+        self.stopEvent.set()
+        self.join()
+
+    def stall(self, start, end):
+        """Returns the longest time the head block did not advance and the number of blocks missed in [start, end]."""
+        with self.lock:
+            window=[s for s in self.samples if start <= s[0] <= end]
+        if len(window) < 2:
+            return { "max_head_gap_s": None, "missed_blocks": None }
+        maxGap=0
+        lastChange=window[0][0]
+        for i in range(1, len(window)):
+            if window[i][1] != window[i-1][1]:
+                maxGap=max(maxGap, window[i][0] - lastChange)
+                lastChange=window[i][0]
+        maxGap=max(maxGap, window[-1][0] - lastChange)
+        expected=int((window[-1][0] - window[0][0]) / BlockIntervalSec)
+        advanced=window[-1][1] - window[0][1]
+        return { "max_head_gap_s": round(maxGap, 3), "missed_blocks": max(0, expected - advanced) }
+
+def benchAccountName(index):
+    chars="abcdefghijklmnopqrstuvwxyz12345"
+    name=""
+    for _ in range(8):
+        name=chars[index % len(chars)] + name
+        index//=len(chars)
+    return "snb" + name
+
+def getStateUsedBytes(node):
+    dbSize=node.processCurlCmd("db_size", "get", "{}", silentErrors=False, exitOnError=True)
+    return int(dbSize["used_bytes"])
+
+def growState(node, creator, targetBytes, nextIndex):
+    """Creates accounts in batches until chainbase uses at least targetBytes. Returns the next unused account index."""
+    auth={ "threshold": 1, "keys": [{ "key": creator.activePublicKey, "weight": 1 }], "accounts": [], "waits": [] }
+    usedBytes=getStateUsedBytes(node)
+    Print("Growing state from %d to %d bytes" % (usedBytes, targetBytes))
+    trans=None
+    while usedBytes < targetBytes:
+        actions=[]
+        for _ in range(args.accounts_per_trx):
+            actions.append({ "account": "eosio", "name": "newaccount",
+                             "authorization": [{ "actor": creator.name, "permission": "active" }],
+                             "data": { "creator": creator.name, "name": benchAccountName(nextIndex), "owner": auth, "active": auth } })
+            nextIndex+=1
+        success, trans=node.pushTransaction({ "actions": actions }, opts=None, permissions="%s@active" % (creator.name))
+        if not success:
+            errorExit("Failed to push newaccount batch ending at account index %d" % (nextIndex))
+        usedBytes=getStateUsedBytes(node)
+        if Utils.Debug: Print("state used bytes: %d, accounts created: %d" % (usedBytes, nextIndex))
+    if trans is not None:
+        node.waitForTransInBlock(Node.getTransId(trans))
+    return nextIndex
+
+def parseLogTime(timeStr):
+    return datetime.strptime(timeStr, Utils.TimeFmt).replace(tzinfo=timezone.utc).timestamp()
+
+def getBackgroundSnapshotEvents(nodeId):
+    """Returns a list of (created, saved) epoch time pairs parsed from the node's stderr files."""
+    timestampPtrn=r'\s+([0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}.[0-9]{3})\s'
+    createdPtrn=re.compile(timestampPtrn + r'.+Background creating state snapshot into')
+    savedPtrn=re.compile(timestampPtrn + r'.+Background saved state snapshot into')
+    events=[]
+    created=None
+    for file in Node.findStderrFiles(Utils.getNodeDataDir(nodeId)):
+        with open(file, 'r') as f:
+            for line in f:
+                match=createdPtrn.search(line)
+                if match:
+                    created=parseLogTime(match.group(1))
+                    continue
+                match=savedPtrn.search(line)
+                if match and created is not None:
+                    events.append((created, parseLogTime(match.group(1))))
+                    created=None
+    return events
+
+def removeSnapshotArg(node):
+    cmdArr=node.cmd.split()
+    if "--snapshot" in cmdArr:
+        i=cmdArr.index("--snapshot")
+        del cmdArr[i:i+2]
+        node.cmd=" ".join(cmdArr)
+
+def benchForeground(node, sampler):
+    start=time.time()
+    res=node.createSnapshot()
+    end=time.time()
+    if res is None or "snapshot_name" not in res:
+        errorExit("create_snapshot failed: %s" % (res))
+    time.sleep(2*BlockIntervalSec)
+    result={ "duration_s": round(end - start, 3), "snapshot_bytes": os.path.getsize(res["snapshot_name"]) }
+    result.update(sampler.stall(start - BlockIntervalSec, end + BlockIntervalSec))
+    return res["snapshot_name"], result
+
+def benchBackground(node, sampler):
+    eventsBefore=len(getBackgroundSnapshotEvents(node.nodeId))
+    def newEventLogged():
+        return len(getBackgroundSnapshotEvents(node.nodeId)) > eventsBefore
+    timeout=args.background_period * BlockIntervalSec * 2 + 60
+    if not Utils.waitForTruth(newEventLogged, timeout=timeout, sleepTime=1):
+        errorExit("No background snapshot was logged within %d seconds" % (timeout))
+    created, saved=getBackgroundSnapshotEvents(node.nodeId)[-1]
+    time.sleep(2*BlockIntervalSec)
+    result={ "duration_s": round(saved - created, 3) }
+    result.update(sampler.stall(created - 2*BlockIntervalSec, saved + BlockIntervalSec))
+    return result
+
+def benchRestore(node, snapshotPath, producerNode):
+    node.kill(signal.SIGTERM)
+    shutil.rmtree(Utils.getNodeDataDir(node.nodeId, "state"), ignore_errors=True)
+    shutil.rmtree(Utils.getNodeDataDir(node.nodeId, "blocks"), ignore_errors=True)
+    removeSnapshotArg(node)
+    start=time.time()
+    if not node.relaunch(chainArg="--snapshot %s" % (snapshotPath), timeout=args.restore_timeout, cachePopen=True):
+        errorExit("Failed to restore node %d from snapshot %s" % (node.nodeId, snapshotPath))
+    started=time.time()
+    targetBlockNum=producerNode.getHeadBlockNum()
+    node.waitForBlock(targetBlockNum, timeout=args.restore_timeout)
+    caughtUp=time.time()
+    return { "startup_s": round(started - start, 3), "catchup_s": round(caughtUp - started, 3) }
+
+walletMgr=WalletMgr(True)
+cluster=Cluster(walletd=True)
+cluster.setWalletMgr(walletMgr)
+
+testSuccessful=False
+sampler=None
+try:
+    TestHelper.printSystemInfo("BEGIN")
+    cluster.killall(allInstances=killAll)
+    cluster.cleanup()
+
+    extraNodeosArgs=" --plugin eosio::db_size_api_plugin --chain-state-db-size-mb %d" % (args.chain_state_db_size_mb)
+    extraNodeosArgs+=" --background-snapshot-write-period-in-blocks %d" % (args.background_period)
+    assert cluster.launch(
+        pnodes=1,
+        prodCount=1,
+        totalProducers=1,
+        totalNodes=2,
+        useBiosBootFile=False,
+        loadSystemContract=False,
+        extraNodeosArgs=extraNodeosArgs)
+
+    producerNode=cluster.getNode(0)
+    restoreNode=cluster.getNode(1)
+
+    sampler=HeadBlockSampler(producerNode, args.sample_interval)
+    sampler.start()
+
+    results=[]
+    nextIndex=0
+    for sizeMb in stateSizesMb:
+        nextIndex=growState(producerNode, cluster.eosioAccount, sizeMb * 1024 * 1024, nextIndex)
+        stateBytes=getStateUsedBytes(producerNode)
+        Print("Benchmarking snapshots at %d state bytes" % (stateBytes))
+
+        background=benchBackground(producerNode, sampler)
+        snapshotPath, foreground=benchForeground(producerNode, sampler)
+        restore=benchRestore(restoreNode, snapshotPath, producerNode)
+        if not keepLogs:
+            os.remove(snapshotPath)
+
+        results.append({ "target_mb": sizeMb, "state_bytes": stateBytes, "accounts": nextIndex,
+                         "foreground": foreground, "background": background, "restore": restore })
+
+    Print("%12s %14s %12s %10s %10s %12s %10s %10s %10s %10s" % ("state bytes", "snapshot bytes", "fg create s", "fg gap s", "fg missed",
+          "bg create s", "bg gap s", "bg missed", "restore s", "catchup s"))
+    for r in results:
+        fg=r["foreground"]
+        bg=r["background"]
+        Print("%12d %14d %12.3f %10s %10s %12.3f %10s %10s %10.3f %10.3f" % (r["state_bytes"], fg["snapshot_bytes"], fg["duration_s"],
+              fg["max_head_gap_s"], fg["missed_blocks"], bg["duration_s"], bg["max_head_gap_s"], bg["missed_blocks"],
+              r["restore"]["startup_s"], r["restore"]["catchup_s"]))
+
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump({ "background_period": args.background_period, "results": results }, f, indent=2)
+        Print("Wrote report to %s" % (args.report))
+
+    testSuccessful=True
+finally:
+    if sampler is not None:
+        sampler.stop()
+    TestHelper.shutdown(cluster, walletMgr, testSuccessful, killEosInstances, killWallet, keepLogs, killAll, dumpErrorDetails)
+
+exitCode=0 if testSuccessful else 1
+exit(exitCode)
@@ -630,11 +630,19 @@ class Utils:
         except Exception:
             pass
         Utils.Print("Starting rabbitmq")
-        p = subprocess.Popen(["rabbitmq-server"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding="utf-8")
-        time.sleep(5)
+        out_path = os.path.join(config_path, "rabbitmq.out")
+        with open(out_path, "w") as out:
+            p = subprocess.Popen(["rabbitmq-server"], stdout=out, stderr=subprocess.STDOUT, encoding="utf-8")
+        watcher = ReadinessWatcher()
+        for addr in [amqp_address, amqps_address]:
+            if addr is not None:
+                host, port = addr.split("@")[1].split("/")[0].rsplit(":", 1)
+                watcher.addPort(f"rabbitmq {host}:{port}", host, int(port), p)
+        # the listeners open before the plugins, such as the management API used to create queues, have started
+        watcher.addLogMarker("rabbitmq startup", out_path, r"Starting broker.*completed|Server startup complete", p)
+        watcher.wait(timeout=30)
         attemptsLeft = 20
         while attemptsLeft > 0:
-            time.sleep(1)
             attemptsLeft -= 1
             try:
                 s = Utils.runCmdReturnStr("rabbitmqctl status")
@@ -644,8 +652,10 @@ class Utils:
             except Exception as e:
                 Utils.Print(f"Could not contact rabbitmq server, retrying (attempts left= {attemptsLeft})")
                 eLast = e
+                time.sleep(1)
         if attemptsLeft == 0:
-            (out, err) = p.communicate(timeout=3)
+            with open(out_path, "r") as f:
+                out = f.read()
             Utils.Print("<<<<<<  BEGIN RABBITMQ ERROR LOG >>>>>>")
             Utils.Print(out)
             Utils.Print("<<<<<<  END RABBITMQ ERROR LOG >>>>>>")
@@ -681,6 +691,113 @@ class Account(object):
     def __str__(self):
         return "Name: %s" % (self.name)
 
+###########################################################################################
+class ReadinessWatcher(object):
+    """Waits for services to come up by polling listening sockets and log markers from one loop.
+    Probes are retried with exponential backoff, and a probe whose process has exited fails immediately."""
+
+    def __init__(self, initialDelay=0.05, maxDelay=0.5):
+        self.initialDelay=initialDelay
+        self.maxDelay=maxDelay
+        self.probes={}
+        self.readyTimes={}        # name -> seconds from wait() until the service was ready
+        self.failed=[]
+
+    @staticmethod
+    def processExited(proc):
+        if proc is None:
+            return False
+        if isinstance(proc, subprocess.Popen):
+            return proc.poll() is not None
+        try:
+            os.kill(proc, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def addProbe(self, name, lam, proc=None):
+        """Registers a callable returning True once the service named name is ready. proc is a Popen or pid to watch for early exit."""
+        assert name not in self.probes, "readiness probe %s already registered" % (name)
+        self.probes[name]=(lam, proc)
+
+    def addPort(self, name, host, port, proc=None):
+        def isListening():
+            try:
+                with socket.create_connection((host, port), timeout=self.maxDelay):
+                    return True
+            except OSError:
+                return False
+        self.addProbe(name, isListening, proc)
+
+    def addUnixSocket(self, name, path, proc=None):
+        def isListening():
+            if not os.path.exists(path):
+                return False
+            s=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                s.settimeout(self.maxDelay)
+                s.connect(path)
+                return True
+            except OSError:
+                return False
+            finally:
+                s.close()
+        self.addProbe(name, isListening, proc)
+
+    def addLogMarker(self, name, path, pattern, proc=None):
+        """Ready once a line matching pattern is appended to the file at path, only the unread tail is scanned on each poll."""
+        regex=re.compile(pattern)
+        state={"offset": 0, "partial": ""}
+        def markerLogged():
+            try:
+                with open(path, "r", errors="replace") as f:
+                    f.seek(state["offset"])
+                    data=f.read()
+                    state["offset"]=f.tell()
+            except OSError:
+                return False
+            lines=(state["partial"] + data).split("\n")
+            state["partial"]=lines.pop()
+            return any(regex.search(line) for line in lines)
+        self.addProbe(name, markerLogged, proc)
+
+    def wait(self, timeout=None):
+        """Polls every pending probe until all are ready, returns False if any process exits or timeout expires."""
+        if timeout is None:
+            timeout=Utils.systemWaitTimeout
+        start=time.time()
+        endTime=start+timeout
+        pending=dict(self.probes)
+        delay=self.initialDelay
+        while pending:
+            for name,(lam, proc) in list(pending.items()):
+                if lam():
+                    self.readyTimes[name]=time.time()-start
+                    if Utils.Debug: Utils.Print("%s ready after %.2f seconds" % (name, self.readyTimes[name]))
+                    del pending[name]
+                elif ReadinessWatcher.processExited(proc):
+                    Utils.Print("ERROR: %s exited before becoming ready" % (name))
+                    self.failed.append(name)
+                    del pending[name]
+            remaining=endTime-time.time()
+            if not pending or remaining <= 0:
+                break
+            time.sleep(min(delay, remaining))
+            delay=min(delay*2, self.maxDelay)
+
+        for name in pending:
+            Utils.Print("ERROR: %s not ready after %d seconds" % (name, timeout))
+            self.failed.append(name)
+        return len(self.failed) == 0
+
+    @staticmethod
+    def waitForPort(name, host, port, timeout=None, proc=None):
+        watcher=ReadinessWatcher()
+        watcher.addPort(name, host, port, proc)
+        return watcher.wait(timeout)
+
 
 if platform.system() == "Darwin":
     # Set a 15-min timeout when this module is imported
@@ -9,11 +9,15 @@ from Cluster import Cluster
 from TestHelper import TestHelper
 from Node import Node
 from WalletMgr import WalletMgr
+from TraceApiFetcher import TraceApiFetcher
+from TestHelper import AppArgs
 from core_symbol import CORE_SYMBOL
 
 # trace_plugin_test
 #
-# test starts cluster with 1 node, executes transaction and checks if trace API returns block with this transaction
+# test starts cluster with 2 nodes, node 0 serving traces with the eosio.token ABI and node 1 with --trace-no-abis,
+# executes transactions and checks that the trace API of both nodes returns the blocks with these transactions and
+# their action traces, then reports how fast each node served the blocks
 #
 ###############################################################
 
@@ -21,13 +25,12 @@ Print=Utils.Print
 errorExit=Utils.errorExit
 cmdError=Utils.cmdError
 
-def get_block(params: str, node: Node) -> json:
-    base_cmd_str = ("curl -s http://%s:%s/v1/") % (TestHelper.LOCAL_HOST, node.port)
-    cmd_str = base_cmd_str + "trace_api/get_block  -X POST -d " + ("'{\"block_num\":%s}'") % params
-    return Utils.runCmdReturnJson(cmd_str)
+appArgs = AppArgs()
+appArgs.add(flag="--num-transfers", type=int, help="transfers to verify in the trace API", default=30)
+appArgs.add(flag="--fetch-concurrency", type=int, help="concurrent trace_api/get_block requests", default=8)
 
 try:
-    args = TestHelper.parse_args({"--host","--port","--wallet-port","--dump-error-details","--keep-logs","-v","--leave-running","--clean-run", "--signing-delay"})
+    args = TestHelper.parse_args({"--host","--port","--wallet-port","--dump-error-details","--keep-logs","-v","--leave-running","--clean-run", "--signing-delay"}, appArgs)
     server=args.host
     port=args.port
     Utils.Debug = args.v
@@ -59,14 +62,16 @@ try:
 
     account_names = ["alice", "bob", "charlie"]
     abs_path = os.path.abspath(os.getcwd() + '/../unittests/contracts/eosio.token/eosio.token.abi')
-    traceNodeosArgs = " --plugin eosio::trace_api_plugin --trace-rpc-abi eosio.token={} --signing-delay {}".format(abs_path, signing_delay)
-    cluster.launch(totalNodes=1, extraNodeosArgs=traceNodeosArgs)
+    traceNodeosArgs = " --plugin eosio::trace_api_plugin --signing-delay {}".format(signing_delay)
+    specificExtraNodeosArgs = { 0: " --trace-rpc-abi eosio.token={}".format(abs_path), 1: " --trace-no-abis" }
+    cluster.launch(totalNodes=2, extraNodeosArgs=traceNodeosArgs, specificExtraNodeosArgs=specificExtraNodeosArgs)
     walletMgr.launch()
     testWalletName="testwallet"
     testWallet=walletMgr.create(testWalletName, [cluster.eosioAccount, cluster.defproduceraAccount])
     cluster.validateAccounts(None)
     accounts=Cluster.createAccountKeys(len(account_names))
     node = cluster.getNode(0)
+    firstBlockNum = node.getHeadBlockNum()
     for idx in range(len(account_names)):
         accounts[idx].name =  account_names[idx]
         walletMgr.importKey(accounts[idx], testWallet)
@@ -108,17 +113,26 @@ try:
             break
     assert(isTrxInBlockFromNode)
 
-    # verify trans via trace_api by calling get_block RPC
-    blockFromTraceApi = get_block(blockNum, node)
-    assert("transactions" in blockFromTraceApi)
-    isTrxInBlockFromTraceApi = False
-    for trx in blockFromTraceApi["transactions"]:
-        assert("id" in trx)
-        if (trx["id"] == transId) :
-            isTrxInBlockFromTraceApi = True
-            Utils.Print("Found transaction {} in block {}".format(transId, blockNum))
-            break
-    assert(isTrxInBlockFromTraceApi)
+    transactions = [trans]
+    for i in range(args.num_transfers - 1):
+        fromAccount = accounts[i % len(accounts)]
+        toAccount = accounts[(i + 1) % len(accounts)]
+        transactions.append(node.transferFunds(fromAccount, toAccount, Node.currencyIntToStr(i + 1, CORE_SYMBOL), "test transfer %d" % (i)))
+    lastBlockNum = max(Node.getTransBlockNum(t) for t in transactions)
+    assert(cluster.getNode(1).waitForBlock(lastBlockNum))
+
+    # verify trans via trace_api by calling get_block RPC on both nodes, ABI decoded on node 0 and raw on node 1
+    for nodeId, abiAccounts in [(0, ["eosio.token"]), (1, None)]:
+        fetcher = TraceApiFetcher(cluster.getNode(nodeId), concurrency=args.fetch_concurrency)
+        blocks = fetcher.fetchRange(firstBlockNum, lastBlockNum)
+        fetcher.close()
+        assert len(fetcher.missing) == 0, "node %d is missing block traces %s" % (nodeId, fetcher.missing)
+        errors = TraceApiFetcher.verify(blocks, transactions, abiAccounts)
+        for error in errors:
+            Utils.Print("ERROR: node %d: %s" % (nodeId, error))
+        assert len(errors) == 0, "node %d trace API does not match the %d submitted transactions" % (nodeId, len(transactions))
+        Utils.Print("Found {} transactions with matching action traces in blocks {} to {} of node {}".format(len(transactions), firstBlockNum, lastBlockNum, nodeId))
+        fetcher.printStats()
 
     testSuccessful=True
 finally:
@@ -2,6 +2,11 @@
 
 import argparse
 from collections import OrderedDict
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
 import re
 import os
 import sys
@@ -23,8 +28,9 @@ import traceback
 #  expected order and the rest will now match.  Alternatively it should indicate swapping field3, since the remaining
 #  fields will also match the order.  But both field2 and field3 should not be indicated.
 #
+#  Files can be validated in parallel with "--jobs", and with "--cache <file>" files that passed are recorded by
+#  content hash so that later runs skip them while both the file and this script are unchanged.
 #
-# 
 ###############################################################
 
 import atexit
@@ -43,6 +49,8 @@ parser.add_argument('-d', '--debug', help="generate debug output into a temporar
 parser.add_argument('-r', '--recurse', help="recurse through an entire directory (if directory provided for \"file\"", action='store_true')
 parser.add_argument('-x', '--extension', type=str, help="extensions array to allow for directory and recursive search.  Defaults to \".hpp\" and \".cpp\".", action='append')
 parser.add_argument('-e', '--exit-on-error', help="Exit immediately when a validation error is discovered.  Default is to run validation on all files and directories provided.", action='store_true')
+parser.add_argument('-j', '--jobs', type=int, help="number of processes validating files in parallel, 0 for one per CPU.  Defaults to 1.  Ignored with --debug.", default=1)
+parser.add_argument('-c', '--cache', type=str, help="file recording the content hash of files that passed, which are then skipped while unchanged", default=None)
 parser.add_argument('files', metavar='file', nargs='+', type=str, help="File containing nodes info in JSON format.")
 args = parser.parse_args()
 
@@ -53,6 +61,10 @@ if args.debug:
     debug_file = open(os.path.join(temp_dir, "validate_reflection.debug"), "w")
 else:
     debug_file = None
+jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+if args.debug and jobs != 1:
+    print("--debug writes one debug file, validating with 1 job")
+    jobs = 1
 extensions = []
 if args.extension is None or len(args.extension) == 0:
     extensions = [".hpp",".cpp"]
@@ -72,8 +84,33 @@ def debug(debug_str):
     if debug_file is not None:
         debug_file.write(debug_str + "\n")
 
+class Tokenizer:
+    """
+    Splits C++ source into tokens in one pass.  Whitespace, comments and preprocessor lines are dropped and
+    string literals become a single token, so braces inside them are never seen by the parser.
+    """
+    token_pattern = re.compile(r'''
+          (?P<skip>\s+|//[^\n]*|/\*.*?\*/|^[ \t]*\#(?:\\\n|[^\n])*)
+        | (?P<raw>R"(?P<delim>[^(\s]*)\(.*?\)(?P=delim)")
+        | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+        | (?P<ident>[A-Za-z_]\w*)
+        | (?P<number>\.?\d(?:[eEpP][+-]|[\w.'])*)
+        | (?P<scope>::)
+        | (?P<punct>.)
+        ''', re.MULTILINE | re.DOTALL | re.VERBOSE)
+
+    def __init__(self, content):
+        self.tokens = []
+        for match in Tokenizer.token_pattern.finditer(content):
+            kind = match.lastgroup
+            if kind == "skip":
+                continue
+            self.tokens.append('""' if kind == "raw" or kind == "string" else match.group(0))
+
+def is_ident(token):
+    return token[0].isalpha() or token[0] == "_"
+
 class EmptyScope:
-    multi_word_type_pattern = r'(?:(?:un)?signed\s+)?(?:short\s+|(?:long\s+){1,2}?)?'
     single_comment_pattern = re.compile(r'//.*\n+')
     single_comment_ignore_swap_pattern = re.compile(r'//\s*(?:%s|%s)\s' % (ignore_str, swap_str))
     multi_line_comment_pattern = re.compile(r'/\*(.*?)\*/', re.MULTILINE | re.DOTALL)
@@ -81,92 +118,26 @@ class EmptyScope:
     strip_extra_pattern = re.compile(r'\n\s*\*\s*')
     invalid_chars_pattern = re.compile(r'([^\w\s,])')
     multi_line_comment_ignore_swap_pattern = re.compile(r'(\w+)(?:\s*,\s*)?')
-    handle_braces_initialization_swap_pattern = re.compile(r'(?:{|;|})\s*([^{};=]*?)\s*{([^{};]*)}(?=\s*;)', re.MULTILINE | re.DOTALL)
-    # pattern to handle fields initialized with {}
-    possible_end_skip_initialization = re.compile(r'{[^;}]*}\s*;', re.MULTILINE | re.DOTALL)
     namespace_str = "namespace"
     struct_str = "struct"
     class_str = "class"
     enum_str = "enum"
-    any_scope_pattern = re.compile(r'\{', re.DOTALL)
-    start_char = "{"
-    end_char = "}"
-    initializer_pattern = re.compile(r'\s*{[^{]*}\s*;', re.MULTILINE)
 
-    def __init__(self, name, start, content, parent_scope):
+    def __init__(self, name, parent_scope):
         pname = parent_scope.name if parent_scope is not None else ""
         self.indent = parent_scope.indent + " > " if parent_scope is not None else " > "
-        debug("%sEmptyScope.__init__ %s %d - Parent %s" % (self.indent, name, start, pname))
+        debug("%sEmptyScope.__init__ %s - Parent %s" % (self.indent, name, pname))
         self.name = name
-        self.content = content
-        self.start = start
-        self.current = start + 1
         self.parent_scope = parent_scope
-        self.end = len(content) - 1 if start == 0 else None
         self.children = OrderedDict()
         self.fields = []
         self.usings = OrderedDict()
         self.inherit = None
 
-    def read(self):
-        debug("%sEmptyScope(%s).read - %s starting at %s" % (self.indent, self.__class__.__name__, self.name, self.current))
-        end = len(self.content) - 1
-        while self.current < end:
-            next_scope = self.next_scope()
-            if next_scope is None:
-                break
-            self.add(next_scope)
-
-        if self.end is None:
-            self.end = self.content.find(EmptyScope.end_char, self.current, len(self.content))
-            debug("%sEmptyScope(%s).read - %s find end current: %s, end: %s" % (self.indent, self.__class__.__name__, self.name, self.current, self.end))
-            pdesc = str(self.parent_scope) if self.parent_scope is not None else "<no parent scope>"
-            assert self.end != -1, "Could not find \"%s\" in \"%s\" - parent scope - %s" % (EmptyScope.end_char, self.content[self.current:], pdesc)
-            if self.end < self.current:
-                assert self.end >= self.current, "End can't be before current"
-        debug("%sEmptyScope(%s).read - %s - Done at %s" % (self.indent, self.__class__.__name__, self.name, self.end))
-
     def add(self, child):
         debug("%sEmptyScope.add %s (%s) to %s (%s) - DROP" % (self.indent, child.name, child.__class__.__name__, self.name, self.__class__.__name__))
         pass
 
-    def find_scope_start(self, content, start, end, find_str):
-        debug("%sEmptyScope.find_scope_start" % (self.indent))
-        loc = content.find(find_str, start, end)
-        if loc == -1:
-            return loc
-        else:
-            return loc + len(find_str) - len(EmptyScope.start_char)
-
-    def find_possible_end(self):
-        possible = self.content.find(EmptyScope.end_char, self.current)
-        possible_skip_init = EmptyScope.possible_end_skip_initialization.search(self.content[self.current:])
-        if possible_skip_init:
-            all = possible_skip_init.group(0)
-            all_start = self.content.find(all, self.current)
-            all_end = all_start + len(all)
-            debug("%sEmptyScope.find_possible_end found possible at %s checking skip from %d to %d, all={\n%s\n}" % (self.indent, possible, all_start, all_end, all))
-            if possible > all_start and possible < all_end:
-                possible = self.content.find(EmptyScope.end_char, all_end + 1)
-        debug("%sEmptyScope.find_possible_end current=%s  possible end=%s" % (self.indent, self.current, possible))
-
-        return possible
-
-    def next_scope(self, end = None):
-        if end is None:
-            end = self.find_possible_end()
-        debug("%sEmptyScope.next_scope current=%s  end=%s" % (self.indent, self.current, end))
-        match = EmptyScope.any_scope_pattern.search(self.content[self.current:end])
-        if match:
-            start = self.find_scope_start(self.content, self.current, end, EmptyScope.start_char)
-            new_scope = EmptyScope(None, start, self.content, self)
-            new_scope.read()
-            self.current = new_scope.end + 1
-            debug("%sEmptyScope.next_scope return EmptyScope current: %s, scope end: %s" % (self.indent, self.current, new_scope.end))
-            return new_scope
-
-        return None
-
     def find_class(self, scoped_name):
         scope_separator = "::"
         loc = scoped_name.find(scope_separator)
@@ -221,20 +192,20 @@ class EmptyScope:
         desc += indent + "  }\n"
         return desc
 
-def allocate_scope(type, name, inherit, start, content, parent_scope):
+def allocate_scope(type, name, inherit, parent_scope):
     indent = parent_scope.indent + " > " if parent_scope is not None else " > "
     debug("%screate_scope" % (indent))
     if type == EmptyScope.namespace_str:
-        return Namespace(name, inherit, start, content, parent_scope)
+        return Namespace(name, inherit, parent_scope)
     elif type == EmptyScope.class_str or type == EmptyScope.struct_str:
-        return ClassStruct(name, inherit, start, content, parent_scope, is_enum=False)
+        return ClassStruct(name, inherit, parent_scope, is_enum=False)
     elif type.startswith(EmptyScope.enum_str):
-        return ClassStruct(name, inherit, start, content, parent_scope, is_enum=True)
+        return ClassStruct(name, inherit, parent_scope, is_enum=True)
     else:
-        assert False, "Script does not account for type = \"%s\" found in \"%s\"" % (type, content[start:])
+        assert False, "Script does not account for type = \"%s\" of \"%s\"" % (type, name)
 
 
-def create_scope(type, name, inherit, start, content, parent_scope):
+def create_scope(type, name, inherit, parent_scope):
     pscope = parent_scope
     elements = name.split('::')
     top_scope = None
@@ -242,14 +213,8 @@ def create_scope(type, name, inherit, start, content, parent_scope):
     for nname in elements:
         if nname in pscope.children:
             new_scope = pscope.children[nname]
-            new_scope.content = content
-            assert start >= new_scope.start, "New scope must start must be greater than prior start"
-            new_scope.start = start
-            new_scope.current = start + 1
-            new_scope.end = None
-
         else:
-            new_scope = allocate_scope(type, nname, inherit, start, content, pscope)
+            new_scope = allocate_scope(type, nname, inherit, pscope)
 
         if top_scope is None:
             top_scope = new_scope
@@ -258,26 +223,18 @@ def create_scope(type, name, inherit, start, content, parent_scope):
 
         pscope = new_scope
 
-    return (top_scope, new_scope)
-
-
-
+    parent_scope.add(top_scope)
+    return new_scope
 
 
 class ClassStruct(EmptyScope):
-    field_pattern = re.compile(r'\n\s*?(?:mutable\s+)?(%s\w[\w:]*(?:\s*<\s*%s\w[\w:\s.,]*\s*(?:\s*<\s*%s\w[\w:]*\s*(?:\s*<\s*%s\w[\w:\s.,]*\s*(?:,\s*%s\w[\w:\s.,]*\s*)*>\s*)?(?:,\s*%s\w[\w:]*\s*(?:\s*<\s*%s\w[\w:\s.,]*\s*(?:,\s*%s\w[\w:\s.,]*\s*)*>\s*)?)?>\s*)?(?:,\s*%s\w[\w:]*\s*(?:\s*<\s*%s\w[\w:\s.,]*\s*(?:\s*<\s*%s\w[\w:]*\s*(?:,\s*%s\w[\w:\s.,]*\s*)*>\s*)?(?:,\s*%s\w[\w:]*\s*(?:\s*<\s*%s\w[\w:\s.,]*\s*(?:,\s*%s\w[\w:\s.,]*\s*)*>\s*)?)?>\s*)?)?>\s*)?)(?:\*\s+|\s+\*|\s+)(\w+)\s*(?:;|=\s*[-]?\w[\w:]*(?:\s*[-/\*\+]\s*[-]?\w[\w:]*)*\s*;|=\s*(?:\w[\w:]*(?:<[^\n;]>)?)?(?:{|(?:\([^\)]*\)?|(?:\"[^\"]*\")?)\s*;)|\s*{[^\}]*}\s*;)' % (EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern, EmptyScope.multi_word_type_pattern), re.MULTILINE | re.DOTALL)
-    enum_field_pattern = re.compile(r'[,\{]\s*?(\w+)\s*(?:=\s*[^,}\s]+)?\s*(?:,|})', re.MULTILINE | re.DOTALL)
-    class_pattern = re.compile(r'(%s|(?<!const )%s|%s(?:\s+class)?)\s+(\w+)(?:\s+final)?\s*(:\s*(public\s+)?([^<\s]+)[^{]*)?\s*\{' % (EmptyScope.struct_str, EmptyScope.class_str, EmptyScope.enum_str), re.MULTILINE | re.DOTALL)
     cb_obj_pattern = re.compile(r'chainbase::object$')
     obj_pattern = re.compile(r'^object$')
-    using_pattern = re.compile(r'\n\s*?using\s+(\w+)\s*=\s*([\w:]+)(?:<.*>)?;')
-    typedef_pattern = re.compile(r'\s*typedef\s+([\w:]+)(?:<.*>)?\s+(\w+)\s*;')
 
-    def __init__(self, name, inherit, start, content, parent_scope, is_enum):
-        EmptyScope.__init__(self, name, start, content, parent_scope)
-        debug("%sClassStruct.__init__ %s %d" % (self.indent, name, start))
+    def __init__(self, name, inherit, parent_scope, is_enum):
+        EmptyScope.__init__(self, name, parent_scope)
+        debug("%sClassStruct.__init__ %s" % (self.indent, name))
         self.classes = OrderedDict()
-        self.pattern = ClassStruct.class_pattern
         self.is_enum = is_enum
         self.inherit = None
         if inherit is None:
@@ -301,149 +258,334 @@ class ClassStruct(EmptyScope):
                 self.classes[child.name] = child
                 self.children[child.name] = child
 
-
-    def add_fields(self, start, end):
-        loc = start - 1 if start > 0 else 0
-
-        while loc < end:
-            debug("%sClassStruct.add_fields -{\n%s\n}" % (self.indent, self.content[loc:end + 1]))
-            if self.is_enum:
-                loc = self.add_enum_field(loc, end)
-            else:
-                debug("%sClassStruct.add_fields - add_field")
-                loc = self.add_field(loc, end)
-        debug("%sClassStruct.add_fields done" % (self.indent))
-
-    def add_field(self, loc, end):
-        debug("%sClassStruct.add_field - %s to %s (%s)" % (self.indent, loc, end + 1, len(self.content)))
-        match = ClassStruct.field_pattern.search(self.content[loc:end+1])
-
-        if match is None:
-            return end
-        if match.group(1) == "using":
-            return loc+match.span()[1]
-
-        field = match.group(2)
+    def add_field(self, field):
         self.fields.append(field)
+        debug("%sClassStruct.add_field - %s (%d)" % (self.indent, field, len(self.fields)))
 
-        all = match.group(0)
-        loc = self.content.find(all, loc) + len(all)
-        debug("%sClassStruct.add_field - %s (%d) - loc: %s, pattern: %s, matched: \"%s\"" % (self.indent, field, len(self.fields), loc, ClassStruct.field_pattern.pattern, all))
-        return loc
-
-    def add_enum_field(self, loc, end):
-        match = ClassStruct.enum_field_pattern.search(self.content[loc:end + 1])
-        if match is None:
-            return end
-        field = match.group(1)
-        self.fields.append(field)
-        all = match.group(0)
-        loc = self.content.find(all, loc) + len(all) - 1    # back up one to not match ','
-        debug("%sClassStruct.add_enum_field - %s (%d) - %s" % (self.indent, field, len(self.fields), ClassStruct.enum_field_pattern.pattern))
-        return loc
-
-    def add_usings(self, start, end):
-        loc = start
-        while loc < end:
-            debug("%sClassStruct.add_usings -{\n%s\n}" % (self.indent, self.content[loc:end + 1]))
-            match = ClassStruct.using_pattern.search(self.content[loc:end])
-            if match is None:
-                break
-            using = match.group(1)
-            class_struct = match.group(2)
-            self.usings[using] = class_struct
-            all = match.group(0)
-            loc = self.content.find(all, loc) + len(all)
-            debug("%sClassStruct.add_usings - %s (%d)" % (self.indent, using, len(self.usings)))
-        debug("%sClassStruct.add_usings done" % (self.indent))
-
-    def add_typedefs(self, start, end):
-        loc = start
-        while loc < end:
-            debug("%sClassStruct.add_typedefs-{\n%s\n}" % (self.indent, self.content[loc:end + 1]))
-            match = ClassStruct.typedef_pattern.search(self.content[loc:end])
-            if match is None:
-                break
-            class_struct = match.group(1)
-            alias_name = match.group(2)
-            self.usings[alias_name] = class_struct;
-            all = match.group(0)
-            loc = self.content.find(all, loc) + len(all)
-            debug("%sClassStruct.add_typedefs- %s (%d)" % (self.indent, alias_name, len(self.usings)))
-        debug("%sClassStruct.add_typedefs done" % (self.indent))
-
-    def next_scope(self, end = None):
-        new_scope = None
-        if end is None:
-            end = self.find_possible_end()
-        debug("%sClassStruct.next_scope current=%s end=%s on %s\n\npossible scope={\n\"%s\"\n\n\npattern=%s" % (self.indent, self.current, end, self.name, self.content[self.current:end], self.pattern.pattern))
-        match = self.pattern.search(self.content[self.current:end])
-        start = -1
-        search_str = None
-        type = None
-        name = None
-        inherit = None
-        if match:
-            debug("%sClassStruct.next_scope match on %s" % (self.indent, self.name))
-            search_str = match.group(0)
-            type = match.group(1)
-            name = match.group(2)
-            if len(match.groups()) >= 3:
-                inherit = match.group(4)
-            debug("%sClassStruct.next_scope match for %s - type: %s, name: %s" % (self.indent, self.name, type, name))
-
-            start = self.find_scope_start(self.content, self.current, end, search_str)
-            debug("%sClassStruct.next_scope all: %s, type: %s, name: %s, start: %s, inherit: %s" % (self.indent, search_str, type, name, start, inherit))
-
-        generic_scope_start = self.find_scope_start(self.content, self.current, end, EmptyScope.start_char)
-        if start == -1 and generic_scope_start == -1:
-            debug("%sClassStruct.next_scope end=%s no scopes add_fields and exit" % (self.indent, end))
-            self.add_fields(self.current, end)
-            self.add_usings(self.current, end)
-            self.add_typedefs(self.current, end)
-            return None
-
-        debug("%sClassStruct.next_scope found \"%s\" - \"%s\" - \"%s\" current=%s, start=%s, end=%s, pattern=%s " % (self.indent, search_str, type, name, self.current, start, end, self.pattern.pattern))
-        # determine if there is a non-namespace/non-class/non-struct scope before a namespace/class/struct scope
-        if type is not None: #start != -1 and (generic_scope_start == -1 or start <= generic_scope_start):
-            debug("%sClassStruct.next_scope found %s at %d" % (self.indent, type, start))
-            new_scope = create_scope(type, name, inherit, start, self.content, self)
-        else:
-            debug("%sClassStruct.next_scope found EmptyScope (%s) at %d, next scope at %s" % (self.indent, type, generic_scope_start, start))
-            empty_scope = EmptyScope("", generic_scope_start, self.content, self)
-            new_scope = (empty_scope, empty_scope)
-
-
-        self.add_fields(self.current, new_scope[0].start)
-        self.add_usings(self.current, new_scope[0].start)
-        self.add_typedefs(self.current, new_scope[0].start)
-        new_scope[1].read()
-
-        if new_scope[1].end + 1 < self.current:
-            assert new_scope[1].end + 1 >= self.current, "Processing of scope should not result in moving backwards"
-        self.current = new_scope[1].end + 1
-
-        return new_scope[0]
+    def add_using(self, alias_name, class_struct):
+        self.usings[alias_name] = class_struct
+        debug("%sClassStruct.add_using - %s = %s (%d)" % (self.indent, alias_name, class_struct, len(self.usings)))
 
 class Namespace(ClassStruct):
-    namespace_class_pattern = re.compile(r'((?<!using\s)%s|%s|%s|%s(?:\s+class)?)\s+((?:\w+)(?:::\w+)*)\s*(?:final)?(:\s*(public\s+)?(\w+)(::\w+)*(?:<[^>]*>)?)?\s*\{' % (EmptyScope.namespace_str, EmptyScope.struct_str, EmptyScope.class_str, EmptyScope.enum_str), re.MULTILINE | re.DOTALL)
-
-    def __init__(self, name, inherit, start, content, parent_scope):
+    def __init__(self, name, inherit, parent_scope):
         assert inherit is None, "namespace %s should not inherit from %s" % (name, inherit)
-        ClassStruct.__init__(self, name, None, start, content, parent_scope, is_enum = False)
-        debug("%sNamespace.__init__ %s %d" % (self.indent, name, start))
+        ClassStruct.__init__(self, name, None, parent_scope, is_enum = False)
+        debug("%sNamespace.__init__ %s" % (self.indent, name))
         self.namespaces = {}
-        self.pattern = Namespace.namespace_class_pattern
 
     def add(self, child):
         debug("%sNamespace.add %s (%s) to %s (%s)" % (self.indent, child.name, child.__class__.__name__, self.name, self.__class__.__name__))
-        if isinstance(child, ClassStruct):
-            ClassStruct.add(self, child)
-            return
         if isinstance(child, Namespace):
             if child.name not in self.children:
                 self.namespaces[child.name] = child
                 self.children[child.name] = child
+            return
+        if isinstance(child, ClassStruct):
+            ClassStruct.add(self, child)
+
+class ScopeParser:
+    """
+    Builds the namespace/class/struct/enum scope tree of a file in a single pass over its tokens.  Declarations
+    are read up to their terminating ";" or "{" while tracking paren, bracket and brace depth, so the parse is
+    linear in the size of the file.  Function bodies and other blocks are skipped by brace depth.
+    """
+    class_keys = ("struct", "class", "union", "enum")
+    access_specifiers = ("public", "private", "protected")
+    declaration_skip = ("friend", "static_assert", "static", "operator", "namespace") + class_keys
+    qualifiers = ("const", "volatile", "mutable", "constexpr", "inline", "thread_local")
+    attributes = ("alignas", "__attribute__", "__declspec")
+
+    def __init__(self, content):
+        self.tokens = Tokenizer(content).tokens
+        self.pos = 0
+
+    def parse(self):
+        global_namespace = Namespace("", None, None)
+        self.parse_body(global_namespace)
+        assert self.pos >= len(self.tokens), "Unmatched \"}\" at token %d of %d" % (self.pos, len(self.tokens))
+        return global_namespace
+
+    def peek(self, offset=0):
+        loc = self.pos + offset
+        return self.tokens[loc] if loc < len(self.tokens) else None
+
+    def skip_balanced(self, loc):
+        """Returns the location after the group opened by the token at loc."""
+        open_char = self.tokens[loc]
+        close_char = { "{": "}", "(": ")", "[": "]" }[open_char]
+        depth = 0
+        while loc < len(self.tokens):
+            token = self.tokens[loc]
+            if token == open_char:
+                depth += 1
+            elif token == close_char:
+                depth -= 1
+                if depth == 0:
+                    return loc + 1
+            loc += 1
+        assert False, "Could not find \"%s\" matching \"%s\"" % (close_char, open_char)
+
+    def is_macro_call(self):
+        token = self.peek()
+        return is_ident(token) and token.isupper() and self.peek(1) == "(" and len(token) > 1
+
+    def parse_body(self, scope):
+        """Reads declarations into scope up to its closing brace, or the end of the file for the global namespace."""
+        while self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            if token == "}":
+                self.pos += 1
+                return
+            if token == ";":
+                self.pos += 1
+            elif token in ScopeParser.access_specifiers and self.peek(1) == ":":
+                self.pos += 2
+            elif self.is_macro_call():
+                end = self.skip_balanced(self.pos + 1)
+                # macros used as declarations without a trailing ";", like OBJECT_CTOR(...) or FC_REFLECT(...)
+                if end < len(self.tokens) and self.tokens[end] in (";", "{", ":", "=", ","):
+                    self.parse_declaration(scope)
+                else:
+                    self.pos = end
+            else:
+                self.parse_declaration(scope)
+        assert scope.parent_scope is None, "Could not find \"}\" closing %s" % (scope.name)
+
+    def parse_declaration(self, scope):
+        head = []
+        while self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            if token == ";":
+                self.pos += 1
+                self.add_declaration(scope, head)
+                return
+            if token == "}":
+                # a declaration missing its ";" before the end of the scope
+                self.add_declaration(scope, head)
+                return
+            if token in ("(", "["):
+                self.pos = self.skip_balanced(self.pos)
+                head.append(token)
+                head.append(")" if token == "(" else "]")
+                continue
+            if token != "{":
+                head.append(token)
+                self.pos += 1
+                continue
+
+            if self.open_namespace(scope, head):
+                return
+            if self.open_class(scope, head):
+                continue
+            self.pos = self.skip_balanced(self.pos)
+            if self.is_function(head):
+                # a "{" ends the head of a function, unless it is part of a constructor's member initializer list
+                if self.peek() == ",":
+                    continue
+                if self.peek() == "{":
+                    self.pos = self.skip_balanced(self.pos)
+                if self.peek() == ";":
+                    self.pos += 1
+                return
+            if len(head) == 0:
+                return
+            head.append("{}")
+
+    def open_namespace(self, scope, head):
+        """Reads the namespace or extern block whose head ends at the current "{"."""
+        if head[-2:] == ["extern", '""']:
+            self.pos += 1
+            self.parse_body(scope)
+            return True
+        if len(head) == 0 or not (head[0] == EmptyScope.namespace_str or head[:2] == ["inline", EmptyScope.namespace_str]):
+            return False
+        name = "".join(head[head.index(EmptyScope.namespace_str) + 1:])
+        self.pos += 1
+        if name == "":
+            # anonymous namespaces are not searched for classes
+            self.parse_body(Namespace("", None, scope))
+        else:
+            self.parse_body(create_scope(EmptyScope.namespace_str, name, None, scope))
+        return True
+
+    def open_class(self, scope, head):
+        """
+        Reads the class, struct or enum whose head ends at the current "{".  The class in head is replaced by a
+        placeholder type, so the declarators following it, as in "struct { ... } field;", are read as fields.
+        """
+        definition = self.class_definition(head)
+        if definition is None:
+            return False
+        type, name, inherit, key_loc = definition
+        self.pos += 1
+        if name is None:
+            # anonymous and specialized classes are read but not searched
+            new_scope = ClassStruct("", None, scope, is_enum=(type == EmptyScope.enum_str))
+        else:
+            new_scope = create_scope(type, name, inherit, scope)
+        if new_scope.is_enum:
+            self.parse_enum_body(new_scope)
+        else:
+            self.parse_body(new_scope)
+        del head[key_loc:]
+        head.append("__class__")
+        return True
+
+    def class_definition(self, head):
+        """Returns (type, name, inherit, location of the class key) if head ends with a class definition."""
+        loc = 0
+        while loc < len(head):
+            if head[loc] == "template" and loc + 1 < len(head) and head[loc + 1] == "<":
+                loc = self.skip_angles(head, loc + 1)
+                continue
+            if head[loc] in ScopeParser.class_keys:
+                break
+            loc += 1
+        if loc >= len(head):
+            return None
+        key_loc = loc
+        type = head[loc]
+        loc += 1
+        if type == EmptyScope.enum_str and loc < len(head) and head[loc] in (EmptyScope.class_str, EmptyScope.struct_str):
+            loc += 1
+        loc = self.skip_attributes(head, loc)
+        name_tokens = []
+        while loc < len(head) and (is_ident(head[loc]) or head[loc] == "::") and head[loc] != "final":
+            name_tokens.append(head[loc])
+            loc += 1
+        specialized = loc < len(head) and head[loc] == "<"
+        if specialized:
+            loc = self.skip_angles(head, loc)
+        if loc < len(head) and head[loc] == "final":
+            loc += 1
+        inherit = None
+        if loc < len(head) and head[loc] == ":":
+            if type == EmptyScope.enum_str:
+                loc = len(head)
+            else:
+                loc += 1
+                while loc < len(head) and head[loc] in ScopeParser.access_specifiers + ("virtual",):
+                    loc += 1
+                inherit_tokens = []
+                while loc < len(head) and (is_ident(head[loc]) or head[loc] == "::"):
+                    inherit_tokens.append(head[loc])
+                    loc += 1
+                inherit = "".join(inherit_tokens)
+                loc = len(head)
+        if loc != len(head):
+            return None
+        if type == "union":
+            type = EmptyScope.struct_str
+        name = "".join(name_tokens) if len(name_tokens) > 0 and not specialized else None
+        return (type, name, inherit, key_loc)
+
+    def skip_angles(self, head, loc):
+        depth = 0
+        while loc < len(head):
+            if head[loc] == "<":
+                depth += 1
+            elif head[loc] == ">":
+                depth -= 1
+                if depth == 0:
+                    return loc + 1
+            loc += 1
+        return loc
+
+    def skip_attributes(self, head, loc):
+        while loc < len(head):
+            if head[loc] in ScopeParser.attributes and loc + 1 < len(head) and head[loc + 1] == "(":
+                loc += 3
+            elif head[loc] == "[" and loc + 2 < len(head) and head[loc + 2] == "[":
+                loc += 4
+            else:
+                return loc
+        return loc
+
+    def is_function(self, head):
+        """A head is a function if it has a "(" outside of template arguments before any "=", or is an operator."""
+        angles = 0
+        prev = None
+        for token in head:
+            if token == "=" and angles == 0:
+                return False
+            if token == "operator":
+                return True
+            if token == "<" and prev is not None and is_ident(prev):
+                angles += 1
+            elif token == ">" and angles > 0:
+                angles -= 1
+            elif token == "(" and angles == 0:
+                return not (prev in ScopeParser.attributes)
+            prev = token
+        return False
+
+    def add_declaration(self, scope, head):
+        if len(head) == 0 or not isinstance(scope, ClassStruct):
+            return
+        if head[0] == "using" and "=" in head:
+            scope.add_using(head[1], self.type_name(head, head.index("=") + 1))
+            return
+        if head[0] == "typedef":
+            if is_ident(head[-1]):
+                scope.add_using(head[-1], self.type_name(head, 1))
+            return
+        if isinstance(scope, Namespace) or head[0] in ("using", "template"):
+            return
+        if any(token in ScopeParser.declaration_skip for token in head) or self.is_function(head):
+            return
+        for index, declarator in enumerate(self.declarators(head)):
+            names = [token for token in declarator if is_ident(token) and token not in ScopeParser.qualifiers]
+            # the first declarator starts with the type, the ones after it only have a name
+            if len(names) >= (2 if index == 0 else 1):
+                scope.add_field(names[-1])
+
+    def declarators(self, head):
+        """Splits a declaration on its top level commas, returning the part of each declarator before its initializer."""
+        result = [[]]
+        angles = 0
+        in_init = False
+        prev = None
+        for token in head:
+            if token == "<" and prev is not None and is_ident(prev):
+                angles += 1
+            elif token == ">" and angles > 0:
+                angles -= 1
+            elif token == "," and angles == 0:
+                result.append([])
+                in_init = False
+            elif token in ("=", "[", ":", "{}") and angles == 0:
+                in_init = True
+            elif angles == 0 and not in_init:
+                result[-1].append(token)
+            prev = token
+        return result
+
+    def type_name(self, head, loc):
+        while loc < len(head) and head[loc] in ("typename", "const", "struct", "class"):
+            loc += 1
+        name = []
+        while loc < len(head) and (is_ident(head[loc]) or head[loc] == "::"):
+            name.append(head[loc])
+            loc += 1
+        return "".join(name)
+
+    def parse_enum_body(self, scope):
+        expect_name = True
+        while self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            if token == "}":
+                self.pos += 1
+                return
+            if token in ("(", "[", "{"):
+                self.pos = self.skip_balanced(self.pos)
+                continue
+            if token == ",":
+                expect_name = True
+            elif expect_name and is_ident(token):
+                scope.add_field(token)
+                expect_name = False
+            self.pos += 1
+        assert False, "Could not find \"}\" closing enum %s" % (scope.name)
 
 class Reflection:
     def __init__(self, name):
@@ -644,35 +786,20 @@ def replace_line_comment(match):
     else:
         return "\n"
 
-def replace_braces_initialization(match):
-    all=match.group(0)
-    preamble = match.group(1)
-    init_data = match.group(2)
-    #check if preamble is the start of an enum declaration
-    match = ClassStruct.class_pattern.search(all)
-    if match is None:
-        repl = all.replace("{%s}" % (init_data), " = {%s}" % (init_data), 1)
-        debug("replace_braces_initialization replacing \"%s\" with \"%s\"." % (all, repl))
-        return repl
-    debug("replace_braces_initialization matched \"%s\" so no replace." % (match.group(1)))
-    return all
-
 def validate_file(file):
     f = open(file, "r", encoding="utf-8")
-    contents = "\n" + f.read()   # lazy fix for complex regex
+    contents = f.read()
     f.close()
     print("analyze %s" % (file))
     debug("analyze %s" % (file))
     contents = EmptyScope.multi_line_comment_pattern.sub(replace_multi_line_comment, contents)
     contents = EmptyScope.single_comment_pattern.sub(replace_line_comment, contents)
-    contents = EmptyScope.handle_braces_initialization_swap_pattern.sub(replace_braces_initialization, contents)
     found = re.search(fc_reflect_str, contents)
     if found is None:
         return
     print("validate %s" % (file))
     debug("validate %s" % (file))
-    global_namespace=Namespace("", None, 0, contents, None)
-    global_namespace.read()
+    global_namespace=ScopeParser(contents).parse()
     if args.debug:
         _, filename = os.path.split(file)
         with open(os.path.join(temp_dir, filename + ".struct"), "w") as f:
@@ -784,52 +911,121 @@ def validate_file(file):
 
     print("%s passed" % (file))
 
+def tool_version():
+    with open(os.path.abspath(__file__), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def file_digest(file):
+    with open(file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class ResultCache:
+    """Content hashes of files that passed, only valid for the version of this script that wrote them."""
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.version = tool_version()
+        self.passed = {}
+        if cache_file is not None and os.path.isfile(cache_file):
+            with open(cache_file, "r") as f:
+                try:
+                    cache = json.load(f)
+                except ValueError:
+                    cache = {}
+            if cache.get("version") == self.version:
+                self.passed = cache.get("passed", {})
+
+    def is_unchanged(self, file, digest):
+        return self.cache_file is not None and self.passed.get(os.path.abspath(file)) == digest
+
+    def add(self, file, digest):
+        self.passed[os.path.abspath(file)] = digest
+
+    def save(self):
+        if self.cache_file is None:
+            return
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({ "version": self.version, "passed": self.passed }, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.cache_file)
+
+def run_validate_file(file):
+    """Validates file, returning (file, passed, stdout, stderr) so output of parallel runs can be printed in file order."""
+    out = io.StringIO()
+    err = io.StringIO()
+    passed = True
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            validate_file(file)
+        except AssertionError:
+            _, info, tb = sys.exc_info()
+            traceback.print_tb(tb) # Fixed format
+            tb_info = traceback.extract_tb(tb)
+            filename, line, func, text = tb_info[-1]
+
+            print("An error occurred in %s:%s: %s" % (filename, line, info), file=sys.stderr)
+            passed = False
+    return (file, passed, out.getvalue(), err.getvalue())
+
+def validate_files(files, cache):
+    result = True
+    digests = {}
+    to_validate = []
+    for file in files:
+        digests[file] = file_digest(file) if cache.cache_file is not None else None
+        if cache.is_unchanged(file, digests[file]):
+            print("%s unchanged" % (file))
+        else:
+            to_validate.append(file)
+
+    pool = None
+    if jobs > 1 and len(to_validate) > 1:
+        # fork so that workers share the parsed arguments
+        pool = multiprocessing.get_context("fork").Pool(jobs)
+        results = pool.imap(run_validate_file, to_validate)
+    else:
+        results = map(run_validate_file, to_validate)
+    try:
+        for file, passed, out, err in results:
+            sys.stdout.write(out)
+            sys.stderr.write(err)
+            if passed:
+                cache.add(file, digests[file])
+                continue
+            if args.exit_on_error:
+                cache.save()
+                exit(1)
+            result = False
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return result
+
 success = True
+cache = ResultCache(args.cache)
 
 def walk(current_dir):
-    result = True
     print("Searching for files: %s" % (current_dir))
+    files = []
     for root, dirs, filenames in os.walk(current_dir):
         for filename in filenames:
             _, extension = os.path.splitext(filename)
             if extension not in extensions:
                 continue
-            try:
-                validate_file(os.path.join(root, filename))
-            except AssertionError:
-                _, info, tb = sys.exc_info()
-                traceback.print_tb(tb) # Fixed format
-                tb_info = traceback.extract_tb(tb)
-                filename, line, func, text = tb_info[-1]
-
-                print("An error occurred in %s:%s: %s" % (filename, line, info), file=sys.stderr)
-                if args.exit_on_error:
-                    exit(1)
-                result = False
+            files.append(os.path.join(root, filename))
 
         if not recurse:
             break
-    return result
+    return validate_files(files, cache)
 
 for file in args.files:
     if os.path.isdir(file):
         success &= walk(file)
     elif os.path.isfile(file):
-        try:
-            validate_file(file)
-        except AssertionError:
-            _, info, tb = sys.exc_info()
-            traceback.print_tb(tb) # Fixed format
-            tb_info = traceback.extract_tb(tb)
-            filename, line, func, text = tb_info[-1]
-
-            print("An error occurred in %s:%s: %s" % (filename, line, info), file=sys.stderr)
-            if args.exit_on_error:
-                exit(1)
-            success = False
+        success &= validate_files([file], cache)
     else:
         print("ERROR \"%s\" is neither a directory nor a file" % file)
         success = False
 
+cache.save()
 exitCode = 0 if success else 1
 exit(exitCode)